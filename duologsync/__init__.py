@@ -0,0 +1,4 @@
+import time
+
+# When DuoLogSync started being imported, reported by --startup-profile
+IMPORT_STARTED_AT = time.perf_counter()
@@ -13,25 +13,42 @@ main():
 create_consumer_producer_tasks():
     Create Producer/Consumer objects and return them as a list of runnable
     asyncio tasks
+
+reload_config():
+    Read the config file again on SIGHUP and start, stop or reconfigure only
+    the streams affected by the changes
 """
 
 import argparse
 import asyncio
+import functools
 import logging
+import os
 import signal
+import sys
+import tempfile
+
+import time
 
-from duologsync.consumer.authlog_consumer import AuthlogConsumer
-from duologsync.producer.authlog_producer import AuthlogProducer
-from duologsync.consumer.telephony_consumer import TelephonyConsumer
-from duologsync.producer.telephony_producer import TelephonyProducer
-from duologsync.consumer.trustmonitor_consumer import TrustMonitorConsumer
-from duologsync.producer.trustmonitor_producer import TrustMonitorProducer
-from duologsync.consumer.activity_consumer import ActivityConsumer
-from duologsync.producer.activity_producer import ActivityProducer
-from duologsync.util import create_admin, check_for_specific_endpoint
+from duologsync import IMPORT_STARTED_AT
+from duologsync.util import create_admin, check_for_specific_endpoint, run_in_executor
+from duologsync.archive import Archive
+from duologsync.checkpoint import CheckpointStore
+from duologsync.commands import COMMANDS
+from duologsync.control import Control
 from duologsync.writer import Writer
 from duologsync.config import Config
+from duologsync.metrics import Metrics
+from duologsync.profiling import Profiler, StartupTimer
 from duologsync.program import Program
+from duologsync.recording import Recorder, Replayer
+from duologsync.streams import Streams, Stream
+
+# Future of the latest config reload, which the next reload waits for
+_reload_future = None
+
+# When the imports above were done, reported by --startup-profile
+IMPORT_DONE_AT = time.perf_counter()
 
 
 def main():
@@ -41,6 +58,10 @@ def main():
     to the program.
     """
 
+    # Subcommands such as 'duologsync replay' are run instead of syncing logs
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+
     arg_parser = argparse.ArgumentParser(
         prog="duologsync", description="Path to config file"
     )
@@ -50,46 +71,172 @@ def main():
         type=str,
         help="Config to start application",
     )
+    recording_group = arg_parser.add_mutually_exclusive_group()
+    recording_group.add_argument(
+        "--record",
+        metavar="DIR",
+        help="save every API response received to DIR",
+    )
+    recording_group.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="send the API responses recorded in DIR instead of calling Duo",
+    )
+    arg_parser.add_argument(
+        "--replay-speed",
+        choices=["recorded", "max"],
+        default="recorded",
+        help="replay responses at the speed they were recorded, or as fast as possible",
+    )
+    arg_parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="report how long each step of startup takes",
+    )
     args = arg_parser.parse_args()
 
+    if args.startup_profile:
+        StartupTimer.start(IMPORT_STARTED_AT)
+        StartupTimer.record("import duologsync", IMPORT_DONE_AT - IMPORT_STARTED_AT)
+
     # Handle shutting down the program via Ctrl-C
     signal.signal(signal.SIGINT, signal_handler)
     # Handle shutting down the program via SIGTERM
     signal.signal(signal.SIGTERM, signal_handler)
+    # Start or stop profiling via SIGUSR1, which is not available on Windows
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, profile_signal_handler)
 
     # Create a config Dictionary from a YAML file located at args.ConfigPath
-    config = Config.create_config(args.ConfigPath)
+    with StartupTimer.time("load config schema"):
+        Config.get_schema_validator()
+    with StartupTimer.time("read config"):
+        config = Config.create_config(args.ConfigPath)
+
+    # Checkpoints of a replay are thrown away so real offsets are left as is
+    replay_directory = None
+    if args.replay and config:
+        replay_directory = tempfile.TemporaryDirectory()
+        config["dls_settings"]["checkpointing"]["directory"] = replay_directory.name
+
     Config.set_config(config)
 
     # Do extra checks for Trust Monitor support
-    is_dtm_in_config = check_for_specific_endpoint("trustmonitor", config)
-    log_format = Config.get_log_format()
-    is_msp = Config.account_is_msp()
-
-    if is_dtm_in_config and log_format != "JSON":
-        Program.log(
-            "DuoLogSync: Trust Monitor endpoint only supports JSON", logging.WARNING
-        )
+    config_error = get_config_error(config)
+    if config_error:
+        Program.log(config_error, logging.WARNING)
         return
 
-    if is_dtm_in_config and is_msp:
-        Program.log(
-            "DuoLogSync: Trust Monitor endpoint only supports non-msp", logging.WARNING
+    with StartupTimer.time("set up logging"):
+        Program.setup_logging(
+            Config.get_log_filepath(),
+            level=Config.get_log_level(),
+            max_bytes=Config.get_log_max_bytes(),
+            backup_count=Config.get_log_backup_count(),
+            rate_limit=Config.get_log_rate_limit(),
         )
-        return
 
-    Program.setup_logging(Config.get_log_filepath())
+    # Connecting to servers, loading checkpoints and looking up child accounts
+    # mostly wait on the network or disk, so they are done at the same time
+    startup_steps = [
+        # Dict of writers (server id: writer) to be used for consumer tasks
+        StartupTimer.time_async(
+            "connect to servers", Writer.connect_writers(Config.get_servers())),
+        # Offsets of every stream are kept in a single checkpoint store
+        StartupTimer.time_async("load checkpoints", run_in_executor(
+            functools.partial(CheckpointStore.open, Config.get_checkpoint_dir()))),
+    ]
+    if not args.replay:
+        startup_steps.append(StartupTimer.time_async(
+            "create admin client", run_in_executor(create_account_admin)))
+
+    server_to_writer, _, *account_admin = asyncio.get_event_loop().run_until_complete(
+        asyncio.gather(*startup_steps))
+
+    # Start a Producer/Consumer pair for every stream
+    with StartupTimer.time("start streams"):
+        if args.replay:
+            streams = Replayer.open(args.replay, realtime=args.replay_speed == "recorded")
+            create_replay_tasks(server_to_writer, streams)
+            tasks = [asyncio.ensure_future(Replayer.run())]
+        else:
+            if args.record:
+                Recorder.open(args.record)
+            if Config.get_archive_enabled():
+                Archive.open(Config.get_archive_dir(), Config.get_archive_segment_seconds(),
+                             Config.get_archive_retention_seconds(), Config.get_archive_max_bytes())
+            admin, child_accounts = account_admin[0]
+            create_tasks(server_to_writer, admin, child_accounts)
+            tasks = []
+
+        # Reload the config via SIGHUP, which is not available on Windows
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(
+                signal.SIGHUP, functools.partial(reload_signal_handler, server_to_writer)
+            )
+
+    # Wait for every stream, including those started by a config reload
+    tasks.append(asyncio.ensure_future(Streams.run()))
 
-    # Dict of writers (server id: writer) to be used for consumer tasks
-    server_to_writer = Writer.create_writers(Config.get_servers())
+    # Periodically commit the offsets saved by consumers
+    tasks.append(asyncio.ensure_future(
+        CheckpointStore.run(
+            Config.get_checkpoint_commit_interval(),
+            Config.get_checkpoint_commit_records())))
 
-    # List of Producer/Consumer objects as asyncio tasks to be run
-    tasks = create_tasks(server_to_writer)
+    # Optionally expose metrics about every stream over HTTP
+    metrics_server = None
+    if Config.get_metrics_enabled():
+        with StartupTimer.time("start metrics server"):
+            metrics_server = asyncio.get_event_loop().run_until_complete(
+                Metrics.start_server(Config.get_metrics_host(), Config.get_metrics_port()))
+
+    # Optionally inspect and steer the running streams over a local socket
+    control_server = None
+    if Config.get_control_enabled():
+        with StartupTimer.time("start control socket"):
+            control_server = asyncio.get_event_loop().run_until_complete(
+                Control.start_server(Config.get_control_socket(), server_to_writer))
+
+    StartupTimer.report()
 
     # Run the Producers and Consumers
     asyncio.get_event_loop().run_until_complete(asyncio.gather(*tasks))
+
+    # Logs written by the streams are sent within what is left of the drain
+    # timeout
+    asyncio.get_event_loop().run_until_complete(Writer.close_writers(
+        server_to_writer.values(),
+        max(Config.get_shutdown_drain_timeout() - Program.get_time_since_shutdown(), 0)))
+    Streams.clear()
+
+    if metrics_server:
+        metrics_server.close()
+        asyncio.get_event_loop().run_until_complete(metrics_server.wait_closed())
+
+    if control_server:
+        asyncio.get_event_loop().run_until_complete(
+            Control.stop_server(control_server, Config.get_control_socket()))
+
     asyncio.get_event_loop().close()
 
+    # Save offsets recorded by consumers after the last commit
+    CheckpointStore.commit()
+
+    # Save records still waiting to be archived
+    Archive.close()
+
+    Recorder.close()
+    Replayer.close()
+    if replay_directory:
+        replay_directory.cleanup()
+
+    # Save a profiling session still running at shutdown
+    Profiler.stop(get_profile_directory())
+
+    # Write out log messages still waiting in the logging queue
+    Program.shutdown_logging()
+
     if Program.is_logging_set():
         print(
             f"DuoLogSync: shutdown successfully. Check "
@@ -110,23 +257,239 @@ def signal_handler(signal_number, stack_frame):
     Program.initiate_shutdown(shutdown_reason)
 
     if stack_frame:
-        Program.log(
-            f"DuoLogSync: stack frame from signal is {stack_frame}", logging.INFO
-        )
+        Program.log("DuoLogSync: stack frame from signal is %s", logging.INFO, stack_frame)
 
 
-def create_tasks(server_to_writer):
+def reload_signal_handler(server_to_writer, signal_number, stack_frame):
     """
-    Create a pair of Producer-Consumer objects for each endpoint enabled within
-    the account defined in config, or retrieve child accounts and do the same
-    if the account is MSP. Return a list containing the asyncio tasks for
-    running those objects.
+    Handler for SIGHUP which reloads the config file once the event loop
+    gets to it
+    """
+
+    asyncio.get_event_loop().call_soon_threadsafe(schedule_reload, server_to_writer)
+
+
+def schedule_reload(server_to_writer):
+    """
+    Start reloading the config once the reloads scheduled earlier are done
 
     @param server_to_writer   Dictionary mapping server ids to writer objects
+    """
 
-    @return list of asyncio tasks for running the Producer and Consumer objects
+    global _reload_future
+    _reload_future = asyncio.ensure_future(
+        reload_config(server_to_writer, previous_reload=_reload_future)
+    )
+
+
+def get_config_error(config):
+    """
+    Check config for combinations of settings that DuoLogSync does not support
+
+    @param config   Dictionary generated from a config file
+
+    @return a message explaining what is not supported, or None
+    """
+
+    is_dtm_in_config = check_for_specific_endpoint("trustmonitor", config)
+
+    if is_dtm_in_config and config["dls_settings"]["log_format"] != "JSON":
+        return "DuoLogSync: Trust Monitor endpoint only supports JSON"
+
+    if is_dtm_in_config and config["account"]["is_msp"]:
+        return "DuoLogSync: Trust Monitor endpoint only supports non-msp"
+
+    server_ids = [server["id"] for server in config["servers"]]
+    for mapping in config["account"]["endpoint_server_mappings"]:
+        if mapping["server"] not in server_ids:
+            return f"DuoLogSync: endpoints are mapped to unknown server {mapping['server']}"
+
+    return None
+
+
+def get_admin_settings():
+    """@return the settings in config used to create the admin object"""
+
+    return (
+        Config.get_account_ikey(),
+        Config.get_account_skey(),
+        Config.get_account_hostname(),
+        Config.account_is_msp(),
+        Config.get_proxy_server(),
+        Config.get_proxy_port(),
+    )
+
+
+def get_stream_servers(child_accounts):
+    """
+    @param child_accounts   MSP child account ids, or [None] if the account
+                            is not MSP
+
+    @return a dictionary mapping the (endpoint, child account) of every stream
+            defined in config to the id of the server its logs are written to
+    """
+
+    stream_servers = {}
+
+    for child_account in child_accounts:
+        for mapping in Config.get_account_endpoint_server_mappings():
+            for endpoint in mapping.get("endpoints"):
+                stream_servers[(endpoint, child_account)] = mapping.get("server")
+
+    return stream_servers
+
+
+async def reload_config(server_to_writer, previous_reload=None):
+    """
+    Read the config file again and apply what changed: streams no longer in
+    config are stopped, new streams are started and streams mapped to another
+    server, log format, filters or aggregation are reconfigured, keeping their
+    queue and offset. Streams that did not change keep running untouched.
+    Changing the account restarts every stream. If the new config is not
+    valid, or a connection to a new server cannot be made, the current config
+    is kept.
+
+    @param server_to_writer   Dictionary mapping server ids to writer objects,
+                              updated with the servers of the new config
+    @param previous_reload    Future of a reload to wait for first, if any
+    """
+
+    if previous_reload is not None:
+        await asyncio.wait([previous_reload])
+
+    if not Program.is_running():
+        return
+
+    config_filepath = Config.get_config_file_path()
+    Program.log("DuoLogSync: reloading config from %s", logging.INFO, config_filepath)
+
+    config = Config.create_config(config_filepath, shutdown_on_error=False)
+    config_error = get_config_error(config) if config else None
+    if config_error:
+        Program.log(config_error, logging.ERROR)
+
+    if config is None or config_error:
+        Program.log("DuoLogSync: config reload failed, keeping the current config",
+                    logging.WARNING)
+        return
+
+    # Connect to new or changed servers before changing anything else
+    current_servers = {server["id"]: server for server in Config.get_servers()}
+    new_writers = {}
+    for server in config["servers"]:
+        if current_servers.get(server["id"]) == server:
+            continue
+
+        writer = Writer(server, connect=False)
+        if not await writer.connect(shutdown_on_error=False):
+            for new_writer in new_writers.values():
+                new_writer.close()
+
+            Program.log("DuoLogSync: config reload failed, keeping the current config",
+                        logging.WARNING)
+            return
+
+        new_writers[server["id"]] = writer
+
+    # Failed and quarantined streams are started again below
+    Streams.forget_failures()
+
+    admin_settings = get_admin_settings()
+    previous_filters = Config.get_value(["dls_settings"]).get("filters", {})
+    previous_aggregation = Config.get_value(["dls_settings"]).get("aggregation", {})
+    ignored_settings = Config.reload(config)
+    if ignored_settings:
+        Program.log("DuoLogSync: changes to %s are only applied after a restart", logging.WARNING,
+                    ', '.join(ignored_settings))
+
+    # Replace writers of changed and removed servers
+    server_ids = [server["id"] for server in config["servers"]]
+    retired_writers = [
+        server_to_writer.pop(server_id) for server_id in list(server_to_writer)
+        if server_id in new_writers or server_id not in server_ids
+    ]
+    server_to_writer.update(new_writers)
+
+    admin = create_admin(
+        Config.get_account_ikey(),
+        Config.get_account_skey(),
+        Config.get_account_hostname(),
+        is_msp=Config.account_is_msp(),
+        proxy_server=Config.get_proxy_server(),
+        proxy_port=Config.get_proxy_port(),
+    )
+    admin_changed = get_admin_settings() != admin_settings
+
+    child_accounts = [None]
+    if Config.account_is_msp():
+        try:
+            child_accounts = [
+                account["account_id"]
+                for account in await run_in_executor(admin.get_child_accounts)
+            ]
+        except (RuntimeError, OSError) as error:
+            Program.log("DuoLogSync: could not list child accounts, keeping the current ones: %s",
+                        logging.WARNING, error)
+            child_accounts = sorted({
+                stream.child_account_id for stream in Streams.get_all()
+                if stream.child_account_id
+            })
+
+    stream_servers = get_stream_servers(child_accounts)
+    log_format = Config.get_log_format()
+    stopped = started = reconfigured = 0
+
+    for stream in Streams.get_all():
+        if admin_changed or (stream.log_type, stream.child_account_id) not in stream_servers:
+            await Streams.remove(stream)
+            stopped += 1
+
+    for (endpoint, child_account), server_id in stream_servers.items():
+        writer = server_to_writer[server_id]
+        stream = Streams.get(endpoint, child_account)
+
+        if stream is None:
+            create_consumer_producer_pair(endpoint, writer, admin, child_account)
+            started += 1
+        elif (stream.consumer.writer is not writer
+              or stream.consumer.log_format != log_format
+              or Config.get_filter_settings(endpoint) != previous_filters.get(endpoint)
+              or Config.get_aggregation_settings(endpoint) != previous_aggregation.get(endpoint)):
+            stream.reconfigure(writer, log_format)
+            reconfigured += 1
+
+    for writer in retired_writers:
+        writer.close()
+
+    Program.log("DuoLogSync: reloaded config - %s streams started, %s stopped and %s reconfigured",
+                logging.INFO, started, stopped, reconfigured)
+
+
+def get_profile_directory():
+    """
+    @return the directory where profile files are saved, next to the log file
+    """
+
+    return os.path.dirname(os.path.abspath(Config.get_log_filepath()))
+
+
+def profile_signal_handler(signal_number, stack_frame):
+    """
+    Handler for SIGUSR1 which starts a profiling session or, if one is
+    already running, stops it and saves the profile to the log directory
+    """
+
+    Profiler.toggle(get_profile_directory())
+
+
+def create_account_admin():
+    """
+    Create the admin object of the account in config and, if the account is
+    MSP, retrieve the ids of its child accounts
+
+    @return a tuple of the admin object and the list of child account ids, or
+            None if the account is not MSP
     """
-    tasks = []
 
     # Object with functions needed to utilize log API calls
     admin = create_admin(
@@ -142,10 +505,35 @@ def create_tasks(server_to_writer):
     # (Config.account_is_msp), and then retrieve child accounts (ignoring those
     # in a blocklist) if the account is indeed MSP
     # TODO: Implement blocklist
+    child_accounts_id = None
     if Config.account_is_msp():
         child_account = admin.get_child_accounts()
         child_accounts_id = [account["account_id"] for account in child_account]
 
+    return admin, child_accounts_id
+
+
+def create_tasks(server_to_writer, admin=None, child_accounts_id=None):
+    """
+    Create a pair of Producer-Consumer objects for each endpoint enabled within
+    the account defined in config, or retrieve child accounts and do the same
+    if the account is MSP. Return a list containing the asyncio tasks for
+    running those objects.
+
+    @param server_to_writer   Dictionary mapping server ids to writer objects
+    @param admin              Admin object returned by create_account_admin,
+                              created if not given
+    @param child_accounts_id  Child account ids returned with admin
+
+    @return list of asyncio tasks for running the Producer and Consumer objects
+    """
+    tasks = []
+
+    if admin is None:
+        admin, child_accounts_id = create_account_admin()
+
+    if Config.account_is_msp():
+
         for account in child_accounts_id:
             # TODO: This can be made into a separate function
             for mapping in Config.get_account_endpoint_server_mappings():
@@ -169,6 +557,44 @@ def create_tasks(server_to_writer):
     return tasks
 
 
+def create_replay_tasks(server_to_writer, streams):
+    """
+    Create a pair of Producer-Consumer objects for each stream of a recording
+    being replayed, writing to the server its endpoint is mapped to in config.
+
+    @param server_to_writer   Dictionary mapping server ids to writer objects
+    @param streams            List of (endpoint, child account) recorded
+
+    @return list of asyncio tasks for running the Producer and Consumer objects
+    """
+    tasks = []
+
+    # Never used to call Duo, but needed to create producers
+    admin = create_admin(
+        Config.get_account_ikey(),
+        Config.get_account_skey(),
+        Config.get_account_hostname(),
+        is_msp=Config.account_is_msp(),
+    )
+
+    for endpoint, child_account in streams:
+        server_id = None
+        for mapping in Config.get_account_endpoint_server_mappings():
+            if endpoint in mapping.get("endpoints"):
+                server_id = mapping.get("server")
+
+        if server_id is None:
+            Program.log("DuoLogSync: not replaying %s logs, which are not mapped to a server in "
+                        "the config", logging.WARNING, endpoint)
+            continue
+
+        tasks.extend(create_consumer_producer_pair(
+            endpoint, server_to_writer[server_id], admin, child_account
+        ))
+
+    return tasks
+
+
 def create_consumer_producer_pair(endpoint, writer, admin, child_account=None):
     """
     Create a pair of Producer-Consumer objects for each endpoint and return a
@@ -185,47 +611,115 @@ def create_consumer_producer_pair(endpoint, writer, admin, child_account=None):
     # The format a log should have before being consumed and sent
     log_format = Config.get_log_format()
     log_queue = asyncio.Queue()
-    producer = consumer = None
 
-    # Create the right pair of Producer-Consumer objects based on endpoint
+    producer = create_producer(endpoint, admin, log_queue, child_account)
+    if producer is None:
+        Program.log("%s is not a recognized endpoint", logging.WARNING, endpoint)
+        del log_queue
+        return []
+
+    consumer = create_consumer(endpoint, log_format, log_queue, writer, child_account)
+
+    if Replayer.is_replaying():
+        producer.api_call = Replayer.get_api_call(endpoint, child_account)
+    elif Recorder.is_recording():
+        producer.api_call = Recorder.wrap(producer.api_call, endpoint, child_account)
+
+    tasks = [
+        asyncio.ensure_future(producer.produce()),
+        asyncio.ensure_future(consumer.consume()),
+    ]
+
+    # Kept so that a config reload can stop or reconfigure the pair later, and
+    # so that it can be restarted if it fails
+    Streams.add(Stream(
+        endpoint, child_account, producer, consumer, tasks,
+        restart=functools.partial(
+            create_consumer_producer_pair, endpoint, admin=admin, child_account=child_account),
+    ))
+
+    return tasks
+
+
+def create_producer(endpoint, admin, log_queue, child_account=None):
+    """
+    Create the Producer object of an endpoint
+
+    @param endpoint         Log type of the producer
+    @param admin            Object from which to get the correct API endpoints
+    @param log_queue        Queue to which the producer adds the logs fetched
+    @param child_account    MSP child account of the producer, if any
+
+    @return the producer, or None if endpoint is not a recognized log type
+    """
+
+    # Their modules are only imported for the endpoints used
     if endpoint == Config.AUTH:
+        from duologsync.producer.authlog_producer import AuthlogProducer
+
         if Config.account_is_msp():
-            producer = AuthlogProducer(
+            return AuthlogProducer(
                 admin.json_api_call,
                 log_queue,
                 child_account_id=child_account,
                 url_path="/admin/v2/logs/authentication",
             )
-        else:
-            producer = AuthlogProducer(admin.get_authentication_log, log_queue)
-        consumer = AuthlogConsumer(log_format, log_queue, writer, child_account)
-    elif endpoint == Config.TELEPHONY:
-        producer = TelephonyProducer(
+        return AuthlogProducer(admin.get_authentication_log, log_queue)
+    if endpoint == Config.TELEPHONY:
+        from duologsync.producer.telephony_producer import TelephonyProducer
+
+        return TelephonyProducer(
             admin.json_api_call,
             log_queue,
             url_path="/admin/v2/logs/telephony",
         )
-        consumer = TelephonyConsumer(log_format, log_queue, writer)
-    elif endpoint == Config.TRUST_MONITOR:
-        producer = TrustMonitorProducer(
+    if endpoint == Config.TRUST_MONITOR:
+        from duologsync.producer.trustmonitor_producer import TrustMonitorProducer
+
+        return TrustMonitorProducer(
             admin.get_trust_monitor_events_by_offset, log_queue
         )
-        consumer = TrustMonitorConsumer(log_format, log_queue, writer, child_account)
-    elif endpoint == Config.ACTIVITY:
-        producer = ActivityProducer(
+    if endpoint == Config.ACTIVITY:
+        from duologsync.producer.activity_producer import ActivityProducer
+
+        return ActivityProducer(
             admin.json_api_call,
             log_queue,
             url_path="/admin/v2/logs/activity",
         )
-        consumer = ActivityConsumer(log_format, log_queue, writer, child_account)
-    else:
-        Program.log(f"{endpoint} is not a recognized endpoint", logging.WARNING)
-        del log_queue
-        return []
 
-    tasks = [
-        asyncio.ensure_future(producer.produce()),
-        asyncio.ensure_future(consumer.consume()),
-    ]
+    return None
 
-    return tasks
+
+def create_consumer(endpoint, log_format, log_queue, writer, child_account=None):
+    """
+    Create the Consumer object of an endpoint
+
+    @param endpoint         Log type of the consumer
+    @param log_format       Format in which the consumer writes logs
+    @param log_queue        Queue from which the consumer reads logs
+    @param writer           Object for writing logs to a server
+    @param child_account    MSP child account of the consumer, if any
+
+    @return the consumer, or None if endpoint is not a recognized log type
+    """
+
+    # Their modules are only imported for the endpoints used
+    if endpoint == Config.AUTH:
+        from duologsync.consumer.authlog_consumer import AuthlogConsumer
+
+        return AuthlogConsumer(log_format, log_queue, writer, child_account)
+    if endpoint == Config.TELEPHONY:
+        from duologsync.consumer.telephony_consumer import TelephonyConsumer
+
+        return TelephonyConsumer(log_format, log_queue, writer)
+    if endpoint == Config.TRUST_MONITOR:
+        from duologsync.consumer.trustmonitor_consumer import TrustMonitorConsumer
+
+        return TrustMonitorConsumer(log_format, log_queue, writer, child_account)
+    if endpoint == Config.ACTIVITY:
+        from duologsync.consumer.activity_consumer import ActivityConsumer
+
+        return ActivityConsumer(log_format, log_queue, writer, child_account)
+
+    return None
@@ -0,0 +1,385 @@
+"""
+Definition of the Archive class, used to keep a local copy of every record
+shipped to a server so that a time range of it can be sent again later
+without calling Duo
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from duologsync.checkpoint import atomic_write_json
+from duologsync.program import Program
+from duologsync.recording import get_segment_prefix
+from duologsync.util import get_log_timestamp
+
+# A single thread appends to the archive so that the records of a stream are
+# saved in the order they were shipped
+ARCHIVE_EXECUTOR = ThreadPoolExecutor(1)
+
+INDEX_FILENAME = 'index.json'
+
+# Seconds between saves of the index of a stream while records are archived
+INDEX_SAVE_INTERVAL = 10
+
+SEGMENT_PATTERN = re.compile(r'^(?P<start>\d+)\.ndjson\.gz$')
+
+
+def get_segment_name(segment_start):
+    """@return the name of the segment file of records from segment_start"""
+    return f"{segment_start:010d}.ndjson.gz"
+
+
+def read_segment(path):
+    """
+    @param path Segment file to read
+
+    @return a generator of the records saved in the segment file. A record
+            cut short by a crash ends the generator.
+    """
+
+    try:
+        with gzip.open(path, 'rt') as segment_file:
+            for line in segment_file:
+                yield json.loads(line)
+    except (EOFError, OSError, ValueError) as error:
+        Program.log("DuoLogSync: stopped reading archive segment '%s' due to error: %s",
+                    logging.WARNING, path, error)
+
+
+def index_segment(path):
+    """
+    @param path Segment file to index
+
+    @return the index entry of the segment file, read from its records
+    """
+
+    first = last = None
+    records = 0
+
+    for record in read_segment(path):
+        records += 1
+        record_time = get_log_timestamp(record)
+        if record_time is not None:
+            first = record_time if first is None else min(first, record_time)
+            last = record_time if last is None else max(last, record_time)
+
+    # Records without a time were archived in the segment of their arrival
+    if first is None:
+        first = last = int(SEGMENT_PATTERN.match(os.path.basename(path)).group('start'))
+
+    return [first, last, records, os.path.getsize(path)]
+
+
+class _StreamArchive:
+    """
+    Segment files of the records shipped by one stream, each holding the
+    records whose time falls in one period of segment_seconds, along with an
+    index of the first and last record time, the number of records and the
+    size of every segment
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILENAME)
+        self.index = self.load_index(directory)
+        self.index_saved_at = 0
+        self.check_index()
+
+    @staticmethod
+    def load_index(directory):
+        """
+        @return the index of the archive of a stream, mapping segment file
+                names to [first record time, last record time, records, size
+                of the segment file in bytes]
+        """
+
+        try:
+            with open(os.path.join(directory, INDEX_FILENAME)) as index_file:
+                return json.load(index_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            Program.log("DuoLogSync: ignoring archive index of '%s' due to error: %s",
+                        logging.WARNING, directory, error)
+            return {}
+
+    @staticmethod
+    def is_indexed(directory, index, name):
+        """
+        @return whether the index entry of a segment file covers all of it.
+                Records appended since the index was last saved, such as
+                before a crash, are not covered.
+        """
+
+        entry = index.get(name)
+        if entry is None or len(entry) < 4:
+            return False
+
+        try:
+            return os.path.getsize(os.path.join(directory, name)) == entry[3]
+        except OSError:
+            return False
+
+    def check_index(self):
+        """
+        Index again the segment files which changed since the index was last
+        saved, so that records appended meanwhile are not left out of it
+        """
+
+        for path in glob.glob(os.path.join(self.directory, '*.ndjson.gz')):
+            name = os.path.basename(path)
+            if not SEGMENT_PATTERN.match(name) or self.is_indexed(self.directory, self.index, name):
+                continue
+
+            Program.log("DuoLogSync: indexing archive segment '%s' again", logging.INFO, path)
+            self.index[name] = index_segment(path)
+
+    def append(self, records, segment_seconds):
+        """
+        Append records to the segment files of their time. Every append adds
+        a gzip member to the end of a segment file, which gzip reads back as
+        a single stream.
+
+        @param records          Records shipped, in the order they were
+        @param segment_seconds  Seconds of record time covered by a segment
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        segments = {}
+
+        for record in records:
+            record_time = get_log_timestamp(record)
+            if record_time is None:
+                record_time = int(time.time())
+
+            name = get_segment_name(int(record_time // segment_seconds * segment_seconds))
+            segments.setdefault(name, []).append(record)
+
+            entry = self.index.get(name)
+            if entry is None:
+                self.index[name] = [record_time, record_time, 1]
+            else:
+                entry[0] = min(entry[0], record_time)
+                entry[1] = max(entry[1], record_time)
+                entry[2] += 1
+
+        for name, segment_records in segments.items():
+            data = ''.join(
+                json.dumps(record, separators=(',', ':')) + '\n' for record in segment_records)
+            with open(os.path.join(self.directory, name), 'ab') as segment_file:
+                segment_file.write(gzip.compress(data.encode()))
+                self.index[name][3:] = [segment_file.tell()]
+
+        if time.monotonic() - self.index_saved_at >= INDEX_SAVE_INTERVAL:
+            self.save_index()
+
+    def prune(self, retention_seconds=0, max_bytes=0, now=None):
+        """
+        Remove the oldest segment files of this stream, along with their
+        index entries, while their newest record is older than
+        retention_seconds or the segment files take more than max_bytes. The
+        newest segment file, which records are appended to, is kept.
+
+        @param retention_seconds    Seconds of record time to keep, or 0 to
+                                    keep every segment file
+        @param max_bytes            Most bytes of segment files to keep, or 0
+                                    for no limit
+        @param now                  Seconds since the epoch
+
+        @return the names of the segment files removed
+        """
+
+        if not retention_seconds and not max_bytes:
+            return []
+
+        if now is None:
+            now = time.time()
+
+        # Names are zero padded segment starts, sorted from the oldest
+        names = sorted(self.index)
+        total_bytes = sum(entry[3] for entry in self.index.values() if len(entry) > 3)
+        removed = []
+
+        for name in names[:-1]:
+            entry = self.index[name]
+            expired = retention_seconds and entry[1] < now - retention_seconds
+            if not expired and not (max_bytes and total_bytes > max_bytes):
+                break
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+            del self.index[name]
+            if len(entry) > 3:
+                total_bytes -= entry[3]
+            removed.append(name)
+
+        if removed:
+            Program.log("DuoLogSync: removed %s archive segments from '%s'", logging.INFO,
+                        len(removed), self.directory)
+            self.save_index()
+
+        return removed
+
+    def save_index(self):
+        """Save the index of this stream"""
+
+        if self.index:
+            atomic_write_json(self.index_path, self.index)
+        self.index_saved_at = time.monotonic()
+
+
+class Archive:
+    """
+    Like the Program class, Archive is not meant to be instantiated. When
+    dls_settings.archive is enabled, consumers hand every page of records
+    they shipped to the archive, which appends them on a background thread to
+    gzipped JSON lines segment files under
+    {directory}/{log_type}[_{child_account_id}]/, one per period of
+    segment_seconds of record time. Records are archived as they were before
+    being formatted, so that they can be sent again in any format. The oldest
+    segments of a stream are removed past retention_seconds of record time or
+    max_bytes.
+    """
+
+    _directory = None
+    _segment_seconds = None
+    _retention_seconds = 0
+    _max_bytes = 0
+
+    # Maps the key of a stream to its _StreamArchive
+    _streams = {}
+
+    @classmethod
+    def open(cls, directory, segment_seconds, retention_seconds=0, max_bytes=0):
+        """
+        Start archiving shipped records
+
+        @param directory            Directory in which to save records
+        @param segment_seconds      Seconds of record time covered by a segment
+        @param retention_seconds    Seconds of record time for which segments
+                                    are kept, or 0 to keep them forever
+        @param max_bytes            Most bytes of segments kept per stream, or
+                                    0 for no limit
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        cls._directory = directory
+        cls._segment_seconds = segment_seconds
+        cls._retention_seconds = retention_seconds
+        cls._max_bytes = max_bytes
+        cls._streams = {}
+        Program.log("DuoLogSync: archiving shipped records to %s", logging.INFO, directory)
+
+    @classmethod
+    def is_archiving(cls):
+        """@return whether shipped records are archived"""
+        return cls._directory is not None
+
+    @classmethod
+    def get_stream_directory(cls, directory, log_type, child_account_id=None):
+        """@return the directory of the archive of a stream"""
+        return os.path.join(directory, get_segment_prefix(log_type, child_account_id))
+
+    @classmethod
+    def append(cls, log_type, child_account_id, records):
+        """
+        Archive records shipped by a stream, without waiting for them to be
+        saved
+
+        @param log_type         Log type of the stream
+        @param child_account_id MSP child account of the stream, if any
+        @param records          Records shipped, as they were before being
+                                formatted
+        """
+
+        if cls._directory is None or not records:
+            return
+
+        stream_directory = cls.get_stream_directory(cls._directory, log_type, child_account_id)
+        stream = cls._streams.get(stream_directory)
+        if stream is None:
+            stream = cls._streams[stream_directory] = _StreamArchive(stream_directory)
+
+        ARCHIVE_EXECUTOR.submit(cls._append, stream, records, cls._segment_seconds,
+                                cls._retention_seconds, cls._max_bytes)
+
+    @staticmethod
+    def _append(stream, records, segment_seconds, retention_seconds, max_bytes):
+        try:
+            stream.append(records, segment_seconds)
+        except OSError as os_error:
+            Program.log("DuoLogSync: failed to archive %s records to '%s' due to error: %s",
+                        logging.ERROR, len(records), stream.directory, os_error)
+
+        try:
+            stream.prune(retention_seconds, max_bytes)
+        except OSError as os_error:
+            Program.log("DuoLogSync: failed to remove archive segments from '%s' due to error: %s",
+                        logging.ERROR, stream.directory, os_error)
+
+    @classmethod
+    def close(cls):
+        """Wait for every record handed to the archive to be saved"""
+
+        if cls._directory is None:
+            return
+
+        for stream in cls._streams.values():
+            ARCHIVE_EXECUTOR.submit(stream.save_index)
+        ARCHIVE_EXECUTOR.submit(lambda: None).result()
+
+        cls._directory = None
+        cls._streams = {}
+
+    @classmethod
+    def read(cls, directory, log_type, child_account_id=None, start=None, end=None):
+        """
+        @param directory        Directory of the archive
+        @param log_type         Log type of the stream to read
+        @param child_account_id MSP child account of the stream, if any
+        @param start            Seconds since the epoch from which to read
+                                records, or None to read from the first
+        @param end              Seconds since the epoch before which to read
+                                records, or None to read up to the last
+
+        @return a generator of the archived records of the stream whose time
+                is within [start, end), in the order of their segments
+        """
+
+        stream_directory = cls.get_stream_directory(directory, log_type, child_account_id)
+        index = _StreamArchive.load_index(stream_directory)
+
+        segments = []
+        for path in glob.glob(os.path.join(stream_directory, '*.ndjson.gz')):
+            name = os.path.basename(path)
+            match = SEGMENT_PATTERN.match(name)
+            if not match:
+                continue
+
+            # Segments changed since the index was last saved are always read
+            entry = index.get(name)
+            if _StreamArchive.is_indexed(stream_directory, index, name) and (
+                    (start is not None and entry[1] < start)
+                    or (end is not None and entry[0] >= end)):
+                continue
+
+            segments.append((int(match.group('start')), path))
+
+        for _, path in sorted(segments):
+            for record in read_segment(path):
+                record_time = get_log_timestamp(record)
+                if record_time is not None and (
+                        (start is not None and record_time < start)
+                        or (end is not None and record_time >= end)):
+                    continue
+
+                yield record
@@ -0,0 +1,280 @@
+"""
+Definition of the BackfillProgress class
+"""
+
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.metrics import (
+    BACKFILL_ETA, BACKFILL_PROGRESS, RECORDS_RATE, Metrics, stream_labels
+)
+from duologsync.program import Program
+
+# Name under which the progress of streams is saved in the checkpoint store
+BACKFILL_STATE = 'backfill'
+
+# Seconds over which records per second and the speed of a stream are measured
+RATE_WINDOW = 60
+
+# Seconds between two progress reports of a stream in the program log
+REPORT_INTERVAL = 60
+
+# Seconds between two saves of the progress of a stream in the checkpoint
+# store, which rewrites the store at its next commit
+SAVE_INTERVAL = 60
+
+
+def format_duration(seconds):
+    """@return seconds as a short duration such as 2h05m or 40s"""
+
+    seconds = int(seconds)
+    if seconds >= 86400:
+        return f"{seconds // 86400}d{seconds % 86400 // 3600:02d}h"
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def get_eta(position, speed, now):
+    """
+    @param position Time of the newest record shipped by a stream
+    @param speed    Seconds of records shipped per second
+    @param now      Seconds since the epoch
+
+    @return the seconds left until the stream ships records of now, or None
+            if it does not catch up at its current speed. Time keeps going
+            while the stream catches up, so only the speed in excess of one
+            second per second shortens the remaining range.
+    """
+
+    if speed is None or speed <= 1:
+        return None
+
+    return max(now - position, 0) / (speed - 1)
+
+
+class CycleEnd:
+    """
+    Put in the queue of a stream by its producer after the last page of a
+    polling cycle. Once the consumer reaches it, every log of the cycle was
+    shipped.
+    """
+
+    __slots__ = ('position', 'poll_interval')
+
+    def __init__(self, position, poll_interval):
+        """
+        @param position         Seconds since the epoch up to which the cycle
+                                fetched logs
+        @param poll_interval    Seconds until the producer polls again
+        """
+
+        self.position = position
+        self.poll_interval = poll_interval
+
+
+class BackfillProgress:
+    """
+    Progress of a stream through the logs from the time it started fetching,
+    the mintime of its producer, up to now. Consumers report the time of the
+    newest record they shipped, and the end of every polling cycle once they
+    shipped its logs, at which point the stream has caught up. A stream
+    lagging more than a poll interval behind its last cycle has fallen behind
+    again. Records per second and the speed of the stream, in seconds of
+    logs shipped per second, are measured over the last RATE_WINDOW seconds
+    to estimate when a stream catches up.
+
+    Progress is exposed as metrics, reported in the program log while a
+    stream catches up and saved in the checkpoint store every SAVE_INTERVAL
+    seconds and once it catches up, where 'duologsync status' reads it.
+    """
+
+    # Maps the key of a stream to its progress
+    _streams = {}
+
+    def __init__(self, log_type, child_account_id=None, start=None):
+        self.log_type = log_type
+        self.child_account_id = child_account_id
+        self.start = start if start is not None else time.time()
+        self.position = self.start
+        self.caught_up = False
+        self.poll_interval = None
+        self.records = 0
+        self.metric_labels = stream_labels(log_type, child_account_id)
+        self.reported_at = time.monotonic()
+        self.saved_at = None
+
+        # (monotonic time, records, position) over the last RATE_WINDOW
+        self.samples = deque([(self.reported_at, 0, self.start)])
+
+    @classmethod
+    def start_stream(cls, log_type, child_account_id=None, start=None):
+        """
+        Track the progress of a stream whose producer starts at start. A
+        stream restarted before catching up keeps the start of its earlier
+        run, in this process or a previous one.
+
+        @param log_type         Log type of the stream
+        @param child_account_id MSP child account of the stream, if any
+        @param start            Seconds since the epoch from which the
+                                producer of the stream fetches logs
+
+        @return the BackfillProgress of the stream
+        """
+
+        key = CheckpointStore.stream_key(log_type, child_account_id)
+        previous = cls._streams.get(key)
+
+        if previous is not None:
+            saved = {'start': previous.start, 'caught_up': previous.caught_up}
+        elif Config.get_checkpointing_enabled():
+            saved = CheckpointStore.get_state(BACKFILL_STATE, log_type, child_account_id)
+        else:
+            saved = None
+
+        if saved and not saved.get('caught_up') and start is not None:
+            start = min(start, saved['start'])
+
+        progress = cls._streams[key] = BackfillProgress(log_type, child_account_id, start)
+        return progress
+
+    @classmethod
+    def get(cls, log_type, child_account_id=None):
+        """@return the BackfillProgress of a stream, or None if not tracked"""
+        return cls._streams.get(CheckpointStore.stream_key(log_type, child_account_id))
+
+    @classmethod
+    def clear(cls):
+        """Stop tracking every stream"""
+        cls._streams = {}
+
+    def shipped(self, records, position):
+        """
+        Count records shipped by the consumer of the stream
+
+        @param records  Number of records shipped
+        @param position Time of the newest record shipped, or None
+        """
+
+        self.records += records
+        if position is not None:
+            self.position = max(self.position, position)
+
+        # Logs of the next cycle are shipped a poll interval after those of
+        # the last one, any lag beyond that means the stream fell behind
+        now = time.time()
+        fell_behind = (self.caught_up and self.poll_interval is not None
+                       and now - self.position > 2 * self.poll_interval)
+        if fell_behind:
+            self.caught_up = False
+            Program.log("%s producer: fell behind, shipped logs up to %s ago",
+                        logging.INFO, self.log_type, format_duration(now - self.position))
+        self.update(now, save=fell_behind)
+
+    def cycle_done(self, position, poll_interval=None):
+        """
+        The producer fetched every log up to position and its consumer
+        shipped them
+
+        @param position         Seconds since the epoch up to which logs were
+                                fetched
+        @param poll_interval    Seconds until the producer polls again
+        """
+
+        self.position = max(self.position, position)
+        self.poll_interval = poll_interval
+        catching_up = not self.caught_up
+        if catching_up:
+            self.caught_up = True
+            Program.log("%s producer: caught up after shipping %s records in %s of logs",
+                        logging.INFO, self.log_type, self.records,
+                        format_duration(time.time() - self.start))
+        self.update(save=catching_up)
+
+    def get_rates(self):
+        """
+        @return the records per second and the speed, in seconds of logs
+                shipped per second, over the last RATE_WINDOW seconds, or
+                None for both if not measured yet
+        """
+
+        first_time, first_records, first_position = self.samples[0]
+        last_time, last_records, last_position = self.samples[-1]
+        elapsed = last_time - first_time
+
+        if elapsed <= 0:
+            return None, None
+
+        return (last_records - first_records) / elapsed, (last_position - first_position) / elapsed
+
+    def get_progress(self, now=None):
+        """@return the fraction of the time from start to now shipped"""
+
+        if now is None:
+            now = time.time()
+
+        if self.caught_up or now <= self.start:
+            return 1.0
+
+        return min(max((self.position - self.start) / (now - self.start), 0.0), 1.0)
+
+    def update(self, now=None, save=False):
+        """
+        Measure the rates of the stream and update its metrics, then save its
+        state every SAVE_INTERVAL seconds and report its progress every
+        REPORT_INTERVAL seconds
+
+        @param now  Seconds since the epoch
+        @param save Whether to save the state of the stream now
+        """
+
+        if now is None:
+            now = time.time()
+
+        monotonic_now = time.monotonic()
+        self.samples.append((monotonic_now, self.records, self.position))
+        while len(self.samples) > 2 and self.samples[1][0] <= monotonic_now - RATE_WINDOW:
+            self.samples.popleft()
+
+        records_per_second, speed = self.get_rates()
+        progress = self.get_progress(now)
+        eta = 0 if self.caught_up else get_eta(self.position, speed, now)
+
+        Metrics.set(BACKFILL_PROGRESS, self.metric_labels, progress)
+        if records_per_second is not None:
+            Metrics.set(RECORDS_RATE, self.metric_labels, records_per_second)
+        if eta is not None:
+            Metrics.set(BACKFILL_ETA, self.metric_labels, eta)
+
+        if save or self.saved_at is None or monotonic_now - self.saved_at >= SAVE_INTERVAL:
+            self.saved_at = monotonic_now
+            CheckpointStore.set_state(BACKFILL_STATE, self.log_type, {
+                'start': self.start,
+                'position': self.position,
+                'caught_up': self.caught_up,
+                'records_per_second': records_per_second,
+                'speed': speed,
+                'updated_at': now,
+            }, self.child_account_id)
+
+        if self.caught_up or monotonic_now - self.reported_at < REPORT_INTERVAL:
+            return
+
+        self.reported_at = monotonic_now
+        position = datetime.fromtimestamp(self.position, timezone.utc)
+        Program.log(
+            "%s producer: backfill %.0f%% done, shipped logs up to %s, "
+            "%.0f records/s, ETA %s",
+            logging.INFO,
+            self.log_type,
+            progress * 100,
+            position.strftime('%Y-%m-%d %H:%M:%S UTC'),
+            records_per_second or 0,
+            format_duration(eta) if eta is not None else 'unknown',
+        )
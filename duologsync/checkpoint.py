@@ -0,0 +1,503 @@
+"""
+Definition of the CheckpointStore class
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from duologsync.program import Program
+
+# A single thread is used for commits so that snapshots reach disk in the
+# order they were taken
+COMMIT_EXECUTOR = ThreadPoolExecutor(1)
+
+# Name of the per-stream checkpoint files used before the store, capturing
+# the log type and the MSP child account of the stream
+LEGACY_CHECKPOINT_PATTERN = re.compile(
+    r'^(?P<log_type>[a-z]+)_checkpoint_data(?:_(?P<child_account_id>.+))?\.txt$')
+
+def atomic_write_json(file_path, data):
+    """
+    Write data as JSON to file_path such that a reader (or a crash) never sees
+    a partially written file. The data is written to a temporary file in the
+    same directory, flushed to disk and then renamed over file_path.
+
+    @param file_path    Path of the file to write
+    @param data         JSON serializable object to save
+    """
+
+    directory = os.path.dirname(file_path) or '.'
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix='.tmp')
+
+    try:
+        with os.fdopen(file_descriptor, 'w') as temp_file:
+            json.dump(data, temp_file, separators=(',', ':'))
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Persist the rename itself. Directories cannot be opened on Windows
+    try:
+        directory_descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(directory_descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(directory_descriptor)
+
+
+class CheckpointStore:
+    """
+    Like the Config and Program classes, CheckpointStore is not meant to be
+    instantiated. It keeps the latest offset of every stream (a log type,
+    optionally for an MSP child account) in memory and periodically commits
+    all of them to a single file in the checkpoint directory. Commits happen
+    off the event loop and are atomic, so a crash leaves either the previous
+    or the new set of offsets on disk, never a partial one. Streams keep the
+    last record acknowledged by their server as a watermark, which is only
+    turned into an offset when a commit is made.
+
+    Offsets saved by older versions of DuoLogSync in per-stream
+    {log_type}_checkpoint_data[_child].txt files are migrated into the store
+    the first time the offset of that stream is requested.
+    """
+
+    FILENAME = 'duologsync_checkpoints.json'
+    FORMAT_VERSION = 1
+
+    # Directory containing the store, set by open()
+    _directory = None
+
+    # Maps a stream key to the latest offset saved for that stream
+    _offsets = {}
+
+    # Additional per-stream state saved alongside offsets. Maps the name of a
+    # kind of state to a dictionary mapping stream keys to values
+    _state = {}
+
+    # Whether _offsets has changed since the last commit
+    _dirty = False
+
+    # Functions saving the offset of the last record acknowledged by the
+    # server of a stream, called before every commit
+    _watermarks = []
+
+    # Records acknowledged since the last commit, and the number of them
+    # after which a commit is made without waiting for the commit interval
+    _acknowledged = 0
+    _commit_records = 0
+    _commit_requested = None
+
+    @staticmethod
+    def stream_key(log_type, child_account_id=None):
+        """
+        @param log_type         Log type of the stream
+        @param child_account_id MSP child account of the stream, if any
+
+        @return the key under which the offset of a stream is stored
+        """
+
+        if child_account_id:
+            return f"{log_type}:{child_account_id}"
+
+        return log_type
+
+    @staticmethod
+    def legacy_checkpoint_path(directory, log_type, child_account_id=None):
+        """
+        @return path of the per-stream checkpoint file used before the store
+        """
+
+        if child_account_id:
+            filename = f"{log_type}_checkpoint_data_{child_account_id}.txt"
+        else:
+            filename = f"{log_type}_checkpoint_data.txt"
+
+        return os.path.join(directory, filename)
+
+    @classmethod
+    def read_legacy_checkpoints(cls, directory):
+        """
+        Read every per-stream checkpoint file used before the store, without
+        migrating them. The directory is listed once, whatever the number of
+        files it holds.
+
+        @param directory    Directory of the checkpoint files
+
+        @return a dictionary mapping the key of every stream with a checkpoint
+                file to its offset, or None if the file could not be read, and
+                the modification time of the file
+        """
+
+        checkpoints = {}
+
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return checkpoints
+
+        for entry in entries:
+            match = LEGACY_CHECKPOINT_PATTERN.match(entry.name)
+            if match is None:
+                continue
+
+            key = cls.stream_key(match.group('log_type'), match.group('child_account_id'))
+
+            try:
+                modified_at = entry.stat().st_mtime
+            except OSError:
+                modified_at = None
+
+            try:
+                with open(entry.path) as checkpoint:
+                    log_offset = json.loads(checkpoint.read())
+            except (OSError, ValueError):
+                log_offset = None
+
+            checkpoints[key] = (log_offset, modified_at)
+
+        return checkpoints
+
+    @classmethod
+    def get_directory(cls):
+        """@return the directory of the store, or None if not open"""
+        return cls._directory
+
+    @classmethod
+    def get_path(cls):
+        """@return the path of the file backing the store"""
+        return os.path.join(cls._directory, cls.FILENAME)
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Load the store kept in directory. A missing store is not an error, it
+        simply means that no offsets have been committed yet.
+
+        @param directory    Directory where the store file is kept
+        """
+
+        cls._directory = directory
+        cls._offsets = {}
+        cls._state = {}
+        cls._dirty = False
+        cls._acknowledged = 0
+
+        try:
+            with open(cls.get_path()) as store_file:
+                contents = json.load(store_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            Program.log("DuoLogSync: could not read checkpoint store '%s' due to error: %s",
+                        logging.WARNING, cls.get_path(), error)
+            return
+
+        # Valid JSON edited by hand may still not be a store. Offsets are then
+        # migrated from legacy checkpoint files, as if there was no store
+        if not isinstance(contents, dict) or not isinstance(contents.get('offsets', {}), dict):
+            Program.log("DuoLogSync: could not read checkpoint store '%s' due to error: it does "
+                        "not hold an object of offsets", logging.WARNING, cls.get_path())
+            return
+
+        cls._offsets = contents.get('offsets', {})
+
+        state = contents.get('state', {})
+        if isinstance(state, dict):
+            cls._state = {
+                name: values for name, values in state.items() if isinstance(values, dict)}
+
+    @classmethod
+    def reset(cls):
+        """Close the store, discarding what was not committed"""
+        cls._directory = None
+        cls._offsets = {}
+        cls._state = {}
+        cls._dirty = False
+        cls._watermarks = []
+        cls._acknowledged = 0
+        cls._commit_records = 0
+        cls._commit_requested = None
+
+    @classmethod
+    def _check_open(cls, directory=None):
+        """
+        Open the store on first use if open() has not been called yet
+
+        @param directory    Directory to open the store in if needed
+        """
+
+        if cls._directory is not None:
+            return
+
+        if directory is None:
+            # Imported here since Config is not needed by the store otherwise
+            from duologsync.config import Config
+            directory = Config.get_checkpoint_dir()
+
+        cls.open(directory)
+
+    @classmethod
+    def get_offset(cls, log_type, child_account_id=None, directory=None):
+        """
+        Retrieve the saved offset of a stream, migrating it from a legacy
+        checkpoint file if the store has no entry for the stream yet.
+
+        @param log_type         Log type of the stream
+        @param child_account_id MSP child account of the stream, if any
+        @param directory        Directory of the store, used if not yet open
+
+        @return the saved offset of the stream or None if there is none
+        """
+
+        cls._check_open(directory)
+        key = cls.stream_key(log_type, child_account_id)
+
+        if key in cls._offsets:
+            return cls._offsets[key]
+
+        legacy_path = cls.legacy_checkpoint_path(
+            cls._directory, log_type, child_account_id)
+
+        try:
+            with open(legacy_path) as checkpoint:
+                log_offset = json.loads(checkpoint.read())
+        except FileNotFoundError:
+            return None
+        except OSError as os_error:
+            Program.log("%s producer: could not access checkpoint file '%s' due to error: %s",
+                        logging.WARNING, log_type, legacy_path, os_error)
+            return None
+
+        Program.log("%s producer: migrating checkpoint file '%s' into checkpoint store '%s'",
+                    logging.INFO, log_type, legacy_path, cls.get_path())
+        cls.set_offset(log_type, log_offset, child_account_id)
+
+        return log_offset
+
+    @classmethod
+    def set_offset(cls, log_type, log_offset, child_account_id=None):
+        """
+        Record the latest offset of a stream. The offset is persisted by the
+        next commit.
+
+        @param log_type         Log type of the stream
+        @param log_offset       Offset to save for the stream
+        @param child_account_id MSP child account of the stream, if any
+        """
+
+        cls._check_open()
+        cls._offsets[cls.stream_key(log_type, child_account_id)] = log_offset
+        cls._dirty = True
+
+    @classmethod
+    def get_state(cls, name, log_type, child_account_id=None):
+        """
+        Retrieve state of kind name saved for a stream
+
+        @param name             Kind of state to retrieve, such as 'dedup'
+        @param log_type         Log type of the stream
+        @param child_account_id MSP child account of the stream, if any
+
+        @return the saved state or None if there is none
+        """
+
+        cls._check_open()
+        key = cls.stream_key(log_type, child_account_id)
+
+        return cls._state.get(name, {}).get(key)
+
+    @classmethod
+    def set_state(cls, name, log_type, value, child_account_id=None):
+        """
+        Record state of kind name for a stream. The state is persisted by the
+        next commit, together with the offsets of every stream. Values must
+        not be modified after being set, set a new value instead.
+
+        @param name             Kind of state to save, such as 'dedup'
+        @param log_type         Log type of the stream
+        @param value            JSON serializable state to save
+        @param child_account_id MSP child account of the stream, if any
+        """
+
+        cls._check_open()
+        key = cls.stream_key(log_type, child_account_id)
+        cls._state.setdefault(name, {})[key] = value
+        cls._dirty = True
+
+    @classmethod
+    def get_states(cls, name):
+        """
+        @param name Kind of state to retrieve, such as 'dedup'
+
+        @return a dictionary mapping the key of every stream with state of
+                kind name to that state
+        """
+
+        cls._check_open()
+        return dict(cls._state.get(name, {}))
+
+    @classmethod
+    def add_watermark(cls, save_watermark):
+        """
+        @param save_watermark   Function saving the offset of the last record
+                                acknowledged by the server of a stream with
+                                set_offset, called before every commit so that
+                                offsets are only computed once per commit
+        """
+        cls._watermarks.append(save_watermark)
+
+    @classmethod
+    def remove_watermark(cls, save_watermark):
+        """@param save_watermark  Function given to add_watermark"""
+        if save_watermark in cls._watermarks:
+            cls._watermarks.remove(save_watermark)
+
+    @classmethod
+    def acknowledge(cls, records):
+        """
+        Count records acknowledged by a server, requesting a commit once
+        commit_records of them were acknowledged since the last commit
+
+        @param records  Number of records acknowledged
+        """
+
+        cls._acknowledged += records
+
+        if (cls._commit_records and cls._acknowledged >= cls._commit_records
+                and cls._commit_requested is not None):
+            cls._commit_requested.set()
+
+    @classmethod
+    def save_watermarks(cls):
+        """Save the offset of the last record acknowledged by every stream"""
+
+        for save_watermark in list(cls._watermarks):
+            save_watermark()
+
+    @classmethod
+    def get_offsets(cls):
+        """@return a copy of the offsets of every stream in the store"""
+        return dict(cls._offsets)
+
+    @classmethod
+    def get_commit_state(cls):
+        """
+        @return a dictionary with the path of the store, the number of streams
+                with an offset, whether changes wait for the next commit and
+                the records acknowledged since the last commit
+        """
+
+        return {
+            'path': cls.get_path() if cls._directory is not None else None,
+            'streams': len(cls._offsets),
+            'changed': cls._dirty,
+            'records_since_commit': cls._acknowledged,
+        }
+
+    @classmethod
+    def _snapshot(cls):
+        """
+        Take a copy of the store contents to be written by a commit and mark
+        the store as clean
+
+        @return the data to save in the store file
+        """
+
+        cls._dirty = False
+        cls._acknowledged = 0
+
+        return {
+            'version': cls.FORMAT_VERSION,
+            'offsets': dict(cls._offsets),
+            'state': {name: dict(values) for name, values in cls._state.items()}
+        }
+
+    @classmethod
+    def commit(cls):
+        """
+        Synchronously write the store to disk if anything has changed. Meant
+        for use once the event loop has stopped.
+        """
+
+        if cls._directory is None:
+            return
+
+        cls.save_watermarks()
+        if not cls._dirty:
+            return
+
+        atomic_write_json(cls.get_path(), cls._snapshot())
+
+    @classmethod
+    async def commit_async(cls):
+        """
+        Write the store to disk, if anything has changed, without blocking the
+        event loop
+        """
+
+        if cls._directory is None:
+            return
+
+        cls.save_watermarks()
+        if not cls._dirty:
+            return
+
+        snapshot = cls._snapshot()
+
+        try:
+            await asyncio.get_event_loop().run_in_executor(
+                COMMIT_EXECUTOR, atomic_write_json, cls.get_path(), snapshot)
+        except OSError as os_error:
+            # Changes are kept in memory and retried with the next commit
+            cls._dirty = True
+            Program.log("DuoLogSync: failed to commit checkpoint store '%s' due to error: %s",
+                        logging.ERROR, cls.get_path(), os_error)
+
+    @classmethod
+    async def run(cls, commit_interval, commit_records=0):
+        """
+        Group-commit the store every commit_interval seconds, and as soon as
+        commit_records records were acknowledged since the last commit, until
+        DuoLogSync shuts down, at which point a final commit is made.
+
+        @param commit_interval  Seconds to wait between commits, or 0 to only
+                                commit after commit_records records
+        @param commit_records   Records acknowledged after which to commit,
+                                or 0 to only commit every commit_interval
+        """
+
+        cls._commit_records = commit_records
+        cls._commit_requested = asyncio.Event()
+        shutdown = Program.get_shutdown_future()
+
+        while not shutdown.done():
+            commit_requested = asyncio.ensure_future(cls._commit_requested.wait())
+            await asyncio.wait([commit_requested, shutdown],
+                               timeout=commit_interval or None,
+                               return_when=asyncio.FIRST_COMPLETED)
+            commit_requested.cancel()
+
+            if shutdown.done():
+                break
+
+            cls._commit_requested.clear()
+            await cls.commit_async()
+
+        cls._commit_requested = None
+        await cls.commit_async()
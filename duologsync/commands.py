@@ -0,0 +1,809 @@
+"""
+Subcommands of DuoLogSync, run instead of syncing logs when the first
+argument given to duologsync names one of them
+
+Functions
+---------
+
+replay():
+    Send the records of a time range from the archive to a server
+
+export():
+    Fetch the logs of a time range from Duo to compressed local files
+
+status():
+    Print the checkpoint, lag and progress of every stream
+
+control():
+    Inspect and steer a running DuoLogSync through its control socket
+"""
+
+import argparse
+import asyncio
+import functools
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+
+from duologsync.archive import Archive
+from duologsync.backfill import BACKFILL_STATE, format_duration, get_eta
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.control import CONTROL_SETTINGS, send_control_request
+from duologsync.producer.cursor import get_cursor_class
+from duologsync.producer.producer import Producer
+from duologsync.program import Program
+from duologsync.recording import get_segment_prefix
+from duologsync.util import get_offset_timestamp, run_in_executor
+from duologsync.writer import Writer
+
+TIME_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"]
+
+# Time relative to now, such as 30d for 30 days ago
+RELATIVE_TIME_PATTERN = re.compile(r'^(?P<amount>\d+)(?P<unit>[smhd])$')
+RELATIVE_TIME_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+LOG_TYPES = [Config.AUTH, Config.TELEPHONY, Config.TRUST_MONITOR, Config.ACTIVITY]
+
+# Log types whose producer fetches the logs of an MSP child account, those of
+# other log types are the logs of the parent account whatever the child
+CHILD_ACCOUNT_LOG_TYPES = [Config.AUTH]
+
+# Extension of exported files for each log format
+EXPORT_EXTENSIONS = {Config.JSON: 'ndjson', Config.CEF: 'cef'}
+
+# Times an API call of an export is retried after an error eligible for a
+# retry, such as HTTP 429, and seconds waited before the first retry, doubled
+# with every retry in a row
+EXPORT_MAX_RETRIES = 5
+EXPORT_RETRY_BACKOFF = 2
+
+# Seconds between reports of the progress of an export
+PROGRESS_INTERVAL = 5
+
+# Poll intervals without activity after which status flags a stream as
+# stale, and the exit status of status when a stream is stale
+STALE_POLLS = 3
+STALE_EXIT_STATUS = 3
+
+
+def parse_time(value, now=None):
+    """
+    Parse a time given on the command line, either as seconds since the
+    epoch, as an ISO 8601 date and time in UTC or as an amount of seconds (s),
+    minutes (m), hours (h) or days (d) before now
+
+    @param value    Time to parse
+    @param now      Seconds since the epoch from which relative times count
+
+    @return the time as seconds since the epoch
+    """
+
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    match = RELATIVE_TIME_PATTERN.match(value)
+    if match:
+        if now is None:
+            now = time.time()
+        return now - int(match.group('amount')) * RELATIVE_TIME_UNITS[match.group('unit')]
+
+    iso_value = re.sub(r'(Z|\+00:?00)$', '', value)
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(iso_value, time_format).replace(
+                tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+
+    raise argparse.ArgumentTypeError(
+        f"'{value}' is not seconds since the epoch, an ISO 8601 UTC time or "
+        "a time before now such as 30d")
+
+
+def load_config(config_path, checkpointing=True):
+    """
+    Read the config of DuoLogSync for a subcommand. Program logs of
+    subcommands are printed to the console.
+
+    @param config_path      Config file of DuoLogSync
+    @param checkpointing    Whether the subcommand may read checkpoints
+
+    @return whether the config is valid
+    """
+
+    config = Config.create_config(config_path, shutdown_on_error=False)
+    if config is None:
+        return False
+
+    # Offsets of the streams of DuoLogSync are neither read nor written
+    if not checkpointing:
+        config['dls_settings']['checkpointing']['enabled'] = False
+
+    Config.set_config(config)
+    return True
+
+
+def replay(args):
+    """
+    Send the archived records of a stream within a time range to a server,
+    as fast as the server takes them. Neither Duo nor the checkpoints of
+    DuoLogSync are used.
+
+    @param args Arguments given after 'duologsync replay'
+
+    @return the exit status of the command
+    """
+
+    arg_parser = argparse.ArgumentParser(
+        prog="duologsync replay",
+        description="Send archived records of a time range to a server",
+    )
+    arg_parser.add_argument("--type", required=True, choices=LOG_TYPES,
+                            help="log type of the records to send")
+    arg_parser.add_argument("--account", metavar="ID",
+                            help="MSP child account of the records to send")
+    arg_parser.add_argument("--from", dest="start", type=parse_time,
+                            help="time of the first records to send, such as "
+                                 "2024-05-01T00:00:00 (UTC) or 7d for 7 days ago")
+    arg_parser.add_argument("--to", dest="end", type=parse_time,
+                            help="time before which records are sent, up to the "
+                                 "last archived if omitted")
+    arg_parser.add_argument("--server", required=True, metavar="ID",
+                            help="id of the server from the config to send records to")
+    arg_parser.add_argument("--archive-dir", metavar="DIR",
+                            help="archive to read, dls_settings.archive.directory "
+                                 "if omitted")
+    arg_parser.add_argument("ConfigPath", metavar="config-path", type=str,
+                            help="config of DuoLogSync")
+    args = arg_parser.parse_args(args)
+
+    if not load_config(args.ConfigPath):
+        return 1
+
+    servers = [server for server in Config.get_servers() if server['id'] == args.server]
+    if not servers:
+        Program.log("DuoLogSync: no server with id '%s' in the config", logging.ERROR, args.server)
+        return 1
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    writer = Writer(servers[0], connect=False)
+    if not loop.run_until_complete(writer.connect(shutdown_on_error=False)):
+        return 1
+
+    # Imported here since duologsync.app imports this module
+    from duologsync.app import create_consumer
+
+    consumer = create_consumer(args.type, Config.get_log_format(), None, writer, args.account)
+    records = Archive.read(
+        args.archive_dir or Config.get_archive_dir(), args.type, args.account,
+        args.start, args.end)
+
+    async def send():
+        sent = 0
+        for record in records:
+            await writer.write(consumer.format_log(record), args.type)
+            sent += 1
+        return sent
+
+    started = time.perf_counter()
+    try:
+        sent = loop.run_until_complete(send())
+    except OSError:
+        return 1
+    finally:
+        loop.run_until_complete(writer.close_gracefully())
+        loop.close()
+
+    Program.log("DuoLogSync: sent %s archived %s records to '%s' in %.1fs", logging.INFO, sent,
+                args.type, args.server, time.perf_counter() - started)
+    return 0
+
+
+class ExportWindow:
+    """
+    Part of the time range of an export, from start to end in milliseconds,
+    fetched for one stream by its own producer into its own part file. The
+    part files of a stream are joined in order once every window is fetched.
+    """
+
+    def __init__(self, log_type, child_account_id, start, end, path):
+        self.log_type = log_type
+        self.child_account_id = child_account_id
+        self.start = start
+        self.end = end
+        self.path = path
+        self.records = 0
+        # Time of the last record fetched
+        self.position = start
+        self.done = False
+
+    def get_progress(self):
+        """@return the fraction of the window fetched so far"""
+
+        if self.done or self.end <= self.start:
+            return 1
+
+        return (self.position - self.start) / (self.end - self.start)
+
+
+def split_time_range(start, end, windows):
+    """
+    @param start    Milliseconds since the epoch at which the range starts
+    @param end      Milliseconds since the epoch at which the range ends
+    @param windows  Number of windows to split the range into
+
+    @return a list of (start, end) windows covering [start, end) in order
+    """
+
+    windows = max(min(windows, end - start), 1)
+    bounds = [start + (end - start) * index // windows for index in range(windows + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+async def export_window(window, producer, consumer):
+    """
+    Fetch every log of a window with the cursor of a producer, as a polling
+    cycle of the producer would, and write them formatted by consumer to the
+    part file of the window
+
+    @param window   ExportWindow to fetch
+    @param producer Producer of the stream of the window
+    @param consumer Consumer used to format the logs of the stream
+    """
+
+    cursor = get_cursor_class(window.log_type)(mintime=window.start)
+    cursor.start_cycle()
+    # maxtime is inclusive, the next window starts at window.end
+    cursor.maxtime = window.end - 1
+    producer.cursor = cursor
+    page_size = Config.get_api_page_size(window.log_type, window.child_account_id)
+    retries = 0
+
+    with gzip.open(window.path, 'wb') as part_file:
+        while cursor.has_more:
+            try:
+                api_result = await producer.call_log_api()
+            except RuntimeError as runtime_error:
+                if retries >= EXPORT_MAX_RETRIES or not Producer.eligible_for_retry(
+                        getattr(runtime_error, 'status', None)):
+                    raise
+
+                retries += 1
+                Program.log("%s export: retrying due to error: %s", logging.WARNING,
+                            window.log_type, runtime_error)
+                await asyncio.sleep(EXPORT_RETRY_BACKOFF * 2 ** (retries - 1))
+                continue
+
+            retries = 0
+            logs = cursor.advance(
+                producer.get_logs(api_result) if api_result else None, page_size)
+            if not logs:
+                continue
+
+            if window.child_account_id:
+                for log in logs:
+                    log['child_account_id'] = window.child_account_id
+
+            data = b''.join(consumer.format_log(log) for log in logs)
+            await run_in_executor(functools.partial(part_file.write, data))
+            window.records += len(logs)
+
+            record_time = cursor.get_record_time(logs[-1])
+            if record_time is not None:
+                window.position = min(max(record_time, window.start), window.end)
+
+    window.done = True
+
+
+def log_export_progress(windows, started):
+    """
+    Log the records exported so far and the share of the time range fetched
+
+    @param windows  ExportWindow objects of the export
+    @param started  Value of time.perf_counter() when the export started
+    """
+
+    records = sum(window.records for window in windows)
+    windows_done = sum(1 for window in windows if window.done)
+    progress = sum(window.get_progress() for window in windows) / len(windows)
+    elapsed = time.perf_counter() - started
+
+    Program.log("DuoLogSync: exported %s records, %s/%s windows done, %.0f%% of the time range "
+                "in %.0fs", logging.INFO, records, windows_done, len(windows), progress * 100,
+                elapsed)
+
+
+async def run_export(windows, producers, consumers, parallel):
+    """
+    Fetch every window of an export, at most parallel at a time, reporting
+    progress every PROGRESS_INTERVAL seconds
+
+    @param windows      ExportWindow objects to fetch
+    @param producers    Function returning a new producer for a window
+    @param consumers    Dictionary mapping log types to the consumer
+                        formatting their logs
+    @param parallel     Most windows fetched at the same time
+    """
+
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(parallel)
+
+    async def fetch(window):
+        async with semaphore:
+            await export_window(window, producers(window), consumers[window.log_type])
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            log_export_progress(windows, started)
+
+    reporter = asyncio.ensure_future(report_progress())
+    tasks = [asyncio.ensure_future(fetch(window)) for window in windows]
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        reporter.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks + [reporter])
+
+    log_export_progress(windows, started)
+
+
+def join_parts(path, parts):
+    """
+    Join the part files of a stream, each a gzip file, into the gzip file at
+    path and remove them
+
+    @param path     File to which the stream is exported
+    @param parts    Part files of the stream, in order
+    """
+
+    with open(path, 'wb') as export_file:
+        for part in parts:
+            with open(part, 'rb') as part_file:
+                shutil.copyfileobj(part_file, export_file)
+
+    for part in parts:
+        os.remove(part)
+
+
+def export(args):
+    """
+    Fetch the logs of a time range from the Duo Admin API to a compressed
+    file per stream, splitting the range of every stream into windows fetched
+    in parallel. Streams of DuoLogSync and their checkpoints are left alone.
+
+    @param args Arguments given after 'duologsync export'
+
+    @return the exit status of the command
+    """
+
+    arg_parser = argparse.ArgumentParser(
+        prog="duologsync export",
+        description="Fetch the logs of a time range from Duo to compressed files",
+    )
+    arg_parser.add_argument("--types", nargs="+", choices=LOG_TYPES,
+                            help="log types to export, those mapped to a server "
+                                 "in the config if omitted")
+    arg_parser.add_argument("--account", dest="accounts", action="append", metavar="ID",
+                            help="MSP child account to export, every child account "
+                                 "if omitted. Can be given more than once")
+    arg_parser.add_argument("--from", dest="start", required=True, type=parse_time,
+                            help="time of the first logs to export, such as "
+                                 "2024-05-01T00:00:00 (UTC) or 30d for 30 days ago")
+    arg_parser.add_argument("--to", dest="end", type=parse_time,
+                            help="time before which logs are exported, now if omitted")
+    arg_parser.add_argument("--format", choices=[Config.JSON, Config.CEF],
+                            help="format of the exported logs, the log_format of "
+                                 "the config if omitted")
+    arg_parser.add_argument("--output", metavar="DIR", default=".",
+                            help="directory to write the exported files to")
+    arg_parser.add_argument("--windows", type=int, default=4,
+                            help="windows the time range of each stream is split into")
+    arg_parser.add_argument("--parallel", type=int, default=4,
+                            help="most windows fetched at the same time")
+    arg_parser.add_argument("ConfigPath", metavar="config-path", type=str,
+                            help="config of DuoLogSync")
+    args = arg_parser.parse_args(args)
+
+    if not load_config(args.ConfigPath, checkpointing=False):
+        return 1
+
+    # Imported here since duologsync.app imports this module
+    from duologsync.app import create_account_admin, create_consumer, create_producer
+
+    log_types = args.types or [
+        log_type for log_type in LOG_TYPES
+        if any(log_type in mapping.get('endpoints')
+               for mapping in Config.get_account_endpoint_server_mappings())]
+    log_format = args.format or Config.get_log_format()
+    start = int(args.start * 1000)
+    end = int((args.end if args.end is not None else time.time()) * 1000)
+
+    if end <= start:
+        Program.log("DuoLogSync: nothing to export, --to is not after --from", logging.ERROR)
+        return 1
+
+    admin, child_accounts = create_account_admin()
+    accounts = (args.accounts or child_accounts) if Config.account_is_msp() else [None]
+
+    os.makedirs(args.output, exist_ok=True)
+    exports = {}
+    windows = []
+    for log_type in log_types:
+        if log_type in CHILD_ACCOUNT_LOG_TYPES:
+            stream_accounts = accounts
+        else:
+            # Exported once rather than a copy of the same logs per child
+            if args.accounts:
+                Program.log("DuoLogSync: %s logs are not fetched per child account, "
+                            "exporting those of the parent account", logging.WARNING, log_type)
+            stream_accounts = [None]
+
+        for account in stream_accounts:
+            path = os.path.join(args.output, f"{get_segment_prefix(log_type, account)}."
+                                             f"{EXPORT_EXTENSIONS[log_format]}.gz")
+            if os.path.exists(path):
+                Program.log("DuoLogSync: not overwriting '%s'", logging.ERROR, path)
+                return 1
+
+            stream_windows = [
+                ExportWindow(log_type, account, window_start, window_end,
+                             f"{path}.part{index}")
+                for index, (window_start, window_end)
+                in enumerate(split_time_range(start, end, args.windows))]
+            exports[path] = stream_windows
+            windows.extend(stream_windows)
+
+    consumers = {
+        log_type: create_consumer(log_type, log_format, None, None) for log_type in log_types}
+
+    def producers(window):
+        return create_producer(window.log_type, admin, None, window.child_account_id)
+
+    Program.log("DuoLogSync: exporting %s logs in %s windows to %s", logging.INFO,
+                ', '.join(log_types), len(windows), args.output)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(run_export(windows, producers, consumers, max(args.parallel, 1)))
+    except (OSError, RuntimeError) as error:
+        Program.log("DuoLogSync: export failed due to error: %s", logging.ERROR, error)
+        return 1
+    finally:
+        loop.close()
+        # Parts of a failed export are removed, those of a finished one are
+        # joined first
+        for path, stream_windows in exports.items():
+            parts = [window.path for window in stream_windows if os.path.exists(window.path)]
+            if all(window.done for window in stream_windows):
+                join_parts(path, parts)
+            else:
+                for part in parts:
+                    os.remove(part)
+
+    for path, stream_windows in exports.items():
+        Program.log("DuoLogSync: exported %s records to %s", logging.INFO,
+                    sum(window.records for window in stream_windows), path)
+
+    return 0
+
+
+def format_table(rows):
+    """@return rows of strings as lines of left aligned columns"""
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    return [
+        '  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        for row in rows]
+
+
+def get_stale_after(log_type, child_account_id=None):
+    """
+    @param log_type         Log type of a stream
+    @param child_account_id MSP child account of the stream, if any
+
+    @return the seconds without activity after which status flags the stream
+            as stale: STALE_POLLS of its longest poll interval
+    """
+
+    poll_interval = max(Config.get_api_timeout(log_type, child_account_id),
+                        Config.get_api_max_timeout(log_type, child_account_id))
+    return STALE_POLLS * poll_interval
+
+
+def get_stream_status(key, checkpoint, progress, now, stale_after=None):
+    """
+    @param key          Key of a stream
+    @param checkpoint   Offset saved for the stream, or None, and the
+                        modification time of its legacy checkpoint file, or
+                        None if the offset is in the checkpoint store
+    @param progress     Backfill progress saved for the stream, or None
+    @param now          Seconds since the epoch
+    @param stale_after  Seconds without activity after which the stream is
+                        stale, or None for STALE_POLLS of its poll interval
+
+    @return the columns of the stream in the output of status, and whether
+            the stream is stale
+    """
+
+    log_offset, modified_at = checkpoint
+    notes = []
+
+    position = get_offset_timestamp(log_offset)
+    if log_offset is not None and position is None:
+        notes.append('unreadable offset')
+    if position is None and progress:
+        position = progress['position']
+    if modified_at is not None:
+        notes.append('legacy file')
+
+    # Running streams save their progress after every polling cycle, older
+    # versions of DuoLogSync only rewrote their checkpoint files
+    if progress:
+        active_at = progress['updated_at']
+    elif modified_at is not None:
+        active_at = modified_at
+    else:
+        active_at = position
+
+    if stale_after is None:
+        log_type, _, child_account_id = key.partition(':')
+        stale_after = get_stale_after(log_type, child_account_id or None)
+
+    stale = active_at is None or now - active_at > stale_after
+    if stale:
+        notes.insert(0, 'stale')
+
+    if position is None:
+        shipped_up_to, lag = '-', '-'
+    else:
+        shipped_up_to = datetime.fromtimestamp(position, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        lag = format_duration(max(now - position, 0))
+
+    done, records_per_second, eta = '-', '-', '-'
+
+    if progress:
+        if progress['caught_up']:
+            done = 'caught up'
+        else:
+            elapsed = progress['updated_at'] - progress['start']
+            fraction = (progress['position'] - progress['start']) / elapsed if elapsed > 0 else 1
+            done = f"{min(max(fraction, 0), 1):.0%}"
+            # Estimated when the progress was saved, less the time since
+            eta_seconds = get_eta(progress['position'], progress['speed'], progress['updated_at'])
+            if eta_seconds is None:
+                eta = 'unknown'
+            else:
+                eta = format_duration(max(eta_seconds - (now - progress['updated_at']), 0))
+
+        if progress['records_per_second'] is not None:
+            records_per_second = f"{progress['records_per_second']:.0f}"
+
+    updated = '-' if active_at is None else f"{format_duration(max(now - active_at, 0))} ago"
+
+    return [
+        key,
+        shipped_up_to,
+        lag,
+        done,
+        records_per_second,
+        eta,
+        updated,
+        ', '.join(notes),
+    ], stale
+
+
+def status(args):
+    """
+    Print the checkpoint and progress of every stream of a config: the time
+    of the newest log shipped and how far behind now it is, the share of the
+    logs from the start of the stream to now shipped, records per second and
+    the estimated time until the stream catches up. Offsets are read from the
+    checkpoint store and from the per-stream checkpoint files of older
+    versions of DuoLogSync not migrated yet, in any of their formats. Streams
+    not active for longer than STALE_POLLS of their poll interval are flagged
+    as stale. Nothing is written, so status can run next to DuoLogSync.
+
+    @param args Arguments given after 'duologsync status'
+
+    @return the exit status of the command, STALE_EXIT_STATUS if a stream is
+            stale
+    """
+
+    arg_parser = argparse.ArgumentParser(
+        prog="duologsync status",
+        description="Print the checkpoint, lag and progress of every stream",
+    )
+    arg_parser.add_argument("--stale-after", dest="stale_after", type=int, default=None,
+                            help="seconds without activity after which a stream is stale, "
+                                 f"{STALE_POLLS} of its poll interval by default")
+    arg_parser.add_argument("ConfigPath", metavar="config-path", type=str,
+                            help="config of DuoLogSync")
+    args = arg_parser.parse_args(args)
+
+    if not load_config(args.ConfigPath):
+        return 1
+
+    directory = Config.get_checkpoint_dir()
+    CheckpointStore.open(directory)
+
+    # Checkpoint files are migrated once their stream is started, after which
+    # the offset in the store is the one in use
+    checkpoints = CheckpointStore.read_legacy_checkpoints(directory)
+    checkpoints.update(
+        (key, (log_offset, None)) for key, log_offset in CheckpointStore.get_offsets().items())
+    backfill = CheckpointStore.get_states(BACKFILL_STATE)
+    keys = sorted(set(checkpoints) | set(backfill))
+
+    if not keys:
+        print(f"No streams saved in the checkpoint directory '{directory}'")
+        return 0
+
+    now = time.time()
+    rows = [['STREAM', 'SHIPPED UP TO (UTC)', 'LAG', 'DONE', 'RECORDS/S', 'ETA', 'UPDATED', 'NOTES']]
+    stale_streams = 0
+
+    for key in keys:
+        row, stale = get_stream_status(
+            key, checkpoints.get(key, (None, None)), backfill.get(key), now, args.stale_after)
+        rows.append(row)
+        stale_streams += stale
+
+    print('\n'.join(format_table(rows)))
+
+    if stale_streams:
+        print(f"{stale_streams} of {len(keys)} streams are stale")
+        return STALE_EXIT_STATUS
+
+    return 0
+
+
+def format_stream_stats(stats):
+    """
+    @param stats    Live stats about a stream, from the control socket
+
+    @return the columns of the stream in the output of control streams.
+            Settings changed through the control socket are marked with *
+    """
+
+    overrides = stats['overrides']
+    poll_interval = f"{stats['poll_interval']:g}s"
+    if 'timeout' in overrides or 'max_timeout' in overrides:
+        poll_interval += '*'
+    page_size = '-' if stats['page_size'] is None else str(stats['page_size'])
+    if 'page_size' in overrides:
+        page_size += '*'
+    records_per_second = stats['records_per_second']
+
+    return [
+        stats['stream'],
+        stats['state'],
+        stats['server'],
+        poll_interval,
+        page_size,
+        str(stats['queued_pages']),
+        str(stats['records_fetched']),
+        str(stats['records_written']),
+        f"{records_per_second:.0f}" if records_per_second is not None else '-',
+        'caught up' if stats['caught_up'] else format_duration(stats['lag']),
+    ]
+
+
+def control(args):
+    """
+    Inspect and steer a running DuoLogSync through its control socket: list
+    its streams with live stats, pause and resume streams, change their poll
+    interval or page size until they stop, commit checkpoints right away or
+    dump the state of queues and connections
+
+    @param args Arguments given after 'duologsync control'
+
+    @return the exit status of the command
+    """
+
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("ConfigPath", metavar="config-path", type=str,
+                               help="config of the running DuoLogSync")
+    stream_parser = argparse.ArgumentParser(add_help=False)
+    stream_parser.add_argument("stream", help="stream such as auth or auth:<child account id>")
+
+    arg_parser = argparse.ArgumentParser(
+        prog="duologsync control",
+        description="Inspect and steer a running DuoLogSync through its control socket",
+    )
+    actions = arg_parser.add_subparsers(dest="action", metavar="action")
+    actions.required = True
+    actions.add_parser("streams", parents=[config_parser],
+                       help="list the streams with live stats")
+    actions.add_parser("pause", parents=[stream_parser, config_parser],
+                       help="stop polling a stream")
+    actions.add_parser("resume", parents=[stream_parser, config_parser],
+                       help="resume polling a paused stream")
+    set_parser = actions.add_parser("set", parents=[stream_parser, config_parser],
+                                    help="change api settings of a stream until it stops")
+    set_parser.add_argument("--timeout", type=float, help="seconds between polls")
+    set_parser.add_argument("--max-timeout", dest="max_timeout", type=float,
+                            help="most seconds between polls of a stream fetching no logs")
+    set_parser.add_argument("--page-size", dest="page_size", type=int,
+                            help="records requested per API call")
+    actions.add_parser("reset", parents=[stream_parser, config_parser],
+                       help="use the api settings of the config for a stream again")
+    actions.add_parser("flush", parents=[config_parser],
+                       help="commit the checkpoints of every stream now")
+    actions.add_parser("dump", parents=[config_parser],
+                       help="print the state of streams, queues and connections as JSON")
+    args = arg_parser.parse_args(args)
+
+    request = {'command': args.action}
+    if 'stream' in args:
+        request['stream'] = args.stream
+    if args.action == 'set':
+        request['settings'] = {
+            name: getattr(args, name) for name in CONTROL_SETTINGS
+            if getattr(args, name) is not None}
+        if not request['settings']:
+            set_parser.error("give at least one of --timeout, --max-timeout and --page-size")
+
+    if not load_config(args.ConfigPath, checkpointing=False):
+        return 1
+
+    path = Config.get_control_socket()
+
+    try:
+        response = send_control_request(path, request)
+    except (OSError, ValueError) as error:
+        print(f"Could not reach DuoLogSync on the control socket '{path}' due to error: "
+              f"{error}. Check that it is running with control enabled.")
+        return 1
+
+    if not response.get('ok'):
+        print(f"DuoLogSync could not {args.action}: {response.get('error')}")
+        return 1
+
+    result = response['result']
+
+    if args.action == 'dump':
+        print(json.dumps(result, indent=2, sort_keys=True))
+    elif args.action == 'flush':
+        if result['changed']:
+            print(f"Could not commit the checkpoint store '{result['path']}', "
+                  "check the program log of DuoLogSync")
+            return 1
+        print(f"Committed the offsets of {result['streams']} streams to '{result['path']}'")
+    elif args.action == 'streams':
+        rows = [['STREAM', 'STATE', 'SERVER', 'POLL INTERVAL', 'PAGE SIZE', 'QUEUED',
+                 'FETCHED', 'WRITTEN', 'RECORDS/S', 'LAG']]
+        rows.extend(format_stream_stats(stats) for stats in result['streams'])
+        rows.extend([key, 'quarantined'] + ['-'] * 8 for key in result['quarantined'])
+        print('\n'.join(format_table(rows)))
+        if any(stats['overrides'] for stats in result['streams']):
+            print('* set through the control socket')
+    else:
+        stats = result
+        page_size = stats['page_size'] or 'the API default'
+        print(f"{stats['stream']}: {stats['state']}, polling every {stats['poll_interval']:g} "
+              f"seconds for {page_size} records per call")
+
+    return 0
+
+
+# Maps the name of each subcommand to the function running it
+COMMANDS = {
+    'replay': replay,
+    'export': export,
+    'status': status,
+    'control': control,
+}
@@ -2,13 +2,10 @@
 Definition of the Config class
 """
 
+import logging
 from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
 
-import yaml
-from cerberus import Validator, schema_registry  # type: ignore
-from yaml import YAMLError
-
 from duologsync.program import Program
 
 
@@ -37,10 +34,42 @@ class Config:
     DIRECTORY_DEFAULT = '/tmp'
     LOG_FILEPATH_DEFAULT = DIRECTORY_DEFAULT + '/' + 'duologsync.log'
     LOG_FORMAT_DEFAULT = 'JSON'
+    LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
+    LOG_LEVEL_DEFAULT = 'INFO'
+    LOG_MAX_BYTES_DEFAULT = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT_DEFAULT = 5
+    LOG_RATE_LIMIT_DEFAULT = 100
     API_OFFSET_DEFAULT = 180
     API_TIMEOUT_DEFAULT = 120
+    API_MAX_TIMEOUT_DEFAULT = 0
+    API_JITTER_DEFAULT = 0.1
+    API_PAGE_SIZE_DEFAULTS = {
+        AUTH: 1000, TELEPHONY: 1000, ACTIVITY: 1000, TRUST_MONITOR: None
+    }
+    API_PAGE_SIZE_MAX = {
+        AUTH: 1000, TELEPHONY: 1000, ACTIVITY: 1000, TRUST_MONITOR: 200
+    }
     CHECKPOINTING_ENABLED_DEFAULT = True
     CHECKPOINTING_DIRECTORY_DEFAULT = DIRECTORY_DEFAULT
+    CHECKPOINTING_COMMIT_INTERVAL_DEFAULT = 1
+    CHECKPOINTING_COMMIT_RECORDS_DEFAULT = 0
+    DEDUP_ENABLED_DEFAULT = False
+    DEDUP_WINDOW_SIZE_DEFAULT = 1000
+    AGGREGATION_WINDOW_DEFAULT = 60
+    SHUTDOWN_DRAIN_TIMEOUT_DEFAULT = 30
+    SUPERVISOR_MAX_RESTARTS_DEFAULT = 5
+    SUPERVISOR_BACKOFF_DEFAULT = 1
+    SUPERVISOR_MAX_BACKOFF_DEFAULT = 300
+    ARCHIVE_ENABLED_DEFAULT = False
+    ARCHIVE_DIRECTORY_DEFAULT = DIRECTORY_DEFAULT + '/' + 'duologsync_archive'
+    ARCHIVE_SEGMENT_SECONDS_DEFAULT = 3600
+    ARCHIVE_RETENTION_SECONDS_DEFAULT = 0
+    ARCHIVE_MAX_BYTES_DEFAULT = 0
+    METRICS_ENABLED_DEFAULT = False
+    METRICS_HOST_DEFAULT = '127.0.0.1'
+    METRICS_PORT_DEFAULT = 9120
+    CONTROL_ENABLED_DEFAULT = False
+    CONTROL_SOCKET_DEFAULT = DIRECTORY_DEFAULT + '/' + 'duologsync.sock'
     PROXY_SERVER_DEFAULT = ''
     PROXY_PORT_DEFAULT = 0
 
@@ -56,6 +85,57 @@ class Config:
         'required': True
     }
 
+    # api settings which can be overridden for an endpoint or a child account
+    API_OVERRIDES = {
+        'offset': {'type': 'number', 'min': 0, 'max': 180},
+        'timeout': {'type': 'number'},
+        'max_timeout': {'type': 'number', 'min': 0},
+        'page_size': {'type': 'integer', 'min': 1, 'max': 1000}
+    }
+
+    # Records whose field, given as a dotted path, has one of the values
+    CONDITIONS = {
+        'type': 'list',
+        'schema': {
+            'type': 'dict',
+            'schema': {
+                'field': {'type': 'string', 'required': True, 'empty': False},
+                'values': {'type': 'list', 'required': True, 'empty': False}
+            }
+        }
+    }
+
+    # Records of an endpoint to drop, and fields of its records to keep or
+    # remove, given as dotted paths such as access_device.location
+    FILTER = {
+        'drop': CONDITIONS,
+        'include_fields': {
+            'type': 'list',
+            'schema': {'type': 'string', 'empty': False}
+        },
+        'exclude_fields': {
+            'type': 'list',
+            'schema': {'type': 'string', 'empty': False}
+        }
+    }
+
+    # Fields identifying records of an endpoint that are rolled up into a
+    # summary when seen within the same window of seconds
+    AGGREGATION = {
+        'key': {
+            'type': 'list',
+            'required': True,
+            'empty': False,
+            'schema': {'type': 'string', 'empty': False}
+        },
+        'window': {
+            'type': 'integer',
+            'min': 1,
+            'default': AGGREGATION_WINDOW_DEFAULT
+        },
+        'pass_through': CONDITIONS
+    }
+
     # Fields for changing the functionality of DuoLogSync
     DLS_SETTINGS = {
         'type': 'dict',
@@ -72,6 +152,32 @@ class Config:
                 'allowed': [CEF, JSON],
                 'default': LOG_FORMAT_DEFAULT
             },
+            'logging': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'level': {
+                        'type': 'string',
+                        'allowed': LOG_LEVELS,
+                        'default': LOG_LEVEL_DEFAULT
+                    },
+                    'max_bytes': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': LOG_MAX_BYTES_DEFAULT
+                    },
+                    'backup_count': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': LOG_BACKUP_COUNT_DEFAULT
+                    },
+                    'rate_limit': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': LOG_RATE_LIMIT_DEFAULT
+                    }
+                }
+            },
             'api': {
                 'type': 'dict',
                 'default': {},
@@ -85,6 +191,35 @@ class Config:
                     'timeout': {
                         'type': 'number',
                         'default': API_TIMEOUT_DEFAULT
+                    },
+                    'max_timeout': {
+                        'type': 'number',
+                        'min': 0,
+                        'default': API_MAX_TIMEOUT_DEFAULT
+                    },
+                    'jitter': {
+                        'type': 'number',
+                        'min': 0,
+                        'max': 1,
+                        'default': API_JITTER_DEFAULT
+                    },
+                    'endpoints': {
+                        'type': 'dict',
+                        'keysrules': {
+                            'type': 'string',
+                            'allowed': [AUTH, TELEPHONY, TRUST_MONITOR, ACTIVITY]
+                        },
+                        'valuesrules': {
+                            'type': 'dict',
+                            'schema': dict(API_OVERRIDES, child_accounts={
+                                'type': 'dict',
+                                'keysrules': {'type': 'string'},
+                                'valuesrules': {
+                                    'type': 'dict',
+                                    'schema': API_OVERRIDES
+                                }
+                            })
+                        }
                     }
                 }
             },
@@ -99,9 +234,148 @@ class Config:
                     'directory': {
                         'type': 'string',
                         'empty': False,
-                        'default': CHECKPOINTING_DIRECTORY_DEFAULT}
+                        'default': CHECKPOINTING_DIRECTORY_DEFAULT},
+                    'commit_interval': {
+                        'type': 'number',
+                        'min': 0,
+                        'default': CHECKPOINTING_COMMIT_INTERVAL_DEFAULT
+                    },
+                    'commit_records': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': CHECKPOINTING_COMMIT_RECORDS_DEFAULT
+                    }
+                }
+            },
+            'shutdown': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'drain_timeout': {
+                        'type': 'number',
+                        'min': 0,
+                        'default': SHUTDOWN_DRAIN_TIMEOUT_DEFAULT
+                    }
+                }
+            },
+            'supervisor': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'max_restarts': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': SUPERVISOR_MAX_RESTARTS_DEFAULT
+                    },
+                    'backoff': {
+                        'type': 'number',
+                        'min': 0,
+                        'default': SUPERVISOR_BACKOFF_DEFAULT
+                    },
+                    'max_backoff': {
+                        'type': 'number',
+                        'min': 0,
+                        'default': SUPERVISOR_MAX_BACKOFF_DEFAULT
+                    }
                 }
             },
+            'archive': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'enabled': {
+                        'type': 'boolean',
+                        'default': ARCHIVE_ENABLED_DEFAULT
+                    },
+                    'directory': {
+                        'type': 'string',
+                        'empty': False,
+                        'default': ARCHIVE_DIRECTORY_DEFAULT
+                    },
+                    'segment_seconds': {
+                        'type': 'integer',
+                        'min': 1,
+                        'default': ARCHIVE_SEGMENT_SECONDS_DEFAULT
+                    },
+                    'retention_seconds': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': ARCHIVE_RETENTION_SECONDS_DEFAULT
+                    },
+                    'max_bytes': {
+                        'type': 'integer',
+                        'min': 0,
+                        'default': ARCHIVE_MAX_BYTES_DEFAULT
+                    }
+                }
+            },
+            'dedup': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'enabled': {
+                        'type': 'boolean',
+                        'default': DEDUP_ENABLED_DEFAULT
+                    },
+                    'window_size': {
+                        'type': 'integer',
+                        'min': 1,
+                        'default': DEDUP_WINDOW_SIZE_DEFAULT
+                    }
+                }
+            },
+            'metrics': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'enabled': {
+                        'type': 'boolean',
+                        'default': METRICS_ENABLED_DEFAULT
+                    },
+                    'host': {
+                        'type': 'string',
+                        'empty': False,
+                        'default': METRICS_HOST_DEFAULT
+                    },
+                    'port': {
+                        'type': 'integer',
+                        'min': 0,
+                        'max': 65535,
+                        'default': METRICS_PORT_DEFAULT
+                    }
+                }
+            },
+            'control': {
+                'type': 'dict',
+                'default': {},
+                'schema': {
+                    'enabled': {
+                        'type': 'boolean',
+                        'default': CONTROL_ENABLED_DEFAULT
+                    },
+                    'socket': {
+                        'type': 'string',
+                        'empty': False,
+                        'default': CONTROL_SOCKET_DEFAULT
+                    }
+                }
+            },
+            'filters': {
+                'type': 'dict',
+                'keysrules': {
+                    'type': 'string',
+                    'allowed': [AUTH, TELEPHONY, TRUST_MONITOR, ACTIVITY]
+                },
+                'valuesrules': {'type': 'dict', 'schema': FILTER}
+            },
+            'aggregation': {
+                'type': 'dict',
+                'keysrules': {
+                    'type': 'string',
+                    'allowed': [AUTH, TELEPHONY, TRUST_MONITOR, ACTIVITY]
+                },
+                'valuesrules': {'type': 'dict', 'schema': AGGREGATION}
+            },
             'proxy': {
                 'type': 'dict',
                 'default': {},
@@ -121,30 +395,28 @@ class Config:
     }
 
     # Schema for a server inside of servers list
-    schema_registry.add(
-        'server',
-        {
-            'id': {'type': 'string', 'required': True, 'empty': False},
-            'hostname': {'type': 'string', 'required': True, 'empty': False},
-            'port': {
-                'type': 'integer',
-                'required': True,
-                'min': 0,
-                'max': 65535
-            },
-            'protocol': {
-                'type': 'string',
-                'required': True,
-                'oneof': [
-                    {
-                        'allowed': ['TCPSSL'],
-                        'dependencies': ['cert_filepath']
-                    },
-                    {'allowed': ['TCP', 'UDP']}
-                ]
-            },
-            'cert_filepath': {'type': 'string', 'empty': False}
-        })
+    SERVER = {
+        'id': {'type': 'string', 'required': True, 'empty': False},
+        'hostname': {'type': 'string', 'required': True, 'empty': False},
+        'port': {
+            'type': 'integer',
+            'required': True,
+            'min': 0,
+            'max': 65535
+        },
+        'protocol': {
+            'type': 'string',
+            'required': True,
+            'oneof': [
+                {
+                    'allowed': ['TCPSSL'],
+                    'dependencies': ['cert_filepath']
+                },
+                {'allowed': ['TCP', 'UDP']}
+            ]
+        },
+        'cert_filepath': {'type': 'string', 'empty': False}
+    }
 
     # List of servers and how DLS will communicate with them
     SERVERS = {
@@ -155,22 +427,19 @@ class Config:
     }
 
     # Describe which servers the logs of certain endpoints should be sent to
-    schema_registry.add(
-        'endpoint_server_mapping',
-        {
-            'server': {
-                'type': 'string',
-                'empty': False,
-                'required': True
-            },
-            'endpoints': {
-                'type': 'list',
-                'empty': False,
-                'required': True,
-                'allowed': [AUTH, TELEPHONY, TRUST_MONITOR, ACTIVITY]
-            }
+    ENDPOINT_SERVER_MAPPING = {
+        'server': {
+            'type': 'string',
+            'empty': False,
+            'required': True
+        },
+        'endpoints': {
+            'type': 'list',
+            'empty': False,
+            'required': True,
+            'allowed': [AUTH, TELEPHONY, TRUST_MONITOR, ACTIVITY]
         }
-    )
+    }
 
     # Account definition, which is used to access Duo logs and tell DLS which
     # logs to fetch and to which servers those logs should be sent
@@ -201,8 +470,9 @@ class Config:
         'account': ACCOUNT
     }
 
-    # Generate a Validator object with the given schema
-    SCHEMA_VALIDATOR = Validator(SCHEMA)
+    # Validator object for the schema, created when first needed since
+    # importing cerberus makes up most of the time DuoLogSync takes to start
+    _schema_validator = None
 
     # Private class variable, should not be accessed directly, only through
     # getter and setter methods
@@ -211,6 +481,12 @@ class Config:
     # Used to ensure that the _config variable is set once and only once
     _config_is_set = False
 
+    # Settings under dls_settings which cannot change without a restart
+    RESTART_REQUIRED_SETTINGS = [
+        'log_filepath', 'logging', 'checkpointing', 'dedup', 'metrics', 'archive',
+        'control'
+    ]
+
     @classmethod
     def _check_config_is_set(cls):
         """
@@ -237,6 +513,30 @@ class Config:
         cls._config = config
         cls._config_is_set = True
 
+    @classmethod
+    def reload(cls, config):
+        """
+        Replace the config set earlier by one read again from the config file.
+        Settings in RESTART_REQUIRED_SETTINGS keep their current values since
+        they are only used when DuoLogSync starts.
+
+        @param config   Dictionary to replace the current config with
+
+        @return the names of the settings in RESTART_REQUIRED_SETTINGS that
+                differ in config and were left unchanged
+        """
+        cls._check_config_is_set()
+
+        ignored_settings = []
+        for setting in cls.RESTART_REQUIRED_SETTINGS:
+            current_value = cls.get_value(['dls_settings', setting])
+            if config['dls_settings'][setting] != current_value:
+                ignored_settings.append(setting)
+            config['dls_settings'][setting] = current_value
+
+        cls._config = config
+        return ignored_settings
+
     @classmethod
     def get_value(cls, keys):
         """
@@ -270,14 +570,85 @@ class Config:
         return cls.get_value(['dls_settings', 'log_format'])
 
     @classmethod
-    def get_api_offset(cls):
+    def get_log_level(cls):
+        """@return the minimum level of DLS program messages to write"""
+        return cls.get_value(['dls_settings', 'logging', 'level'])
+
+    @classmethod
+    def get_log_max_bytes(cls):
+        """@return the size at which the DLS log file is rotated"""
+        return cls.get_value(['dls_settings', 'logging', 'max_bytes'])
+
+    @classmethod
+    def get_log_backup_count(cls):
+        """@return the number of rotated DLS log files to keep"""
+        return cls.get_value(['dls_settings', 'logging', 'backup_count'])
+
+    @classmethod
+    def get_log_rate_limit(cls):
+        """@return the per-minute limit of similar INFO messages to write"""
+        return cls.get_value(['dls_settings', 'logging', 'rate_limit'])
+
+    @classmethod
+    def get_api_setting(cls, name, log_type=None, child_account_id=None):
+        """
+        @param name             Name of the api setting
+        @param log_type         Log type of the stream using the setting
+        @param child_account_id MSP child account of the stream, if any
+
+        @return the value of the api setting for a stream, taken from the
+                overrides of its child account, then from the overrides of
+                its endpoint, then from the api settings of every endpoint
+        """
+
+        api_settings = cls.get_value(['dls_settings', 'api'])
+        endpoint_settings = api_settings.get('endpoints', {}).get(log_type, {})
+        child_settings = endpoint_settings.get('child_accounts', {}).get(child_account_id, {})
+
+        for settings in (child_settings, endpoint_settings, api_settings):
+            if name in settings:
+                return settings[name]
+
+        return None
+
+    @classmethod
+    def get_api_offset(cls, log_type=None, child_account_id=None):
         """@return the timestamp from which record retrieval should begin"""
-        return cls.get_value(['dls_settings', 'api', 'offset'])
+        return cls.get_api_setting('offset', log_type, child_account_id)
 
     @classmethod
-    def get_api_timeout(cls):
+    def get_api_timeout(cls, log_type=None, child_account_id=None):
         """@return the seconds to wait between API calls"""
-        return cls.get_value(['dls_settings', 'api', 'timeout'])
+        return cls.get_api_setting('timeout', log_type, child_account_id)
+
+    @classmethod
+    def get_api_max_timeout(cls, log_type=None, child_account_id=None):
+        """
+        @return the most seconds to wait between API calls of a stream whose
+                polls keep fetching no logs, or 0 to always wait the timeout
+        """
+        return cls.get_api_setting('max_timeout', log_type, child_account_id)
+
+    @classmethod
+    def get_api_jitter(cls):
+        """
+        @return the fraction of the poll interval by which polls of a stream
+                are moved at random, so that streams do not all poll at once
+        """
+        return cls.get_api_setting('jitter') or 0
+
+    @classmethod
+    def get_api_page_size(cls, log_type, child_account_id=None):
+        """
+        @return the number of records to request per API call, or None to
+                leave it up to the API
+        """
+
+        page_size = cls.get_api_setting('page_size', log_type, child_account_id)
+        if page_size is None:
+            return cls.API_PAGE_SIZE_DEFAULTS.get(log_type)
+
+        return min(page_size, cls.API_PAGE_SIZE_MAX.get(log_type, page_size))
 
     @classmethod
     def get_checkpointing_enabled(cls):
@@ -290,6 +661,132 @@ class Config:
         return cls.get_value(
             ['dls_settings', 'checkpointing', 'directory'])
 
+    @classmethod
+    def get_checkpoint_commit_interval(cls):
+        """@return the seconds to wait between checkpoint store commits"""
+        return cls.get_value(
+            ['dls_settings', 'checkpointing', 'commit_interval'])
+
+    @classmethod
+    def get_checkpoint_commit_records(cls):
+        """
+        @return the records acknowledged after which the checkpoint store
+                commits without waiting for the commit interval
+        """
+        return cls.get_value(
+            ['dls_settings', 'checkpointing', 'commit_records'])
+
+    @classmethod
+    def get_shutdown_drain_timeout(cls):
+        """
+        @return the seconds given to streams and writers to deliver the logs
+                already fetched once shutdown is initiated
+        """
+        return cls.get_value(['dls_settings', 'shutdown', 'drain_timeout'])
+
+    @classmethod
+    def get_supervisor_max_restarts(cls):
+        """
+        @return the restarts in a row after which a failing stream is
+                quarantined rather than restarted again
+        """
+        return cls.get_value(['dls_settings', 'supervisor', 'max_restarts'])
+
+    @classmethod
+    def get_supervisor_backoff(cls):
+        """@return the seconds to wait before restarting a failed stream"""
+        return cls.get_value(['dls_settings', 'supervisor', 'backoff'])
+
+    @classmethod
+    def get_supervisor_max_backoff(cls):
+        """
+        @return the most seconds to wait before restarting a failed stream,
+                and for how long a restarted stream must run to be healthy
+        """
+        return cls.get_value(['dls_settings', 'supervisor', 'max_backoff'])
+
+    @classmethod
+    def get_archive_enabled(cls):
+        """@return whether shipped records should be archived"""
+        return cls.get_value(['dls_settings', 'archive', 'enabled'])
+
+    @classmethod
+    def get_archive_dir(cls):
+        """@return the directory where shipped records are archived"""
+        return cls.get_value(['dls_settings', 'archive', 'directory'])
+
+    @classmethod
+    def get_archive_segment_seconds(cls):
+        """@return the seconds of record time covered by an archive segment"""
+        return cls.get_value(['dls_settings', 'archive', 'segment_seconds'])
+
+    @classmethod
+    def get_archive_retention_seconds(cls):
+        """
+        @return the seconds of record time an archive segment is kept for, or
+                0 to keep segments forever
+        """
+        return cls.get_value(['dls_settings', 'archive', 'retention_seconds'])
+
+    @classmethod
+    def get_archive_max_bytes(cls):
+        """
+        @return the most bytes of archive segments kept for a stream, or 0 for
+                no limit
+        """
+        return cls.get_value(['dls_settings', 'archive', 'max_bytes'])
+
+    @classmethod
+    def get_dedup_enabled(cls):
+        """@return whether recently written records should be deduplicated"""
+        return cls.get_value(['dls_settings', 'dedup', 'enabled'])
+
+    @classmethod
+    def get_dedup_window_size(cls):
+        """@return the number of recent record ids remembered per stream"""
+        return cls.get_value(['dls_settings', 'dedup', 'window_size'])
+
+    @classmethod
+    def get_filter_settings(cls, log_type):
+        """
+        @return the filter settings of a log type, or None if its records
+                are not filtered
+        """
+        return cls.get_value(['dls_settings']).get('filters', {}).get(log_type)
+
+    @classmethod
+    def get_aggregation_settings(cls, log_type):
+        """
+        @return the aggregation settings of a log type, or None if its
+                records are not rolled up
+        """
+        return cls.get_value(['dls_settings']).get('aggregation', {}).get(log_type)
+
+    @classmethod
+    def get_metrics_enabled(cls):
+        """@return whether the metrics endpoint should be served"""
+        return cls.get_value(['dls_settings', 'metrics', 'enabled'])
+
+    @classmethod
+    def get_metrics_host(cls):
+        """@return the address on which the metrics endpoint listens"""
+        return cls.get_value(['dls_settings', 'metrics', 'host'])
+
+    @classmethod
+    def get_metrics_port(cls):
+        """@return the port on which the metrics endpoint listens"""
+        return cls.get_value(['dls_settings', 'metrics', 'port'])
+
+    @classmethod
+    def get_control_enabled(cls):
+        """@return whether the control socket should be served"""
+        return cls.get_value(['dls_settings', 'control', 'enabled'])
+
+    @classmethod
+    def get_control_socket(cls):
+        """@return the path of the Unix socket on which DuoLogSync is controlled"""
+        return cls.get_value(['dls_settings', 'control', 'socket'])
+
     @classmethod
     def get_servers(cls):
         """@return the list of servers to which Duo logs will be written"""
@@ -336,14 +833,21 @@ class Config:
         return cls.get_value(['dls_settings', 'proxy', 'proxy_port'])
 
     @classmethod
-    def create_config(cls, config_filepath):
+    def create_config(cls, config_filepath, shutdown_on_error=True):
         """
         Attempt to read the file at config_filepath and generate a config
         Dictionary object based on a defined JSON schema
 
-        @param config_filepath  File from which to generate a config object
+        @param config_filepath      File from which to generate a config object
+        @param shutdown_on_error    Whether to shut DuoLogSync down if the
+                                    config file is not valid
+
+        @return the config Dictionary, or None if the config file is not valid
         """
 
+        # Imported here since it is only needed once, and slow to import
+        import yaml
+
         shutdown_reason = None
 
         try:
@@ -355,9 +859,6 @@ class Config:
                 # Check config against a schema to ensure all the needed fields
                 # and values are defined
                 config = cls._validate_and_normalize_config(config)
-                if config.get('dls_settings').get('api').get('timeout') < cls.API_TIMEOUT_DEFAULT:
-                    config['dls_settings']['api']['timeout'] = cls.API_TIMEOUT_DEFAULT
-                    Program.log(f'DuoLogSync: Setting default api timeout to {cls.API_TIMEOUT_DEFAULT} seconds.')
                 config['config_file_path'] = config_filepath
 
         # Will occur when given a bad filepath or a bad file
@@ -367,30 +868,73 @@ class Config:
                         'that the filename is correct')
 
         # Will occur if the config file does not contain valid YAML
-        except YAMLError as yaml_error:
+        except yaml.YAMLError as yaml_error:
             shutdown_reason = f"{yaml_error}"
             Program.log('DuoLogSync: Failed to parse the config file. Check '
                         'that the config file has valid YAML.')
 
         # Validation of the config against a schema failed
-        except ValueError:
-            shutdown_reason = f"{cls.SCHEMA_VALIDATOR.errors}"
+        except ValueError as value_error:
+            shutdown_reason = f"{value_error}" or f"{cls.get_schema_validator().errors}"
             Program.log('DuoLogSync: Validation of the config file failed. '
                         'Check that required fields have proper values.')
 
         # No exception raised during the try block, return config
         else:
-            # Calculate offset as a timestamp and rewrite its value in config
-            offset = config.get('dls_settings').get('api').get('offset')
-            offset = datetime.now(timezone.utc) - timedelta(days=offset)
-            config['dls_settings']['api']['offset'] = int(offset.timestamp())
+            api_settings = config['dls_settings']['api']
+            now = datetime.now(timezone.utc)
+            cls._normalize_api_settings(api_settings, now)
+
+            for endpoint_settings in api_settings.get('endpoints', {}).values():
+                cls._normalize_api_settings(endpoint_settings, now)
+
+                for child_settings in endpoint_settings.get('child_accounts', {}).values():
+                    cls._normalize_api_settings(child_settings, now)
+
             return config
 
         # At this point, it is guaranteed that an exception was raised, which
-        # means that it is shutdown time
-        Program.initiate_shutdown(shutdown_reason)
+        # means that it is shutdown time, unless the config is being reloaded
+        if shutdown_on_error:
+            Program.initiate_shutdown(shutdown_reason)
+        else:
+            Program.log("DuoLogSync: %s", logging.ERROR, shutdown_reason)
+
         return None
 
+    @classmethod
+    def _normalize_api_settings(cls, settings, now):
+        """
+        Enforce the minimum timeout and calculate the offset as a timestamp,
+        for the settings given among a dictionary of api settings
+
+        @param settings Dictionary of api settings to update in place
+        @param now      Time from which the offset in days is counted
+        """
+
+        if settings.get('timeout', cls.API_TIMEOUT_DEFAULT) < cls.API_TIMEOUT_DEFAULT:
+            settings['timeout'] = cls.API_TIMEOUT_DEFAULT
+            Program.log("DuoLogSync: Setting default api timeout to %s seconds.", logging.ERROR,
+                        cls.API_TIMEOUT_DEFAULT)
+
+        # Calculate offset as a timestamp and rewrite its value in config
+        if 'offset' in settings:
+            offset = now - timedelta(days=settings['offset'])
+            settings['offset'] = int(offset.timestamp())
+
+    @classmethod
+    def get_schema_validator(cls):
+        """@return the Validator object used to check configs against SCHEMA"""
+
+        if cls._schema_validator is None:
+            from cerberus import Validator, schema_registry  # type: ignore
+
+            schema_registry.add('server', cls.SERVER)
+            schema_registry.add('endpoint_server_mapping', cls.ENDPOINT_SERVER_MAPPING)
+            cls._schema_validator = Validator(cls.SCHEMA)
+
+        return cls._schema_validator
+
     @classmethod
     def _validate_and_normalize_config(cls, config):
         """
@@ -401,10 +945,17 @@ class Config:
         """
 
         # Config is not a valid structure
-        if not cls.SCHEMA_VALIDATOR.validate(config):
+        if not cls.get_schema_validator().validate(config):
             raise ValueError
 
-        config = cls.SCHEMA_VALIDATOR.normalized(config)
+        config = cls.get_schema_validator().normalized(config)
+
+        # Offsets would only be saved on shutdown, so a crash would resend
+        # every log fetched since DuoLogSync started
+        checkpointing = config['dls_settings']['checkpointing']
+        if not checkpointing['commit_interval'] and not checkpointing['commit_records']:
+            raise ValueError("checkpointing commit_interval and commit_records cannot both be 0")
+
         return config
 
     @staticmethod
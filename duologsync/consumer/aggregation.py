@@ -0,0 +1,132 @@
+"""
+Definition of the Aggregator class
+"""
+
+import json
+
+from duologsync.config import Config
+from duologsync.consumer.filter import (
+    CHILD_ACCOUNT_ID_FIELD, compile_conditions, compile_paths, get_path,
+    include_paths, matches_any
+)
+from duologsync.util import get_log_timestamp
+
+# Fields holding the time of an event in one of the log types, copied from the
+# last record rolled up into a summary so the summary sorts like a record
+TIMESTAMP_FIELDS = ('timestamp', 'isotimestamp', 'ts', 'surfaced_timestamp')
+
+# Field of a summary record describing the records rolled up into it
+AGGREGATION_FIELD = 'aggregation'
+
+
+def get_hashable(value):
+    """
+    @return value, or a string representing it if it cannot be hashed
+    """
+
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+
+    return value
+
+
+class Aggregator:
+    """
+    Roll up the records of a page sharing the same values for key fields
+    within a time window into a single summary record, configured under
+    dls_settings.aggregation for a log type. A summary holds the key fields,
+    the time fields of the last record rolled up and, under 'aggregation', the
+    number of records rolled up with the time of the first and last one.
+    Records matching a pass_through condition, or without a time, are never
+    rolled up. Summaries are made at the end of every page so that the offset
+    saved after a page covers only records that were delivered.
+    """
+
+    def __init__(self, key, window=None, pass_through=None):
+        self.key_paths = [path.split('.') for path in key]
+        self.key_tree = compile_paths(list(key) + [CHILD_ACCOUNT_ID_FIELD])
+        self.window = window or Config.AGGREGATION_WINDOW_DEFAULT
+        self.pass_through_conditions = compile_conditions(pass_through)
+
+        # Maps (window start, key values) to [first record, count, first time,
+        # last time, last record] for the page being consumed
+        self.groups = {}
+
+    @staticmethod
+    def create(log_type):
+        """
+        @return an Aggregator for the given log type if aggregation is
+                configured for it, otherwise None
+        """
+
+        settings = Config.get_aggregation_settings(log_type)
+
+        if not settings:
+            return None
+
+        return Aggregator(**settings)
+
+    def add(self, log):
+        """
+        Roll log up into the summary of its key and window
+
+        @param log  Record to roll up
+
+        @return whether log was rolled up, otherwise it should be written as is
+        """
+
+        if matches_any(log, self.pass_through_conditions):
+            return False
+
+        timestamp = get_log_timestamp(log)
+        if timestamp is None:
+            return False
+
+        group_key = (timestamp // self.window,) + tuple(
+            get_hashable(get_path(log, keys)) for keys in self.key_paths)
+        group = self.groups.get(group_key)
+
+        if group is None:
+            self.groups[group_key] = [log, 1, timestamp, timestamp, log]
+        else:
+            group[1] += 1
+            group[2] = min(group[2], timestamp)
+            group[3] = max(group[3], timestamp)
+            group[4] = log
+
+        return True
+
+    def flush(self):
+        """
+        @return a list of (summary record, number of records rolled up into
+                it) for every key and window seen since the last flush, in the
+                order they were first seen. A record that was rolled up alone
+                is returned as is, with a count of 1.
+        """
+
+        summaries = []
+
+        for first_log, count, first_timestamp, last_timestamp, last_log in self.groups.values():
+            if count == 1:
+                summaries.append((first_log, 1))
+                continue
+
+            summary = include_paths(first_log, self.key_tree)
+            for field in TIMESTAMP_FIELDS:
+                if field in last_log:
+                    summary[field] = last_log[field]
+
+            summary[AGGREGATION_FIELD] = {
+                'count': count,
+                'first_timestamp': first_timestamp,
+                'last_timestamp': last_timestamp,
+                'window_seconds': self.window,
+            }
+            summaries.append((summary, count))
+
+        self.groups = {}
+        return summaries
+
+    def reset(self):
+        """Forget the records rolled up since the last flush"""
+        self.groups = {}
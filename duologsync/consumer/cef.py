@@ -5,6 +5,7 @@ Definition of functions for creating CEF-type logs
 import socket
 from datetime import datetime
 from duologsync.config import Config
+from duologsync.consumer.aggregation import AGGREGATION_FIELD
 from duologsync.__version__ import __version__
 
 # What follows are required prefix fields for every CEF message
@@ -59,6 +60,9 @@ def log_to_cef(log, keys_to_labels, log_type):
     ])
 
     extension = _construct_extension(log, keys_to_labels)
+    aggregation_extension = _construct_aggregation_extension(log)
+    if aggregation_extension:
+        extension = ' '.join([extension, aggregation_extension])
     msg = header + '|' + extension
     cef_log = ' '.join([syslog_header, msg])
 
@@ -104,3 +108,25 @@ def _construct_extension(log, keys_to_labels):
 
     extensions = ' '.join(extensions)
     return extensions
+
+
+def _construct_aggregation_extension(log):
+    """
+    Create the extensions describing the records rolled up into a summary:
+    their number as cnt, and the time of the first and last one in
+    milliseconds as start and end
+
+    @param log  The log to convert into a CEF message
+
+    @return the extensions, or an empty string if log is not a summary
+    """
+
+    aggregation = log.get(AGGREGATION_FIELD)
+    if not isinstance(aggregation, dict):
+        return ''
+
+    return ' '.join([
+        f"cnt={aggregation['count']}",
+        f"start={int(aggregation['first_timestamp'] * 1000)}",
+        f"end={int(aggregation['last_timestamp'] * 1000)}",
+    ])
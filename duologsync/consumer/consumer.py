@@ -2,24 +2,35 @@
 Definition of the Consumer class
 """
 
-import os
 import json
 import logging
+import time
 import traceback
+from duologsync.archive import Archive
+from duologsync.backfill import BackfillProgress, CycleEnd
+from duologsync.checkpoint import CheckpointStore
 from duologsync.config import Config
+from duologsync.metrics import (
+    BYTES_WRITTEN, CHECKPOINT_AGE, INGESTION_LAG, QUEUE_DEPTH, RECORDS_AGGREGATED,
+    RECORDS_FILTERED, RECORDS_WRITTEN, Metrics, stream_labels
+)
+from duologsync.profiling import FORMAT_LOG, UPDATE_LOG_CHECKPOINT, WRITE, StageTimer
 from duologsync.program import Program
 from duologsync.producer.producer import Producer
+from duologsync.consumer.aggregation import Aggregator
 from duologsync.consumer.cef import log_to_cef
-from duologsync.util import extract_error_info
+from duologsync.consumer.dedup import DedupWindow
+from duologsync.consumer.filter import RecordFilter
+from duologsync.util import extract_error_info, get_log_timestamp
 
 
 class Consumer:
     """
     Read logs from a queue shared with a producer object and write those logs
-    somewhere using the write objects passed. Additionally, once logs have been
-    written successfully, take the latest log_offset - also shared with the
-    Producer pair - and save it to a checkpointing file in order to recover
-    progress if a crash occurs.
+    somewhere using the write objects passed, until the producer stops.
+    Additionally, the last log written successfully is kept as a watermark,
+    whose offset is saved to the checkpoint store whenever the store commits
+    in order to recover progress if a crash occurs.
     """
 
     def __init__(self, log_format, log_queue, writer, child_account_id=None):
@@ -29,7 +40,14 @@ class Consumer:
         self.log_queue = log_queue
         self.writer = writer
         self.log_offset = None
+        self.acknowledged_log = None
         self.child_account_id = child_account_id
+        self.dedup_window = None
+        self.record_filter = None
+        self.aggregator = None
+        self.metric_labels = None
+        self.stage_timer = None
+        self.backfill = None
 
     async def consume(self):
         """
@@ -38,71 +56,261 @@ class Consumer:
         protocol to respective SIEMs or servers.
         """
 
-        while Program.is_running():
-            Program.log(f"{self.log_type} consumer: waiting for logs", logging.INFO)
+        # Created here since log_type is only known once subclasses are set up
+        self.dedup_window = DedupWindow.create(self.log_type, self.child_account_id)
+        self.record_filter = RecordFilter.create(self.log_type)
+        self.aggregator = Aggregator.create(self.log_type)
+        self.metric_labels = stream_labels(self.log_type, self.child_account_id)
+        self.stage_timer = StageTimer(self.metric_labels)
+        # Tracked by the producer of the stream, created before this consumer
+        self.backfill = BackfillProgress.get(self.log_type, self.child_account_id)
 
-            # Call unblocks only when there is an element in the queue to get
-            logs = await self.log_queue.get()
+        # Offsets are only computed when the checkpoint store commits
+        CheckpointStore.add_watermark(self.save_watermark)
 
-            # Time to shutdown
-            if not Program.is_running():
-                continue
+        try:
+            while True:
+                Program.log("%s consumer: waiting for logs", logging.INFO, self.log_type)
 
-            Program.log(
-                f"{self.log_type} consumer: received {len(logs)} logs from queue",
-                logging.INFO,
+                # Call unblocks only when there is an element in the queue to get
+                logs = await self.log_queue.get()
+                Metrics.set(QUEUE_DEPTH, self.metric_labels, self.log_queue.qsize())
+
+                # Every page of the cycle before the marker was written
+                if isinstance(logs, CycleEnd):
+                    if self.backfill:
+                        self.backfill.cycle_done(logs.position, logs.poll_interval)
+                    continue
+
+                # The producer puts [] once it stopped, after its last page, so
+                # pages already fetched are written before shutting down
+                if not logs and not Program.is_running():
+                    break
+
+                Program.log(
+                    "%s consumer: received %s logs from queue",
+                    logging.INFO,
+                    self.log_type,
+                    len(logs),
+                )
+
+                # Keep track of the latest log written in the case that a problem
+                # occurs in the middle of writing logs
+                last_log_written = None
+                successful_write = False
+                duplicates_dropped = 0
+                records_filtered = 0
+                records_aggregated = 0
+                records_written = 0
+                bytes_written = 0
+                format_duration = 0
+                write_duration = 0
+
+                # If we are sending empty [] to unblock consumers, nothing should be written to file
+                if logs:
+                    # Read once so that a config reload cannot swap it mid-page
+                    aggregator = self.aggregator
+                    rolled_up_logs = []
+                    # Records as they were shipped, before being formatted
+                    shipped_logs = [] if Archive.is_archiving() else None
+                    # Records added to the dedup window, journaled once written
+                    deduplicated_logs = []
+
+                    try:
+                        Program.log("%s consumer: writing logs", logging.INFO, self.log_type)
+                        if aggregator:
+                            aggregator.reset()
+
+                        for log in logs:
+                            # Already delivered before a restart, skip formatting and writing
+                            if self.dedup_window and self.dedup_window.is_duplicate(log):
+                                duplicates_dropped += 1
+                                last_log_written = log
+                                continue
+
+                            # Dropped by filters, but covered by the offset
+                            record_filter = self.record_filter
+                            if record_filter and record_filter.is_dropped(log):
+                                records_filtered += 1
+                                last_log_written = log
+                                continue
+
+                            if self.child_account_id:
+                                log["child_account_id"] = self.child_account_id
+
+                            # Written as part of a summary once the page is read
+                            if aggregator and aggregator.add(log):
+                                rolled_up_logs.append(log)
+                                continue
+
+                            format_start = time.perf_counter()
+                            shipped_log = record_filter.project(log) if record_filter else log
+                            formatted_log = self.format_log(shipped_log)
+                            write_start = time.perf_counter()
+                            await self.writer.write(formatted_log, self.log_type)
+                            write_duration += time.perf_counter() - write_start
+                            format_duration += write_start - format_start
+                            last_log_written = log
+                            records_written += 1
+                            bytes_written += len(formatted_log)
+                            if shipped_logs is not None:
+                                shipped_logs.append(shipped_log)
+
+                            # Logs rolled up before this one are not delivered yet
+                            if not rolled_up_logs:
+                                self.acknowledged_log = log
+
+                            if self.dedup_window:
+                                self.dedup_window.add(log)
+                                deduplicated_logs.append(log)
+
+                        if rolled_up_logs:
+                            for summary, count in aggregator.flush():
+                                format_start = time.perf_counter()
+                                # Summaries only hold the key fields, leave them be
+                                if record_filter and count == 1:
+                                    shipped_log = record_filter.project(summary)
+                                else:
+                                    shipped_log = summary
+                                formatted_log = self.format_log(shipped_log)
+                                write_start = time.perf_counter()
+                                await self.writer.write(formatted_log, self.log_type)
+                                write_duration += time.perf_counter() - write_start
+                                format_duration += write_start - format_start
+                                records_written += 1
+                                bytes_written += len(formatted_log)
+                                if shipped_logs is not None:
+                                    shipped_logs.append(shipped_log)
+                                if count > 1:
+                                    records_aggregated += count
+
+                            # Every log of the page is now delivered
+                            last_log_written = logs[-1]
+                            if self.dedup_window:
+                                for log in rolled_up_logs:
+                                    self.dedup_window.add(log)
+                                deduplicated_logs.extend(rolled_up_logs)
+
+                        # All the logs were written successfully
+                        successful_write = True
+
+                    # Specifically watch out for errno 32 - Broken pipe. This means
+                    # that the connect established by writer was reset or shutdown.
+                    except OSError as conn_error:
+                        err = extract_error_info(conn_error)
+                        shutdown_reason = (f"{self.log_type} consumer: connection error - [{conn_error} error_code: {err['error_code']}]")
+                        Program.log("%s consumer: %s - connection to the destination server was reset or shutdown - error_message: %s error_code: %s\n%s", logging.ERROR, self.log_type, type(conn_error).__name__, err['error_message'], err['error_code'], traceback.format_exc())
+                        Program.initiate_shutdown(shutdown_reason)
+
+                    finally:
+                        if successful_write:
+                            Program.log(
+                                "%s consumer: successfully wrote all logs",
+                                logging.INFO,
+                                self.log_type,
+                            )
+                        else:
+                            Program.log(
+                                "%s consumer: failed to write some logs",
+                                logging.WARNING,
+                                self.log_type,
+                            )
+
+                        if duplicates_dropped:
+                            Program.log(
+                                "%s consumer: dropped %s already delivered logs",
+                                logging.INFO,
+                                self.log_type,
+                                duplicates_dropped,
+                            )
+
+                        # Logs rolled up into summaries that were not all written
+                        # are fetched again rather than skipped by the offset
+                        if rolled_up_logs and not successful_write:
+                            last_log_written = None
+
+                        if records_filtered:
+                            Program.log(
+                                "%s consumer: dropped %s logs matching filters",
+                                logging.INFO,
+                                self.log_type,
+                                records_filtered,
+                            )
+
+                        if records_aggregated:
+                            Program.log(
+                                "%s consumer: rolled up %s logs into summaries",
+                                logging.INFO,
+                                self.log_type,
+                                records_aggregated,
+                            )
+
+                        if deduplicated_logs:
+                            self.dedup_window.journal(deduplicated_logs)
+
+                        if shipped_logs:
+                            Archive.append(self.log_type, self.child_account_id, shipped_logs)
+
+                        Metrics.inc(RECORDS_WRITTEN, self.metric_labels, records_written)
+                        Metrics.inc(RECORDS_FILTERED, self.metric_labels, records_filtered)
+                        Metrics.inc(RECORDS_AGGREGATED, self.metric_labels, records_aggregated)
+                        Metrics.inc(BYTES_WRITTEN, self.metric_labels, bytes_written)
+                        self.stage_timer.record(FORMAT_LOG, format_duration)
+                        self.stage_timer.record(WRITE, write_duration)
+
+                        if successful_write:
+                            records_acknowledged = len(logs)
+                        else:
+                            records_acknowledged = (
+                                records_written + duplicates_dropped + records_filtered)
+                        CheckpointStore.acknowledge(records_acknowledged)
+
+                        # Nothing to checkpoint if not even the first log was written
+                        if last_log_written is not None:
+                            self.acknowledged_log = last_log_written
+
+                            event_timestamp = get_log_timestamp(last_log_written)
+                            if event_timestamp is not None:
+                                Metrics.set(INGESTION_LAG, self.metric_labels, event_timestamp)
+
+                            if self.backfill:
+                                self.backfill.shipped(records_acknowledged, event_timestamp)
+                else:
+                    Program.log("%s consumer: No logs to write", logging.INFO, self.log_type)
+
+                # The connection failed and shutdown was initiated, the pages
+                # left are fetched again after a restart
+                if logs and not successful_write:
+                    break
+        finally:
+            self.save_watermark()
+            CheckpointStore.remove_watermark(self.save_watermark)
+
+        Program.log("%s consumer: shutting down", logging.INFO, self.log_type)
+
+    def save_watermark(self):
+        """
+        Save the offset of the last log acknowledged by the server, along with
+        the window of recently written logs, to the checkpoint store. Called
+        by the store before every commit, so the offset is computed once per
+        commit however many logs were written since the last one.
+        """
+
+        log = self.acknowledged_log
+        if log is None:
+            return
+
+        self.acknowledged_log = None
+        self.log_offset = Producer.get_log_offset(
+            log, current_log_offset=self.log_offset, log_type=self.log_type
+        )
+        with self.stage_timer.time(UPDATE_LOG_CHECKPOINT):
+            self.update_log_checkpoint(
+                self.log_type, self.log_offset, self.child_account_id
             )
 
-            # Keep track of the latest log written in the case that a problem
-            # occurs in the middle of writing logs
-            last_log_written = None
-            successful_write = False
-
-            # If we are sending empty [] to unblock consumers, nothing should be written to file
-            if logs:
-                try:
-                    Program.log(f"{self.log_type} consumer: writing logs", logging.INFO)
-                    for log in logs:
-                        if self.child_account_id:
-                            log["child_account_id"] = self.child_account_id
-                        await self.writer.write(self.format_log(log), self.log_type)
-                        last_log_written = log
-
-                    # All the logs were written successfully
-                    successful_write = True
-
-                # Specifically watch out for errno 32 - Broken pipe. This means
-                # that the connect established by writer was reset or shutdown.
-                except OSError as conn_error:
-                    err = extract_error_info(conn_error)
-                    shutdown_reason = (f"{self.log_type} consumer: connection error - [{conn_error} error_code: {err['error_code']}]")
-                    Program.log(f"{self.log_type} consumer: {type(conn_error).__name__} - connection to the destination server was reset or shutdown - error_message: {err['error_message']} error_code: {err['error_code']}\n{traceback.format_exc()}", logging.ERROR,)
-                    Program.initiate_shutdown(shutdown_reason)
-
-                finally:
-                    if successful_write:
-                        Program.log(
-                            f"{self.log_type} consumer: successfully wrote all logs",
-                            logging.INFO,
-                        )
-                    else:
-                        Program.log(
-                            f"{self.log_type} consumer: failed to write some logs",
-                            logging.WARNING,
-                        )
-
-                    self.log_offset = Producer.get_log_offset(
-                        last_log_written,
-                        current_log_offset=self.log_offset,
-                        log_type=self.log_type,
-                    )
-                    self.update_log_checkpoint(
-                        self.log_type, self.log_offset, self.child_account_id
-                    )
-            else:
-                Program.log(f"{self.log_type} consumer: No logs to write", logging.INFO)
-
-        Program.log(f"{self.log_type} consumer: shutting down", logging.INFO)
+        if self.dedup_window:
+            self.dedup_window.save()
 
     def format_log(self, log):
         """
@@ -127,23 +335,14 @@ class Consumer:
     @staticmethod
     def update_log_checkpoint(log_type, log_offset, child_account_id):
         """
-        Save log_offset to the checkpoint file for log_type.
+        Save log_offset to the checkpoint store under the stream for log_type.
+        The store commits the offset to disk shortly after, off the event loop.
 
-        @param log_type     Used to determine which checkpoint file to open
-        @param log_offset   Information to save in the checkpoint file
+        @param log_type         Used to determine which stream to save under
+        @param log_offset       Information to save in the checkpoint store
+        @param child_account_id MSP child account of the stream, if any
         """
 
-        checkpoint_filename = f"{log_type}_checkpoint_data_" + child_account_id + ".txt" if child_account_id else f"{log_type}_checkpoint_data.txt"
-        checkpoint_file_path = os.path.join(Config.get_checkpoint_dir(), checkpoint_filename)
-
-        if os.path.exists(checkpoint_file_path):
-            Program.log(f"{log_type} consumer: saving latest log offset '{log_offset}' to a checkpoint file '{checkpoint_file_path}'", logging.INFO)
-        else:
-            Program.log(f"{log_type} consumer: checkpoint file '{checkpoint_file_path}' doesn't exist and it will be created to save the latest offset '{log_offset}'", logging.INFO)
-
-        # Open file checkpoint_filename in writing mode only
-        checkpoint_file = open(checkpoint_file_path, "w")
-        checkpoint_file.write(json.dumps(log_offset) + "\n")
-
-        # According to Python docs, closing a file also flushes the file
-        checkpoint_file.close()
+        Program.log("%s consumer: saving latest log offset '%s' to the checkpoint store", logging.INFO, log_type, log_offset)
+        CheckpointStore.set_offset(log_type, log_offset, child_account_id)
+        Metrics.set(CHECKPOINT_AGE, stream_labels(log_type, child_account_id), time.time())
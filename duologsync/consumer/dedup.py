@@ -0,0 +1,198 @@
+"""
+Definition of the DedupWindow class
+"""
+
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from duologsync.checkpoint import CheckpointStore, atomic_write_json
+from duologsync.config import Config
+from duologsync.program import Program
+
+# Field uniquely identifying a record of each log type
+LOG_TYPE_TO_ID_FIELD = {
+    Config.AUTH: 'txid',
+    Config.TELEPHONY: 'telephony_id',
+    Config.ACTIVITY: 'activity_id',
+    Config.TRUST_MONITOR: 'sv_id'
+}
+
+# Name under which dedup windows are saved in the checkpoint store
+DEDUP_STATE = 'dedup'
+
+# Pages appended to the journal of a window before it is rewritten with only
+# the ids of the window
+JOURNAL_MAX_PAGES = 100
+
+
+def get_journal_path(directory, log_type, child_account_id=None):
+    """@return the path of the journal of the dedup window of a stream"""
+
+    suffix = f"_{child_account_id}" if child_account_id else ''
+    return os.path.join(directory, f"duologsync_dedup_{log_type}{suffix}.jsonl")
+
+
+def read_journal(path):
+    """
+    @param path Journal of a dedup window
+
+    @return the ids saved in the journal, oldest first. A line cut short by
+            a crash is skipped.
+    """
+
+    ids = []
+
+    try:
+        with open(path) as journal_file:
+            for line in journal_file:
+                try:
+                    page_ids = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(page_ids, list):
+                    ids.extend(page_ids)
+    except FileNotFoundError:
+        pass
+    except OSError as os_error:
+        Program.log("DuoLogSync: could not read dedup journal '%s' due to error: %s",
+                    logging.WARNING, path, os_error)
+
+    return ids
+
+
+class DedupWindow:
+    """
+    Bounded, least-recently-used set of the ids of records recently written
+    by a consumer. The ids of every page written are appended to a journal
+    next to the checkpoint store right away, ahead of the offset of the
+    stream, and the window is also saved in the store along with the offset.
+    After a restart, or a crash between writing and checkpointing, records
+    that were already delivered but not yet covered by the saved offset are
+    thus dropped instead of being shipped a second time.
+    """
+
+    def __init__(self, log_type, child_account_id=None, size=None):
+        self.log_type = log_type
+        self.child_account_id = child_account_id
+        self.id_field = LOG_TYPE_TO_ID_FIELD.get(log_type)
+        self.size = size or Config.DEDUP_WINDOW_SIZE_DEFAULT
+
+        directory = CheckpointStore.get_directory()
+        self.journal_path = (
+            get_journal_path(directory, log_type, child_account_id)
+            if directory is not None else None)
+        self.journal_pages = 0
+
+        saved_ids = CheckpointStore.get_state(
+            DEDUP_STATE, log_type, child_account_id) or []
+        if self.journal_path is not None:
+            saved_ids = saved_ids + read_journal(self.journal_path)
+
+        self.recent_ids = OrderedDict()
+        for log_id in saved_ids:
+            self.add_id(log_id)
+
+    @staticmethod
+    def create(log_type, child_account_id=None):
+        """
+        @return a DedupWindow for the given stream if deduplication is enabled
+                in config, otherwise None
+        """
+
+        if not Config.get_dedup_enabled():
+            return None
+
+        return DedupWindow(
+            log_type, child_account_id, size=Config.get_dedup_window_size())
+
+    def get_id(self, log):
+        """
+        @param log  Record from which to retrieve an id
+
+        @return the id of log or None if it does not have one
+        """
+
+        if self.id_field is None:
+            return None
+
+        return log.get(self.id_field)
+
+    def is_duplicate(self, log):
+        """
+        @param log  Record to check
+
+        @return whether a record with the same id was recently written
+        """
+
+        log_id = self.get_id(log)
+
+        return log_id is not None and log_id in self.recent_ids
+
+    def add(self, log):
+        """
+        Remember the id of a record that has been written, evicting the least
+        recently written id if the window is full
+
+        @param log  Record that has been written
+        """
+
+        log_id = self.get_id(log)
+
+        if log_id is not None:
+            self.add_id(log_id)
+
+    def add_id(self, log_id):
+        """
+        Remember the id of a record that has been written
+
+        @param log_id   Id of the record
+        """
+
+        self.recent_ids[log_id] = None
+        self.recent_ids.move_to_end(log_id)
+
+        if len(self.recent_ids) > self.size:
+            self.recent_ids.popitem(last=False)
+
+    def journal(self, logs):
+        """
+        Append the ids of records just written to the journal of the window,
+        so that they are known after a crash before the next commit of the
+        checkpoint store. The journal is rewritten with only the ids of the
+        window once it holds JOURNAL_MAX_PAGES pages.
+
+        @param logs Records that have been written
+        """
+
+        if self.journal_path is None:
+            return
+
+        ids = [log_id for log_id in map(self.get_id, logs) if log_id is not None]
+        if not ids:
+            return
+
+        try:
+            if self.journal_pages >= JOURNAL_MAX_PAGES:
+                atomic_write_json(self.journal_path, list(self.recent_ids))
+                self.journal_pages = 0
+            else:
+                # Lines start with a newline, as the rewritten journal does
+                # not end with one
+                with open(self.journal_path, 'a') as journal_file:
+                    journal_file.write('\n' + json.dumps(ids, separators=(',', ':')))
+                self.journal_pages += 1
+        except OSError as os_error:
+            Program.log("DuoLogSync: could not append to dedup journal '%s' due to error: %s",
+                        logging.WARNING, self.journal_path, os_error)
+
+    def save(self):
+        """
+        Record the window in the checkpoint store to be persisted by the next
+        commit
+        """
+
+        CheckpointStore.set_state(
+            DEDUP_STATE, self.log_type, list(self.recent_ids),
+            self.child_account_id)
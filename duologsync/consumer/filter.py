@@ -0,0 +1,196 @@
+"""
+Definition of the RecordFilter class
+"""
+
+from duologsync.config import Config
+
+# Added to records of MSP child accounts by DuoLogSync, kept by include_fields
+CHILD_ACCOUNT_ID_FIELD = 'child_account_id'
+
+
+def compile_paths(paths):
+    """
+    @param paths    Dotted field paths, such as 'access_device.location'
+
+    @return a tree of nested dictionaries of the keys of every path, in which
+            None marks the end of a path. A path also covers every path it
+            is a prefix of.
+    """
+
+    tree = {}
+
+    for path in paths:
+        node = tree
+        *parents, last = path.split('.')
+
+        for key in parents:
+            child = node.setdefault(key, {})
+            # A shorter path already covers this one
+            if child is None:
+                break
+            node = child
+        else:
+            node[last] = None
+
+    return tree
+
+
+def compile_conditions(conditions):
+    """
+    @param conditions   List of dictionaries with a dotted field path under
+                        'field' and a list of values under 'values'
+
+    @return the conditions in the form expected by matches_any
+    """
+
+    return [
+        (condition['field'].split('.'), condition['values'])
+        for condition in conditions or []
+    ]
+
+
+def get_path(record, keys):
+    """
+    @param record   Record from which to retrieve a value
+    @param keys     Keys of a field path, as split by compile_conditions
+
+    @return the value at the end of the field path, or None if the path does
+            not lead to a value
+    """
+
+    value = record
+
+    for key in keys:
+        value = value.get(key) if isinstance(value, dict) else None
+
+    return value
+
+
+def matches_any(record, conditions):
+    """
+    @param record       Record to check
+    @param conditions   Conditions returned by compile_conditions
+
+    @return whether the field of any condition is equal to one of its values
+    """
+
+    for keys, values in conditions:
+        value = get_path(record, keys)
+
+        if value is not None and value in values:
+            return True
+
+    return False
+
+
+def include_paths(record, tree):
+    """
+    @return a copy of record containing only the fields in tree
+    """
+
+    included = {}
+
+    for key, subtree in tree.items():
+        if key not in record:
+            continue
+
+        value = record[key]
+        if subtree is None:
+            included[key] = value
+        elif isinstance(value, dict):
+            included[key] = include_paths(value, subtree)
+
+    return included
+
+
+def exclude_paths(record, tree):
+    """
+    @return record without the fields in tree. Dictionaries are copied only
+            when a field is removed from them, record itself is not modified.
+    """
+
+    excluded = record
+
+    for key, subtree in tree.items():
+        value = record.get(key)
+
+        if subtree is not None:
+            # Nothing to remove below a missing field or a non dictionary
+            if not isinstance(value, dict):
+                continue
+
+            value = exclude_paths(value, subtree)
+            if value is record[key]:
+                continue
+
+        elif key not in record:
+            continue
+
+        if excluded is record:
+            excluded = dict(record)
+
+        if subtree is None:
+            del excluded[key]
+        else:
+            excluded[key] = value
+
+    return excluded
+
+
+class RecordFilter:
+    """
+    Filter and projection of the records of a stream, configured under
+    dls_settings.filters for its log type. Records matching any of the drop
+    conditions are not written, and the records written are reduced to the
+    fields in include_fields, if given, minus the fields in exclude_fields.
+    Conditions and field paths are compiled once, when the filter is created.
+    """
+
+    def __init__(self, drop=None, include_fields=None, exclude_fields=None):
+        self.drop_conditions = compile_conditions(drop)
+
+        self.include_tree = None
+        if include_fields:
+            self.include_tree = compile_paths(
+                list(include_fields) + [CHILD_ACCOUNT_ID_FIELD])
+
+        self.exclude_tree = compile_paths(exclude_fields or [])
+
+    @staticmethod
+    def create(log_type):
+        """
+        @return a RecordFilter for the given log type if one is configured,
+                otherwise None
+        """
+
+        settings = Config.get_filter_settings(log_type)
+
+        if not settings:
+            return None
+
+        return RecordFilter(**settings)
+
+    def is_dropped(self, log):
+        """
+        @param log  Record to check
+
+        @return whether log matches any of the drop conditions
+        """
+
+        return matches_any(log, self.drop_conditions)
+
+    def project(self, log):
+        """
+        @param log  Record to project, which is not modified
+
+        @return log reduced to the configured fields, or log itself if no
+                field has to be removed
+        """
+
+        if self.include_tree is not None:
+            log = include_paths(log, self.include_tree)
+
+        if self.exclude_tree:
+            log = exclude_paths(log, self.exclude_tree)
+
+        return log
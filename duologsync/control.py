@@ -0,0 +1,490 @@
+"""
+Definition of the Control class
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import time
+
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.metrics import RECORDS_FETCHED, RECORDS_WRITTEN, Metrics, stream_labels
+from duologsync.program import Program
+from duologsync.scheduler import Scheduler
+from duologsync.streams import Streams
+
+# Maps every command accepted on the control socket to the Control method
+# carrying it out
+CONTROL_COMMANDS = {
+    'streams': 'list_streams',
+    'pause': 'pause_stream',
+    'resume': 'resume_stream',
+    'set': 'set_settings',
+    'reset': 'reset_settings',
+    'flush': 'flush_checkpoints',
+    'dump': 'dump_state',
+}
+
+# Api settings of a stream which can be changed through the control socket
+CONTROL_SETTINGS = ('timeout', 'max_timeout', 'page_size')
+
+# Seconds a client waits for DuoLogSync to answer a request
+CONTROL_TIMEOUT = 10
+
+
+class ControlError(Exception):
+    """
+    Raised for a request made on the control socket that cannot be carried
+    out, the message of which is sent back to the client
+    """
+
+
+def send_control_request(path, request, timeout=CONTROL_TIMEOUT):
+    """
+    Send a request to the control socket of a running DuoLogSync
+
+    @param path     Path of the control socket
+    @param request  Dictionary with the command to run and its arguments
+    @param timeout  Seconds to wait for the response
+
+    @return the response as a dictionary, with 'ok' set to whether the
+            command was carried out along with its 'result' or 'error'
+
+    @raise OSError if the socket cannot be reached, ValueError if the
+           response is not valid
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as control_socket:
+        control_socket.settimeout(timeout)
+        control_socket.connect(path)
+        control_socket.sendall(json.dumps(request).encode() + b'\n')
+
+        with control_socket.makefile('rb') as responses:
+            response = responses.readline()
+
+    if not response:
+        raise ValueError('the connection was closed without a response')
+
+    return json.loads(response)
+
+
+def get_task_state(task):
+    """@return whether an asyncio task is running, cancelled, done or failed"""
+
+    if not task.done():
+        return 'running'
+    if task.cancelled():
+        return 'cancelled'
+    if task.exception() is not None:
+        return f"failed: {task.exception()}"
+    return 'done'
+
+
+class Control:
+    """
+    Like the Metrics class, Control is not meant to be instantiated. It serves
+    a local Unix domain socket through which a running DuoLogSync is inspected
+    and steered: streams are listed with live stats, paused and resumed, their
+    poll interval and page size are changed, checkpoints are committed on
+    demand and the state of queues and connections is dumped. Every request
+    and response is a JSON object on a line of its own.
+
+    Changes made through the socket last until the stream stops, they are not
+    saved to the config.
+    """
+
+    # Maps the id of every server to its writer, kept up to date by reloads
+    _server_to_writer = {}
+
+    # Connections of clients, closed when the server stops
+    _connections = set()
+
+    @classmethod
+    async def start_server(cls, path, server_to_writer):
+        """
+        Start serving control requests on the Unix domain socket at path,
+        which only the user running DuoLogSync can connect to. A socket left
+        behind by a DuoLogSync which did not shut down is replaced.
+
+        @param path             Path of the control socket
+        @param server_to_writer Dictionary mapping server ids to writer
+                                objects, dumped along with the streams
+
+        @return the asyncio server, which should be stopped on shutdown, or
+                None if the socket could not be served
+        """
+
+        cls._server_to_writer = server_to_writer
+
+        if not hasattr(socket, 'AF_UNIX'):
+            Program.log("DuoLogSync: the control socket is not supported on this platform",
+                        logging.WARNING)
+            return None
+
+        try:
+            cls._remove_stale_socket(path)
+            # Created without permissions for others rather than restricted
+            # once bound, when they may have connected already
+            previous_umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(cls._handle_connection, path)
+            finally:
+                os.umask(previous_umask)
+        except (OSError, ControlError) as error:
+            Program.log("DuoLogSync: could not serve the control socket '%s' due to error: %s",
+                        logging.ERROR, path, error)
+            return None
+
+        Program.log("DuoLogSync: serving the control socket at '%s'", logging.INFO, path)
+
+        return server
+
+    @staticmethod
+    def _remove_stale_socket(path):
+        """
+        Remove the socket at path unless a process is listening on it
+
+        @param path Path of the control socket
+
+        @raise ControlError if path is in use or is not a socket
+        """
+
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(mode):
+            raise ControlError('the path exists and is not a socket')
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+            return
+        finally:
+            probe.close()
+
+        raise ControlError('another process is listening on it')
+
+    @classmethod
+    async def stop_server(cls, server, path):
+        """
+        Stop serving the control socket, closing the connections of clients
+
+        @param server   Server returned by start_server
+        @param path     Path of the control socket
+        """
+
+        server.close()
+        for writer in list(cls._connections):
+            writer.close()
+        await server.wait_closed()
+
+        # Newer versions of Python remove the socket themselves
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    async def _handle_connection(cls, reader, writer):
+        """
+        Answer every request sent on a connection to the control socket
+        """
+
+        cls._connections.add(writer)
+
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+
+                response = await cls.handle_request(request)
+                writer.write(json.dumps(response, default=str).encode() + b'\n')
+                await writer.drain()
+        # Requests too long to be read are answered by closing the connection
+        except (OSError, ValueError):
+            pass
+        finally:
+            cls._connections.discard(writer)
+            writer.close()
+
+    @classmethod
+    async def handle_request(cls, request):
+        """
+        @param request  Line of JSON sent by a client
+
+        @return the response to send back to the client
+        """
+
+        try:
+            request = json.loads(request)
+        except ValueError as error:
+            return {'ok': False, 'error': f"request is not valid JSON: {error}"}
+
+        try:
+            if not isinstance(request, dict):
+                raise ControlError('requests must be JSON objects')
+
+            method = CONTROL_COMMANDS.get(request.get('command'))
+            if method is None:
+                raise ControlError(f"unknown command {request.get('command')}, expected one "
+                                   f"of {', '.join(CONTROL_COMMANDS)}")
+
+            result = await getattr(cls, method)(request)
+        except ControlError as error:
+            return {'ok': False, 'error': str(error)}
+
+        return {'ok': True, 'result': result}
+
+    @staticmethod
+    def get_stream(request):
+        """
+        @param request  Request naming a stream by its key, such as auth or
+                        auth:<child account id>
+
+        @return the running stream named in request
+
+        @raise ControlError if no such stream is running
+        """
+
+        key = request.get('stream')
+        if not isinstance(key, str):
+            raise ControlError('no stream given')
+
+        log_type, _, child_account_id = key.partition(':')
+        stream = Streams.get(log_type, child_account_id or None)
+        if stream is None:
+            raise ControlError(f"no {key} stream is running")
+
+        return stream
+
+    @staticmethod
+    def get_stream_stats(stream, now=None):
+        """
+        @param stream   A running stream
+        @param now      Seconds since the epoch
+
+        @return a dictionary of live stats about stream
+        """
+
+        if now is None:
+            now = time.time()
+
+        producer = stream.producer
+        labels = stream_labels(stream.log_type, stream.child_account_id)
+        records_per_second, _ = producer.backfill.get_rates()
+
+        if stream.get_error() is not None:
+            state = 'failed'
+        elif producer.paused:
+            state = 'paused'
+        else:
+            state = 'running'
+
+        return {
+            'stream': stream.key,
+            'state': state,
+            'server': stream.consumer.writer.server_id,
+            'poll_interval': producer.get_poll_interval(),
+            'page_size': producer.get_page_size(),
+            'overrides': dict(producer.overrides),
+            'queued_pages': producer.log_queue.qsize(),
+            'records_fetched': Metrics.get(RECORDS_FETCHED, labels) or 0,
+            'records_written': Metrics.get(RECORDS_WRITTEN, labels) or 0,
+            'records_per_second': records_per_second,
+            'lag': max(now - producer.backfill.position, 0),
+            'caught_up': producer.backfill.caught_up,
+            'restarts': stream.restarts,
+        }
+
+    @classmethod
+    async def list_streams(cls, request):
+        """@return live stats about every stream, and the quarantined ones"""
+
+        now = time.time()
+        streams = sorted(Streams.get_all(), key=lambda stream: stream.key)
+
+        return {
+            'streams': [cls.get_stream_stats(stream, now) for stream in streams],
+            'quarantined': Streams.get_quarantined(),
+        }
+
+    @classmethod
+    async def pause_stream(cls, request):
+        """
+        Stop polling a stream. Its consumer keeps writing the logs already
+        fetched, so its checkpoint keeps up with them.
+
+        @return live stats about the stream
+        """
+
+        stream = cls.get_stream(request)
+        if not stream.producer.paused:
+            Program.log("DuoLogSync: pausing the %s stream", logging.INFO, stream.key)
+            stream.producer.paused = True
+
+        return cls.get_stream_stats(stream)
+
+    @classmethod
+    async def resume_stream(cls, request):
+        """
+        Resume polling a paused stream, which fetches the logs of the time it
+        was paused first
+
+        @return live stats about the stream
+        """
+
+        stream = cls.get_stream(request)
+        if stream.producer.paused:
+            Program.log("DuoLogSync: resuming the %s stream", logging.INFO, stream.key)
+            stream.producer.paused = False
+
+        return cls.get_stream_stats(stream)
+
+    @classmethod
+    async def set_settings(cls, request):
+        """
+        Change api settings of a stream, among CONTROL_SETTINGS. A new poll
+        interval applies to the poll the stream is waiting for.
+
+        @return live stats about the stream
+        """
+
+        stream = cls.get_stream(request)
+        settings = request.get('settings')
+
+        if not isinstance(settings, dict) or not settings:
+            raise ControlError('no settings given')
+
+        cls.check_settings(stream, settings)
+
+        Program.log("DuoLogSync: setting %s for the %s stream", logging.INFO, json.dumps(settings),
+                    stream.key)
+        stream.producer.overrides.update(settings)
+        stream.producer.wake_up()
+
+        return cls.get_stream_stats(stream)
+
+    @staticmethod
+    def check_settings(stream, settings):
+        """
+        Check api settings to set for a stream against the limits the config
+        enforces: poll intervals of at least the default timeout, which
+        respects the rate limits of Duo, a max_timeout of 0 or at least the
+        timeout, and a page size the endpoint accepts
+
+        @param stream   Stream whose settings are to be changed
+        @param settings Dictionary mapping names of CONTROL_SETTINGS to values
+
+        @raise ControlError if a setting cannot be set to its value
+        """
+
+        for name, value in settings.items():
+            if name not in CONTROL_SETTINGS:
+                raise ControlError(f"{name} cannot be set, expected one of "
+                                   f"{', '.join(CONTROL_SETTINGS)}")
+
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ControlError(f"{value} is not a valid {name}")
+
+        page_size = settings.get('page_size')
+        if page_size is not None:
+            page_size_max = Config.API_PAGE_SIZE_MAX[stream.log_type]
+            if not isinstance(page_size, int) or not 1 <= page_size <= page_size_max:
+                raise ControlError(f"{page_size} is not a valid page_size, expected a "
+                                   f"whole number from 1 to {page_size_max}")
+
+        producer = stream.producer
+        timeout = settings.get('timeout', producer.overrides.get(
+            'timeout', Config.get_api_timeout(stream.log_type, stream.child_account_id)))
+        max_timeout = settings.get('max_timeout', producer.overrides.get(
+            'max_timeout', Config.get_api_max_timeout(stream.log_type, stream.child_account_id)))
+
+        if timeout < Config.API_TIMEOUT_DEFAULT:
+            raise ControlError(f"{timeout} is not a valid timeout, expected at least "
+                               f"{Config.API_TIMEOUT_DEFAULT} seconds")
+
+        if max_timeout and max_timeout < timeout:
+            raise ControlError(f"{max_timeout} is not a valid max_timeout, expected 0 or at "
+                               f"least the timeout of {timeout} seconds")
+
+    @classmethod
+    async def reset_settings(cls, request):
+        """
+        Have a stream use the api settings of the config again
+
+        @return live stats about the stream
+        """
+
+        stream = cls.get_stream(request)
+        if stream.producer.overrides:
+            Program.log("DuoLogSync: resetting the settings of the %s stream", logging.INFO,
+                        stream.key)
+            stream.producer.overrides.clear()
+            stream.producer.wake_up()
+
+        return cls.get_stream_stats(stream)
+
+    @classmethod
+    async def flush_checkpoints(cls, request):
+        """
+        Commit the offsets of every stream to the checkpoint store now,
+        rather than at the next commit interval
+
+        @return the state of the checkpoint store once committed
+        """
+
+        Program.log("DuoLogSync: committing checkpoints on request", logging.INFO)
+        await CheckpointStore.commit_async()
+
+        return CheckpointStore.get_commit_state()
+
+    @classmethod
+    async def dump_state(cls, request):
+        """
+        @return the internal state of every stream, including its tasks,
+                cursor and queue, along with the connections to servers, the
+                checkpoint store and the scheduler
+        """
+
+        streams = []
+
+        for stream in sorted(Streams.get_all(), key=lambda stream: stream.key):
+            producer = stream.producer
+            consumer = stream.consumer
+            streams.append({
+                'stream': stream.key,
+                'tasks': [get_task_state(task) for task in stream.tasks],
+                'queued_pages': producer.log_queue.qsize(),
+                'producer': {
+                    'paused': producer.paused,
+                    'cursor': str(producer.cursor),
+                    'idle_cycles': producer.idle_cycles,
+                    'cycle_logs': producer.cycle_logs,
+                    'overrides': dict(producer.overrides),
+                },
+                'consumer': {
+                    'server': consumer.writer.server_id,
+                    'log_format': consumer.log_format,
+                    'log_offset': consumer.log_offset,
+                    'unsaved_watermark': consumer.acknowledged_log is not None,
+                },
+            })
+
+        return {
+            'running': Program.is_running(),
+            'streams': streams,
+            'quarantined': Streams.get_quarantined(),
+            'pending_restarts': Streams.get_pending_restarts(),
+            'connections': [writer.get_state() for writer in cls._server_to_writer.values()],
+            'checkpoints': CheckpointStore.get_commit_state(),
+            'sleeping_tasks': Scheduler.get_sleeping(),
+        }
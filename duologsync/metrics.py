@@ -0,0 +1,276 @@
+"""
+Definition of the Metrics class
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+
+from duologsync.program import Program
+
+# Names of the metrics collected by DuoLogSync
+RECORDS_FETCHED = 'dls_records_fetched_total'
+RECORDS_WRITTEN = 'dls_records_written_total'
+RECORDS_FILTERED = 'dls_records_filtered_total'
+RECORDS_AGGREGATED = 'dls_records_aggregated_total'
+BYTES_WRITTEN = 'dls_bytes_written_total'
+API_CALL_DURATION = 'dls_api_call_duration_seconds'
+API_RATE_LIMITED = 'dls_api_rate_limited_total'
+QUEUE_DEPTH = 'dls_queue_depth'
+WRITER_DRAIN_DURATION = 'dls_writer_drain_duration_seconds'
+CHECKPOINT_AGE = 'dls_checkpoint_age_seconds'
+INGESTION_LAG = 'dls_ingestion_lag_seconds'
+STAGE_DURATION = 'dls_stage_duration_seconds'
+STREAM_RESTARTS = 'dls_stream_restarts_total'
+POLL_INTERVAL = 'dls_poll_interval_seconds'
+STREAM_QUARANTINED = 'dls_stream_quarantined'
+BACKFILL_PROGRESS = 'dls_backfill_progress_ratio'
+BACKFILL_ETA = 'dls_backfill_eta_seconds'
+RECORDS_RATE = 'dls_records_per_second'
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Maps the name of a metric to its type and help text
+METRIC_DESCRIPTIONS = {
+    RECORDS_FETCHED: (COUNTER, 'Records fetched from the Duo Admin API'),
+    RECORDS_WRITTEN: (COUNTER, 'Records written to a server'),
+    RECORDS_FILTERED: (COUNTER, 'Records dropped by the filters of a stream'),
+    RECORDS_AGGREGATED: (COUNTER, 'Records rolled up into summaries by a stream'),
+    BYTES_WRITTEN: (COUNTER, 'Bytes of formatted records written to a server'),
+    API_CALL_DURATION: (HISTOGRAM, 'Duration of calls to the Duo Admin API'),
+    API_RATE_LIMITED: (COUNTER, 'Calls to the Duo Admin API rejected with HTTP 429'),
+    QUEUE_DEPTH: (GAUGE, 'Pages of records waiting to be consumed'),
+    WRITER_DRAIN_DURATION: (HISTOGRAM, 'Duration of writing a record and draining the connection'),
+    CHECKPOINT_AGE: (GAUGE, 'Seconds since the offset of a stream was last saved'),
+    INGESTION_LAG: (GAUGE, 'Seconds between now and the newest record shipped'),
+    STAGE_DURATION: (HISTOGRAM, 'Time spent by a stream in a stage of its pipeline'),
+    STREAM_RESTARTS: (COUNTER, 'Restarts of a stream after it failed'),
+    POLL_INTERVAL: (GAUGE, 'Seconds between the current and the next poll of a stream'),
+    STREAM_QUARANTINED: (GAUGE, 'Whether a stream failed too many times to be restarted'),
+    BACKFILL_PROGRESS: (GAUGE, 'Fraction of the logs from the start of a stream to now shipped'),
+    BACKFILL_ETA: (GAUGE, 'Estimated seconds until a stream ships the logs of now'),
+    RECORDS_RATE: (GAUGE, 'Records shipped per second by a stream over the last minute'),
+}
+
+# Metrics whose value is a timestamp, rendered as the seconds elapsed since
+AGE_METRICS = (CHECKPOINT_AGE, INGESTION_LAG)
+
+HISTOGRAM_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+
+def stream_labels(log_type, child_account_id=None):
+    """
+    @param log_type         Log type of a stream
+    @param child_account_id MSP child account of a stream, if any
+
+    @return the labels identifying the metrics of a stream
+    """
+
+    return {'endpoint': log_type, 'account': child_account_id or ''}
+
+
+class Metrics:
+    """
+    Like the Config and Program classes, Metrics is not meant to be
+    instantiated. It collects counters, gauges and histograms about the
+    throughput and latency of every stream, which can be scraped in the
+    Prometheus text format from an optional local HTTP endpoint.
+    """
+
+    # Maps (metric name, labels) to the value of a counter or gauge
+    _values = {}
+
+    # Maps (metric name, labels) to [bucket counts, sum, count]
+    _histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    @classmethod
+    def reset(cls):
+        """Discard every metric collected so far"""
+        cls._values = {}
+        cls._histograms = {}
+
+    @classmethod
+    def inc(cls, name, labels, amount=1):
+        """
+        Increase the counter name with the given labels by amount
+
+        @param name     Name of the counter
+        @param labels   Dictionary of label names to label values
+        @param amount   Value to add to the counter
+        """
+
+        key = cls._key(name, labels)
+        cls._values[key] = cls._values.get(key, 0) + amount
+
+    @classmethod
+    def set(cls, name, labels, value):
+        """
+        Set the gauge name with the given labels to value
+
+        @param name     Name of the gauge
+        @param labels   Dictionary of label names to label values
+        @param value    New value of the gauge
+        """
+
+        cls._values[cls._key(name, labels)] = value
+
+    @classmethod
+    def get(cls, name, labels):
+        """@return the value of a counter or gauge, or None if never set"""
+        return cls._values.get(cls._key(name, labels))
+
+    @classmethod
+    def observe(cls, name, labels, value):
+        """
+        Record value in the histogram name with the given labels
+
+        @param name     Name of the histogram
+        @param labels   Dictionary of label names to label values
+        @param value    Observed value, such as a duration in seconds
+        """
+
+        key = cls._key(name, labels)
+        histogram = cls._histograms.get(key)
+
+        if histogram is None:
+            histogram = [[0] * len(HISTOGRAM_BUCKETS), 0.0, 0]
+            cls._histograms[key] = histogram
+
+        bucket = bisect.bisect_left(HISTOGRAM_BUCKETS, value)
+        if bucket < len(HISTOGRAM_BUCKETS):
+            histogram[0][bucket] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    @classmethod
+    def get_histograms(cls, name):
+        """
+        @param name Name of the histograms to retrieve
+
+        @return a list of (labels, sum, count) for every histogram named name
+        """
+
+        return [
+            (dict(labels), histogram[1], histogram[2])
+            for (histogram_name, labels), histogram in cls._histograms.items()
+            if histogram_name == name
+        ]
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+
+        if not pairs:
+            return ''
+
+        formatted = ','.join(
+            '{}="{}"'.format(
+                name,
+                str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in pairs)
+
+        return '{' + formatted + '}'
+
+    @classmethod
+    def render(cls):
+        """
+        @return every metric collected so far in the Prometheus text format
+        """
+
+        now = time.time()
+        lines = []
+        by_name = {}
+
+        for (name, labels), value in cls._values.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in cls._histograms.items():
+            by_name.setdefault(name, []).append((labels, histogram))
+
+        for name in sorted(by_name):
+            metric_type, help_text = METRIC_DESCRIPTIONS.get(name, (GAUGE, name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                if metric_type == HISTOGRAM:
+                    bucket_counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(HISTOGRAM_BUCKETS, bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket"
+                                     f"{cls._format_labels(labels, [('le', bound)])} "
+                                     f"{cumulative}")
+                    lines.append(f"{name}_bucket"
+                                 f"{cls._format_labels(labels, [('le', '+Inf')])} "
+                                 f"{count}")
+                    lines.append(f"{name}_sum{cls._format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{cls._format_labels(labels)} {count}")
+                    continue
+
+                if name in AGE_METRICS:
+                    value = max(now - value, 0)
+
+                lines.append(f"{name}{cls._format_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    async def _handle_request(cls, reader, writer):
+        """
+        Answer a single HTTP request made to the metrics endpoint
+        """
+
+        try:
+            request_line = await reader.readline()
+
+            # Skip the request headers
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else ''
+
+            if len(parts) > 1 and parts[0] == 'GET' and path.split('?')[0] == '/metrics':
+                status = '200 OK'
+                body = cls.render().encode()
+            else:
+                status = '404 Not Found'
+                body = b'Not Found\n'
+
+            writer.write(
+                f"HTTP/1.0 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (OSError, UnicodeDecodeError):
+            pass
+        finally:
+            writer.close()
+
+    @classmethod
+    async def start_server(cls, host, port):
+        """
+        Start serving metrics over HTTP at http://host:port/metrics
+
+        @param host Address on which to listen
+        @param port Port on which to listen
+
+        @return the asyncio server, which should be closed on shutdown
+        """
+
+        server = await asyncio.start_server(cls._handle_request, host, port)
+        Program.log("DuoLogSync: serving metrics at http://%s:%s/metrics", logging.INFO, host, port)
+
+        return server
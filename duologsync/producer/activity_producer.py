@@ -1,9 +1,7 @@
 """
 Definition of the ActivityProducer class
 """
-import datetime
 import functools
-import math
 
 from duologsync.config import Config
 from duologsync.producer.producer import Producer
@@ -23,19 +21,6 @@ class ActivityProducer(Producer):
             Config.ACTIVITY,
             url_path=url_path,
         )
-        self.first_pass = True
-        self.mintime = None
-
-        # Default to the generated mintime if no checkpoint is found
-        if isinstance(self.log_offset, int):
-            self.mintime = self.log_offset
-            self.log_offset = None
-
-        # If we have a string based offset, it's pulled from the checkpoint file
-        if isinstance(self.log_offset, str):
-            (previous_time, _) = self.log_offset.split(",")
-            self.mintime = int(previous_time)
-            self.log_offset = None
 
     async def call_log_api(self):
         """
@@ -43,20 +28,17 @@ class ActivityProducer(Producer):
 
         @return the result of a call to the Activity Log API endpoint
         """
-        today = datetime.datetime.now(tz=datetime.timezone.utc)
-        maxtime = math.floor(today.timestamp() * 1000) - 120
-
         parameters = normalize_params(
             {
-                "mintime": f"{self.mintime}",
-                "maxtime": f"{maxtime}",
-                "limit": "1000",
+                "mintime": f"{self.cursor.mintime}",
+                "maxtime": f"{self.cursor.maxtime}",
+                "limit": f"{self.get_page_size()}",
                 "sort": "ts:asc",
             }
         )
 
-        if self.log_offset is not None:
-            parameters["next_offset"] = [f"{self.log_offset}"]
+        if self.cursor.next_offset is not None:
+            parameters["next_offset"] = [f"{self.cursor.next_offset}"]
 
         api_result = await run_in_executor(
             functools.partial(
@@ -18,14 +18,6 @@ class AuthlogProducer(Producer):
     def __init__(self, api_call, log_queue, child_account_id=None, url_path=None):
         super().__init__(api_call, log_queue, Config.AUTH, account_id=child_account_id,
                          url_path=url_path)
-        self.mintime = None
-
-        # log_offset for Auth can be an int or a tuple, depending on if there
-        # was a checkpoint file. Appropriately set mintime and log_offset if
-        # log_offset is just an int
-        if isinstance(self.log_offset, int):
-            self.mintime = self.log_offset
-            self.log_offset = None
 
     async def call_log_api(self):
         """
@@ -35,22 +27,24 @@ class AuthlogProducer(Producer):
         @return the result of a call to the authentication log API endpoint
         """
 
+        page_size = str(self.get_page_size())
+
         if Config.account_is_msp():
-            # In case of recovering from checkpoint, self.mintime is None since its not init
-            # anywhere. When duo_client is directly used, client will initialize self.mintime to
-            # time.time() - 86400 (1 day in past). We will have to do similar thing when directly
-            # calling logs endpoint for MSP accounts. Mintime is never used when next offset is
-            # present
-            if not self.mintime:
-                self.mintime = (int(time.time()) - 86400) * 1000
+            # When duo_client is directly used, client will initialize mintime
+            # to time.time() - 86400 (1 day in past) if none is given. We will
+            # have to do similar thing when directly calling logs endpoint for
+            # MSP accounts.
+            if not self.cursor.mintime:
+                self.cursor.mintime = (int(time.time()) - 86400) * 1000
 
             # Make an API call to retrieve authlog logs for MSP accounts
-            parameters = normalize_params({"mintime": str(self.mintime), "maxtime": str(int(time.time()) * 1000),
-                                           "limit": '1000',
+            parameters = normalize_params({"mintime": str(self.cursor.mintime),
+                                           "maxtime": str(self.cursor.maxtime),
+                                           "limit": page_size,
                                            "account_id": self.account_id, "sort": 'ts:asc'})
 
-            if self.log_offset is not None:
-                parameters["next_offset"] = self.log_offset
+            if self.cursor.next_offset is not None:
+                parameters["next_offset"] = self.cursor.next_offset
 
             authlog_api_result = await run_in_executor(
                 functools.partial(
@@ -66,10 +60,11 @@ class AuthlogProducer(Producer):
                 functools.partial(
                     self.api_call,
                     api_version=2,
-                    mintime=self.mintime,
-                    next_offset=self.log_offset,
+                    mintime=self.cursor.mintime,
+                    maxtime=self.cursor.maxtime,
+                    next_offset=self.cursor.next_offset,
                     sort='ts:asc',
-                    limit='1000'
+                    limit=page_size
                 )
             )
 
@@ -0,0 +1,313 @@
+"""
+Definition of the Cursor class, and of a subclass for every log endpoint
+"""
+
+import math
+import time
+from datetime import datetime
+
+from duologsync.config import Config
+
+ISO_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f+00:00"
+
+
+class Cursor:
+    """
+    Position of a producer in the logs of an endpoint: the window of a polling
+    cycle, from mintime to maxtime in milliseconds, and the next_offset given
+    by the API for the page following the last page fetched. A cycle begins
+    with start_cycle and every page fetched is given to advance, until
+    has_more is False because every page available was fetched.
+
+    The offset saved to the checkpoint store once a record is written is
+    given by get_checkpoint, and from_checkpoint creates a cursor resuming
+    after that record. Subclasses define how each endpoint pages its records.
+    """
+
+    # Fields of an API response which may hold its records
+    RECORDS_FIELDS = ("authlogs", "events", "items")
+
+    # Milliseconds between the start of a cycle and its maxtime
+    MAXTIME_LAG = 0
+
+    def __init__(self, mintime=None, next_offset=None):
+        self.mintime = mintime
+        self.maxtime = None
+        self.next_offset = next_offset
+        self.has_more = False
+
+    def __str__(self):
+        return f"mintime: {self.mintime}, next_offset: {self.next_offset}"
+
+    @classmethod
+    def from_checkpoint(cls, offset):
+        """
+        @param offset   Offset returned by util.get_log_offset, either the
+                        default mintime or an offset from the checkpoint store
+
+        @return a cursor positioned after the record offset was saved for
+        """
+
+        if offset is None or isinstance(offset, int):
+            return cls(mintime=offset)
+
+        return cls(*cls.parse_checkpoint(offset))
+
+    @staticmethod
+    def parse_checkpoint(offset):
+        """
+        @param offset   Offset saved to the checkpoint store
+
+        @return the mintime and next_offset resuming after the offset
+        """
+
+        return offset, None
+
+    @staticmethod
+    def get_record_time(record):
+        """
+        @return the time of record in milliseconds, or None if it has none
+        """
+
+        if record.get("isotimestamp"):
+            return int(
+                (
+                    datetime.strptime(record["isotimestamp"], ISO_TIMESTAMP_FORMAT)
+                    - datetime(1970, 1, 1)
+                ).total_seconds()
+                * 1000
+            )
+
+        if record.get("timestamp"):
+            return record["timestamp"] * 1000
+
+        return None
+
+    @classmethod
+    def get_checkpoint(cls, record):
+        """
+        @param record   Record that was written
+
+        @return the offset to save to the checkpoint store once record is
+                written, or None if the record has no offset
+        """
+
+        if record.get("isotimestamp") and record.get("txid"):
+            return [str(cls.get_record_time(record)), record["txid"]]
+
+        if record.get("timestamp"):
+            return record["timestamp"] + 1
+
+        return None
+
+    @classmethod
+    def is_page(cls, response):
+        """@return whether response is an API response rather than a record"""
+        return any(field in response for field in cls.RECORDS_FIELDS)
+
+    @classmethod
+    def get_page(cls, response):
+        """
+        @param response The result of an API call, possibly None
+
+        @return the records of response and the next_offset it gives for the
+                page that follows, if any
+        """
+
+        if isinstance(response, list):
+            return response, None
+
+        if not response:
+            return [], None
+
+        records = []
+        for field in cls.RECORDS_FIELDS:
+            if response.get(field) is not None:
+                records = response[field]
+                break
+
+        metadata = response.get("metadata") or {}
+        return records, metadata.get("next_offset")
+
+    @classmethod
+    def get_page_offset(cls, response):
+        """
+        @return the offset from which to fetch the page following response,
+                or None if response has no records nor next_offset
+        """
+
+        records, next_offset = cls.get_page(response)
+
+        if next_offset is not None:
+            return next_offset
+
+        if records:
+            return cls.get_checkpoint(records[-1])
+
+        return None
+
+    def start_cycle(self, now=None):
+        """
+        Begin a polling cycle, whose pages are all fetched up to the same
+        maxtime so that records arriving meanwhile wait for the next cycle
+
+        @param now  Seconds since the epoch at which the cycle begins
+        """
+
+        if now is None:
+            now = time.time()
+
+        self.maxtime = math.floor(now * 1000) - self.MAXTIME_LAG
+        self.has_more = True
+
+    def advance(self, response, page_size=None):
+        """
+        Move the cursor past a page of records. Once the API gives no
+        next_offset, the following cycle starts after the last record.
+
+        @param response     The result of an API call for the page at the
+                            cursor, possibly None
+        @param page_size    The number of records requested, if known. A page
+                            with fewer records is the last of the cycle.
+
+        @return the records of response
+        """
+
+        records, next_offset = self.get_page(response)
+
+        if next_offset is not None:
+            self.next_offset = next_offset
+            self.has_more = bool(records) and (
+                page_size is None or len(records) >= page_size)
+            return records
+
+        if records:
+            last_record_time = self.get_record_time(records[-1])
+            if last_record_time is not None:
+                self.mintime = last_record_time + 1
+                self.next_offset = None
+
+        self.has_more = False
+        return records
+
+
+class AuthlogCursor(Cursor):
+    """
+    Authentication logs are paged with a [timestamp, txid] next_offset, which
+    is also the offset saved after a record
+    """
+
+    RECORDS_FIELDS = ("authlogs",)
+
+    @staticmethod
+    def parse_checkpoint(offset):
+        return int(offset[0]), list(offset)
+
+
+class TimestampIdCursor(Cursor):
+    """
+    Telephony and Activity logs are paged with a 'timestamp,id' next_offset.
+    The offset saved after a record is the millisecond following the record
+    with its id, from which polling resumes.
+    """
+
+    RECORDS_FIELDS = ("items",)
+    MAXTIME_LAG = 120
+
+    # Field holding the id of a record
+    ID_FIELD = None
+
+    @staticmethod
+    def parse_checkpoint(offset):
+        previous_time, _ = offset.split(",")
+        return int(previous_time), None
+
+    @staticmethod
+    def get_record_time(record):
+        if not record.get("ts"):
+            return None
+
+        return int(
+            datetime.strptime(record["ts"], ISO_TIMESTAMP_FORMAT).timestamp() * 1000
+        )
+
+    @classmethod
+    def get_checkpoint(cls, record):
+        record_time = cls.get_record_time(record)
+        if record_time is None:
+            return None
+
+        return f"{record_time + 1},{record.get(cls.ID_FIELD)}"
+
+
+class TelephonyCursor(TimestampIdCursor):
+    """Position of a producer in the Telephony logs"""
+
+    ID_FIELD = "telephony_id"
+
+
+class ActivityCursor(TimestampIdCursor):
+    """Position of a producer in the Activity logs"""
+
+    ID_FIELD = "activity_id"
+
+
+class TrustMonitorCursor(Cursor):
+    """
+    Trust Monitor events are paged with an offset. The offset saved after an
+    event is the millisecond following its surfaced_timestamp.
+    """
+
+    RECORDS_FIELDS = ("events",)
+
+    @staticmethod
+    def parse_checkpoint(offset):
+        return int(offset), None
+
+    @staticmethod
+    def get_record_time(record):
+        record_time = record.get("surfaced") or record.get("surfaced_timestamp")
+        if record_time is None:
+            return None
+
+        return int(record_time)
+
+    @classmethod
+    def get_checkpoint(cls, record):
+        record_time = cls.get_record_time(record)
+        if record_time is None:
+            return None
+
+        return record_time + 1
+
+    @classmethod
+    def get_page(cls, response):
+        records, next_offset = super().get_page(response)
+
+        if next_offset is not None:
+            next_offset = int(next_offset)
+
+        return records, next_offset
+
+    def start_cycle(self, now=None):
+        super().start_cycle(now)
+
+        # An offset past mintime is the time of the event following the last
+        # one fetched, so the window of the new cycle starts there
+        if self.mintime and self.next_offset and self.next_offset > self.mintime:
+            self.mintime = self.next_offset
+            self.next_offset = None
+
+
+# Maps each log type to the class of its cursors
+CURSORS = {
+    Config.AUTH: AuthlogCursor,
+    Config.TELEPHONY: TelephonyCursor,
+    Config.ACTIVITY: ActivityCursor,
+    Config.TRUST_MONITOR: TrustMonitorCursor,
+}
+
+
+def get_cursor_class(log_type):
+    """@return the class of the cursors of log_type"""
+    return CURSORS.get(log_type, Cursor)
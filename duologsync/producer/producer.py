@@ -2,23 +2,45 @@
 Definition of the Producer class
 """
 
+import asyncio
 import functools
 import logging
-from datetime import datetime
+import random
+import time
+from http import HTTPStatus
 from socket import gaierror
 
 
+from duologsync.backfill import BackfillProgress, CycleEnd
 from duologsync.config import Config
-from duologsync.program import Program, ProgramShutdownError
+from duologsync.metrics import (
+    API_CALL_DURATION, API_RATE_LIMITED, POLL_INTERVAL, QUEUE_DEPTH,
+    RECORDS_FETCHED, Metrics, stream_labels
+)
+from duologsync.producer.cursor import get_cursor_class
+from duologsync.profiling import CALL_LOG_API, GET_LOGS, StageTimer
+from duologsync.program import Program, ProgramShutdownError, StreamFailedError
+from duologsync.recording import REPLAY_POLL_INTERVAL, Replayer
+from duologsync.scheduler import Scheduler
 from duologsync.util import get_log_offset, restless_sleep, run_in_executor, extract_error_info
 
+# Pages waiting in the queue of a stream above which a producer waits for its
+# consumer before fetching more
+MAX_QUEUED_PAGES = 10
+
+# Cycles in a row without logs past which the poll interval stops doubling,
+# well beyond any max_timeout
+MAX_IDLE_CYCLES = 32
+
 
 class Producer:
     """
     Read data from a specific log endpoint via an API call at a polling
     duration that is user specified. The data is published to a queue which
     is only used for data of the same log type, and offset information is
-    recorded to allow checkpointing and recovery from a crash.
+    recorded to allow checkpointing and recovery from a crash. Every polling
+    cycle fetches all the pages available, keeping track of its position in
+    the logs with a Cursor.
     """
 
     def __init__(self, api_call, log_queue, log_type, account_id=None, url_path=None):
@@ -26,68 +48,142 @@ class Producer:
         self.log_queue = log_queue
         self.log_type = log_type
         self.account_id = account_id
-        self.log_offset = get_log_offset(
-            self.log_type,
-            Config.get_checkpointing_enabled(),
-            Config.get_checkpoint_dir(),
-            self.account_id,
+        self.cursor = get_cursor_class(self.log_type).from_checkpoint(
+            get_log_offset(
+                self.log_type,
+                Config.get_checkpointing_enabled(),
+                Config.get_checkpoint_dir(),
+                self.account_id,
+            )
         )
         self.url_path = url_path
+        self.backfill = BackfillProgress.start_stream(
+            self.log_type, self.account_id,
+            self.cursor.mintime / 1000 if self.cursor.mintime else None)
+        self.metric_labels = stream_labels(self.log_type, self.account_id)
+        self.stage_timer = StageTimer(self.metric_labels)
+
+        # Polling cycles in a row which fetched no logs, and logs fetched by
+        # the current cycle
+        self.idle_cycles = 0
+        self.cycle_logs = 0
+
+        # Set through the control socket: whether polling is resumed, cleared
+        # while paused, and api settings taking precedence over those in config
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.overrides = {}
+
+        # Done to wake the producer up before its next poll
+        self.wakeup = None
+
+    @property
+    def paused(self):
+        """@return whether polling is paused through the control socket"""
+        return not self.resumed.is_set()
+
+    @paused.setter
+    def paused(self, paused):
+        if paused:
+            self.resumed.clear()
+        else:
+            self.resumed.set()
 
     async def produce(self):
         """
         The main function of this class and subclasses. Runs a loop, sleeping
-        for the polling duration then making an API call, consuming the logs
-        from that API call and saving the offset of the latest log read.
+        until the next polling deadline then making API calls until every page
+        of logs available was fetched and added to the queue. Deadlines are
+        set every poll interval, give or take the jitter, however long
+        fetching the logs takes.
         """
 
+        previous_poll = None
+
         # Exit when DuoLogSync is shutting down (due to error or Ctrl-C)
         while Program.is_running():
-            shutdown_reason = None
+            failure_reason = None
+            poll_interval = self.get_poll_interval()
+            Metrics.set(POLL_INTERVAL, self.metric_labels, poll_interval)
+            next_poll = self.get_next_poll(previous_poll, poll_interval)
             Program.log(
-                f"{self.log_type} producer: fetching next logs after "
-                f"{Config.get_api_timeout()} seconds",
+                "%s producer: fetching next logs after %s seconds",
                 logging.INFO,
+                self.log_type,
+                round(next_poll - Scheduler.time(), 1),
             )
 
             try:
-                # Sleep for api_timeout amount of time, but check for program
-                # shutdown every second
-                await restless_sleep(Config.get_api_timeout())
-                Program.log(
-                    f"{self.log_type} producer: fetching logs from offset {self.log_offset or self.mintime}",
-                    logging.INFO,
-                )
-                api_result = await self.call_log_api()
-
-                if api_result:
-                    formatted_logs = self.get_logs(api_result)
-                    await self.add_logs_to_queue(formatted_logs)
-                else:
+                # Sleep until the next poll, unless shutdown is initiated. A
+                # poll interval changed meanwhile applies to this poll
+                self.wakeup = asyncio.get_event_loop().create_future()
+                if not await Scheduler.sleep_until(next_poll, self.wakeup):
+                    continue
+
+                previous_poll = next_poll
+                await self.wait_while_paused()
+                self.cursor.start_cycle()
+                self.cycle_logs = 0
+
+                while self.cursor.has_more:
                     Program.log(
-                        f"{self.log_type} producer: no new logs available", logging.INFO
+                        "%s producer: fetching logs from %s",
+                        logging.INFO,
+                        self.log_type,
+                        # Formatted on the logging thread, once the cursor moved
+                        str(self.cursor),
                     )
+                    api_call_start = time.perf_counter()
+                    api_result = await self.call_log_api()
+                    api_call_duration = time.perf_counter() - api_call_start
+                    Metrics.observe(API_CALL_DURATION, self.metric_labels, api_call_duration)
+                    self.stage_timer.record(CALL_LOG_API, api_call_duration)
+
+                    if api_result:
+                        with self.stage_timer.time(GET_LOGS):
+                            formatted_logs = self.get_logs(api_result)
+                        await self.add_logs_to_queue(formatted_logs)
+                    else:
+                        self.cursor.advance(None)
+                        Program.log(
+                            "%s producer: no new logs available", logging.INFO, self.log_type
+                        )
+
+                    if self.cursor.has_more:
+                        await self.wait_for_consumer()
+
+                # Quiet streams are polled less often until logs appear again
+                if self.cycle_logs:
+                    self.idle_cycles = 0
+                else:
+                    self.idle_cycles = min(self.idle_cycles + 1, MAX_IDLE_CYCLES)
+
+                # Every log up to the end of the cycle was fetched, and is
+                # shipped once the consumer reaches this marker
+                await self.log_queue.put(
+                    CycleEnd(self.cursor.maxtime / 1000, self.get_poll_interval()))
 
             except gaierror as gai_error:
-                shutdown_reason = self.handle_address_info_error(gai_error)
+                failure_reason = self.handle_address_info_error(gai_error)
 
             except OSError as os_error:
-                shutdown_reason = self.handle_os_error(os_error)
+                failure_reason = self.handle_os_error(os_error)
 
             # duo_client throws a RuntimeError if the ikey or skey is invalid
             except RuntimeError as runtime_error:
-                shutdown_reason = self.handle_runtime_error_gracefully(runtime_error)
+                failure_reason = self.handle_runtime_error_gracefully(runtime_error)
 
             # Shutdown hath been noticed and thus shutdown shall begin
             except ProgramShutdownError:
                 break
 
-            if shutdown_reason:
-                Program.initiate_shutdown(shutdown_reason)
+            # Only this stream is restarted, the others keep running
+            if failure_reason:
+                raise StreamFailedError(failure_reason)
 
         # Unblock consumer but putting anything in the shared queue
         await self.log_queue.put([])
-        Program.log(f"{self.log_type} producer: shutting down", logging.INFO)
+        Program.log("%s producer: shutting down", logging.INFO, self.log_type)
 
     def handle_os_error(self, os_error: OSError):
         """
@@ -101,7 +197,7 @@ class Producer:
         Handle an address info error gracefully by logging the error and returning a string to indicate that the producer should shut down.
         """
         err = extract_error_info(gai_error)
-        Program.log(f"{self.log_type} producer: make sure that the host information details provider in the configuration file {Config.get_config_file_path()} is correct", logging.ERROR)
+        Program.log("%s producer: make sure that the host information details provider in the configuration file %s is correct", logging.ERROR, self.log_type, Config.get_config_file_path())
         return f"{self.log_type} producer: [{err['error_message']} error_code: {err['error_code']}]"
 
     def handle_runtime_error_gracefully(self, runtime_error: RuntimeError):
@@ -114,10 +210,17 @@ class Producer:
         error_data = getattr(runtime_error, "data", None)
         error_code = error_data['code'] if error_data else None
 
+        if http_error_code == HTTPStatus.TOO_MANY_REQUESTS.value:
+            Metrics.inc(API_RATE_LIMITED, self.metric_labels)
+
         if self.eligible_for_retry(http_error_code):
             Program.log(
-                f"{self.log_type} producer: retrying due to error: {runtime_error} error_code: {error_code} http_status_code: {http_error_code}",
+                "%s producer: retrying due to error: %s error_code: %s http_status_code: %s",
                 logging.WARNING,
+                self.log_type,
+                runtime_error,
+                error_code,
+                http_error_code,
             )
 
             return None
@@ -138,43 +241,148 @@ class Producer:
 
         return False
 
-    async def add_logs_to_queue(self, logs):
+    def get_poll_interval(self):
+        """
+        @return the seconds between the start of the next polling cycle and
+                the one before: the api timeout, doubled for every cycle in a
+                row which fetched no logs, up to the api max_timeout
         """
-        If logs is not none, add them to this Writer's queue
 
-        @param logs The logs to be added to the asyncio queue
+        if Replayer.is_replaying():
+            return REPLAY_POLL_INTERVAL
+
+        timeout = self.overrides.get(
+            'timeout', Config.get_api_timeout(self.log_type, self.account_id))
+        max_timeout = self.overrides.get(
+            'max_timeout', Config.get_api_max_timeout(self.log_type, self.account_id))
+
+        if not max_timeout or max_timeout <= timeout:
+            return timeout
+
+        return min(timeout * 2 ** self.idle_cycles, max_timeout)
+
+    def get_page_size(self):
+        """
+        @return the number of records to request per API call, or None to
+                leave it up to the API
         """
 
-        # Important for recovery in the event of a crash
-        self.log_offset = Producer.get_log_offset(
-            logs, current_log_offset=self.log_offset, log_type=self.log_type
-        )
+        page_size = self.overrides.get('page_size')
+        if page_size is None:
+            return Config.get_api_page_size(self.log_type, self.account_id)
+
+        return min(page_size, Config.API_PAGE_SIZE_MAX.get(self.log_type, page_size))
+
+    def wake_up(self):
+        """
+        End the wait for the next poll early, for it to be set again from
+        the current poll interval
+        """
+
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+
+    @staticmethod
+    def get_next_poll(previous_poll, poll_interval, now=None):
+        """
+        Streams started together are spread over their first poll interval,
+        and every following interval is moved by up to the api jitter, so
+        that streams do not all call the API at the same time
+
+        @param previous_poll    Deadline of the previous poll, or None before
+                                the first one
+        @param poll_interval    Seconds between two polls
+        @param now              Current time on the monotonic clock
+
+        @return the deadline of the next poll
+        """
+
+        if now is None:
+            now = Scheduler.time()
+
+        jitter = Config.get_api_jitter()
+
+        if previous_poll is None:
+            if jitter:
+                return now + random.uniform(0, poll_interval)
+            return now + poll_interval
+
+        if jitter:
+            poll_interval *= random.uniform(1 - jitter, 1 + jitter)
+
+        return Scheduler.next_deadline(previous_poll, poll_interval, now)
+
+    async def wait_for_consumer(self):
+        """
+        Before fetching the next page of a cycle, wait while the consumer has
+        many pages left to write, so that a long backlog is not held in memory
+        """
+
+        if not Program.is_running():
+            raise ProgramShutdownError
+
+        while self.log_queue.qsize() >= MAX_QUEUED_PAGES:
+            await restless_sleep(1)
+
+        await self.wait_while_paused()
+
+    async def wait_while_paused(self):
+        """
+        Wait while polling is paused through the control socket. The consumer
+        keeps writing the logs already fetched.
+        """
+
+        if not self.paused:
+            return
+
+        Program.log("%s producer: paused", logging.INFO, self.log_type)
+        shutdown = Program.get_shutdown_future()
+        resumed = asyncio.ensure_future(self.resumed.wait())
+
+        try:
+            await asyncio.wait([resumed, shutdown], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            resumed.cancel()
+
+        if shutdown.done():
+            raise ProgramShutdownError
+
+    async def add_logs_to_queue(self, logs):
+        """
+        Move the cursor past the page of logs given and add its logs, if any,
+        to this Writer's queue
+
+        @param logs The result of an API call, whose logs are to be added to
+                    the asyncio queue
+        """
 
         # Authlogs v2, Trust Monitor, Telephony, and Activity endpoint returns dict response
-        if isinstance(logs, dict):
-            if logs.get("authlogs", None) is not None:
-                logs = logs["authlogs"]
-            elif logs.get("events", None) is not None:
-                logs = logs["events"]
-            elif logs.get("items", None) is not None:
-                logs = logs["items"]
+        logs = self.cursor.advance(
+            logs, self.get_page_size())
 
         if len(logs):
             Program.log(
-                f"{self.log_type} producer: adding {len(logs)} logs to the queue",
+                "%s producer: adding %s logs to the queue",
                 logging.INFO,
+                self.log_type,
+                len(logs),
             )
 
             await self.log_queue.put(logs)
+            self.cycle_logs += len(logs)
+            Metrics.inc(RECORDS_FETCHED, self.metric_labels, len(logs))
+            Metrics.set(QUEUE_DEPTH, self.metric_labels, self.log_queue.qsize())
 
             Program.log(
-                f"{self.log_type} producer: successfully added logs to the queue",
+                "%s producer: successfully added logs to the queue",
                 logging.INFO,
+                self.log_type,
             )
         else:
             Program.log(
-                f"{self.log_type} producer: no new logs to add to the queue",
+                "%s producer: no new logs to add to the queue",
                 logging.INFO,
+                self.log_type,
             )
 
     async def call_log_api(self):
@@ -189,7 +397,7 @@ class Producer:
         if Config.account_is_msp():
             # Make an API call to retrieve authlog logs for MSP accounts
             parameters = {
-                "mintime": str(self.log_offset),
+                "mintime": str(self.cursor.mintime),
                 "account_id": self.account_id,
             }
 
@@ -200,7 +408,7 @@ class Producer:
             )
         else:
             api_result = await run_in_executor(
-                functools.partial(self.api_call, mintime=self.log_offset)
+                functools.partial(self.api_call, mintime=self.cursor.mintime)
             )
 
         return api_result
@@ -223,92 +431,26 @@ class Producer:
     @staticmethod
     def get_log_offset(log, current_log_offset=None, log_type=None):
         """
-        Get offset information given an individual log.
+        Get offset information given an individual log, or an API response.
 
-        @param log  Individual log from which to get offset information
+        @param log                  Individual log or API response from which
+                                    to get offset information
+        @param current_log_offset   Offset returned if log has none
+        @param log_type             Log type of log
 
         @return the offset of the log
         """
 
-        # In case of authlogs, dict is returned as response. So we check for that and record
-        # information from metadata field. This is applicable for producer log offset
-        # Elif loops are considered when offset is calculated for checkpointing. Here logs will be
-        # of type dict. Authlog will have txid field in addition to timestamp field which can be
-        # used for identification. Direct timestamp field cannot be used since it loses precision.
-        # Hence, calculating timestamp from isotimestamp field.
-        if isinstance(log, dict):
-            if log_type is not None and log_type == Config.AUTH:
-                if (
-                    log.get("authlogs")
-                    and log.get("metadata", {}).get("next_offset") is not None
-                ):
-                    return log.get("metadata", {}).get("next_offset")
-
-            if log_type is not None and log_type in [Config.ACTIVITY, Config.TELEPHONY]:
-                # Telephony and Activity require a comma separated string of `timestamp,id` for
-                # the next_offset parameter to the Admin API. Here we parse the
-                # next_offset from an individual log. Called from the consumer logic.
-
-                # Check if we're processing a response or an individual log
-                if log.get("items") is None:
-                    next_timestamp_to_poll_from = (
-                        datetime.strptime(
-                            log.get("ts", ""),
-                            "%Y-%m-%dT%H:%M:%S.%f+00:00",
-                        ).timestamp()
-                        * 1000
-                    )
-                    id_field = "activity_id"
-                    if log_type == Config.TELEPHONY:
-                        id_field = "telephony_id"
-                    log_id = log.get(id_field)
-                    next_timestamp = int(next_timestamp_to_poll_from) + 1
-                    return f"{next_timestamp},{log_id}"
-                else:
-                    if (log.get("metadata", {}) or {}).get("next_offset", None) is not None:
-                        next_offset = log.get("metadata", {}).get("next_offset", None)
-                        return next_offset
-
-            if log_type is not None and log_type == Config.TRUST_MONITOR:
-                # For the Trust Monitor API, once DLS paginates through and
-                # transports all events within the supplied mintime and maxtime window,
-                # we need to keep track of the last event's timestamp and
-                # supply that as the new mintime so that we can continue to poll
-
-                # Check if we're processing a response or an individual log
-                if log.get("events") is None:
-                    next_timestamp_to_poll_from = log.get("surfaced_timestamp", 0)
-                    return int(next_timestamp_to_poll_from) + 1
-                else:
-                    if log.get("metadata", {}).get("next_offset") is not None:
-                        return int(log.get("metadata", {}).get("next_offset", 0))
-                    else:
-                        events = log.get("events", {})
-                        if events:
-                            last_event = events[len(events) - 1]
-                            next_timestamp_to_poll_from = last_event.get(
-                                "surfaced"
-                            ) or last_event.get("surfaced_timestamp")
-                            return int(next_timestamp_to_poll_from) + 1
-
-            if log.get("isotimestamp") and log.get("txid"):
-                value = int(
-                    (
-                        datetime.strptime(
-                            log.get("isotimestamp", ""),
-                            "%Y-%m-%dT%H:%M:%S.%f+00:00",
-                        )
-                        - datetime(1970, 1, 1)
-                    ).total_seconds()
-                    * 1000
-                )
-
-                return [str(value), log.get("txid")]
+        cursor_class = get_cursor_class(log_type)
 
-            if log.get("timestamp"):
-                return log.get("timestamp", 0) + 1
+        if isinstance(log, list):
+            offset = cursor_class.get_checkpoint(log[-1]) if log else None
+        elif cursor_class.is_page(log):
+            offset = cursor_class.get_page_offset(log)
+        else:
+            offset = cursor_class.get_checkpoint(log)
 
+        if offset is None:
             return current_log_offset
-        else:
-            timestamp = log[-1]["timestamp"]
-            return timestamp + 1
+
+        return offset
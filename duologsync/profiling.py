@@ -0,0 +1,253 @@
+"""
+Definition of the StageTimer, Profiler and StartupTimer classes, used to find
+where time is spent by the pipeline of each stream and during startup
+"""
+
+import cProfile
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from duologsync.metrics import STAGE_DURATION, Metrics
+from duologsync.program import Program
+
+# Stages of the pipeline of a stream
+CALL_LOG_API = 'call_log_api'
+GET_LOGS = 'get_logs'
+FORMAT_LOG = 'format_log'
+WRITE = 'write'
+UPDATE_LOG_CHECKPOINT = 'update_log_checkpoint'
+
+STAGES = (CALL_LOG_API, GET_LOGS, FORMAT_LOG, WRITE, UPDATE_LOG_CHECKPOINT)
+
+
+class StageTimer:
+    """
+    Measure the time a stream spends in each stage of its pipeline. Every
+    measurement is added to the dls_stage_duration_seconds histogram of the
+    stream, so time is aggregated per stream and per stage.
+    """
+
+    def __init__(self, labels):
+        # Labels are built once since measurements are taken for every page
+        self.stage_labels = {
+            stage: dict(labels, stage=stage) for stage in STAGES
+        }
+
+    def record(self, stage, seconds):
+        """
+        Record that seconds were spent in stage
+
+        @param stage    One of STAGES
+        @param seconds  Time spent in the stage
+        """
+
+        Metrics.observe(STAGE_DURATION, self.stage_labels[stage], seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """
+        Context manager recording the time spent in its body under stage
+
+        @param stage    One of STAGES
+        """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+
+def summarize_stages():
+    """
+    @return a line for every stream and stage describing the time spent in
+            that stage, slowest stage first
+    """
+
+    summary = []
+
+    for labels, total, count in Metrics.get_histograms(STAGE_DURATION):
+        stream = labels.get('endpoint', '')
+        if labels.get('account'):
+            stream = f"{stream} [{labels['account']}]"
+
+        summary.append((total, (
+            f"{stream} {labels.get('stage')}: {count} calls, "
+            f"{total:.3f}s total, {1000 * total / max(count, 1):.3f}ms average")))
+
+    return [line for _, line in sorted(summary, reverse=True)]
+
+
+class Profiler:
+    """
+    Like the Program class, Profiler is not meant to be instantiated. It runs
+    a cProfile session on the event loop that can be started and stopped
+    while DuoLogSync is running, for instance by sending it SIGUSR1.
+    """
+
+    _profile = None
+
+    @classmethod
+    def is_active(cls):
+        """@return whether a profiling session is running"""
+        return cls._profile is not None
+
+    @classmethod
+    def start(cls):
+        """Begin profiling everything that runs on the event loop"""
+
+        if cls.is_active():
+            return
+
+        cls._profile = cProfile.Profile()
+        cls._profile.enable()
+        Program.log('DuoLogSync: started profiling', logging.INFO)
+
+    @classmethod
+    def stop(cls, directory):
+        """
+        End the profiling session and save its results in directory
+
+        @param directory    Where the profile file should be saved
+
+        @return the path of the saved profile file
+        """
+
+        if not cls.is_active():
+            return None
+
+        profile = cls._profile
+        cls._profile = None
+        profile.disable()
+
+        profile_path = os.path.join(
+            directory,
+            f"duologsync_profile_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+
+        try:
+            profile.dump_stats(profile_path)
+        except OSError as os_error:
+            Program.log("DuoLogSync: could not save profile to '%s' due to error: %s",
+                        logging.WARNING, profile_path, os_error)
+            return None
+
+        Program.log("DuoLogSync: saved profile to '%s'", logging.INFO, profile_path)
+
+        for line in summarize_stages():
+            Program.log("DuoLogSync: stage timing %s", logging.INFO, line)
+
+        return profile_path
+
+    @classmethod
+    def toggle(cls, directory):
+        """
+        Start a profiling session, or stop the running one and save it
+
+        @param directory    Where the profile file should be saved
+        """
+
+        if cls.is_active():
+            cls.stop(directory)
+        else:
+            cls.start()
+
+
+class StartupTimer:
+    """
+    Like the Program class, StartupTimer is not meant to be instantiated. When
+    DuoLogSync is started with --startup-profile, it measures how long each
+    step of startup takes, so that the steps delaying a failover can be found.
+    Steps run concurrently are measured separately and may overlap.
+    """
+
+    _started_at = None
+    _steps = []
+
+    @classmethod
+    def start(cls, started_at=None):
+        """
+        Begin measuring startup steps
+
+        @param started_at   Value of time.perf_counter() when startup began,
+                            defaults to now
+        """
+
+        cls._started_at = time.perf_counter() if started_at is None else started_at
+        cls._steps = []
+
+    @classmethod
+    def is_active(cls):
+        """@return whether startup steps are being measured"""
+        return cls._started_at is not None
+
+    @classmethod
+    def record(cls, step, seconds):
+        """
+        Record that step took seconds, if startup steps are being measured
+
+        @param step     Name of the startup step
+        @param seconds  Time spent in the step
+        """
+
+        if cls.is_active():
+            cls._steps.append((step, seconds))
+
+    @classmethod
+    @contextmanager
+    def time(cls, step):
+        """
+        Context manager recording the time spent in its body under step
+
+        @param step Name of the startup step
+        """
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            cls.record(step, time.perf_counter() - start)
+
+    @classmethod
+    async def time_async(cls, step, awaitable):
+        """
+        Await awaitable and record the time it took under step
+
+        @param step         Name of the startup step
+        @param awaitable    Coroutine or future running the step
+
+        @return the result of awaitable
+        """
+
+        start = time.perf_counter()
+
+        try:
+            return await awaitable
+        finally:
+            cls.record(step, time.perf_counter() - start)
+
+    @classmethod
+    def report(cls):
+        """
+        Log and print the time taken by every step and by startup as a whole,
+        then stop measuring
+
+        @return the lines of the report
+        """
+
+        if not cls.is_active():
+            return []
+
+        total = time.perf_counter() - cls._started_at
+        lines = [f"{step}: {1000 * seconds:.1f}ms" for step, seconds in cls._steps]
+        lines.append(f"total: {1000 * total:.1f}ms")
+
+        for line in lines:
+            Program.log("DuoLogSync: startup timing %s", logging.INFO, line)
+            print(f"DuoLogSync: startup timing {line}")
+
+        cls._started_at = None
+        return lines
@@ -2,7 +2,16 @@
 Definition of the Program class
 """
 
+import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
+import time
+from collections import OrderedDict
+
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 
 class ProgramShutdownError(Exception):
@@ -12,6 +21,79 @@ class ProgramShutdownError(Exception):
     """
 
 
+class StreamFailedError(Exception):
+    """
+    Raise when a stream cannot go on, so that it is restarted while the other
+    streams keep running
+    """
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limit how often messages built from the same template are logged at INFO
+    level or below. Once rate_limit messages of a template have been logged
+    within interval seconds, further ones are dropped until the interval
+    ends. The next message of that template then reports how many were
+    suppressed. Messages above INFO level are never dropped.
+    """
+
+    # Past this many templates, the least recently logged ones are forgotten
+    MAX_TEMPLATES = 1000
+
+    def __init__(self, rate_limit, interval=60):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.interval = interval
+
+        # Maps a message template to [interval start, logged, suppressed],
+        # from the least to the most recently logged
+        self._windows = OrderedDict()
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not isinstance(record.msg, str):
+            return True
+
+        now = time.monotonic()
+        window = self._windows.get(record.msg)
+
+        if window is None:
+            while len(self._windows) >= self.MAX_TEMPLATES:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(record.msg)
+
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            self._windows[record.msg] = [now, 1, 0]
+
+            if suppressed:
+                record.msg = (f"{record.msg} [suppressed {suppressed} similar "
+                              f"messages in the last {self.interval} seconds]")
+
+            return True
+
+        if window[1] < self.rate_limit:
+            window[1] += 1
+            return True
+
+        window[2] += 1
+        return False
+
+
+class DeferredFormatQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler which leaves formatting of messages to the thread writing
+    them to the log file rather than doing it on the event loop
+    """
+
+    def prepare(self, record):
+        # Tracebacks must be rendered while they still exist
+        if record.exc_info:
+            return super().prepare(record)
+
+        return record
+
+
 class Program:
     """
     The Program class is used not to create objects, but to keep track of this
@@ -27,6 +109,17 @@ class Program:
     # print statements will be used in lieu of logs
     _logging_set = False
 
+    # Background thread writing queued log messages to the log file
+    _log_listener = None
+
+    # Future done once shutdown is initiated, so that tasks waiting for it
+    # wake up immediately, and the event loop it belongs to
+    _shutdown_future = None
+    _shutdown_loop = None
+
+    # Monotonic time at which shutdown was initiated
+    _shutdown_time = None
+
     @classmethod
     def is_logging_set(cls):
         """
@@ -47,37 +140,91 @@ class Program:
     def initiate_shutdown(cls, reason):
         """
         Simply set _running to False which will propogate to all consumers and
-        producers causing them to begin the shutdown procedure.
+        producers causing them to begin the shutdown procedure. Producers stop
+        polling right away while consumers write the pages already fetched.
 
         @param reason   Explanation of why a shutdown was requested
         """
 
         cls.log(f"DuoLogSync: Shutting down due to [{reason}]", logging.ERROR)
+        if cls._running:
+            cls._shutdown_time = time.monotonic()
         cls._running = False
 
+        future = cls._shutdown_future
+        if future is None or future.done():
+            return
+
+        # Shutdown may be initiated by a signal handler interrupting the event
+        # loop while it waits, which call_soon_threadsafe wakes up
+        try:
+            cls._shutdown_loop.call_soon_threadsafe(cls._set_shutdown, future)
+        except RuntimeError:
+            # The event loop is closed, nothing is waiting anymore
+            pass
+
     @classmethod
-    def setup_logging(cls, log_filepath):
+    def get_time_since_shutdown(cls):
+        """
+        @return the seconds elapsed since shutdown was initiated, or 0 if it
+                was not
         """
-        Function to set up logging, such as saving logs to log_filepath.
 
-        @param log_filepath Filepath where logging messages should be saved
+        if cls._running or cls._shutdown_time is None:
+            return 0
+
+        return time.monotonic() - cls._shutdown_time
+
+    @staticmethod
+    def _set_shutdown(future):
+        if not future.done():
+            future.set_result(None)
+
+    @classmethod
+    def get_shutdown_future(cls):
         """
+        Tasks waiting for something else, such as a deadline, wait for this
+        future as well rather than checking is_running periodically
 
-        try:
-            logging.basicConfig(
-                # Where to save logs
-                filename=log_filepath,
+        @return a future of the current event loop which is done once shutdown
+                is initiated
+        """
+
+        loop = asyncio.get_event_loop()
+        future = cls._shutdown_future
 
-                # How logs should be formatted
-                format='%(asctime)s %(levelname)-8s %(message)s',
+        if (future is None or cls._shutdown_loop is not loop
+                or (future.done() and cls._running)):
+            future = loop.create_future()
+            cls._shutdown_future = future
+            cls._shutdown_loop = loop
 
-                # Minimum level required of a log in order to be seen / written
-                level=logging.INFO,
+        if not cls._running:
+            cls._set_shutdown(future)
 
-                # Date format to use with logs
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            cls.log(f"Configured logging to write to file {log_filepath}.")
+        return future
+
+    @classmethod
+    def setup_logging(cls, log_filepath, level=logging.INFO, max_bytes=0,
+                      backup_count=0, rate_limit=0):
+        """
+        Function to set up logging, such as saving logs to log_filepath.
+        Messages are handed to a background thread through a queue so that
+        writing them to disk does not block the event loop.
+
+        @param log_filepath Filepath where logging messages should be saved
+        @param level        Minimum level of a message for it to be logged
+        @param max_bytes    Size at which the log file is rotated, 0 to never
+                            rotate it
+        @param backup_count Number of rotated log files to keep
+        @param rate_limit   Maximum messages per minute built from the same
+                            template at INFO level or below, 0 for no limit
+        """
+
+        try:
+            # Where to save logs, rotating the file once it grows too large
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_filepath, maxBytes=max_bytes, backupCount=backup_count)
 
         except FileNotFoundError as file_not_found_error:
             cls.log(f"DuoLogSync: Could not follow the path {log_filepath}. "
@@ -85,20 +232,69 @@ class Program:
             cls.initiate_shutdown(f"{file_not_found_error}")
             return
 
+        # How logs should be formatted
+        file_handler.setFormatter(
+            logging.Formatter(fmt=LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+        # Signal handlers log too, and unlike Queue.put, SimpleQueue.put
+        # cannot deadlock when a signal interrupts it. Python 3.6 lacks it
+        log_queue = queue.SimpleQueue() if hasattr(queue, 'SimpleQueue') else queue.Queue(-1)
+        queue_handler = DeferredFormatQueueHandler(log_queue)
+        if rate_limit:
+            queue_handler.addFilter(RateLimitFilter(rate_limit))
+
+        cls.shutdown_logging()
+        cls._log_listener = logging.handlers.QueueListener(
+            queue_handler.queue, file_handler)
+        cls._log_listener.start()
+        atexit.register(cls.shutdown_logging)
+
+        root_logger = logging.getLogger()
+        root_logger.addHandler(queue_handler)
+
+        # Minimum level required of a log in order to be seen / written
+        root_logger.setLevel(level)
+
+        cls.log(f"Configured logging to write to file {log_filepath}.")
         cls._logging_set = True
         cls.log('Starting DuoLogSync', logging.INFO)
 
     @classmethod
-    def log(cls, message, level=logging.ERROR):
+    def shutdown_logging(cls):
+        """
+        Write out every queued log message and stop the background thread
+        writing them to the log file
+        """
+
+        if cls._log_listener is None:
+            return
+
+        root_logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            if isinstance(handler, DeferredFormatQueueHandler):
+                root_logger.removeHandler(handler)
+
+        cls._log_listener.stop()
+        for handler in cls._log_listener.handlers:
+            handler.close()
+        cls._log_listener = None
+
+    @classmethod
+    def log(cls, message, level=logging.ERROR, *args):
         """
         Wrapper around the logging.log method with additional functionality to
         use a print statement in the case that logging has yet to be set up
 
-        @param message  A statement to be logged or printed
+        @param message  A statement to be logged or printed. May contain
+                        %-style placeholders filled in from args, which is
+                        only done if the message is actually written
         @param level    Urgency / value of message
+        @param args     Values for the placeholders in message
         """
 
         if cls._logging_set:
-            logging.log(level, message)
+            logging.log(level, message, *args)
+        elif args:
+            print(message % args)
         else:
             print(message)
@@ -0,0 +1,355 @@
+"""
+Definition of the Recorder and Replayer classes, used to save the responses
+of the Duo Admin API received by producers and to feed them back through the
+pipeline later, without access to Duo
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from duologsync.metrics import QUEUE_DEPTH, Metrics, stream_labels
+from duologsync.program import Program, ProgramShutdownError
+from duologsync.scheduler import Scheduler
+
+# Responses saved in a segment file before starting the next one
+SEGMENT_MAX_RESPONSES = 100
+
+# Seconds between the polling cycles of a replayed stream, whose responses
+# carry their own timing
+REPLAY_POLL_INTERVAL = Scheduler.RESOLUTION
+
+SEGMENT_PATTERN = re.compile(r'^(?P<stream>.+)-(?P<index>\d{6})\.jsonl\.gz$')
+
+
+def get_segment_prefix(log_type, child_account_id=None):
+    """
+    @return the start of the names of segment files of a stream, following
+            the naming of legacy checkpoint files
+    """
+
+    if child_account_id:
+        return f"{log_type}_{child_account_id}"
+
+    return log_type
+
+
+def list_segments(directory):
+    """
+    @param directory    Directory containing segment files
+
+    @return a dictionary mapping segment prefixes to the paths of their
+            segment files, in the order they were written
+    """
+
+    segments = {}
+
+    for path in glob.glob(os.path.join(directory, '*.jsonl.gz')):
+        match = SEGMENT_PATTERN.match(os.path.basename(path))
+        if match:
+            segments.setdefault(match.group('stream'), []).append(
+                (int(match.group('index')), path))
+
+    return {
+        prefix: [path for _, path in sorted(paths)]
+        for prefix, paths in segments.items()
+    }
+
+
+def read_segments(paths):
+    """
+    @param paths    Segment files to read, in order
+
+    @return a generator of the entries saved in the segment files. An entry
+            cut short by a crash ends the generator.
+    """
+
+    for path in paths:
+        try:
+            with gzip.open(path, 'rt') as segment_file:
+                for line in segment_file:
+                    yield json.loads(line)
+        except (EOFError, OSError, ValueError) as error:
+            Program.log("DuoLogSync: stopped reading recording '%s' due to error: %s",
+                        logging.WARNING, path, error)
+            return
+
+
+class _SegmentWriter:
+    """Save the responses received by one stream into its segment files"""
+
+    def __init__(self, directory, log_type, child_account_id):
+        self.directory = directory
+        self.log_type = log_type
+        self.child_account_id = child_account_id
+        self.prefix = get_segment_prefix(log_type, child_account_id)
+        self.segment_file = None
+        self.responses_in_segment = 0
+        self.lock = threading.Lock()
+
+        # Continue after the segments of an earlier recording, if any
+        self.next_index = len(list_segments(directory).get(self.prefix, []))
+
+    def write(self, entry):
+        """
+        Append entry to the current segment file, starting a new one when
+        the current one is full
+
+        @param entry    JSON serializable description of a response
+        """
+
+        entry = dict(entry, log_type=self.log_type, account_id=self.child_account_id)
+
+        with self.lock:
+            if self.segment_file is None or self.responses_in_segment >= SEGMENT_MAX_RESPONSES:
+                self.close()
+                path = os.path.join(
+                    self.directory, f"{self.prefix}-{self.next_index:06d}.jsonl.gz")
+                self.segment_file = gzip.open(path, 'wt')
+                self.next_index += 1
+
+            self.segment_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+            # Keep what was saved so far readable if DuoLogSync crashes
+            self.segment_file.flush()
+            self.responses_in_segment += 1
+
+    def close(self):
+        """Close the current segment file"""
+
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+            self.responses_in_segment = 0
+
+
+class Recorder:
+    """
+    Like the Program class, Recorder is not meant to be instantiated. When a
+    recording directory is given with --record, the API call of every
+    producer is wrapped so that each response, or error, is saved along with
+    when it was requested and how long it took. Responses are saved as
+    gzipped JSON lines in segment files named
+    {log_type}[_{child_account_id}]-{index}.jsonl.gz.
+    """
+
+    _directory = None
+    _writers = []
+
+    @classmethod
+    def open(cls, directory):
+        """
+        Start recording into directory, creating it if needed
+
+        @param directory    Where segment files should be saved
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        cls._directory = directory
+        cls._writers = []
+
+        Program.log("DuoLogSync: recording API responses to '%s'", logging.INFO, directory)
+
+    @classmethod
+    def is_recording(cls):
+        """@return whether API responses are being recorded"""
+        return cls._directory is not None
+
+    @classmethod
+    def wrap(cls, api_call, log_type, child_account_id=None):
+        """
+        @param api_call         Function used by a producer to call the API
+        @param log_type         Log type of the producer
+        @param child_account_id MSP child account of the producer, if any
+
+        @return a function calling api_call and recording its result
+        """
+
+        writer = _SegmentWriter(cls._directory, log_type, child_account_id)
+        cls._writers.append(writer)
+
+        def recorded_api_call(*args, **kwargs):
+            requested_at = time.time()
+            start = time.perf_counter()
+
+            try:
+                response = api_call(*args, **kwargs)
+            except RuntimeError as runtime_error:
+                writer.write({
+                    'time': requested_at,
+                    'duration': time.perf_counter() - start,
+                    'error': {
+                        'message': str(runtime_error),
+                        'status': getattr(runtime_error, 'status', None),
+                        'data': getattr(runtime_error, 'data', None),
+                    },
+                })
+                raise
+
+            writer.write({
+                'time': requested_at,
+                'duration': time.perf_counter() - start,
+                'response': response,
+            })
+
+            return response
+
+        return recorded_api_call
+
+    @classmethod
+    def close(cls):
+        """Close the segment files being written"""
+
+        for writer in cls._writers:
+            with writer.lock:
+                writer.close()
+
+        cls._writers = []
+        cls._directory = None
+
+
+class _StreamReplayer:
+    """Answer the API calls of one producer with its recorded responses"""
+
+    def __init__(self, log_type, child_account_id, paths):
+        self.log_type = log_type
+        self.child_account_id = child_account_id
+        self.entries = read_segments(paths)
+        self.finished = False
+
+    def __call__(self, *args, **kwargs):
+        entry = next(self.entries, None)
+
+        if entry is None:
+            self.finished = True
+            return None
+
+        if Replayer.realtime:
+            # Answer when the recorded response was originally received
+            answer_at = (Replayer.started_at + entry['time'] + entry['duration']
+                         - Replayer.recording_started_at)
+
+            while Program.is_running():
+                remaining = answer_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, 1))
+
+        if 'error' in entry:
+            runtime_error = RuntimeError(entry['error']['message'])
+            runtime_error.status = entry['error']['status']
+            runtime_error.data = entry['error']['data']
+            raise runtime_error
+
+        return entry['response']
+
+
+class Replayer:
+    """
+    Like the Program class, Replayer is not meant to be instantiated. When a
+    recording directory is given with --replay, producers are created for
+    the streams found in the recording, and their API calls are answered
+    with the recorded responses, either at the recorded speed or as fast as
+    possible. Once every response was replayed and written, DuoLogSync shuts
+    down.
+    """
+
+    realtime = True
+    started_at = None
+    recording_started_at = None
+
+    _streams = {}
+
+    @classmethod
+    def open(cls, directory, realtime=True):
+        """
+        Prepare to replay the recording in directory
+
+        @param directory    Directory containing segment files
+        @param realtime     Whether responses should be replayed at the speed
+                            they were recorded, rather than as fast as possible
+
+        @return a list of (log_type, child_account_id) for every stream
+                found in the recording
+        """
+
+        cls.realtime = realtime
+        cls._streams = {}
+        first_times = []
+
+        for paths in list_segments(directory).values():
+            first_entry = next(read_segments(paths[:1]), None)
+            if first_entry is None:
+                continue
+
+            stream = (first_entry['log_type'], first_entry.get('account_id'))
+            cls._streams[stream] = _StreamReplayer(stream[0], stream[1], paths)
+            first_times.append(first_entry['time'])
+
+        cls.recording_started_at = min(first_times, default=0)
+        cls.started_at = time.monotonic()
+
+        Program.log("DuoLogSync: replaying %s recorded streams from '%s' %s", logging.INFO,
+                    len(cls._streams), directory,
+                    'at recorded speed' if realtime else 'as fast as possible')
+
+        return list(cls._streams)
+
+    @classmethod
+    def is_replaying(cls):
+        """@return whether recorded API responses are being replayed"""
+        return bool(cls._streams)
+
+    @classmethod
+    def get_api_call(cls, log_type, child_account_id=None):
+        """
+        @return a function returning the next recorded response of a stream
+                each time it is called, or None once every response was
+                returned
+        """
+
+        return cls._streams[(log_type, child_account_id)]
+
+    @classmethod
+    def is_finished(cls):
+        """
+        @return whether every recorded response was replayed and taken from
+                the queue by its consumer
+        """
+
+        for (log_type, child_account_id), stream in cls._streams.items():
+            if not stream.finished:
+                return False
+
+            queue_depth = Metrics.get(QUEUE_DEPTH, stream_labels(log_type, child_account_id))
+            if queue_depth:
+                return False
+
+        return True
+
+    @classmethod
+    async def run(cls):
+        """
+        Shut DuoLogSync down once the replay is finished. A consumer still
+        writing the last page it took from its queue finishes writing it.
+        """
+
+        while Program.is_running():
+            if cls.is_finished():
+                Program.initiate_shutdown('finished replaying recorded API responses')
+                break
+
+            try:
+                await Scheduler.sleep(0.1)
+            except ProgramShutdownError:
+                break
+
+    @classmethod
+    def close(cls):
+        """Forget the recording being replayed"""
+        cls._streams = {}
@@ -0,0 +1,173 @@
+"""
+Definition of the Scheduler class
+"""
+
+import asyncio
+import heapq
+import math
+
+from duologsync.program import Program, ProgramShutdownError
+
+
+class Scheduler:
+    """
+    The Scheduler class is used not to create objects, but to wake up tasks
+    sleeping until a deadline on the monotonic clock of the event loop. A
+    single timer serves every sleeping task: deadlines are rounded up to the
+    next tick of RESOLUTION seconds, and every task due at the same tick is
+    woken up by the same timer callback, so that thousands of streams polling
+    at the same rate cost a handful of wakeups. Sleeping tasks are woken up as
+    soon as shutdown is initiated rather than checking for it periodically.
+    """
+
+    # Seconds between two ticks of the timer
+    RESOLUTION = 0.1
+
+    # Event loop the timer runs on
+    _loop = None
+
+    # Heap of the ticks at which tasks are waiting
+    _ticks = []
+
+    # Maps a tick to the futures of the tasks waiting for it
+    _waiters = {}
+
+    # Timer callback for the earliest tick, and that tick
+    _timer = None
+    _timer_tick = None
+
+    @classmethod
+    def time(cls):
+        """
+        @return the current time on the monotonic clock deadlines are set on
+        """
+
+        return asyncio.get_event_loop().time()
+
+    @classmethod
+    def next_deadline(cls, deadline, period, now=None):
+        """
+        Deadlines are set at a fixed rate rather than a fixed delay after the
+        work of a period is done, so that they do not drift. Deadlines missed
+        because the work took longer than a period are skipped.
+
+        @param deadline The previous deadline
+        @param period   Seconds between two deadlines
+        @param now      Current time on the monotonic clock
+
+        @return the first deadline of the form deadline + n * period after now,
+                or now if period is not positive and that deadline has passed
+        """
+
+        if now is None:
+            now = cls.time()
+
+        if period <= 0:
+            return max(deadline, now)
+
+        deadline += period
+
+        if deadline < now:
+            deadline += math.ceil((now - deadline) / period) * period
+
+        return deadline
+
+    @classmethod
+    async def sleep(cls, duration):
+        """
+        @param duration The number of seconds to sleep for
+
+        @raise ProgramShutdownError if shutdown is initiated meanwhile
+        """
+
+        await cls.sleep_until(cls.time() + duration)
+
+    @classmethod
+    async def sleep_until(cls, deadline, wake=None):
+        """
+        @param deadline Time on the monotonic clock until which to sleep
+        @param wake     Future ending the sleep early once done, if any
+
+        @return whether the deadline was reached, rather than wake done
+
+        @raise ProgramShutdownError if shutdown is initiated meanwhile
+        """
+
+        shutdown = Program.get_shutdown_future()
+        if shutdown.done():
+            raise ProgramShutdownError
+
+        loop = cls._get_loop()
+        future = loop.create_future()
+        tick = math.ceil(deadline / cls.RESOLUTION)
+
+        waiters = cls._waiters.get(tick)
+        if waiters is None:
+            waiters = cls._waiters[tick] = []
+            heapq.heappush(cls._ticks, tick)
+        waiters.append(future)
+        cls._set_timer()
+
+        waiting = [future, shutdown]
+        if wake is not None:
+            waiting.append(wake)
+
+        try:
+            await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Forgotten by the timer callback if it has not run yet
+            future.cancel()
+
+        if future.cancelled():
+            if shutdown.done():
+                raise ProgramShutdownError
+            return False
+
+        return True
+
+    @classmethod
+    def get_sleeping(cls):
+        """@return the number of tasks sleeping until a deadline"""
+
+        return sum(
+            not future.done() for waiters in cls._waiters.values() for future in waiters)
+
+    @classmethod
+    def _get_loop(cls):
+        loop = asyncio.get_event_loop()
+
+        # Tasks of another event loop will never be woken up
+        if loop is not cls._loop:
+            cls._loop = loop
+            cls._ticks = []
+            cls._waiters = {}
+            cls._timer = None
+            cls._timer_tick = None
+
+        return loop
+
+    @classmethod
+    def _set_timer(cls):
+        tick = cls._ticks[0]
+
+        if cls._timer is not None:
+            if cls._timer_tick <= tick:
+                return
+            cls._timer.cancel()
+
+        cls._timer = cls._loop.call_at(tick * cls.RESOLUTION, cls._wake_up)
+        cls._timer_tick = tick
+
+    @classmethod
+    def _wake_up(cls):
+        cls._timer = None
+        cls._timer_tick = None
+        now = cls._loop.time()
+
+        while cls._ticks and cls._ticks[0] * cls.RESOLUTION <= now:
+            for future in cls._waiters.pop(heapq.heappop(cls._ticks)):
+                if not future.done():
+                    future.set_result(None)
+
+        if cls._ticks:
+            cls._set_timer()
@@ -0,0 +1,314 @@
+"""
+Definition of the Stream and Streams classes, used to keep track of the
+Producer/Consumer pair running for every log type, optionally for an MSP child
+account, so that a pair can be stopped or reconfigured while the others keep
+running
+"""
+
+import asyncio
+import logging
+import time
+
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.aggregation import Aggregator
+from duologsync.consumer.filter import RecordFilter
+from duologsync.metrics import STREAM_QUARANTINED, STREAM_RESTARTS, Metrics, stream_labels
+from duologsync.program import Program, ProgramShutdownError
+from duologsync.scheduler import Scheduler
+
+
+class Stream:
+    """
+    A Producer/Consumer pair along with the asyncio tasks running them
+    """
+
+    def __init__(self, log_type, child_account_id, producer, consumer, tasks,
+                 restart=None):
+        self.log_type = log_type
+        self.child_account_id = child_account_id
+        self.producer = producer
+        self.consumer = consumer
+        self.tasks = tasks
+
+        # Called with a writer to start a new stream replacing this one
+        self.restart = restart
+        self.restarts = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def key(self):
+        """@return the key identifying this stream, as in CheckpointStore"""
+        return CheckpointStore.stream_key(self.log_type, self.child_account_id)
+
+    def reconfigure(self, writer, log_format):
+        """
+        Have the consumer of this stream write the next logs it formats with
+        log_format to writer, filtered and rolled up as currently set in
+        config. Logs being written when this is called are written as before.
+
+        @param writer       Object for writing logs to a server
+        @param log_format   The format logs should have once consumed
+        """
+
+        self.consumer.writer = writer
+        self.consumer.log_format = log_format
+        self.consumer.record_filter = RecordFilter.create(self.log_type)
+        self.consumer.aggregator = Aggregator.create(self.log_type)
+
+    def get_error(self):
+        """@return the exception a task of this stream failed with, or None"""
+
+        for task in self.tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                return task.exception()
+
+        return None
+
+    async def stop(self):
+        """
+        Cancel the tasks of this stream and wait for them to finish. The
+        consumer saves the offset of the last log it wrote, so a stream
+        started again later continues from there.
+        """
+
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.wait(self.tasks)
+
+
+class Streams:
+    """
+    Like the Program class, Streams is not meant to be instantiated. It maps
+    the key of every running stream to its Stream object.
+    """
+
+    _streams = {}
+
+    # Tasks waiting to restart streams which failed
+    _restarts = set()
+
+    # Maps the key of every stream which kept failing and is not restarted
+    # anymore to the labels of its metrics
+    _quarantined = {}
+
+    # Done once a stream is added, for run to watch the tasks of the stream
+    _added = None
+
+    @classmethod
+    def add(cls, stream):
+        """
+        @param stream   Stream to keep track of, replacing any stream with
+                        the same key
+        """
+
+        cls._streams[stream.key] = stream
+
+        if cls._added is not None and not cls._added.done():
+            cls._added.set_result(None)
+
+    @classmethod
+    def get(cls, log_type, child_account_id=None):
+        """@return the running stream of a log type, or None"""
+        return cls._streams.get(CheckpointStore.stream_key(log_type, child_account_id))
+
+    @classmethod
+    def get_all(cls):
+        """@return a list of every running stream"""
+        return list(cls._streams.values())
+
+    @classmethod
+    def get_quarantined(cls):
+        """@return the keys of every quarantined stream"""
+        return sorted(cls._quarantined)
+
+    @classmethod
+    def get_pending_restarts(cls):
+        """@return the number of failed streams waiting to be restarted"""
+        return sum(not restart.done() for restart in cls._restarts)
+
+    @classmethod
+    async def remove(cls, stream):
+        """
+        Stop stream and stop keeping track of it
+
+        @param stream   Stream to stop
+        """
+
+        Program.log("DuoLogSync: stopping the %s stream", logging.INFO, stream.key)
+        if cls._streams.get(stream.key) is stream:
+            del cls._streams[stream.key]
+
+        await stream.stop()
+
+    @classmethod
+    async def run(cls):
+        """
+        Wait until every stream is done, including streams added while
+        waiting. A stream that failed is restarted, or quarantined if it keeps
+        failing, while the other streams keep running. A stream that was
+        stopped is not an error. Once shutdown is initiated, streams are
+        drained.
+        """
+
+        while True:
+            for stream in cls.get_all():
+                error = stream.get_error()
+                if error is not None:
+                    await cls.supervise(stream, error)
+
+            cls._restarts = {restart for restart in cls._restarts if not restart.done()}
+            tasks = [task for stream in cls.get_all() for task in stream.tasks]
+            pending = [task for task in tasks + list(cls._restarts) if not task.done()]
+
+            if not pending:
+                if not Program.is_running():
+                    break
+
+                if cls._quarantined and not cls._streams:
+                    Program.initiate_shutdown("every stream is quarantined")
+                    break
+
+                # Streams may still be added by a config reload
+                try:
+                    await Scheduler.sleep(1)
+                except ProgramShutdownError:
+                    break
+                continue
+
+            shutdown = Program.get_shutdown_future()
+            if shutdown.done():
+                await cls.drain(pending)
+                continue
+
+            # Streams added meanwhile, such as by a config reload, are
+            # watched from the next round
+            cls._added = asyncio.get_event_loop().create_future()
+            try:
+                await asyncio.wait(pending + [shutdown, cls._added],
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                cls._added.cancel()
+                cls._added = None
+
+    @classmethod
+    async def supervise(cls, stream, error):
+        """
+        Stop a stream that failed and restart it after a backoff doubling
+        with every restart in a row, up to max_backoff. A stream failing
+        again after max_restarts restarts in a row is quarantined instead,
+        until the config is reloaded.
+
+        @param stream   Stream of which a task failed
+        @param error    Exception the task failed with
+        """
+
+        await cls.remove(stream)
+
+        if not Program.is_running():
+            return
+
+        labels = stream_labels(stream.log_type, stream.child_account_id)
+        max_backoff = Config.get_supervisor_max_backoff()
+
+        # A stream which ran long enough since its last restart recovered
+        restarts = stream.restarts
+        if time.monotonic() - stream.started_at > max_backoff:
+            restarts = 0
+
+        if stream.restart is None or restarts >= Config.get_supervisor_max_restarts():
+            Program.log("DuoLogSync: quarantining the %s stream after %s restarts, it "
+                        "failed with: %s", logging.ERROR, stream.key, restarts, error)
+            cls._quarantined[stream.key] = labels
+            Metrics.set(STREAM_QUARANTINED, labels, 1)
+            return
+
+        backoff = min(Config.get_supervisor_backoff() * 2 ** restarts, max_backoff)
+        Program.log("DuoLogSync: restarting the %s stream in %s seconds, it failed with: %s",
+                    logging.WARNING, stream.key, backoff, error)
+        cls._restarts.add(asyncio.ensure_future(cls.restart(stream, backoff, restarts + 1)))
+
+    @classmethod
+    async def restart(cls, stream, backoff, restarts):
+        """
+        Start a stream again, from the last log it wrote, once backoff seconds
+        have passed
+
+        @param stream   Stream which failed
+        @param backoff  Seconds to wait before starting it again
+        @param restarts Restarts of the stream in a row, this one included
+        """
+
+        try:
+            await Scheduler.sleep(backoff)
+        except ProgramShutdownError:
+            return
+
+        # Started again by a config reload meanwhile
+        if cls.get(stream.log_type, stream.child_account_id) is not None:
+            return
+
+        stream.restart(stream.consumer.writer)
+        new_stream = cls.get(stream.log_type, stream.child_account_id)
+        if new_stream is None:
+            return
+
+        new_stream.restarts = restarts
+        new_stream.producer.paused = stream.producer.paused
+        new_stream.producer.overrides = stream.producer.overrides
+        Metrics.inc(STREAM_RESTARTS, stream_labels(stream.log_type, stream.child_account_id))
+
+        # Without checkpointing, the offset of the last log written is only
+        # known by the consumer which wrote it
+        log_offset = stream.consumer.log_offset
+        if log_offset is not None:
+            new_stream.consumer.log_offset = log_offset
+            new_stream.producer.cursor = new_stream.producer.cursor.from_checkpoint(log_offset)
+
+    @classmethod
+    def forget_failures(cls):
+        """
+        Cancel pending restarts and lift quarantines, for the streams to be
+        started again right away by a config reload
+        """
+
+        for restart in cls._restarts:
+            restart.cancel()
+        cls._restarts = set()
+
+        for labels in cls._quarantined.values():
+            Metrics.set(STREAM_QUARANTINED, labels, 0)
+        cls._quarantined = {}
+
+    @classmethod
+    async def drain(cls, tasks):
+        """
+        Give the streams until the drain timeout after shutdown to write the
+        pages already fetched, then cancel those still running. Pages a
+        stream did not write are fetched again after a restart.
+
+        @param tasks    Tasks of the streams still running
+        """
+
+        timeout = max(Config.get_shutdown_drain_timeout() - Program.get_time_since_shutdown(), 0)
+        Program.log("DuoLogSync: draining streams for up to %.0f seconds", logging.INFO, timeout)
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if not pending:
+            return
+
+        Program.log("DuoLogSync: stopping %s tasks of streams which did not finish writing before "
+                    "the drain timeout", logging.WARNING, len(pending))
+
+        for task in pending:
+            task.cancel()
+
+        await asyncio.wait(pending)
+
+    @classmethod
+    def clear(cls):
+        """Forget every stream"""
+        cls._streams = {}
+        cls._restarts = set()
+        cls._quarantined = {}
@@ -3,17 +3,16 @@ Unrelated, but useful functions used in various places throughout DuoLogSync.
 """
 
 import asyncio
-import json
 import logging
 import os
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
-import duo_client # type: ignore
-
 from duologsync.__version__ import __version__
+from duologsync.checkpoint import CheckpointStore
 from duologsync.config import Config
-from duologsync.program import Program, ProgramShutdownError
+from duologsync.program import Program
+from duologsync.scheduler import Scheduler
 
 EXECUTOR = ThreadPoolExecutor(3)
 MILLISECOND_BASED_LOG_TYPES = [
@@ -22,29 +21,22 @@ MILLISECOND_BASED_LOG_TYPES = [
     Config.ACTIVITY,
     Config.TELEPHONY,
 ]
+ISO_TIMESTAMP_FORMATS = ["%Y-%m-%dT%H:%M:%S.%f+00:00", "%Y-%m-%dT%H:%M:%S+00:00"]
 
 
 async def restless_sleep(duration):
     """
-    Wrapper for the asyncio.sleep function to sleep for duration seconds
-    but check every second that DuoLogSync is still running. This is
-    necessary in the case that the program should be shutting down but
-    a producer is in the middle of a 2 minute poll and will not be aware
-    of program shutdown until much later.
+    Sleep for duration seconds, unless DuoLogSync shuts down meanwhile. This
+    is necessary in the case that the program should be shutting down but a
+    producer is in the middle of a 2 minute poll and would not be aware of
+    program shutdown until much later.
 
     @param duration The number of seconds to sleep for
-    """
-
-    while duration > 0:
-        await asyncio.sleep(1)
 
-        # Poll for program running state
-        if Program.is_running():
-            duration = duration - 1
-            continue
+    @raise ProgramShutdownError as soon as shutdown is initiated
+    """
 
-        # Otherwise, program is done running, raise an exception to be caught
-        raise ProgramShutdownError
+    await Scheduler.sleep(duration)
 
 
 async def run_in_executor(function_obj):
@@ -71,77 +63,128 @@ def store_failed_udp_ingestion_logs(log_type, checkpoint_directory, log):
     # Open the udp file, 'with' statement automatically closes it
     with open(file_path, "a+") as udp_file:
         udp_file.write(log.decode('utf-8'))
-        Program.log(
-            f"{log_type} producer: storing failed UDP logs in backlog file at '{file_path}'",
-            logging.INFO,
-        )
+        Program.log("%s producer: storing failed UDP logs in backlog file at '%s'", logging.INFO,
+                    log_type, file_path)
 
 def get_log_offset(
     log_type, recover_log_offset, checkpoint_directory, child_account_id=None
 ):
     """
     Retrieve the offset from which logs of log_type should be fetched either by
-    using the default offset or by using a timestamp saved in a checkpoint file
+    using the default offset or by using an offset saved in the checkpoint store
 
     @param log_type             Name of the log for which recovery is occurring
     @param recover_log_offset   Whether checkpoint files should be used to
                                 retrieve log offset info
-    @param checkpoint_directory Directory containing log offset checkpoint files
+    @param checkpoint_directory Directory containing the checkpoint store
+    @param child_account_id     MSP child account whose offset is retrieved
 
     @return the last offset read for a log type based on checkpointing data
     """
 
     milliseconds_per_second = 1000
-    log_offset = Config.get_api_offset() or 0
+    log_offset = Config.get_api_offset(log_type, child_account_id) or 0
 
     # Auth, Trust Monitor, Telephony, and Activity must have timestamp represented in milliseconds, not seconds
     if log_type in MILLISECOND_BASED_LOG_TYPES:
         log_offset *= milliseconds_per_second  # type: ignore
 
-    # In this case, look for a checkpoint file from which to read the log offset
+    # In this case, look for a checkpoint from which to read the log offset
     if recover_log_offset:
-        try:
-            checkpoint_file_path = (
-                os.path.join(
-                    checkpoint_directory,
-                    f"{log_type}_checkpoint_data_{child_account_id}.txt",
-                )
-                if child_account_id
-                else os.path.join(
-                    checkpoint_directory, f"{log_type}_checkpoint_data.txt"
-                )
-            )
-            Program.log(
-                f"{log_type} producer: recovering log offset from checkpoint file at '{checkpoint_file_path}'",
-                logging.INFO,
-            )
-
-            # Open the checkpoint file, 'with' statement automatically closes it
-            with open(checkpoint_file_path) as checkpoint:
-                # Set log_offset equal to the contents of the checkpoint file
-                log_offset = json.loads(checkpoint.read())
-
-        # Most likely, the checkpoint file doesn't exist
-        except OSError as os_error:
-            err = extract_error_info(os_error, "filename")
+        checkpoint_offset = CheckpointStore.get_offset(
+            log_type, child_account_id, directory=checkpoint_directory
+        )
+
+        if checkpoint_offset is not None:
+            Program.log("%s producer: recovered log offset from checkpoint store at '%s'",
+                        logging.INFO, log_type, CheckpointStore.get_path())
+            log_offset = checkpoint_offset
+
+        # The stream has never been checkpointed
+        else:
             display_offset = log_offset
             if log_type in MILLISECOND_BASED_LOG_TYPES:
                 display_offset /= milliseconds_per_second
             iso_timestamp = datetime.fromtimestamp(
                 display_offset, tz=timezone.utc
             ).isoformat()
-            Program.log(
-                f"{log_type} producer: could not access checkpoint file '{err['filename']}' to read log offset due to error: {err['error_message']} error_code: {err['error_code']}",
-                logging.WARNING,
-            )
-            Program.log(
-                f"{log_type} producer: the logs will be consumed from offset: '{iso_timestamp} (UTC)'",
-                logging.INFO,
-            )
+            Program.log("%s producer: no checkpoint found in '%s' to read log offset",
+                        logging.WARNING, log_type, CheckpointStore.get_path())
+            Program.log("%s producer: the logs will be consumed from offset: '%s (UTC)'",
+                        logging.INFO, log_type, iso_timestamp)
 
     return log_offset
 
 
+def get_log_timestamp(log):
+    """
+    Retrieve the time at which the event described by a log occurred. Each log
+    type stores it differently: Trust Monitor uses surfaced_timestamp in
+    milliseconds, Auth and Telephony use timestamp in seconds and Activity
+    uses an ISO 8601 ts string.
+
+    @param log  Individual log from which to get the event time
+
+    @return the event time of log as seconds since the epoch or None if the
+            log does not have one
+    """
+
+    surfaced_timestamp = log.get("surfaced_timestamp")
+    if surfaced_timestamp:
+        return int(surfaced_timestamp) / 1000
+
+    timestamp = log.get("timestamp")
+    if isinstance(timestamp, (int, float)):
+        # Some log types report timestamp in milliseconds
+        if timestamp > 10 ** 11:
+            return timestamp / 1000
+        return timestamp
+
+    iso_timestamp = log.get("ts") or log.get("isotimestamp")
+    if isinstance(iso_timestamp, str):
+        for timestamp_format in ISO_TIMESTAMP_FORMATS:
+            try:
+                return datetime.strptime(
+                    iso_timestamp, timestamp_format
+                ).replace(tzinfo=timezone.utc).timestamp()
+            except ValueError:
+                continue
+
+    return None
+
+
+def get_offset_timestamp(log_offset):
+    """
+    Retrieve the time up to which a stream shipped logs from its checkpoint.
+    Depending on the log type and on the version of DuoLogSync which saved
+    it, an offset is a timestamp, a 'timestamp,id' string or a
+    [timestamp, txid] list, with the timestamp in seconds or milliseconds.
+
+    @param log_offset   Offset saved for a stream
+
+    @return the time of log_offset as seconds since the epoch or None if the
+            offset has none of these formats
+    """
+
+    if isinstance(log_offset, list) and log_offset:
+        log_offset = log_offset[0]
+
+    if isinstance(log_offset, str):
+        log_offset = log_offset.split(',', 1)[0]
+
+    if isinstance(log_offset, bool):
+        return None
+
+    try:
+        timestamp = float(log_offset)
+    except (TypeError, ValueError):
+        return None
+
+    if timestamp > 10 ** 11:
+        return timestamp / 1000
+    return timestamp
+
+
 def create_admin(ikey, skey, host, is_msp=False, proxy_server=None, proxy_port=None):
     """
     Create an Admin object (from the duo_client library) with the given values.
@@ -156,27 +199,25 @@ def create_admin(ikey, skey, host, is_msp=False, proxy_server=None, proxy_port=N
     @return a newly created Admin object
     """
 
+    # Imported here so that it is loaded while connections to servers are
+    # being made, rather than delaying the start of DuoLogSync
+    import duo_client  # type: ignore
+
     if is_msp:
         admin = duo_client.Accounts(
             ikey=ikey, skey=skey, host=host, user_agent=f"Duo Log Sync/{__version__}"
         )
-        Program.log(
-            f"duo_client Account_Admin initialized for ikey: {ikey}, host: {host}",
-            logging.INFO,
-        )
+        Program.log("duo_client Account_Admin initialized for ikey: %s, host: %s", logging.INFO,
+                    ikey, host)
     else:
         admin = duo_client.Admin(
             ikey=ikey, skey=skey, host=host, user_agent=f"Duo Log Sync/{__version__}"
         )
-        Program.log(
-            f"duo_client Admin initialized for ikey: {ikey}, host: {host}", logging.INFO
-        )
+        Program.log("duo_client Admin initialized for ikey: %s, host: %s", logging.INFO, ikey, host)
 
     if proxy_server and proxy_port:
         admin.set_proxy(host=proxy_server, port=proxy_port)
-        Program.log(
-            f"duo_client Proxy configured: {proxy_server}:{proxy_port}", logging.INFO
-        )
+        Program.log("duo_client Proxy configured: %s:%s", logging.INFO, proxy_server, proxy_port)
 
     return admin
 
@@ -6,10 +6,12 @@ import asyncio
 import ssl
 import logging
 import socket
+import time
 import traceback
 from socket import gaierror
 
 from duologsync.config import Config
+from duologsync.metrics import WRITER_DRAIN_DURATION, Metrics
 from duologsync.program import Program
 from duologsync import util
 
@@ -53,20 +55,25 @@ class Writer:
     and open_connections objects for sending data over UDP, TCP and TCPSSL.
     """
 
-    def __init__(self, server):
+    def __init__(self, server, connect=True):
         # Needed to determine what type of writer to create and how to use it
+        self.server_id = server['id']
         self.protocol = server['protocol']
         self.hostname = server['hostname']
         self.port = server['port']
-
-        # Create the actual writer
-        self.writer = asyncio.get_event_loop().run_until_complete(
-            self.create_writer(
-                self.hostname,
-                self.port,
-                server.get('cert_filepath')
+        self.cert_filepath = server.get('cert_filepath')
+        self.writer = None
+
+        # Create the actual writer, unless the event loop is already running
+        # and connect() will be awaited instead
+        if connect:
+            self.writer = asyncio.get_event_loop().run_until_complete(
+                self.create_writer(
+                    self.hostname,
+                    self.port,
+                    self.cert_filepath
+                )
             )
-        )
 
     @staticmethod
     def create_writers(servers):
@@ -79,15 +86,125 @@ class Writer:
         @return a dictionary mapping server name to writer object
         """
 
-        writers = {}
+        return asyncio.get_event_loop().run_until_complete(
+            Writer.connect_writers(servers))
+
+    @staticmethod
+    async def connect_writers(servers):
+        """
+        Like create_writers, but connects to every server at the same time
+        rather than one after the other, for use while the event loop runs.
+
+        @param servers  List of servers for which to create writer objects
+
+        @return a dictionary mapping server name to writer object
+        """
 
-        for server in servers:
-            server_id = server['id']
-            writer = Writer(server)
-            writers[server_id] = writer
+        writers = {server['id']: Writer(server, connect=False) for server in servers}
+        await asyncio.gather(*(writer.connect() for writer in writers.values()))
 
         return writers
 
+    async def connect(self, shutdown_on_error=True):
+        """
+        Create the actual writer of a Writer object made with connect=False
+
+        @param shutdown_on_error    Whether DuoLogSync should shut down if the
+                                    connection cannot be made
+
+        @return whether the connection was made
+        """
+
+        self.writer = await self.create_writer(
+            self.hostname,
+            self.port,
+            self.cert_filepath,
+            shutdown_on_error=shutdown_on_error
+        )
+
+        return self.writer is not None
+
+    def get_state(self):
+        """
+        @return a dictionary describing the server of this writer and the
+                state of its connection
+        """
+
+        state = {
+            'server': self.server_id,
+            'protocol': self.protocol,
+            'hostname': self.hostname,
+            'port': self.port,
+            'connected': self.writer is not None,
+        }
+
+        # Only TCP connections buffer data, UDP writers are plain sockets
+        transport = getattr(self.writer, 'transport', None)
+        if transport is not None:
+            state['closing'] = transport.is_closing()
+            state['write_buffer_bytes'] = transport.get_write_buffer_size()
+
+        return state
+
+    def close(self):
+        """
+        Close the connection of this writer. Data already written to a TCP
+        connection is still sent before it is closed.
+        """
+
+        if self.writer is None:
+            return
+
+        Program.log("DuoLogSync: Closing connection to %s:%s", logging.INFO, self.hostname,
+                    self.port)
+        self.writer.close()
+        self.writer = None
+
+    async def close_gracefully(self):
+        """
+        Close the connection of this writer and wait until the data written
+        to it, possibly still buffered, was sent
+        """
+
+        writer = self.writer
+        self.close()
+
+        # UDP sends every datagram right away. Python 3.6 cannot wait
+        if writer is None or self.protocol == 'UDP' or not hasattr(writer, 'wait_closed'):
+            return
+
+        try:
+            await writer.wait_closed()
+        except OSError as error:
+            Program.log("DuoLogSync: %s while closing connection to %s:%s", logging.WARNING, error,
+                        self.hostname, self.port)
+
+    @staticmethod
+    async def close_writers(writers, timeout):
+        """
+        Close every writer, giving them timeout seconds to send the data
+        written to them
+
+        @param writers  Writer objects to close
+        @param timeout  Seconds to wait for data to be sent
+        """
+
+        tasks = [asyncio.ensure_future(writer.close_gracefully()) for writer in writers]
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if not pending:
+            return
+
+        Program.log("DuoLogSync: %s connections did not send the logs written to them before the "
+                    "drain timeout", logging.WARNING, len(pending))
+
+        for task in pending:
+            task.cancel()
+
+        await asyncio.wait(pending)
+
     async def write(self, data, log_type):
         """
         Wrapper for writer functions. Makes it easy for parts of a program that
@@ -96,6 +213,8 @@ class Writer:
 
         @param data The information to be written over a network connection
         """
+        write_start = time.perf_counter()
+
         if self.protocol == 'UDP':
             try:
                 self.writer.sendto(data, (self.hostname, self.port))
@@ -105,7 +224,7 @@ class Writer:
                 # Store the failed UDP ingestion logs in a file and log the error
                 # message to the console
                 err = util.extract_error_info(error)
-                Program.log(f"{log_type} producer: error while sending data to {self.hostname}:{self.port} error_message: {err['error_message']} error_code: {err['error_code']}", logging.WARNING)
+                Program.log("%s producer: error while sending data to %s:%s error_message: %s error_code: %s", logging.WARNING, log_type, self.hostname, self.port, err['error_message'], err['error_code'])
                 util.store_failed_udp_ingestion_logs(
                     log_type,
                     Config.get_checkpoint_dir(),
@@ -117,22 +236,30 @@ class Writer:
                 await self.writer.drain()
             except OSError as error:
                 err = util.extract_error_info(error)
-                Program.log(f"{log_type} writer: {type(error).__name__} while sending data to {self.hostname}:{self.port} over {self.protocol} - error_message: {err['error_message']} error_code: {err['error_code']}\n{traceback.format_exc()}", logging.ERROR,)
+                Program.log("%s writer: %s while sending data to %s:%s over %s - error_message: %s error_code: %s\n%s", logging.ERROR, log_type, type(error).__name__, self.hostname, self.port, self.protocol, err['error_message'], err['error_code'], traceback.format_exc())
                 raise
 
-    async def create_writer(self, host, port, cert_filepath):
+        Metrics.observe(
+            WRITER_DRAIN_DURATION,
+            {'server': self.server_id, 'endpoint': log_type},
+            time.perf_counter() - write_start,
+        )
+
+    async def create_writer(self, host, port, cert_filepath, shutdown_on_error=True):
         """
         Wrapper for functions to create TCP or UDP connections.
 
-        @param host             Hostname of the network connection to establish
-        @param port             Port of the network connection to establish
-        @param cert_filepath    Path to file containing SSL certificate
+        @param host                 Hostname of the network connection to establish
+        @param port                 Port of the network connection to establish
+        @param cert_filepath        Path to file containing SSL certificate
+        @param shutdown_on_error    Whether to shut DuoLogSync down, rather
+                                    than only log, if an error occurs
 
         @return a 'writer' object for writing data over the connection made
         """
 
-        Program.log(f"DuoLogSync: Opening connection to {host}:{port} with protocol {self.protocol}",
-                    logging.INFO)
+        Program.log("DuoLogSync: Opening connection to %s:%s with protocol %s", logging.INFO, host,
+                    port, self.protocol)
 
         # Message to be logged if an error occurs in this function
         help_message = f"DuoLogSync: check that host-{host} and port-{port} are correct in the configuration file '{Config.get_config_file_path()}'"
@@ -171,7 +298,11 @@ class Writer:
         else:
             return writer
 
-        Program.initiate_shutdown(shutdown_reason)
+        if shutdown_on_error:
+            Program.initiate_shutdown(shutdown_reason)
+        else:
+            Program.log("DuoLogSync: %s", logging.ERROR, shutdown_reason)
+
         Program.log(help_message, logging.ERROR)
         return None
 
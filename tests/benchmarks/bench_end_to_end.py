@@ -0,0 +1,251 @@
+"""
+End-to-end throughput benchmark of the whole duologsync.app.main pipeline,
+from a FakeDuoAPI to a Sink over TCP, UDP or TLS.
+
+Usage:
+    python -m tests.benchmarks.bench_end_to_end --records 20000 --output e2e.json
+
+DuoLogSync runs in a child process so that its peak RSS is measured on its
+own. Records per second are measured from the first API request to the last
+record received, which leaves out start up. Latency is measured for every
+JSON record, from when the fake API first served it to when the sink
+received it. This benchmark needs a Unix system, and the openssl command for
+--protocol TCPSSL.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import yaml
+
+from duologsync.__version__ import __version__
+from duologsync.config import Config
+from tests.benchmarks.fake_duo_api import LOG_PATHS, FakeDuoAPI
+from tests.benchmarks.sink import Sink, create_self_signed_certificate
+
+RESULTS_FORMAT_VERSION = 1
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, fraction):
+    """
+    @param values   Values from which to pick a percentile
+    @param fraction Percentile to pick, between 0 and 1
+
+    @return the value below which fraction of values fall, or None if there
+            are no values
+    """
+
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def write_config(directory, args, sink, certfile):
+    """
+    Write a config for DuoLogSync to send the logs of the fake API to sink
+
+    @return the path of the config written
+    """
+
+    server = {
+        'id': 'sink',
+        'hostname': 'localhost' if args.protocol == 'TCPSSL' else '127.0.0.1',
+        'port': sink.port,
+        'protocol': args.protocol,
+    }
+    if certfile:
+        server['cert_filepath'] = certfile
+
+    config = {
+        'version': '1.0.0',
+        'dls_settings': {
+            'log_filepath': os.path.join(directory, 'duologsync.log'),
+            'log_format': args.log_format,
+            'api': {'offset': 1},
+            'checkpointing': {'enabled': True, 'directory': directory},
+        },
+        'servers': [server],
+        'account': {
+            'ikey': 'DIXXXXXXXXXXXXXXXXXX',
+            'skey': 'benchmark-secret-key',
+            'hostname': 'api-first.test.duosecurity.com',
+            'endpoint_server_mappings': [
+                {'endpoints': args.endpoints, 'server': 'sink'},
+            ],
+            'is_msp': args.child_accounts > 0,
+        },
+    }
+
+    config_path = os.path.join(directory, 'config.yml')
+    with open(config_path, 'w') as config_file:
+        yaml.safe_dump(config, config_file)
+
+    return config_path
+
+
+def get_peak_rss_bytes():
+    """@return the peak RSS of the largest child process waited for"""
+
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    # Linux reports kilobytes while MacOS reports bytes
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def run(args):
+    """
+    Run DuoLogSync against a fake API and a sink until every record arrived
+    or args.timeout seconds passed
+
+    @return the results of the run, ready to be saved as JSON
+    """
+
+    api = FakeDuoAPI(
+        records=args.records, log_types=args.endpoints,
+        child_accounts=args.child_accounts, latency=args.latency,
+        rate_limit_probability=args.rate_limit_probability)
+
+    # With child accounts, each of them has its own stream of authlogs
+    expected_records = args.records * (args.child_accounts or len(args.endpoints))
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = keyfile = None
+        if args.protocol == 'TCPSSL':
+            certfile = os.path.join(directory, 'sink.crt')
+            keyfile = os.path.join(directory, 'sink.key')
+            create_self_signed_certificate(certfile, keyfile)
+
+        sink = Sink(args.protocol, api.served_at, certfile, keyfile)
+        config_path = write_config(directory, args, sink, certfile)
+
+        api.start()
+        sink.start()
+
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'tests.benchmarks.run_duologsync',
+             '--api-port', str(api.port), '--poll-interval', str(args.poll_interval),
+             config_path],
+            cwd=REPOSITORY_ROOT, stdout=subprocess.DEVNULL)
+
+        try:
+            complete = sink.wait_for(
+                expected_records, args.timeout, unique=args.log_format == Config.JSON)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+            api.stop()
+            sink.stop()
+
+    elapsed = None
+    if api.first_request_at is not None and sink.last_received_at is not None:
+        elapsed = sink.last_received_at - api.first_request_at
+
+    is_json = args.log_format == Config.JSON
+    records_received = len(sink.ids) if is_json else sink.records_received
+    latencies = sink.latencies
+
+    return {
+        'version': RESULTS_FORMAT_VERSION,
+        'duologsync_version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'parameters': {
+            'records': args.records,
+            'endpoints': args.endpoints,
+            'child_accounts': args.child_accounts,
+            'log_format': args.log_format,
+            'protocol': args.protocol,
+            'latency': args.latency,
+            'rate_limit_probability': args.rate_limit_probability,
+            'poll_interval': args.poll_interval,
+        },
+        'results': {
+            'complete': complete,
+            'records_expected': expected_records,
+            'records_received': records_received,
+            'duplicates_received': sink.records_received - len(sink.ids) if is_json else None,
+            'api_requests': api.requests,
+            'api_rate_limited': api.rate_limited,
+            'elapsed_seconds': elapsed,
+            'wall_seconds': time.perf_counter() - start,
+            'records_per_second': records_received / elapsed if elapsed else None,
+            'latency_p50_seconds': percentile(latencies, 0.5),
+            'latency_p99_seconds': percentile(latencies, 0.99),
+            'latency_max_seconds': max(latencies) if latencies else None,
+            'peak_rss_bytes': get_peak_rss_bytes(),
+            'exit_code': process.returncode,
+        },
+    }
+
+
+def main(args=None):
+    """
+    Run the benchmark, optionally saving its results
+
+    @return the exit code: 1 if not every record arrived in time, 0 otherwise
+    """
+
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m tests.benchmarks.bench_end_to_end',
+        description='End-to-end throughput benchmark of DuoLogSync')
+    arg_parser.add_argument('--records', type=int, default=10000,
+                            help='records served per stream (default: 10000)')
+    arg_parser.add_argument('--endpoints', nargs='+', default=[Config.AUTH],
+                            choices=sorted(LOG_PATHS.values()),
+                            help='endpoints to fetch records from (default: auth)')
+    arg_parser.add_argument('--child-accounts', type=int, default=0,
+                            help='MSP child accounts, each with its own authlogs (default: 0)')
+    arg_parser.add_argument('--log-format', default=Config.JSON, choices=[Config.CEF, Config.JSON],
+                            help='format records are sent in, latency is only '
+                                 'measured for JSON (default: JSON)')
+    arg_parser.add_argument('--protocol', default='TCP', choices=['TCP', 'TCPSSL', 'UDP'],
+                            help='protocol records are sent with (default: TCP)')
+    arg_parser.add_argument('--latency', type=float, default=0,
+                            help='seconds the fake API waits before answering (default: 0)')
+    arg_parser.add_argument('--rate-limit-probability', type=float, default=0,
+                            help='chance of the fake API answering HTTP 429 (default: 0)')
+    arg_parser.add_argument('--poll-interval', type=float, default=0,
+                            help='seconds between API calls of DuoLogSync (default: 0)')
+    arg_parser.add_argument('--timeout', type=float, default=300,
+                            help='seconds to wait for every record (default: 300)')
+    arg_parser.add_argument('--output', help='file in which to save results as JSON')
+    args = arg_parser.parse_args(args)
+
+    if args.child_accounts and args.endpoints != [Config.AUTH]:
+        arg_parser.error('--child-accounts can only be used with the auth endpoint')
+
+    results = run(args)
+
+    for name, value in results['results'].items():
+        print(f"{name:<25} {value}")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    return 0 if results['results']['complete'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+Microbenchmarks for the per-record hot paths of DuoLogSync: formatting logs,
+computing offsets and saving checkpoints.
+
+Usage:
+    python -m tests.benchmarks.bench_hot_paths --output results.json
+    python -m tests.benchmarks.bench_hot_paths --compare results.json
+
+Results are saved as JSON so that the numbers of two versions can be compared.
+With --compare, every benchmark slower than the baseline by more than
+--threshold is reported and the exit code is 1.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timezone
+
+from duologsync.__version__ import __version__
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.activity_consumer import ActivityConsumer, ACTIVITY_KEYS_TO_LABELS
+from duologsync.consumer.authlog_consumer import AuthlogConsumer, AUTHLOG_KEYS_TO_LABELS
+from duologsync.consumer.cef import _construct_extension, log_to_cef
+from duologsync.consumer.consumer import Consumer
+from duologsync.consumer.telephony_consumer import TelephonyConsumer, TELEPHONY_KEYS_TO_LABELS
+from duologsync.consumer.trustmonitor_consumer import TrustMonitorConsumer
+from duologsync.producer.producer import Producer
+from duologsync.program import Program
+from tests.benchmarks.records import make_logs, make_response
+
+RESULTS_FORMAT_VERSION = 1
+
+# Number of distinct records each benchmark cycles through
+RECORD_COUNT = 100
+
+# Start of the synthetic records: 2022-07-10T00:00:00Z
+START_MS = 1657411200000
+
+CONSUMERS = {
+    Config.AUTH: AuthlogConsumer,
+    Config.TELEPHONY: TelephonyConsumer,
+    Config.ACTIVITY: ActivityConsumer,
+    Config.TRUST_MONITOR: TrustMonitorConsumer,
+}
+
+KEYS_TO_LABELS = {
+    Config.AUTH: AUTHLOG_KEYS_TO_LABELS,
+    Config.TELEPHONY: TELEPHONY_KEYS_TO_LABELS,
+    Config.ACTIVITY: ACTIVITY_KEYS_TO_LABELS,
+}
+
+
+def cycle(items):
+    """
+    @return a function returning the next element of items on every call, so
+            that a benchmark does not repeatedly process a single record
+    """
+
+    state = {'index': 0}
+    count = len(items)
+
+    def next_item():
+        index = state['index']
+        state['index'] = (index + 1) % count
+        return items[index]
+
+    return next_item
+
+
+def define_benchmarks():
+    """
+    @return a dictionary of benchmark names to functions, each function
+            running the code being measured once
+    """
+
+    benchmarks = {}
+    logs = {
+        log_type: make_logs(log_type, RECORD_COUNT, START_MS)
+        for log_type in CONSUMERS
+    }
+
+    for log_type, keys_to_labels in KEYS_TO_LABELS.items():
+        next_log = cycle(logs[log_type])
+
+        benchmarks[f"log_to_cef[{log_type}]"] = (
+            lambda next_log=next_log, keys_to_labels=keys_to_labels, log_type=log_type:
+            log_to_cef(next_log(), keys_to_labels, log_type))
+        benchmarks[f"_construct_extension[{log_type}]"] = (
+            lambda next_log=next_log, keys_to_labels=keys_to_labels:
+            _construct_extension(next_log(), keys_to_labels))
+
+    for log_type, consumer_class in CONSUMERS.items():
+        next_log = cycle(logs[log_type])
+
+        for log_format in (Config.CEF, Config.JSON):
+            consumer = consumer_class(log_format, None, None)
+            benchmarks[f"Consumer.format_log[{log_type},{log_format}]"] = (
+                lambda consumer=consumer, next_log=next_log:
+                consumer.format_log(next_log()))
+
+        # Offset of the last record of a page, as computed by the consumer
+        benchmarks[f"Producer.get_log_offset[{log_type},record]"] = (
+            lambda next_log=next_log, log_type=log_type:
+            Producer.get_log_offset(next_log(), log_type=log_type))
+
+        # Offset of the next page, as computed by the producer
+        response = make_response(log_type, logs[log_type], has_more=True)
+        benchmarks[f"Producer.get_log_offset[{log_type},response]"] = (
+            lambda response=response, log_type=log_type:
+            Producer.get_log_offset(response, log_type=log_type))
+
+    config = {
+        'dls_settings': {
+            'api': {'offset': 180, 'timeout': 120},
+            'checkpointing': {'enabled': True, 'directory': '/tmp'},
+        },
+        'account': {'hostname': 'api-first.test.duosecurity.com'},
+    }
+    benchmarks['Config.get_value_from_keys[depth=1]'] = (
+        lambda: Config.get_value_from_keys(config, ('account',)))
+    benchmarks['Config.get_value_from_keys[depth=3]'] = (
+        lambda: Config.get_value_from_keys(config, ('dls_settings', 'api', 'timeout')))
+
+    auth_offsets = cycle([
+        Producer.get_log_offset(log, log_type=Config.AUTH) for log in logs[Config.AUTH]
+    ])
+    benchmarks['Consumer.update_log_checkpoint'] = (
+        lambda: Consumer.update_log_checkpoint(Config.AUTH, auth_offsets(), None))
+
+    def commit_many_streams():
+        CheckpointStore._dirty = True
+        CheckpointStore.commit()
+
+    benchmarks['CheckpointStore.commit[100 streams]'] = commit_many_streams
+
+    return benchmarks
+
+
+def prepare_environment(directory):
+    """
+    Set up logging and the checkpoint store the way DuoLogSync does, but
+    within directory, so benchmarks measure the cost of a running program
+
+    @param directory    Temporary directory for the log file and checkpoints
+    """
+
+    Program.setup_logging(
+        os.path.join(directory, 'duologsync.log'), level=logging.INFO,
+        max_bytes=Config.LOG_MAX_BYTES_DEFAULT,
+        backup_count=Config.LOG_BACKUP_COUNT_DEFAULT,
+        rate_limit=Config.LOG_RATE_LIMIT_DEFAULT)
+    CheckpointStore.open(directory)
+
+    for index in range(100):
+        CheckpointStore.set_offset(Config.AUTH, [str(START_MS), 'txid'], f"DA{index:08d}")
+
+
+def run_benchmark(function, repeat, min_time):
+    """
+    Time function, calling it enough times per round for a round to last at
+    least min_time seconds
+
+    @param function The code to measure
+    @param repeat   Number of rounds to time
+    @param min_time Minimum duration of a round in seconds
+
+    @return a dictionary describing the speed of function
+    """
+
+    timer = timeit.Timer(function)
+    number = 1
+
+    # Same approach as Timer.autorange, but with a configurable duration
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2 if number < 1000 else 10
+
+    per_call = [total / number for total in timer.repeat(repeat, number)]
+    mean = sum(per_call) / len(per_call)
+
+    return {
+        'ops_per_sec': 1 / mean,
+        'mean_us': mean * 1e6,
+        'best_us': min(per_call) * 1e6,
+        'calls_per_round': number,
+        'rounds': repeat,
+    }
+
+
+def run_benchmarks(name_filter=None, repeat=5, min_time=0.2):
+    """
+    @param name_filter  Only run benchmarks whose name contains this string
+    @param repeat       Number of rounds to time for each benchmark
+    @param min_time     Minimum duration of a round in seconds
+
+    @return the results of every benchmark run, ready to be saved as JSON
+    """
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_environment(directory)
+
+        try:
+            for name, function in define_benchmarks().items():
+                if name_filter and name_filter not in name:
+                    continue
+
+                results[name] = run_benchmark(function, repeat, min_time)
+                print(f"{name:<55} {results[name]['ops_per_sec']:>12,.0f} ops/s "
+                      f"{results[name]['mean_us']:>10.2f} us/op")
+        finally:
+            Program.shutdown_logging()
+
+    return {
+        'version': RESULTS_FORMAT_VERSION,
+        'duologsync_version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'benchmarks': results,
+    }
+
+
+def compare_results(results, baseline, threshold):
+    """
+    @param results      Results of the current run
+    @param baseline     Results of an earlier run to compare against
+    @param threshold    Fraction by which a benchmark may be slower than the
+                        baseline before it is considered a regression
+
+    @return a list of (name, baseline mean, current mean, change) for every
+            benchmark slower than baseline by more than threshold
+    """
+
+    regressions = []
+
+    for name, result in results['benchmarks'].items():
+        baseline_result = baseline.get('benchmarks', {}).get(name)
+        if baseline_result is None:
+            continue
+
+        change = result['mean_us'] / baseline_result['mean_us'] - 1
+        if change > threshold:
+            regressions.append(
+                (name, baseline_result['mean_us'], result['mean_us'], change))
+
+    return regressions
+
+
+def main(args=None):
+    """
+    Run the benchmarks, optionally saving or comparing their results
+
+    @return the exit code: 1 if a regression was found, 0 otherwise
+    """
+
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m tests.benchmarks.bench_hot_paths',
+        description='Microbenchmarks for the hot paths of DuoLogSync')
+    arg_parser.add_argument('--output', help='file in which to save results as JSON')
+    arg_parser.add_argument('--compare', help='results of an earlier run to compare against')
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help='slowdown reported as a regression (default: 0.1)')
+    arg_parser.add_argument('--filter', dest='name_filter',
+                            help='only run benchmarks whose name contains this string')
+    arg_parser.add_argument('--repeat', type=int, default=5,
+                            help='rounds timed per benchmark (default: 5)')
+    arg_parser.add_argument('--min-time', type=float, default=0.2,
+                            help='minimum duration of a round in seconds (default: 0.2)')
+    args = arg_parser.parse_args(args)
+
+    start = time.perf_counter()
+    results = run_benchmarks(args.name_filter, args.repeat, args.min_time)
+    print(f"ran {len(results['benchmarks'])} benchmarks in "
+          f"{time.perf_counter() - start:.1f}s")
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = compare_results(results, baseline, args.threshold)
+        for name, baseline_mean, mean, change in regressions:
+            print(f"REGRESSION {name}: {baseline_mean:.2f} us -> {mean:.2f} us "
+                  f"(+{change:.0%})")
+
+        if regressions:
+            return 1
+
+        print(f"no regression above {args.threshold:.0%} against {args.compare}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+A local stand-in for the Duo Admin and Accounts APIs, serving synthetic logs
+with the pagination semantics of the log endpoints DuoLogSync polls.
+
+Requests are not authenticated, so any ikey and skey can be used. Point a
+duo_client object at it with ca_certs='HTTP' and port=FakeDuoAPI.port.
+"""
+
+import bisect
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from duologsync.config import Config
+from duologsync.consumer.dedup import LOG_TYPE_TO_ID_FIELD
+from tests.benchmarks.records import LOG_FACTORIES, RESPONSE_KEYS
+
+# Maps each path served to the log type of its records
+LOG_PATHS = {
+    '/admin/v2/logs/authentication': Config.AUTH,
+    '/admin/v2/logs/telephony': Config.TELEPHONY,
+    '/admin/v2/logs/activity': Config.ACTIVITY,
+    '/admin/v1/trust_monitor/events': Config.TRUST_MONITOR,
+}
+
+CHILD_ACCOUNTS_PATH = '/accounts/v1/account/list'
+
+# Default and maximum page sizes of each log type, as documented by Duo
+PAGE_LIMITS = {
+    Config.AUTH: (100, 1000),
+    Config.TELEPHONY: (100, 1000),
+    Config.ACTIVITY: (100, 1000),
+    Config.TRUST_MONITOR: (50, 200),
+}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Stream:
+    """Synthetic records of one log type for one account, oldest first"""
+
+    def __init__(self, log_type, count, start_ms, step_ms, seed):
+        rng = random.Random(seed)
+        factory = LOG_FACTORIES[log_type]
+        id_field = LOG_TYPE_TO_ID_FIELD[log_type]
+
+        self.timestamps = [start_ms + index * step_ms for index in range(count)]
+        self.records = [factory(timestamp, rng) for timestamp in self.timestamps]
+        self.index_by_id = {
+            record[id_field]: index for index, record in enumerate(self.records)
+        }
+
+
+class FakeDuoAPI:
+    """
+    Serve the /admin/v2/logs/* and Trust Monitor endpoints, and the child
+    account listing of the Accounts API, from a background thread.
+
+    Every stream has records records spread evenly over the span seconds
+    before the server started. Pages honour mintime, maxtime and limit, and
+    a page that is not empty carries a next_offset pointing after its last
+    record, so a client can resume from it once new records arrive.
+    """
+
+    def __init__(self, records=1000, log_types=tuple(LOG_PATHS.values()),
+                 child_accounts=0, latency=0, rate_limit_probability=0,
+                 span=3600, seed=0, host='127.0.0.1', port=0):
+        """
+        @param records                  Number of records of every stream
+        @param log_types                Log types for which to serve records
+        @param child_accounts           Number of MSP child accounts, whose
+                                        requests are given their own records
+        @param latency                  Seconds to wait before every answer
+        @param rate_limit_probability   Chance of answering HTTP 429
+        @param span                     Seconds over which records are spread
+        @param seed                     Seed of the synthetic records
+        @param host                     Address on which to listen
+        @param port                     Port on which to listen, 0 for any
+        """
+
+        self.latency = latency
+        self.rate_limit_probability = rate_limit_probability
+        self.child_account_ids = [f"DA{index:018d}" for index in range(child_accounts)]
+
+        end_ms = int(time.time() * 1000) - 2000
+        step_ms = max(1, span * 1000 // max(records, 1))
+        start_ms = end_ms - step_ms * records
+
+        self.streams = {}
+        for account_id in [None] + self.child_account_ids:
+            for log_type in log_types:
+                seed += 1
+                self.streams[(log_type, account_id)] = _Stream(
+                    log_type, records, start_ms, step_ms, seed)
+
+        # Maps the id of every record served to when it was first served
+        self.served_at = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self.first_request_at = None
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = _ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def port(self):
+        """@return the port on which the server listens"""
+        return self._server.server_address[1]
+
+    def start(self):
+        """Start answering requests in a background thread"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.1,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop answering requests and close the listening socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_page(self, log_type, params, account_id=None):
+        """
+        @param log_type     Log type of the records requested
+        @param params       Query parameters of the request
+        @param account_id   MSP child account of the records requested
+
+        @return the response field of an answer to a request for a page of
+                records, or None if there are no such records
+        """
+
+        stream = self.streams.get((log_type, account_id))
+        if stream is None:
+            return None
+
+        default_limit, max_limit = PAGE_LIMITS[log_type]
+        mintime = int(float(params.get('mintime', [0])[0]))
+        maxtime = int(float(params.get('maxtime', [time.time() * 1000])[0]))
+        limit = min(int(params.get('limit', [default_limit])[0]), max_limit)
+
+        start = bisect.bisect_left(stream.timestamps, mintime)
+        end = bisect.bisect_right(stream.timestamps, maxtime)
+
+        if log_type == Config.TRUST_MONITOR:
+            offset = params.get('offset')
+            if offset:
+                start = max(start, bisect.bisect_left(stream.timestamps, int(offset[0])))
+        else:
+            # duo_client sends the [timestamp, id] offset of authlogs as two
+            # values, while other producers send a single 'timestamp,id'
+            next_offset = ','.join(params.get('next_offset', []))
+            if next_offset:
+                timestamp, _, log_id = next_offset.partition(',')
+                index = stream.index_by_id.get(log_id)
+                if index is None:
+                    index = bisect.bisect_right(stream.timestamps, int(timestamp)) - 1
+                start = max(start, index + 1)
+
+        page = stream.records[start:min(end, start + limit)]
+        next_offset = None
+
+        if page:
+            last_timestamp = stream.timestamps[start + len(page) - 1]
+            last_id = page[-1][LOG_TYPE_TO_ID_FIELD[log_type]]
+
+            if log_type == Config.AUTH:
+                next_offset = [str(last_timestamp), last_id]
+            elif log_type == Config.TRUST_MONITOR:
+                next_offset = str(last_timestamp + 1)
+            else:
+                next_offset = f"{last_timestamp},{last_id}"
+
+            self._mark_served(log_type, page)
+
+        return {
+            RESPONSE_KEYS[log_type]: page,
+            'metadata': {
+                'next_offset': next_offset,
+                'total_objects': max(end - start, 0),
+            },
+        }
+
+    def _mark_served(self, log_type, page):
+        now = time.perf_counter()
+        id_field = LOG_TYPE_TO_ID_FIELD[log_type]
+
+        with self._lock:
+            for record in page:
+                self.served_at.setdefault(record[id_field], now)
+
+    def _should_rate_limit(self):
+        with self._lock:
+            self.requests += 1
+            if self.first_request_at is None:
+                self.first_request_at = time.perf_counter()
+
+            if self._random.random() < self.rate_limit_probability:
+                self.rate_limited += 1
+                return True
+
+        return False
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _answer(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, params):
+                path = urlparse(self.path).path
+
+                if api.latency:
+                    time.sleep(api.latency)
+
+                if api._should_rate_limit():
+                    self._answer(429, {'stat': 'FAIL', 'code': 42901,
+                                       'message': 'Too Many Requests'})
+                elif path == CHILD_ACCOUNTS_PATH:
+                    self._answer(200, {'stat': 'OK', 'response': [
+                        {'account_id': account_id, 'name': f"Child {account_id}",
+                         'api_hostname': 'api-first.test.duosecurity.com'}
+                        for account_id in api.child_account_ids
+                    ]})
+                else:
+                    account_id = params.get('account_id', [None])[0]
+                    response = None
+                    if self.command == 'GET' and path in LOG_PATHS:
+                        response = api.get_page(LOG_PATHS[path], params, account_id)
+
+                    if response is None:
+                        self._answer(404, {'stat': 'FAIL', 'code': 40401,
+                                           'message': 'Resource not found'})
+                    else:
+                        self._answer(200, {'stat': 'OK', 'response': response})
+
+            def do_GET(self):
+                self._handle(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode()
+                try:
+                    params = {key: [value] for key, value in json.loads(body).items()}
+                except (ValueError, AttributeError):
+                    params = parse_qs(body)
+                self._handle(params)
+
+        return Handler
@@ -0,0 +1,210 @@
+"""
+Synthetic, but realistically shaped, Duo log records and API responses for
+benchmarks and load tests
+"""
+
+import json
+import random
+import uuid
+from datetime import datetime, timezone
+
+USERS = ['angela_rees', 'samplename', 'jdoe', 'mlopez', 'kwong', 'tnguyen']
+APPLICATIONS = ['Web SDK', 'Microsoft RDP', 'Cisco ASA', 'Okta', 'api']
+FACTORS = ['duo_push', 'phone_call', 'passcode', 'sms_passcode', 'webauthn']
+RESULTS = ['success', 'success', 'success', 'denied', 'fraud']
+CITIES = [
+    ('Ann Arbor', 'Michigan', 'United States'),
+    ('Austin', 'Texas', 'United States'),
+    ('London', 'England', 'United Kingdom'),
+    ('Tokyo', 'Tokyo', 'Japan'),
+]
+ACTIVITY_ACTIONS = ['phone_create', 'user_update', 'admin_login', 'policy_update']
+
+
+def iso_timestamp(timestamp_ms):
+    """@return timestamp_ms formatted the way Duo formats ISO timestamps"""
+    return datetime.fromtimestamp(
+        timestamp_ms / 1000, tz=timezone.utc
+    ).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def _ip(rng):
+    return '.'.join(str(rng.randint(1, 254)) for _ in range(4))
+
+
+def make_auth_log(timestamp_ms, rng=random):
+    """@return an authentication log as returned by /admin/v2/logs/authentication"""
+
+    city, state, country = rng.choice(CITIES)
+    user = rng.choice(USERS)
+
+    return {
+        'access_device': {
+            'browser': 'Chrome',
+            'browser_version': '84.0.4147.125',
+            'flash_version': 'uninstalled',
+            'hostname': None,
+            'ip': _ip(rng),
+            'is_encryption_enabled': 'unknown',
+            'is_firewall_enabled': 'unknown',
+            'is_password_set': 'unknown',
+            'java_version': 'uninstalled',
+            'location': {'city': city, 'country': country, 'state': state},
+            'os': 'Mac OS X',
+            'os_version': '10.15.6',
+        },
+        'alias': '',
+        'application': {'key': 'DINALEC345G8XZDFP7EP', 'name': rng.choice(APPLICATIONS)},
+        'auth_device': {
+            'ip': None,
+            'location': {'city': None, 'country': None, 'state': None},
+            'name': 'WAQWPO8MD9PPHPW2HPCI',
+        },
+        'email': f"{user}@example.com",
+        'event_type': 'authentication',
+        'factor': rng.choice(FACTORS),
+        'isotimestamp': iso_timestamp(timestamp_ms),
+        'ood_software': None,
+        'reason': 'user_approved',
+        'result': rng.choice(RESULTS),
+        'timestamp': timestamp_ms // 1000,
+        'trusted_endpoint_status': 'not trusted',
+        'txid': str(uuid.UUID(int=rng.getrandbits(128))),
+        'user': {'groups': ['Engineering'], 'key': 'DU50VRIGM3ELGSN0XAA3', 'name': user},
+        'eventtype': 'authentication',
+        'host': 'api-first.test.duosecurity.com',
+    }
+
+
+def make_telephony_log(timestamp_ms, rng=random):
+    """@return a telephony log as returned by /admin/v2/logs/telephony"""
+
+    return {
+        'context': rng.choice(['authentication', 'enrollment', 'administrator login']),
+        'credits': rng.randint(1, 5),
+        'phone': f"+1{rng.randint(2000000000, 9999999999)}",
+        'telephony_id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'ts': iso_timestamp(timestamp_ms),
+        'txid': str(uuid.UUID(int=rng.getrandbits(128))),
+        'type': rng.choice(['sms', 'phone']),
+        'eventtype': 'telephony',
+        'host': 'api-first.test.duosecurity.com',
+    }
+
+
+def make_activity_log(timestamp_ms, rng=random):
+    """@return an activity log as returned by /admin/v2/logs/activity"""
+
+    user = rng.choice(USERS)
+    details = json.dumps({
+        'created': '2022-07-10T00:00:00.000000+00:00',
+        'last_login': '2022-07-11T00:00:00.000000+00:00',
+        'status': 'Active',
+        'groups': [{'name': 'Jedi', 'key': 'DG0DU4883PFLGTUIDIXG'}],
+    })
+
+    return {
+        'access_device': {'ip': {'address': _ip(rng)}, 'location': {}},
+        'action': {'name': rng.choice(ACTIVITY_ACTIONS)},
+        'activity_id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'actor': {'details': details, 'key': 'DU123456789012345678', 'name': user, 'type': 'user'},
+        'akey': 'DA0STO6EVV8EAONUD8P7',
+        'application': {'key': 'DINALEC345G8XZDFP7EP', 'name': rng.choice(APPLICATIONS), 'type': 'sso'},
+        'outcome': {'result': 'SUCCESS'},
+        'target': {'details': details, 'key': 'DU123456789012345678', 'name': user, 'type': 'user'},
+        'ts': iso_timestamp(timestamp_ms),
+    }
+
+
+def make_trust_monitor_event(timestamp_ms, rng=random):
+    """@return a Trust Monitor event as returned by /admin/v1/trust_monitor/events"""
+
+    surfaced_auth = make_auth_log(timestamp_ms - 1000, rng)
+    user = surfaced_auth['user']['name']
+
+    return {
+        'explanations': [
+            {'summary': f"{user} has not logged in from this IP recently.", 'type': 'NEW_NETBLOCK'},
+            {'summary': f"{user} has rarely used this IP.", 'type': 'UNUSUAL_NETBLOCK'},
+        ],
+        'from_common_netblock': False,
+        'from_new_user': False,
+        'low_risk_ip': False,
+        'priority_event': rng.random() < 0.1,
+        'priority_reasons': [],
+        'sekey': 'SEISSBQR6V0LSGE0MU56',
+        'state': 'new',
+        'state_updated_timestamp': None,
+        'surfaced_auth': surfaced_auth,
+        'surfaced_timestamp': timestamp_ms,
+        'sv_id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'triage_event_uri': 'https://admin.example.com/trust-monitor?sekey=SEISSBQR6V0LSGE0MU56',
+        'triaged_as_interesting': False,
+        'type': 'auth',
+    }
+
+
+# Maps each log type to the function making one of its records
+LOG_FACTORIES = {
+    'auth': make_auth_log,
+    'telephony': make_telephony_log,
+    'activity': make_activity_log,
+    'trustmonitor': make_trust_monitor_event,
+}
+
+# Maps each log type to the key under which its records are returned
+RESPONSE_KEYS = {
+    'auth': 'authlogs',
+    'telephony': 'items',
+    'activity': 'items',
+    'trustmonitor': 'events',
+}
+
+
+def make_logs(log_type, count, start_ms, step_ms=1000, seed=0):
+    """
+    @return count records of log_type, step_ms apart starting at start_ms
+    """
+
+    rng = random.Random(seed)
+    factory = LOG_FACTORIES[log_type]
+
+    return [factory(start_ms + index * step_ms, rng) for index in range(count)]
+
+
+def get_next_offset(log_type, log):
+    """
+    @return the metadata next_offset Duo would return after log
+    """
+
+    if log_type == 'auth':
+        return [str(int(datetime.strptime(
+            log['isotimestamp'], '%Y-%m-%dT%H:%M:%S.%f+00:00'
+        ).replace(tzinfo=timezone.utc).timestamp() * 1000)), log['txid']]
+
+    if log_type == 'trustmonitor':
+        return str(log['surfaced_timestamp'])
+
+    id_field = 'telephony_id' if log_type == 'telephony' else 'activity_id'
+    timestamp_ms = int(datetime.strptime(
+        log['ts'], '%Y-%m-%dT%H:%M:%S.%f+00:00'
+    ).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+    return f"{timestamp_ms},{log[id_field]}"
+
+
+def make_response(log_type, logs, has_more=False, total_objects=None):
+    """
+    @return an API response containing logs, with a next_offset pointing
+            after the last log if has_more
+    """
+
+    next_offset = get_next_offset(log_type, logs[-1]) if logs and has_more else None
+
+    return {
+        RESPONSE_KEYS[log_type]: logs,
+        'metadata': {
+            'next_offset': next_offset,
+            'total_objects': len(logs) if total_objects is None else total_objects,
+        },
+    }
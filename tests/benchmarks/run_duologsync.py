@@ -0,0 +1,67 @@
+"""
+Run duologsync.app.main against a FakeDuoAPI. Started by bench_end_to_end in
+its own process so that its memory and CPU usage can be measured apart from
+the fake API and the sink.
+
+Usage:
+    python -m tests.benchmarks.run_duologsync --api-port PORT config.yml [options]
+
+Options other than --api-port and --poll-interval are passed to DuoLogSync.
+
+Two things differ from a regular run: duo_client objects talk plain HTTP to
+127.0.0.1:PORT, and the 120 second minimum of dls_settings.api.timeout is
+replaced by --poll-interval, for every endpoint, so a backlog can be drained
+quickly.
+"""
+
+import argparse
+import asyncio
+import sys
+from unittest import mock
+
+from duologsync import app
+from duologsync.config import Config
+from duologsync.util import create_admin
+
+
+def main(args=None):
+    """Run DuoLogSync until it receives SIGINT or SIGTERM"""
+
+    arg_parser = argparse.ArgumentParser(prog='python -m tests.benchmarks.run_duologsync')
+    arg_parser.add_argument('--api-port', type=int,
+                            help='port on which the fake Duo API listens')
+    arg_parser.add_argument('--poll-interval', type=float, default=0,
+                            help='seconds between API calls (default: 0)')
+    arg_parser.add_argument('config_path', help='config to start DuoLogSync with')
+    args, duologsync_args = arg_parser.parse_known_args(args)
+
+    create_config = Config.create_config
+
+    def create_config_with_poll_interval(config_filepath, **kwargs):
+        config = create_config(config_filepath, **kwargs)
+        if config is not None:
+            api_settings = config['dls_settings']['api']
+            api_settings['timeout'] = args.poll_interval
+            for endpoint_settings in api_settings.get('endpoints', {}).values():
+                endpoint_settings.pop('timeout', None)
+                for child_settings in endpoint_settings.get('child_accounts', {}).values():
+                    child_settings.pop('timeout', None)
+        return config
+
+    def create_local_admin(*admin_args, **admin_kwargs):
+        admin = create_admin(*admin_args, **admin_kwargs)
+        admin.host = '127.0.0.1'
+        admin.port = args.api_port
+        admin.ca_certs = 'HTTP'
+        return admin
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    with mock.patch.object(Config, 'create_config', create_config_with_poll_interval), \
+            mock.patch.object(app, 'create_admin', create_local_admin), \
+            mock.patch.object(sys, 'argv', ['duologsync', args.config_path] + duologsync_args):
+        app.main()
+
+
+if __name__ == '__main__':
+    main()
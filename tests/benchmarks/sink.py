@@ -0,0 +1,183 @@
+"""
+A local TCP, UDP or TLS server standing in for a SIEM, counting the records
+DuoLogSync writes to it and measuring how long after being served by a
+FakeDuoAPI each record arrived.
+"""
+
+import json
+import socket
+import socketserver
+import ssl
+import subprocess
+import threading
+import time
+
+# Fields identifying a JSON record, checked in this order since telephony
+# logs also have a txid
+ID_FIELDS = ('telephony_id', 'activity_id', 'sv_id', 'txid')
+
+
+def create_self_signed_certificate(certfile, keyfile, hostname='localhost'):
+    """
+    Create a certificate valid for hostname and 127.0.0.1 with the openssl
+    command line tool
+
+    @param certfile Where to save the certificate
+    @param keyfile  Where to save the private key of the certificate
+    @param hostname Hostname for which the certificate is valid
+    """
+
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', f"/CN={hostname}",
+         '-addext', f"subjectAltName=DNS:{hostname},IP:127.0.0.1",
+         '-keyout', keyfile, '-out', certfile],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class Sink:
+    """
+    Receive newline separated records over TCP, TCPSSL or UDP, the protocols
+    DuoLogSync can write with, from a background thread.
+    """
+
+    def __init__(self, protocol='TCP', served_at=None, certfile=None,
+                 keyfile=None, host='127.0.0.1', port=0):
+        """
+        @param protocol     One of TCP, TCPSSL or UDP
+        @param served_at    Dictionary mapping record ids to when they were
+                            served, used to measure latency of JSON records
+        @param certfile     Certificate presented to TCPSSL clients
+        @param keyfile      Private key of certfile
+        @param host         Address on which to listen
+        @param port         Port on which to listen, 0 for any
+        """
+
+        self.protocol = protocol
+        self.served_at = served_at if served_at is not None else {}
+        self.records_received = 0
+        self.first_received_at = None
+        self.last_received_at = None
+        self.latencies = []
+        self.ids = set()
+
+        self._condition = threading.Condition()
+        self._server = self._create_server(host, port, certfile, keyfile)
+        self._thread = None
+
+    @property
+    def port(self):
+        """@return the port on which the sink listens"""
+        return self._server.server_address[1]
+
+    def _create_server(self, host, port, certfile, keyfile):
+        sink = self
+
+        if self.protocol == 'UDP':
+            class DatagramHandler(socketserver.BaseRequestHandler):
+                def handle(self):
+                    for line in self.request[0].splitlines():
+                        sink.receive(line)
+
+            server = socketserver.UDPServer((host, port), DatagramHandler)
+
+            # DuoLogSync sends a datagram per record, which may come in faster
+            # than they are handled
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+
+            return server
+
+        class StreamHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    sink.receive(line.rstrip(b'\n'))
+
+        class TCPServer(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        server_class = TCPServer
+
+        if self.protocol == 'TCPSSL':
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(certfile, keyfile)
+
+            class TLSServer(TCPServer):
+                def get_request(self):
+                    connection, address = super().get_request()
+                    return ssl_context.wrap_socket(connection, server_side=True), address
+
+            server_class = TLSServer
+
+        return server_class((host, port), StreamHandler)
+
+    def start(self):
+        """Start receiving records in a background thread"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.1,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop receiving records and close the listening socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def receive(self, line):
+        """
+        Count a record, and measure its latency if it is a JSON record
+
+        @param line The record received, without its trailing newline
+        """
+
+        if not line:
+            return
+
+        now = time.perf_counter()
+        record_id = None
+
+        if line.startswith(b'{'):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {}
+
+            for id_field in ID_FIELDS:
+                if id_field in record:
+                    record_id = record[id_field]
+                    break
+
+        with self._condition:
+            self.records_received += 1
+            if self.first_received_at is None:
+                self.first_received_at = now
+            self.last_received_at = now
+
+            if record_id is not None and record_id not in self.ids:
+                self.ids.add(record_id)
+                served_at = self.served_at.get(record_id)
+                if served_at is not None:
+                    self.latencies.append(now - served_at)
+
+            self._condition.notify_all()
+
+    def wait_for(self, count, timeout, unique=True):
+        """
+        Wait until count records were received
+
+        @param count    Number of records to wait for
+        @param timeout  Maximum number of seconds to wait
+        @param unique   Whether to count records with distinct ids only
+
+        @return whether count records were received before timeout
+        """
+
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while (len(self.ids) if unique else self.records_received) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+
+        return True
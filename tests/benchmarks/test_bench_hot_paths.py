@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from duologsync.config import Config
+from duologsync.producer.producer import Producer
+from tests.benchmarks.bench_hot_paths import compare_results, run_benchmarks
+from tests.benchmarks.records import LOG_FACTORIES, make_logs, make_response
+
+
+class TestRecords(TestCase):
+    def test_make_logs_is_deterministic(self):
+        for log_type in LOG_FACTORIES:
+            with self.subTest(log_type=log_type):
+                self.assertEqual(make_logs(log_type, 3, 1657411200000),
+                                 make_logs(log_type, 3, 1657411200000))
+
+    def test_response_offsets_are_understood_by_producer(self):
+        test_params = [
+            (Config.AUTH, ['1657411202000']),
+            (Config.TELEPHONY, '1657411202000,'),
+            (Config.ACTIVITY, '1657411202000,'),
+            (Config.TRUST_MONITOR, 1657411202000),
+        ]
+
+        for log_type, expected_offset in test_params:
+            with self.subTest(log_type=log_type):
+                logs = make_logs(log_type, 3, 1657411200000)
+                offset = Producer.get_log_offset(
+                    make_response(log_type, logs, has_more=True), log_type=log_type)
+
+                if isinstance(expected_offset, list):
+                    self.assertEqual(offset[0], expected_offset[0])
+                elif isinstance(expected_offset, str):
+                    self.assertTrue(offset.startswith(expected_offset))
+                else:
+                    self.assertEqual(offset, expected_offset)
+
+
+class TestBenchHotPaths(TestCase):
+    def test_run_benchmarks(self):
+        results = run_benchmarks('get_value_from_keys', repeat=1, min_time=0.001)
+
+        self.assertEqual(set(results['benchmarks']), {
+            'Config.get_value_from_keys[depth=1]',
+            'Config.get_value_from_keys[depth=3]',
+        })
+        for result in results['benchmarks'].values():
+            self.assertGreater(result['ops_per_sec'], 0)
+
+    def test_compare_results(self):
+        baseline = {'benchmarks': {'a': {'mean_us': 10.0}, 'b': {'mean_us': 10.0}}}
+        results = {'benchmarks': {
+            'a': {'mean_us': 10.5}, 'b': {'mean_us': 13.0}, 'c': {'mean_us': 1.0}
+        }}
+
+        regressions = compare_results(results, baseline, 0.1)
+
+        self.assertEqual([regression[0] for regression in regressions], ['b'])
+        self.assertAlmostEqual(regressions[0][3], 0.3)
@@ -0,0 +1,125 @@
+import http.client
+import json
+import socket
+import time
+from unittest import TestCase
+
+import duo_client
+
+from duologsync.config import Config
+from tests.benchmarks.fake_duo_api import FakeDuoAPI
+from tests.benchmarks.sink import Sink
+
+
+def create_client(client_class, api):
+    return client_class(ikey='DIXXXXXXXXXXXXXXXXXX', skey='secret', host='127.0.0.1',
+                        ca_certs='HTTP', port=api.port)
+
+
+class TestFakeDuoAPI(TestCase):
+    def setUp(self):
+        self.api = FakeDuoAPI(records=250, child_accounts=2)
+        self.api.start()
+        self.admin = create_client(duo_client.Admin, self.api)
+
+    def tearDown(self):
+        self.api.stop()
+
+    def test_authlog_pagination(self):
+        txids = []
+        next_offset = None
+
+        while True:
+            response = self.admin.get_authentication_log(
+                api_version=2, mintime=0, next_offset=next_offset, limit='100')
+            if not response['authlogs']:
+                break
+            txids.extend(log['txid'] for log in response['authlogs'])
+            next_offset = response['metadata']['next_offset']
+
+        self.assertEqual(len(txids), 250)
+        self.assertEqual(len(set(txids)), 250)
+        self.assertEqual(len(self.api.served_at), 250)
+
+    def test_telephony_pagination_with_string_offset(self):
+        ids = []
+        params = {'mintime': '0', 'maxtime': str(int(time.time() * 1000)), 'limit': '1000'}
+
+        while True:
+            response = self.admin.json_api_call('GET', '/admin/v2/logs/telephony', params)
+            if not response['items']:
+                break
+            ids.extend(log['telephony_id'] for log in response['items'])
+            params['next_offset'] = [response['metadata']['next_offset']]
+
+        self.assertEqual(len(set(ids)), 250)
+
+    def test_mintime_and_maxtime(self):
+        timestamps = self.api.streams[(Config.ACTIVITY, None)].timestamps
+
+        response = self.admin.json_api_call('GET', '/admin/v2/logs/activity', {
+            'mintime': str(timestamps[10]), 'maxtime': str(timestamps[19]), 'limit': '1000'
+        })
+
+        self.assertEqual(len(response['items']), 10)
+        self.assertEqual(response['metadata']['total_objects'], 10)
+
+    def test_trust_monitor_default_limit_and_offset(self):
+        maxtime = int(time.time() * 1000)
+        response = self.admin.get_trust_monitor_events_by_offset(mintime=0, maxtime=maxtime)
+
+        self.assertEqual(len(response['events']), 50)
+
+        next_page = self.admin.get_trust_monitor_events_by_offset(
+            mintime=0, maxtime=maxtime, offset=response['metadata']['next_offset'])
+
+        timestamps = self.api.streams[(Config.TRUST_MONITOR, None)].timestamps
+        self.assertEqual(next_page['events'][0]['surfaced_timestamp'], timestamps[50])
+
+    def test_child_accounts_have_their_own_logs(self):
+        accounts = create_client(duo_client.Accounts, self.api)
+        child_accounts = accounts.get_child_accounts()
+
+        self.assertEqual(len(child_accounts), 2)
+
+        response = accounts.json_api_call('GET', '/admin/v2/logs/authentication', {
+            'mintime': '0', 'limit': '10', 'account_id': child_accounts[0]['account_id']
+        })
+        own_response = self.admin.get_authentication_log(api_version=2, mintime=0, limit='10')
+
+        self.assertEqual(len(response['authlogs']), 10)
+        self.assertNotEqual(response['authlogs'][0]['txid'], own_response['authlogs'][0]['txid'])
+
+    def test_rate_limit_injection(self):
+        self.api.rate_limit_probability = 1
+
+        connection = http.client.HTTPConnection('127.0.0.1', self.api.port)
+        connection.request('GET', '/admin/v2/logs/authentication?mintime=0')
+        response = connection.getresponse()
+
+        self.assertEqual(response.status, 429)
+        self.assertEqual(json.loads(response.read())['code'], 42901)
+        self.assertEqual(self.api.rate_limited, 1)
+        connection.close()
+
+
+class TestSink(TestCase):
+    def test_tcp_sink_counts_records_and_latency(self):
+        sink = Sink('TCP', served_at={'id1': time.perf_counter()})
+        sink.start()
+
+        with socket.create_connection(('127.0.0.1', sink.port)) as connection:
+            connection.sendall(b'{"txid": "id1"}\n{"txid": "id2"}\nCEF:0|Duo Security\n')
+
+        self.assertTrue(sink.wait_for(3, timeout=5, unique=False))
+        sink.stop()
+
+        self.assertEqual(sink.ids, {'id1', 'id2'})
+        self.assertEqual(len(sink.latencies), 1)
+
+    def test_wait_for_times_out(self):
+        sink = Sink('UDP')
+        sink.start()
+
+        self.assertFalse(sink.wait_for(1, timeout=0.1))
+        sink.stop()
@@ -166,3 +166,32 @@ class TestApp(TestCase):
 
         self.assertEqual(mock.call_count, 4)
         mock.assert_has_calls(calls, any_order=True)
+
+    @patch("duologsync.app.create_admin")
+    @patch("duologsync.app.create_consumer_producer_pair")
+    def test_create_tasks_with_admin_created_at_startup(self, mock, mock_createadmin):
+        server_to_writer = {"Main": "writer_1"}
+        config = {
+            "dls_settings": {"proxy": {"proxy_server": "test.com", "proxy_port": 1234}},
+            "account": {
+                "ikey": "a",
+                "skey": "a",
+                "hostname": "a",
+                "endpoint_server_mappings": [
+                    {"endpoints": ["auth"], "server": "Main"}
+                ],
+                "is_msp": True,
+            },
+        }
+        Config.set_config(config)
+
+        create_tasks(server_to_writer, "duo_admin", ["12345", "56789"])
+
+        calls = [
+            call("auth", "writer_1", "duo_admin", "12345"),
+            call("auth", "writer_1", "duo_admin", "56789"),
+        ]
+
+        mock_createadmin.assert_not_called()
+        self.assertEqual(mock.call_count, 2)
+        mock.assert_has_calls(calls, any_order=True)
@@ -0,0 +1,213 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from duologsync.archive import Archive, INDEX_FILENAME
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.authlog_consumer import AuthlogConsumer
+from duologsync.metrics import Metrics
+from duologsync.program import Program
+
+START = 1700000000
+
+
+def auth_log(txid, timestamp):
+    return {'txid': txid, 'timestamp': timestamp, 'result': 'success'}
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        Archive.open(self.directory, 3600)
+
+    def tearDown(self):
+        Archive.close()
+        self.temp_dir.cleanup()
+
+    def test_records_are_read_back_by_time_range(self):
+        logs = [auth_log(str(hour), START + hour * 3600) for hour in range(5)]
+        Archive.append(Config.AUTH, None, logs[:3])
+        Archive.append(Config.AUTH, None, logs[3:])
+        Archive.close()
+
+        self.assertEqual(list(Archive.read(self.directory, Config.AUTH)), logs)
+        self.assertEqual(
+            list(Archive.read(self.directory, Config.AUTH, start=START + 3600, end=START + 3 * 3600)),
+            logs[1:3])
+
+    def test_segments_are_partitioned_by_record_time(self):
+        Archive.append(Config.AUTH, 'DA123', [
+            auth_log('a', 7200), auth_log('b', 7300), auth_log('c', 10800)])
+        Archive.close()
+
+        stream_directory = os.path.join(self.directory, 'auth_DA123')
+        self.assertEqual(sorted(os.listdir(stream_directory)), [
+            '0000007200.ndjson.gz', '0000010800.ndjson.gz', INDEX_FILENAME])
+
+        with open(os.path.join(stream_directory, INDEX_FILENAME)) as index_file:
+            self.assertEqual(json.load(index_file), {
+                '0000007200.ndjson.gz': [7200, 7300, 2, os.path.getsize(
+                    os.path.join(stream_directory, '0000007200.ndjson.gz'))],
+                '0000010800.ndjson.gz': [10800, 10800, 1, os.path.getsize(
+                    os.path.join(stream_directory, '0000010800.ndjson.gz'))],
+            })
+
+    def test_records_with_fractional_times(self):
+        log = {'txid': 'a', 'ts': '2023-11-14T22:13:20.500000+00:00'}
+        Archive.append(Config.ACTIVITY, None, [log])
+        Archive.close()
+
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'activity')).count(
+            '1699999200.ndjson.gz'), 1)
+        self.assertEqual(list(Archive.read(self.directory, Config.ACTIVITY)), [log])
+
+    def test_segments_outside_the_range_are_skipped(self):
+        Archive.append(Config.AUTH, None, [auth_log('a', 7200), auth_log('b', 10800)])
+        Archive.close()
+
+        # Reading the first segment would fail, the index rules it out
+        path = os.path.join(self.directory, 'auth', '0000007200.ndjson.gz')
+        size = os.path.getsize(path)
+        with open(path, 'wb') as segment:
+            segment.write(b'x' * size)
+
+        self.assertEqual(list(Archive.read(self.directory, Config.AUTH, start=10000)),
+                         [auth_log('b', 10800)])
+
+    def test_records_are_appended_across_runs(self):
+        Archive.append(Config.AUTH, None, [auth_log('a', 7200)])
+        Archive.close()
+
+        Archive.open(self.directory, 3600)
+        Archive.append(Config.AUTH, None, [auth_log('b', 7300)])
+        Archive.close()
+
+        self.assertEqual([log['txid'] for log in Archive.read(self.directory, Config.AUTH)],
+                         ['a', 'b'])
+
+    def test_records_appended_after_the_index_was_saved_are_read(self):
+        index_path = os.path.join(self.directory, 'auth', INDEX_FILENAME)
+        Archive.append(Config.AUTH, None, [auth_log('a', 7200)])
+        Archive.close()
+        with open(index_path) as index_file:
+            saved_index = index_file.read()
+
+        # The index is not saved again before a crash
+        Archive.open(self.directory, 3600)
+        Archive.append(Config.AUTH, None, [auth_log('b', 7300)])
+        Archive.close()
+        with open(index_path, 'w') as index_file:
+            index_file.write(saved_index)
+
+        self.assertEqual(list(Archive.read(self.directory, Config.AUTH, start=7250)),
+                         [auth_log('b', 7300)])
+
+        # The next run indexes the segment again
+        Archive.open(self.directory, 3600)
+        Archive.append(Config.AUTH, None, [auth_log('c', 7400)])
+        Archive.close()
+        with open(index_path) as index_file:
+            self.assertEqual(json.load(index_file)['0000007200.ndjson.gz'][:3], [7200, 7400, 3])
+
+    def test_truncated_segment_is_read_up_to_the_damage(self):
+        Archive.append(Config.AUTH, None, [auth_log('a', 7200)])
+        Archive.close()
+
+        path = os.path.join(self.directory, 'auth', '0000007200.ndjson.gz')
+        member = gzip.compress(b'{"txid": "b", "timestamp": 7300}\n')
+        with open(path, 'ab') as segment:
+            segment.write(member[:len(member) // 2])
+
+        self.assertEqual([log['txid'] for log in Archive.read(self.directory, Config.AUTH)],
+                         ['a'])
+
+    def test_segments_past_retention_are_removed(self):
+        Archive.close()
+        Archive.open(self.directory, 3600, retention_seconds=2 * 3600)
+        now = START + 10 * 3600
+
+        with patch('duologsync.archive.time.time', return_value=now):
+            for hour in range(7, 10):
+                Archive.append(Config.AUTH, None, [auth_log(str(hour), START + hour * 3600 + 60)])
+            Archive.close()
+
+        # The newest record of the segment of hour 7 is more than 2 hours old
+        self.assertEqual([log['txid'] for log in Archive.read(self.directory, Config.AUTH)],
+                         ['8', '9'])
+        stream_directory = os.path.join(self.directory, Config.AUTH)
+        with open(os.path.join(stream_directory, INDEX_FILENAME)) as index_file:
+            self.assertEqual(len(json.load(index_file)), 2)
+        self.assertEqual(len(os.listdir(stream_directory)), 3)
+
+    def test_oldest_segments_are_removed_past_max_bytes(self):
+        logs = [auth_log(str(hour), START + hour * 3600) for hour in range(4)]
+        Archive.append(Config.AUTH, None, logs)
+        Archive.close()
+        stream_directory = os.path.join(self.directory, Config.AUTH)
+        segment_bytes = os.path.getsize(
+            os.path.join(stream_directory, '1699999200.ndjson.gz'))
+
+        Archive.open(self.directory, 3600, max_bytes=2 * segment_bytes + segment_bytes // 2)
+        Archive.append(Config.AUTH, None, [auth_log('4', START + 4 * 3600)])
+        Archive.close()
+
+        self.assertEqual([log['txid'] for log in Archive.read(self.directory, Config.AUTH)],
+                         ['3', '4'])
+
+    def test_newest_segment_is_kept(self):
+        Archive.close()
+        Archive.open(self.directory, 3600, retention_seconds=60, max_bytes=1)
+        Archive.append(Config.AUTH, None, [auth_log('a', START)])
+        Archive.close()
+
+        self.assertEqual(len(list(Archive.read(self.directory, Config.AUTH))), 1)
+
+    def test_nothing_is_archived_once_closed(self):
+        Archive.close()
+        Archive.append(Config.AUTH, None, [auth_log('a', 7200)])
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class TestConsumerArchive(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        CheckpointStore.open(self.directory)
+        Config.set_config({'dls_settings': {
+            'dedup': {'enabled': False},
+            'filters': {Config.AUTH: {'include_fields': ['txid', 'timestamp']}},
+        }})
+        Archive.open(os.path.join(self.directory, 'archive'), 3600)
+
+    def tearDown(self):
+        Archive.close()
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.temp_dir.cleanup()
+
+    def test_shipped_records_are_archived_as_written(self):
+        writer = MagicMock()
+        writer.write = AsyncMock()
+        log_queue = asyncio.Queue()
+        log_queue.put_nowait([auth_log('a', START), auth_log('b', START + 1)])
+        Program._running = False
+        log_queue.put_nowait([])
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(AuthlogConsumer(Config.JSON, log_queue, writer).consume())
+        loop.close()
+        Archive.close()
+
+        self.assertEqual(
+            list(Archive.read(os.path.join(self.directory, 'archive'), Config.AUTH)),
+            [{'txid': 'a', 'timestamp': START}, {'txid': 'b', 'timestamp': START + 1}])
@@ -0,0 +1,105 @@
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from duologsync.backfill import BACKFILL_STATE, BackfillProgress, format_duration, get_eta
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.metrics import BACKFILL_ETA, BACKFILL_PROGRESS, Metrics, stream_labels
+
+START = 1700000000
+
+
+class TestBackfillProgress(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        CheckpointStore.open(self.temp_dir.name)
+        Config.set_config({'dls_settings': {'checkpointing': {'enabled': True}}})
+
+    def tearDown(self):
+        BackfillProgress.clear()
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Metrics.reset()
+        self.temp_dir.cleanup()
+
+    def test_progress_and_eta(self):
+        progress = BackfillProgress.start_stream(Config.AUTH, start=START)
+
+        with patch('duologsync.backfill.time.monotonic', side_effect=[10, 20]):
+            progress.samples.clear()
+            progress.samples.append((0, 0, START))
+            progress.shipped(500, START + 3000)
+            progress.update(now=START + 10000)
+
+        self.assertAlmostEqual(progress.get_progress(now=START + 10000), 0.3)
+        self.assertEqual(progress.get_rates(), (25, 150))
+        # 7000 seconds behind, catching up 149 seconds every second
+        self.assertAlmostEqual(Metrics.get(BACKFILL_ETA, stream_labels(Config.AUTH)), 7000 / 149)
+
+    def test_caught_up_once_a_cycle_is_shipped(self):
+        progress = BackfillProgress.start_stream(Config.AUTH, 'DA123', start=START)
+        progress.cycle_done(START + 5000)
+
+        labels = stream_labels(Config.AUTH, 'DA123')
+        self.assertEqual(Metrics.get(BACKFILL_PROGRESS, labels), 1)
+        self.assertEqual(Metrics.get(BACKFILL_ETA, labels), 0)
+        self.assertTrue(
+            CheckpointStore.get_state(BACKFILL_STATE, Config.AUTH, 'DA123')['caught_up'])
+
+    def test_state_is_saved_every_interval(self):
+        progress = BackfillProgress.start_stream(Config.AUTH, start=START)
+
+        with patch('duologsync.backfill.time.monotonic', side_effect=[10, 20, 30, 75]), \
+                patch.object(CheckpointStore, 'set_state') as set_state:
+            for page in range(1, 5):
+                progress.shipped(100, START + page * 60)
+
+        # Pages shipped meanwhile are only kept in memory
+        self.assertEqual(set_state.call_count, 2)
+        self.assertEqual(set_state.call_args.args[2]['position'], START + 240)
+
+        progress.cycle_done(START + 300)
+        self.assertTrue(CheckpointStore.get_state(BACKFILL_STATE, Config.AUTH)['caught_up'])
+
+    def test_stream_falls_behind_when_lagging_past_a_poll_interval(self):
+        progress = BackfillProgress.start_stream(Config.AUTH, start=START)
+        progress.cycle_done(START + 600, 120)
+
+        with patch('duologsync.backfill.time.time', return_value=START + 800):
+            progress.shipped(100, START + 650)
+        self.assertTrue(progress.caught_up)
+
+        with patch('duologsync.backfill.time.time', return_value=START + 1000):
+            progress.shipped(100, START + 660)
+        self.assertFalse(progress.caught_up)
+        self.assertFalse(CheckpointStore.get_state(BACKFILL_STATE, Config.AUTH)['caught_up'])
+
+    def test_restarted_stream_keeps_its_start(self):
+        BackfillProgress.start_stream(Config.AUTH, start=START).shipped(10, START + 600)
+        BackfillProgress.clear()
+
+        # Resumes from its checkpoint, after the logs already shipped
+        progress = BackfillProgress.start_stream(Config.AUTH, start=START + 600)
+
+        self.assertEqual(progress.start, START)
+
+    def test_stream_caught_up_earlier_starts_anew(self):
+        BackfillProgress.start_stream(Config.AUTH, start=START).cycle_done(START + 600)
+
+        progress = BackfillProgress.start_stream(Config.AUTH, start=START + 600)
+
+        self.assertEqual(progress.start, START + 600)
+        self.assertFalse(progress.caught_up)
+
+    def test_eta_is_unknown_while_not_catching_up(self):
+        self.assertIsNone(get_eta(START, None, START + 100))
+        self.assertIsNone(get_eta(START, 0.5, START + 100))
+        self.assertEqual(get_eta(START, 3, START + 100), 50)
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(40), '40s')
+        self.assertEqual(format_duration(125), '2m05s')
+        self.assertEqual(format_duration(7500), '2h05m')
+        self.assertEqual(format_duration(90000), '1d01h')
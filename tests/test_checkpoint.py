@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from duologsync.checkpoint import CheckpointStore, atomic_write_json
+from duologsync.program import Program
+
+
+class TestCheckpointStore(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        CheckpointStore.open(self.directory)
+
+    def tearDown(self):
+        CheckpointStore.reset()
+        Program._running = True
+        self.temp_dir.cleanup()
+
+    def test_stream_key(self):
+        self.assertEqual(CheckpointStore.stream_key('auth'), 'auth')
+        self.assertEqual(CheckpointStore.stream_key('auth', 'DA123'), 'auth:DA123')
+
+    def test_set_and_commit_offsets(self):
+        CheckpointStore.set_offset('auth', ['1597671838335', 'txid'])
+        CheckpointStore.set_offset('telephony', '1597671838336,id', 'DA123')
+
+        CheckpointStore.commit()
+        CheckpointStore.open(self.directory)
+
+        self.assertEqual(CheckpointStore.get_offset('auth'), ['1597671838335', 'txid'])
+        self.assertEqual(CheckpointStore.get_offset('telephony', 'DA123'), '1597671838336,id')
+
+    def test_state_is_committed_with_offsets(self):
+        CheckpointStore.set_offset('auth', 1597671838, 'DA123')
+        CheckpointStore.set_state('dedup', 'auth', ['txid1', 'txid2'], 'DA123')
+
+        CheckpointStore.commit()
+        CheckpointStore.open(self.directory)
+
+        self.assertEqual(CheckpointStore.get_state('dedup', 'auth', 'DA123'), ['txid1', 'txid2'])
+        self.assertIsNone(CheckpointStore.get_state('dedup', 'auth'))
+
+    def test_commit_only_when_dirty(self):
+        CheckpointStore.commit()
+
+        self.assertFalse(os.path.exists(CheckpointStore.get_path()))
+
+    def test_missing_offset_is_none(self):
+        self.assertIsNone(CheckpointStore.get_offset('activity'))
+
+    def test_migrate_legacy_checkpoint_files(self):
+        legacy_path = os.path.join(self.directory, 'trustmonitor_checkpoint_data.txt')
+        with open(legacy_path, 'w') as legacy_file:
+            legacy_file.write(json.dumps(1597671838336) + '\n')
+        child_legacy_path = os.path.join(self.directory, 'auth_checkpoint_data_DA123.txt')
+        with open(child_legacy_path, 'w') as legacy_file:
+            legacy_file.write(json.dumps(['1597671838335', 'txid']) + '\n')
+
+        self.assertEqual(CheckpointStore.get_offset('trustmonitor'), 1597671838336)
+        self.assertEqual(CheckpointStore.get_offset('auth', 'DA123'), ['1597671838335', 'txid'])
+
+        CheckpointStore.commit()
+        with open(CheckpointStore.get_path()) as store_file:
+            offsets = json.load(store_file)['offsets']
+
+        self.assertEqual(offsets, {
+            'trustmonitor': 1597671838336,
+            'auth:DA123': ['1597671838335', 'txid'],
+        })
+
+    def test_read_legacy_checkpoints_without_migrating(self):
+        for filename, contents in [
+                ('telephony_checkpoint_data.txt', '"1597671838336,id"'),
+                ('auth_checkpoint_data_DA123.txt', '{'),
+                ('auth_udp_failed_ingestion_logs.txt', '{}')]:
+            with open(os.path.join(self.directory, filename), 'w') as legacy_file:
+                legacy_file.write(contents)
+
+        checkpoints = CheckpointStore.read_legacy_checkpoints(self.directory)
+
+        self.assertEqual(sorted(checkpoints), ['auth:DA123', 'telephony'])
+        self.assertEqual(checkpoints['telephony'][0], '1597671838336,id')
+        self.assertIsNone(checkpoints['auth:DA123'][0])
+        self.assertEqual(CheckpointStore.get_offsets(), {})
+
+    def test_corrupt_store_starts_empty(self):
+        with open(CheckpointStore.get_path(), 'w') as store_file:
+            store_file.write('{"offsets": ')
+
+        CheckpointStore.open(self.directory)
+
+        self.assertEqual(CheckpointStore.get_offsets(), {})
+
+    def test_store_which_is_not_an_object_starts_empty(self):
+        legacy_path = os.path.join(self.directory, 'telephony_checkpoint_data.txt')
+        with open(legacy_path, 'w') as legacy_file:
+            legacy_file.write(json.dumps('1597671838336,id') + '\n')
+
+        for contents in ['[]', 'null', '{"offsets": [1, 2]}']:
+            with self.subTest(contents=contents):
+                with open(CheckpointStore.get_path(), 'w') as store_file:
+                    store_file.write(contents)
+
+                CheckpointStore.open(self.directory)
+
+                self.assertEqual(CheckpointStore.get_offsets(), {})
+                # Falls back to the legacy checkpoint files
+                self.assertEqual(CheckpointStore.get_offset('telephony'), '1597671838336,id')
+
+    def test_invalid_state_is_ignored(self):
+        with open(CheckpointStore.get_path(), 'w') as store_file:
+            json.dump({'offsets': {'auth': 5}, 'state': {'backfill': [], 'other': {'a': 1}}},
+                      store_file)
+
+        CheckpointStore.open(self.directory)
+
+        self.assertEqual(CheckpointStore.get_offsets(), {'auth': 5})
+        self.assertEqual(CheckpointStore.get_states('other'), {'a': 1})
+        self.assertEqual(CheckpointStore.get_states('backfill'), {})
+
+    def test_run_commits_on_shutdown(self):
+        Program._running = False
+        CheckpointStore.set_offset('auth', 1597671838)
+
+        asyncio.new_event_loop().run_until_complete(CheckpointStore.run(0))
+        CheckpointStore.open(self.directory)
+
+        self.assertEqual(CheckpointStore.get_offset('auth'), 1597671838)
+
+    def test_watermarks_are_saved_before_commit(self):
+        saved = []
+
+        def save_watermark():
+            saved.append(True)
+            CheckpointStore.set_offset('auth', 1597671838)
+
+        CheckpointStore.add_watermark(save_watermark)
+        CheckpointStore.commit()
+        CheckpointStore.remove_watermark(save_watermark)
+        CheckpointStore.commit()
+        CheckpointStore.open(self.directory)
+
+        self.assertEqual(saved, [True])
+        self.assertEqual(CheckpointStore.get_offset('auth'), 1597671838)
+
+    def test_run_commits_after_commit_records(self):
+        loop = asyncio.new_event_loop()
+        commits = []
+
+        async def commit_async():
+            commits.append(CheckpointStore._acknowledged)
+            CheckpointStore._acknowledged = 0
+
+        async def acknowledge_records():
+            run_task = asyncio.ensure_future(CheckpointStore.run(0, commit_records=100))
+            await asyncio.sleep(0)
+
+            CheckpointStore.acknowledge(60)
+            await asyncio.sleep(0.01)
+            self.assertEqual(commits, [])
+
+            CheckpointStore.acknowledge(60)
+            await asyncio.sleep(0.01)
+            self.assertEqual(commits, [120])
+
+            Program.initiate_shutdown('test')
+            await run_task
+
+        with patch.object(CheckpointStore, 'commit_async', commit_async):
+            loop.run_until_complete(acknowledge_records())
+        loop.close()
+
+        # A final commit is made on shutdown
+        self.assertEqual(commits, [120, 0])
+
+    def test_atomic_write_json_leaves_no_temp_files(self):
+        file_path = os.path.join(self.directory, 'data.json')
+
+        atomic_write_json(file_path, {'a': 1})
+        atomic_write_json(file_path, {'a': 2})
+
+        with open(file_path) as data_file:
+            self.assertEqual(json.load(data_file), {'a': 2})
+        self.assertEqual(os.listdir(self.directory), ['data.json'])
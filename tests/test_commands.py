@@ -0,0 +1,390 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import yaml
+
+from duologsync.archive import Archive
+from duologsync.checkpoint import CheckpointStore, atomic_write_json
+from duologsync.commands import control, export, parse_time, replay, split_time_range, status
+from duologsync.config import Config
+from duologsync.program import Program
+from tests.benchmarks.records import make_logs, make_response
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), 'resources', 'config_files', 'standard.yml')
+
+
+class TestParseTime(TestCase):
+    def test_epoch_seconds(self):
+        self.assertEqual(parse_time('1700000000'), 1700000000)
+
+    def test_iso_times_are_utc(self):
+        self.assertEqual(parse_time('2023-11-14T22:13:20'), 1700000000)
+        self.assertEqual(parse_time('2023-11-14T22:13:20Z'), 1700000000)
+        self.assertEqual(parse_time('2023-11-14'), 1699920000)
+
+    def test_relative_times(self):
+        self.assertEqual(parse_time('30d', now=1700000000), 1700000000 - 30 * 86400)
+        self.assertEqual(parse_time('2h', now=1700000000), 1700000000 - 7200)
+
+    def test_invalid_time(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_time('yesterday')
+
+
+class TestReplay(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.archive_dir = os.path.join(self.temp_dir.name, 'archive')
+
+        with open(CONFIG_FILE) as config_file:
+            config = yaml.safe_load(config_file)
+        config['dls_settings']['archive'] = {'directory': self.archive_dir}
+        self.config_path = os.path.join(self.temp_dir.name, 'config.yml')
+        with open(self.config_path, 'w') as config_file:
+            yaml.safe_dump(config, config_file)
+
+        Archive.open(self.archive_dir, 3600)
+        Archive.append(Config.AUTH, None, [
+            {'txid': str(index), 'timestamp': 1700000000 + index * 600} for index in range(12)])
+        Archive.close()
+
+    def tearDown(self):
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        self.temp_dir.cleanup()
+
+    @patch('duologsync.commands.Writer.close_gracefully', new_callable=AsyncMock)
+    @patch('duologsync.commands.Writer.write', new_callable=AsyncMock)
+    @patch('duologsync.commands.Writer.connect', new_callable=AsyncMock, return_value=True)
+    def test_archived_time_range_is_sent_to_the_server(self, connect, write, close_gracefully):
+        status = replay([
+            '--type', 'auth', '--from', '1700001200', '--to', '2023-11-14T23:13:20',
+            '--server', 'backup', self.config_path])
+
+        self.assertEqual(status, 0)
+        sent = [json.loads(call.args[0]) for call in write.call_args_list]
+        self.assertEqual([record['txid'] for record in sent], ['2', '3', '4', '5'])
+        close_gracefully.assert_awaited_once()
+
+    @patch('duologsync.commands.Writer.connect', new_callable=AsyncMock, return_value=True)
+    def test_unknown_server(self, connect):
+        status = replay(['--type', 'auth', '--server', 'nowhere', self.config_path])
+
+        self.assertEqual(status, 1)
+        connect.assert_not_called()
+
+
+def rate_limited_error():
+    error = RuntimeError('Received 429 Too Many Requests')
+    error.status = 429
+    return error
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.temp_dir.name, 'checkpoints')
+        self.output_dir = os.path.join(self.temp_dir.name, 'export')
+        os.makedirs(self.checkpoint_dir)
+
+        with open(CONFIG_FILE) as config_file:
+            config = yaml.safe_load(config_file)
+        config['dls_settings']['checkpointing'] = {
+            'enabled': True, 'directory': self.checkpoint_dir}
+        config['account']['is_msp'] = False
+        self.config = config
+        self.config_path = os.path.join(self.temp_dir.name, 'config.yml')
+        with open(self.config_path, 'w') as config_file:
+            yaml.safe_dump(config, config_file)
+
+        self.child_accounts = None
+        self.logs = [{'txid': str(index), 'timestamp': 1700000000 + index * 600}
+                     for index in range(12)]
+        self.api_calls = []
+        self.errors = []
+
+    def tearDown(self):
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        self.temp_dir.cleanup()
+
+    def get_authentication_log(self, mintime, maxtime, **kwargs):
+        self.api_calls.append((mintime, maxtime))
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return {'authlogs': [
+            log for log in self.logs if mintime <= log['timestamp'] * 1000 <= maxtime]}
+
+    def json_api_call(self, method, path, params):
+        self.api_calls.append((path, params.get('account_id')))
+
+        return make_response('telephony', make_logs('telephony', 3, 1700000000000))
+
+    def export(self, *args):
+        admin = MagicMock()
+        admin.get_authentication_log = self.get_authentication_log
+        admin.json_api_call = self.json_api_call
+
+        with patch('duologsync.app.create_account_admin',
+                   return_value=(admin, self.child_accounts)), \
+                patch('duologsync.commands.EXPORT_RETRY_BACKOFF', 0):
+            return export(list(args) + ['--output', self.output_dir, self.config_path])
+
+    def read_export(self, filename):
+        with gzip.open(os.path.join(self.output_dir, filename)) as export_file:
+            return [json.loads(line) for line in export_file]
+
+    def test_time_range_is_exported_in_windows(self):
+        status = self.export('--types', 'auth', '--from', '1700000000',
+                             '--to', '1700007200', '--windows', '3')
+
+        self.assertEqual(status, 0)
+        self.assertEqual(sorted(self.api_calls), [
+            (1700000000000, 1700002399999),
+            (1700002400000, 1700004799999),
+            (1700004800000, 1700007199999),
+        ])
+        self.assertEqual(self.read_export('auth.ndjson.gz'), self.logs)
+        self.assertEqual(os.listdir(self.output_dir), ['auth.ndjson.gz'])
+
+    def test_checkpoints_are_left_alone(self):
+        self.export('--types', 'auth', '--from', '1700000000', '--to', '1700007200')
+
+        self.assertEqual(os.listdir(self.checkpoint_dir), [])
+
+    def test_rate_limited_calls_are_retried(self):
+        self.errors = [rate_limited_error(), rate_limited_error()]
+
+        status = self.export('--types', 'auth', '--from', '1700000000',
+                             '--to', '1700007200', '--windows', '1')
+
+        self.assertEqual(status, 0)
+        self.assertEqual(len(self.api_calls), 3)
+        self.assertEqual(len(self.read_export('auth.ndjson.gz')), 12)
+
+    def test_failed_export_leaves_no_files(self):
+        self.errors = [RuntimeError('Received 401 Invalid signature')]
+
+        status = self.export('--types', 'auth', '--from', '1700000000',
+                             '--to', '1700007200', '--format', 'CEF')
+
+        self.assertEqual(status, 1)
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_existing_export_is_not_overwritten(self):
+        os.makedirs(self.output_dir)
+        with open(os.path.join(self.output_dir, 'auth.ndjson.gz'), 'w') as export_file:
+            export_file.write('earlier export')
+
+        status = self.export('--types', 'auth', '--from', '1700000000')
+
+        self.assertEqual(status, 1)
+        self.assertEqual(self.api_calls, [])
+
+    def test_parent_logs_are_exported_once_for_msp_accounts(self):
+        self.config['account']['is_msp'] = True
+        with open(self.config_path, 'w') as config_file:
+            yaml.safe_dump(self.config, config_file)
+        self.child_accounts = ['DA123', 'DA456']
+
+        status = self.export('--types', 'telephony', '--from', '1700000000',
+                             '--to', '1700007200', '--windows', '1')
+
+        # Telephony logs are those of the parent account whatever the child
+        self.assertEqual(status, 0)
+        self.assertEqual(self.api_calls, [('/admin/v2/logs/telephony', None)])
+        self.assertEqual(os.listdir(self.output_dir), ['telephony.ndjson.gz'])
+        self.assertTrue(all('child_account_id' not in log
+                            for log in self.read_export('telephony.ndjson.gz')))
+
+    def test_split_time_range(self):
+        self.assertEqual(split_time_range(0, 10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(split_time_range(0, 2, 4), [(0, 1), (1, 2)])
+
+
+class TestStatus(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        with open(CONFIG_FILE) as config_file:
+            config = yaml.safe_load(config_file)
+        config['dls_settings']['checkpointing'] = {'directory': self.temp_dir.name}
+        self.config_path = os.path.join(self.temp_dir.name, 'config.yml')
+        with open(self.config_path, 'w') as config_file:
+            yaml.safe_dump(config, config_file)
+
+    def tearDown(self):
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        self.temp_dir.cleanup()
+
+    def status(self, *args, exit_status=0):
+        output = io.StringIO()
+        with redirect_stdout(output), patch('duologsync.commands.time.time', return_value=1700010000):
+            self.assertEqual(status(list(args) + [self.config_path]), exit_status)
+
+        return output.getvalue().splitlines()
+
+    def write_legacy_checkpoint(self, filename, contents, modified_at):
+        path = os.path.join(self.temp_dir.name, filename)
+        with open(path, 'w') as checkpoint:
+            checkpoint.write(contents)
+        os.utime(path, (modified_at, modified_at))
+
+    def test_progress_of_every_stream(self):
+        atomic_write_json(os.path.join(self.temp_dir.name, CheckpointStore.FILENAME), {
+            'version': 1,
+            'offsets': {'auth:DA123': ['1700003000000', 'a'], 'telephony': '1700009900000,b'},
+            'state': {'backfill': {
+                'auth:DA123': {
+                    'start': 1700000000, 'position': 1700003000, 'caught_up': False,
+                    'records_per_second': 25.0, 'speed': 150.0, 'updated_at': 1700009990,
+                },
+            }},
+        })
+
+        lines = self.status()
+
+        self.assertEqual(lines[0].split(), [
+            'STREAM', 'SHIPPED', 'UP', 'TO', '(UTC)', 'LAG', 'DONE', 'RECORDS/S', 'ETA',
+            'UPDATED', 'NOTES'])
+        # 6990 seconds behind when saved, catching up 149 seconds every second
+        self.assertEqual(lines[1].split(), [
+            'auth:DA123', '2023-11-14', '23:03:20', '1h56m', '30%', '25', '36s', '10s', 'ago'])
+        self.assertEqual(lines[2].split(), [
+            'telephony', '2023-11-15', '00:58:20', '1m40s', '-', '-', '-', '1m40s', 'ago'])
+
+    def test_legacy_checkpoint_files_in_every_format(self):
+        self.write_legacy_checkpoint('auth_checkpoint_data.txt', '1700009000', 1700009900)
+        self.write_legacy_checkpoint(
+            'telephony_checkpoint_data_DA123.txt', '"1700009500000,b"', 1700009900)
+        self.write_legacy_checkpoint(
+            'trustmonitor_checkpoint_data.txt', '1700009600000', 1700009900)
+        self.write_legacy_checkpoint('activity_checkpoint_data.txt', '[1700009700000, "c"]', 1700009900)
+        # Migrated into the store already, whose offset is the one in use
+        self.write_legacy_checkpoint('auth_checkpoint_data_DA456.txt', '1600000000', 1600000000)
+        atomic_write_json(os.path.join(self.temp_dir.name, CheckpointStore.FILENAME), {
+            'version': 1, 'offsets': {'auth:DA456': ['1700009800000', 'd']}, 'state': {}})
+
+        lines = self.status()
+
+        self.assertEqual([line.split()[:4] for line in lines[1:]], [
+            ['activity', '2023-11-15', '00:55:00', '5m00s'],
+            ['auth', '2023-11-15', '00:43:20', '16m40s'],
+            ['auth:DA456', '2023-11-15', '00:56:40', '3m20s'],
+            ['telephony:DA123', '2023-11-15', '00:51:40', '8m20s'],
+            ['trustmonitor', '2023-11-15', '00:53:20', '6m40s'],
+        ])
+        self.assertTrue(lines[1].endswith('legacy file'))
+        self.assertFalse(lines[3].endswith('legacy file'))
+        # Legacy checkpoint files are read, not migrated
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), [
+            'activity_checkpoint_data.txt', 'auth_checkpoint_data.txt',
+            'auth_checkpoint_data_DA456.txt', 'config.yml', CheckpointStore.FILENAME,
+            'telephony_checkpoint_data_DA123.txt', 'trustmonitor_checkpoint_data.txt'])
+
+    def test_stale_streams_are_flagged(self):
+        # Not rewritten for longer than 3 poll intervals of 120 seconds
+        self.write_legacy_checkpoint('auth_checkpoint_data.txt', '1700009000', 1700009000)
+        self.write_legacy_checkpoint('telephony_checkpoint_data.txt', '"not an offset"', 1700009900)
+
+        lines = self.status(exit_status=3)
+
+        self.assertEqual(lines[1].split()[-3:], ['stale,', 'legacy', 'file'])
+        self.assertEqual(lines[2].split(), [
+            'telephony', '-', '-', '-', '-', '-', '1m40s', 'ago',
+            'unreadable', 'offset,', 'legacy', 'file'])
+        self.assertEqual(lines[-1], '1 of 2 streams are stale')
+
+    def test_stale_after_option(self):
+        self.write_legacy_checkpoint('auth_checkpoint_data.txt', '1700009000', 1700009000)
+
+        self.status('--stale-after', '3600')
+
+    def test_empty_checkpoint_directory(self):
+        self.assertIn('No streams saved', self.status()[0])
+
+
+STREAM_STATS = {
+    'stream': 'auth:DA123', 'state': 'paused', 'server': 'siem', 'poll_interval': 300,
+    'page_size': 1000, 'overrides': {'timeout': 300}, 'queued_pages': 2,
+    'records_fetched': 500, 'records_written': 300, 'records_per_second': 25.0,
+    'lag': 125, 'caught_up': False, 'restarts': 0,
+}
+
+
+class TestControl(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        with open(CONFIG_FILE) as config_file:
+            config = yaml.safe_load(config_file)
+        config['dls_settings']['control'] = {
+            'enabled': True, 'socket': os.path.join(self.temp_dir.name, 'dls.sock')}
+        self.config_path = os.path.join(self.temp_dir.name, 'config.yml')
+        with open(self.config_path, 'w') as config_file:
+            yaml.safe_dump(config, config_file)
+
+    def tearDown(self):
+        Config._config = None
+        Config._config_is_set = False
+        self.temp_dir.cleanup()
+
+    def control(self, response, *args):
+        output = io.StringIO()
+        with redirect_stdout(output), patch(
+                'duologsync.commands.send_control_request', return_value=response) as send:
+            exit_status = control(list(args) + [self.config_path])
+
+        return exit_status, send, output.getvalue().splitlines()
+
+    def test_streams_are_listed(self):
+        exit_status, send, lines = self.control(
+            {'ok': True, 'result': {'streams': [STREAM_STATS], 'quarantined': ['telephony']}},
+            'streams')
+
+        self.assertEqual(exit_status, 0)
+        send.assert_called_once_with(
+            os.path.join(self.temp_dir.name, 'dls.sock'), {'command': 'streams'})
+        self.assertEqual(lines[1].split(), [
+            'auth:DA123', 'paused', 'siem', '300s*', '1000', '2', '500', '300', '25', '2m05s'])
+        self.assertEqual(lines[2].split()[:2], ['telephony', 'quarantined'])
+        self.assertEqual(lines[3], '* set through the control socket')
+
+    def test_settings_of_a_stream_are_sent(self):
+        exit_status, send, lines = self.control(
+            {'ok': True, 'result': STREAM_STATS},
+            'set', 'auth:DA123', '--timeout', '300', '--page-size', '500')
+
+        self.assertEqual(exit_status, 0)
+        self.assertEqual(send.call_args.args[1], {
+            'command': 'set', 'stream': 'auth:DA123',
+            'settings': {'timeout': 300, 'page_size': 500}})
+        self.assertEqual(
+            lines, ['auth:DA123: paused, polling every 300 seconds for 1000 records per call'])
+
+    def test_error_of_a_request(self):
+        exit_status, _, lines = self.control(
+            {'ok': False, 'error': 'no auth stream is running'}, 'pause', 'auth')
+
+        self.assertEqual(exit_status, 1)
+        self.assertEqual(lines, ['DuoLogSync could not pause: no auth stream is running'])
+
+    def test_duologsync_not_running(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            exit_status = control(['flush', self.config_path])
+
+        self.assertEqual(exit_status, 1)
+        self.assertIn('Could not reach DuoLogSync', output.getvalue())
@@ -2,6 +2,8 @@ from unittest import TestCase
 from unittest.mock import patch
 import os
 import sys
+import tempfile
+import yaml
 from yaml import YAMLError
 from duologsync.config import Config
 from duologsync.program import Program
@@ -71,6 +73,45 @@ class TestConfig(TestCase):
 
         self.assertEqual(log_format, 'JSON')
 
+    def test_get_logging_settings(self):
+        config = {'dls_settings': {'logging': {
+            'level': 'WARNING', 'max_bytes': 1024, 'backup_count': 2, 'rate_limit': 10}}}
+
+        Config.set_config(config)
+
+        self.assertEqual(Config.get_log_level(), 'WARNING')
+        self.assertEqual(Config.get_log_max_bytes(), 1024)
+        self.assertEqual(Config.get_log_backup_count(), 2)
+        self.assertEqual(Config.get_log_rate_limit(), 10)
+
+    def test_get_api_settings_with_endpoint_overrides(self):
+        config = {'dls_settings': {'api': {
+            'offset': 1, 'timeout': 300,
+            'endpoints': {
+                'auth': {
+                    'timeout': 120, 'page_size': 500,
+                    'child_accounts': {'DA123': {'offset': 2}}},
+                'trustmonitor': {'page_size': 1000}}}}}
+
+        Config.set_config(config)
+
+        self.assertEqual(Config.get_api_timeout(), 300)
+        self.assertEqual(Config.get_api_timeout('auth'), 120)
+        self.assertEqual(Config.get_api_timeout('auth', 'DA123'), 120)
+        self.assertEqual(Config.get_api_timeout('telephony'), 300)
+        self.assertEqual(Config.get_api_offset('auth'), 1)
+        self.assertEqual(Config.get_api_offset('auth', 'DA123'), 2)
+        self.assertEqual(Config.get_api_offset('auth', 'DA456'), 1)
+        self.assertEqual(Config.get_api_page_size('auth'), 500)
+        self.assertEqual(Config.get_api_page_size('telephony'), 1000)
+        self.assertEqual(Config.get_api_page_size('trustmonitor'), 200)
+
+    def test_get_api_page_size_defaults(self):
+        Config.set_config({'dls_settings': {'api': {'timeout': 120}}})
+
+        self.assertEqual(Config.get_api_page_size('activity'), 1000)
+        self.assertIsNone(Config.get_api_page_size('trustmonitor'))
+
     def test_get_checkpointing_enabled(self):
         config = {'dls_settings': {'checkpointing': {'enabled': False}}}
 
@@ -87,6 +128,46 @@ class TestConfig(TestCase):
 
         self.assertEqual(checkpoint_dir, '/tmp')
 
+    def test_get_checkpoint_commit_interval(self):
+        config = {'dls_settings': {'checkpointing': {'commit_interval': 5}}}
+
+        Config.set_config(config)
+        commit_interval = Config.get_checkpoint_commit_interval()
+
+        self.assertEqual(commit_interval, 5)
+
+    def test_get_shutdown_drain_timeout(self):
+        config = {'dls_settings': {'shutdown': {'drain_timeout': 10}}}
+
+        Config.set_config(config)
+
+        self.assertEqual(Config.get_shutdown_drain_timeout(), 10)
+
+    def test_get_dedup_settings(self):
+        config = {'dls_settings': {'dedup': {'enabled': True, 'window_size': 50}}}
+
+        Config.set_config(config)
+
+        self.assertEqual(Config.get_dedup_enabled(), True)
+        self.assertEqual(Config.get_dedup_window_size(), 50)
+
+    def test_get_metrics_settings(self):
+        config = {'dls_settings': {'metrics': {'enabled': True, 'host': '0.0.0.0', 'port': 9000}}}
+
+        Config.set_config(config)
+
+        self.assertEqual(Config.get_metrics_enabled(), True)
+        self.assertEqual(Config.get_metrics_host(), '0.0.0.0')
+        self.assertEqual(Config.get_metrics_port(), 9000)
+
+    def test_get_control_settings(self):
+        config = {'dls_settings': {'control': {'enabled': True, 'socket': '/run/dls.sock'}}}
+
+        Config.set_config(config)
+
+        self.assertEqual(Config.get_control_enabled(), True)
+        self.assertEqual(Config.get_control_socket(), '/run/dls.sock')
+
     def test_get_servers(self):
         config = {'servers': ['item1', 'item2']}
 
@@ -151,13 +232,51 @@ class TestConfig(TestCase):
             'dls_settings': {
                 'log_filepath': '/tmp/duologsync.log',
                 'log_format': 'JSON',
+                'logging': {
+                    'level': 'INFO',
+                    'max_bytes': 10485760,
+                    'backup_count': 5,
+                    'rate_limit': 100
+                },
                 'api': {
                     'offset': 180,
-                    'timeout': 120
+                    'timeout': 120,
+                    'max_timeout': 0,
+                    'jitter': 0.1
                 },  
                 'checkpointing': {
                     'enabled': False,
-                    'directory': '/tmp/dls_checkpoints'
+                    'directory': '/tmp/dls_checkpoints',
+                    'commit_interval': 1,
+                    'commit_records': 0
+                },
+                'shutdown': {
+                    'drain_timeout': 30
+                },
+                'supervisor': {
+                    'max_restarts': 5,
+                    'backoff': 1,
+                    'max_backoff': 300
+                },
+                'archive': {
+                    'enabled': False,
+                    'directory': '/tmp/duologsync_archive',
+                    'segment_seconds': 3600,
+                    'retention_seconds': 0,
+                    'max_bytes': 0
+                },
+                'dedup': {
+                    'enabled': False,
+                    'window_size': 1000
+                },
+                'metrics': {
+                    'enabled': False,
+                    'host': '127.0.0.1',
+                    'port': 9120
+                },
+                'control': {
+                    'enabled': False,
+                    'socket': '/tmp/duologsync.sock'
                 },
                 'proxy': {
                     'proxy_server': 'test.com',
@@ -253,6 +372,47 @@ class TestConfig(TestCase):
         self.assertNotEqual(config['account']['is_msp'], None)
         self.assertNotEqual(config['account']['block_list'], None)
 
+    def test_create_config_with_endpoint_overrides(self):
+        config_filepath = 'tests/resources/config_files/endpoint_overrides.yml'
+
+        config = Config.create_config(config_filepath)
+        endpoints = config['dls_settings']['api']['endpoints']
+
+        self.assertEqual(endpoints['auth']['timeout'], 120)
+        self.assertEqual(endpoints['auth']['child_accounts']['DA123']['timeout'], 120)
+        self.assertEqual(endpoints['trustmonitor']['timeout'], 900)
+        self.assertNotIn('offset', endpoints['auth'])
+        self.assertGreater(endpoints['auth']['child_accounts']['DA123']['offset'],
+                           config['dls_settings']['api']['offset'])
+
+    @patch('duologsync.program.Program.initiate_shutdown')
+    def test_create_config_with_unknown_endpoint_override(self, mock_initiate_shutdown):
+        with tempfile.NamedTemporaryFile('w', suffix='.yml') as config_file:
+            with open('tests/resources/config_files/endpoint_overrides.yml') as overrides:
+                config_file.write(overrides.read().replace('trustmonitor:', 'adminlog:', 1))
+            config_file.flush()
+
+            self.assertIsNone(Config.create_config(config_file.name))
+
+        mock_initiate_shutdown.assert_called_once()
+
+    @patch('duologsync.program.Program.initiate_shutdown')
+    def test_create_config_without_checkpoint_commits(self, mock_initiate_shutdown):
+        with open('tests/resources/config_files/standard.yml') as standard:
+            config = yaml.safe_load(standard)
+
+        for commit_interval, commit_records, valid in [(0, 0, False), (0, 100, True), (5, 0, True)]:
+            config['dls_settings']['checkpointing'] = {
+                'commit_interval': commit_interval, 'commit_records': commit_records}
+            with tempfile.NamedTemporaryFile('w', suffix='.yml') as config_file:
+                yaml.safe_dump(config, config_file)
+                config_file.flush()
+
+                self.assertEqual(Config.create_config(config_file.name) is not None, valid)
+
+        mock_initiate_shutdown.assert_called_once_with(
+            "checkpointing commit_interval and commit_records cannot both be 0")
+
     def test_get_value_from_keys_normal(self):
         dictionary = {'level_one': '2FA',
                       'access_device': {'ip': '192.168.0.1'}}
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import tempfile
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.aggregation import Aggregator
+from duologsync.consumer.authlog_consumer import AuthlogConsumer
+from duologsync.metrics import RECORDS_AGGREGATED, RECORDS_WRITTEN, Metrics, stream_labels
+from duologsync.program import Program
+
+
+def auth_log(txid, timestamp, user='jane', result='success'):
+    return {
+        'txid': txid,
+        'result': result,
+        'factor': 'duo_push',
+        'timestamp': timestamp,
+        'isotimestamp': datetime.fromtimestamp(
+            timestamp, tz=timezone.utc).isoformat(timespec='microseconds'),
+        'user': {'name': user, 'key': 'DU' + user},
+        'application': {'name': 'VPN'},
+    }
+
+
+class TestAggregator(TestCase):
+    def tearDown(self):
+        Config._config = None
+        Config._config_is_set = False
+
+    def test_rolls_up_records_by_key_and_window(self):
+        aggregator = Aggregator(key=['user.name', 'application.name', 'result'], window=60)
+
+        for log in [
+                auth_log('a', 1700000000),
+                auth_log('b', 1700000010),
+                auth_log('c', 1700000020, user='john'),
+                auth_log('d', 1700000030),
+                # Next window
+                auth_log('e', 1700000100)]:
+            self.assertTrue(aggregator.add(log))
+
+        summaries = aggregator.flush()
+
+        self.assertEqual(summaries[0], ({
+            'user': {'name': 'jane'},
+            'application': {'name': 'VPN'},
+            'result': 'success',
+            'timestamp': 1700000030,
+            'isotimestamp': '2023-11-14T22:13:50.000000+00:00',
+            'aggregation': {
+                'count': 3,
+                'first_timestamp': 1700000000,
+                'last_timestamp': 1700000030,
+                'window_seconds': 60,
+            },
+        }, 3))
+        self.assertEqual(summaries[1], (auth_log('c', 1700000020, user='john'), 1))
+        self.assertEqual(summaries[2], (auth_log('e', 1700000100), 1))
+        self.assertEqual(aggregator.flush(), [])
+
+    def test_pass_through_and_untimed_records_are_not_rolled_up(self):
+        aggregator = Aggregator(key=['user.name'], pass_through=[
+            {'field': 'result', 'values': ['fraud']}])
+
+        self.assertFalse(aggregator.add(auth_log('a', 1700000000, result='fraud')))
+        self.assertFalse(aggregator.add({'user': {'name': 'jane'}}))
+        self.assertEqual(aggregator.flush(), [])
+
+    def test_unhashable_key_values(self):
+        aggregator = Aggregator(key=['user'])
+
+        aggregator.add(auth_log('a', 1700000000))
+        aggregator.add(auth_log('b', 1700000001))
+
+        (summary, count), = aggregator.flush()
+        self.assertEqual(count, 2)
+        self.assertEqual(summary['user'], {'name': 'jane', 'key': 'DUjane'})
+
+    def test_create_from_config(self):
+        Config.set_config({'dls_settings': {'aggregation': {
+            'auth': {'key': ['user.name'], 'window': 30}}}})
+
+        aggregator = Aggregator.create(Config.AUTH)
+
+        self.assertEqual(aggregator.window, 30)
+        self.assertIsNone(Aggregator.create(Config.TELEPHONY))
+
+
+class TestConsumerAggregation(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        CheckpointStore.open(self.temp_dir.name)
+        Config.set_config({'dls_settings': {
+            'dedup': {'enabled': False},
+            'aggregation': {'auth': {
+                'key': ['user.name', 'result'],
+                'window': 60,
+                'pass_through': [{'field': 'result', 'values': ['fraud']}],
+            }},
+        }})
+
+    def tearDown(self):
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.temp_dir.cleanup()
+
+    def consume_page(self, writer, logs):
+        loop = asyncio.new_event_loop()
+        log_queue = asyncio.Queue()
+        consumer = AuthlogConsumer(Config.JSON, log_queue, writer)
+
+        async def consume_one_page():
+            await log_queue.put(logs)
+            consume_task = asyncio.ensure_future(consumer.consume())
+            while log_queue.qsize():
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            Program._running = False
+            await log_queue.put([])
+            await consume_task
+
+        loop.run_until_complete(consume_one_page())
+        loop.close()
+
+    def test_consumer_writes_summaries_after_pass_through_records(self):
+        writer = MagicMock()
+        writer.write = AsyncMock()
+
+        self.consume_page(writer, [
+            auth_log('a', 1700000000),
+            auth_log('b', 1700000001, result='fraud'),
+            auth_log('c', 1700000002),
+        ])
+
+        written = [json.loads(call[0][0]) for call in writer.write.call_args_list]
+        self.assertEqual([log.get('txid') for log in written], ['b', None])
+        self.assertEqual(written[1]['aggregation']['count'], 2)
+        self.assertEqual(Metrics.get(RECORDS_WRITTEN, stream_labels(Config.AUTH)), 2)
+        self.assertEqual(Metrics.get(RECORDS_AGGREGATED, stream_labels(Config.AUTH)), 2)
+        self.assertEqual(CheckpointStore.get_offset(Config.AUTH), ['1700000002000', 'c'])
+
+    def test_failed_summary_write_does_not_move_checkpoint(self):
+        writer = MagicMock()
+        writer.write = AsyncMock(side_effect=[None, BrokenPipeError(32, 'Broken pipe')])
+
+        self.consume_page(writer, [
+            auth_log('a', 1700000000),
+            auth_log('b', 1700000001, result='fraud'),
+            auth_log('c', 1700000002),
+        ])
+
+        self.assertIsNone(CheckpointStore.get_offset(Config.AUTH))
@@ -1,6 +1,9 @@
 from unittest import TestCase
 
-from duologsync.consumer.cef import _construct_extension
+from duologsync.config import Config
+from duologsync.consumer.aggregation import Aggregator
+from duologsync.consumer.authlog_consumer import AUTHLOG_KEYS_TO_LABELS
+from duologsync.consumer.cef import _construct_extension, log_to_cef
 
 
 class TestCef(TestCase):
@@ -22,3 +25,21 @@ class TestCef(TestCase):
                 response = _construct_extension(mock_log, keys_to_label)
 
                 self.assertEqual(param2, response)
+
+    def test_summary_carries_its_count_and_times(self):
+        aggregator = Aggregator(['user.name', 'result'], window=60)
+        for timestamp in [1700000000, 1700000010, 1700000030]:
+            aggregator.add({'user': {'name': 'bob'}, 'result': 'success',
+                            'timestamp': timestamp})
+        [(summary, _)] = aggregator.flush()
+
+        cef_log = log_to_cef(summary, AUTHLOG_KEYS_TO_LABELS, Config.AUTH)
+
+        self.assertTrue(cef_log.endswith(
+            'duser=bob cnt=3 start=1700000000000 end=1700000030000'))
+
+    def test_record_without_aggregation_has_no_count(self):
+        cef_log = log_to_cef({'user': {'name': 'bob'}, 'timestamp': 1700000000},
+                             AUTHLOG_KEYS_TO_LABELS, Config.AUTH)
+
+        self.assertNotIn('cnt=', cef_log)
@@ -0,0 +1,100 @@
+import asyncio
+import tempfile
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from duologsync.backfill import BackfillProgress, CycleEnd
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.authlog_consumer import AuthlogConsumer
+from duologsync.metrics import Metrics
+from duologsync.program import Program
+
+
+def auth_log(txid, timestamp):
+    return {
+        'txid': txid,
+        'timestamp': timestamp,
+        'isotimestamp': '2023-11-14T22:13:%02d.000000+00:00' % (timestamp % 60),
+    }
+
+
+class TestConsumerShutdown(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        CheckpointStore.open(self.temp_dir.name)
+        Config.set_config({'dls_settings': {
+            'dedup': {'enabled': False}, 'checkpointing': {'enabled': False}}})
+
+    def tearDown(self):
+        BackfillProgress.clear()
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.temp_dir.cleanup()
+
+    def consume(self, writer, pages):
+        loop = asyncio.new_event_loop()
+        log_queue = asyncio.Queue()
+        for page in pages:
+            log_queue.put_nowait(page)
+
+        # As a producer does once it stopped polling
+        Program._running = False
+        log_queue.put_nowait([])
+
+        loop.run_until_complete(AuthlogConsumer(Config.JSON, log_queue, writer).consume())
+        loop.close()
+        return log_queue
+
+    def test_pages_fetched_before_shutdown_are_written(self):
+        writer = MagicMock()
+        writer.write = AsyncMock()
+
+        log_queue = self.consume(writer, [
+            [auth_log('a', 1700000030), auth_log('b', 1700000031)],
+            [auth_log('c', 1700000032)],
+        ])
+
+        self.assertEqual(writer.write.call_count, 3)
+        self.assertTrue(log_queue.empty())
+        self.assertEqual(CheckpointStore.get_offset(Config.AUTH), ['1700000032000', 'c'])
+
+    def test_consumer_stops_once_a_write_fails(self):
+        writer = MagicMock()
+        writer.write = AsyncMock(side_effect=BrokenPipeError(32, 'Broken pipe'))
+
+        log_queue = self.consume(writer, [
+            [auth_log('a', 1700000030)],
+            [auth_log('b', 1700000031)],
+        ])
+
+        self.assertEqual(writer.write.call_count, 1)
+        self.assertEqual(log_queue.qsize(), 2)
+        self.assertIsNone(CheckpointStore.get_offset(Config.AUTH))
+
+    def test_cycle_is_done_once_its_pages_are_written(self):
+        writer = MagicMock()
+        writer.write = AsyncMock()
+        progress = BackfillProgress.start_stream(Config.AUTH, start=1700000000)
+
+        self.consume(writer, [
+            [auth_log('a', 1700000030)],
+            [auth_log('b', 1700000031)],
+            CycleEnd(1700000100, 120),
+        ])
+
+        self.assertTrue(progress.caught_up)
+        self.assertEqual(progress.position, 1700000100)
+        self.assertEqual(progress.poll_interval, 120)
+
+    def test_cycle_is_not_done_when_a_write_fails(self):
+        writer = MagicMock()
+        writer.write = AsyncMock(side_effect=BrokenPipeError(32, 'Broken pipe'))
+        progress = BackfillProgress.start_stream(Config.AUTH, start=1700000000)
+
+        self.consume(writer, [[auth_log('a', 1700000030)], CycleEnd(1700000100, 120)])
+
+        self.assertFalse(progress.caught_up)
@@ -0,0 +1,131 @@
+import asyncio
+import tempfile
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.authlog_consumer import AuthlogConsumer
+from duologsync.consumer.dedup import DedupWindow, get_journal_path
+from duologsync.metrics import Metrics
+from duologsync.program import Program
+
+
+class TestDedupWindow(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        CheckpointStore.open(self.temp_dir.name)
+
+    def tearDown(self):
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.temp_dir.cleanup()
+
+    def test_is_duplicate_after_add(self):
+        window = DedupWindow(Config.AUTH, size=10)
+        log = {'txid': 'abc'}
+
+        self.assertFalse(window.is_duplicate(log))
+        window.add(log)
+        self.assertTrue(window.is_duplicate(log))
+
+    def test_id_field_per_log_type(self):
+        test_params = [
+            (Config.AUTH, 'txid'),
+            (Config.TELEPHONY, 'telephony_id'),
+            (Config.ACTIVITY, 'activity_id'),
+            (Config.TRUST_MONITOR, 'sv_id'),
+        ]
+
+        for log_type, id_field in test_params:
+            with self.subTest(log_type=log_type):
+                window = DedupWindow(log_type, size=10)
+                window.add({id_field: 'id1'})
+
+                self.assertTrue(window.is_duplicate({id_field: 'id1'}))
+
+    def test_logs_without_id_are_never_duplicates(self):
+        window = DedupWindow(Config.AUTH, size=10)
+        window.add({'timestamp': 1})
+
+        self.assertFalse(window.is_duplicate({'timestamp': 1}))
+        self.assertEqual(len(window.recent_ids), 0)
+
+    def test_window_evicts_oldest_ids(self):
+        window = DedupWindow(Config.AUTH, size=2)
+
+        for txid in ['a', 'b', 'c']:
+            window.add({'txid': txid})
+
+        self.assertFalse(window.is_duplicate({'txid': 'a'}))
+        self.assertTrue(window.is_duplicate({'txid': 'b'}))
+        self.assertTrue(window.is_duplicate({'txid': 'c'}))
+
+    def test_window_is_restored_from_checkpoint_store(self):
+        window = DedupWindow(Config.ACTIVITY, child_account_id='DA123', size=10)
+        window.add({'activity_id': 'a1'})
+        window.save()
+        CheckpointStore.commit()
+
+        CheckpointStore.open(self.temp_dir.name)
+        restored_window = DedupWindow(Config.ACTIVITY, child_account_id='DA123', size=10)
+
+        self.assertTrue(restored_window.is_duplicate({'activity_id': 'a1'}))
+
+    def test_create_returns_none_when_disabled(self):
+        Config.set_config({'dls_settings': {'dedup': {'enabled': False, 'window_size': 10}}})
+
+        self.assertIsNone(DedupWindow.create(Config.AUTH))
+
+    def test_window_is_restored_from_journal_without_commit(self):
+        Config.set_config({'dls_settings': {'dedup': {'enabled': True, 'window_size': 10}}})
+        page = [{'txid': 'a', 'timestamp': 1700000000}, {'txid': 'b', 'timestamp': 1700000001}]
+
+        def consume(page):
+            writer = MagicMock()
+            writer.write = AsyncMock()
+            log_queue = asyncio.Queue()
+            log_queue.put_nowait(page)
+            # As a producer does once it stopped polling
+            log_queue.put_nowait([])
+            Program._running = False
+
+            loop = asyncio.new_event_loop()
+            loop.run_until_complete(AuthlogConsumer(Config.JSON, log_queue, writer).consume())
+            loop.close()
+            Program._running = True
+            return writer.write.call_count
+
+        self.assertEqual(consume(page), 2)
+
+        # Crash before the store commits the offset and the window
+        CheckpointStore.open(self.temp_dir.name)
+        self.assertIsNone(CheckpointStore.get_offset(Config.AUTH))
+
+        # The page fetched again is not shipped twice
+        self.assertEqual(consume(page), 0)
+
+    def test_journal_is_rewritten_with_the_window(self):
+        window = DedupWindow(Config.AUTH, size=3)
+
+        with patch('duologsync.consumer.dedup.JOURNAL_MAX_PAGES', 2):
+            for txid in ['a', 'b', 'c', 'd']:
+                window.add({'txid': txid})
+                window.journal([{'txid': txid}])
+
+        with open(get_journal_path(self.temp_dir.name, Config.AUTH)) as journal_file:
+            self.assertEqual(journal_file.read(), '["a","b","c"]\n["d"]')
+
+        restored_window = DedupWindow(Config.AUTH, size=3)
+        self.assertEqual(list(restored_window.recent_ids), ['b', 'c', 'd'])
+
+    def test_truncated_journal_line_is_skipped(self):
+        with open(get_journal_path(self.temp_dir.name, Config.AUTH, 'DA123'), 'w') as journal_file:
+            journal_file.write('\n["a"]\n["b", "c')
+
+        window = DedupWindow(Config.AUTH, 'DA123', size=10)
+
+        self.assertEqual(list(window.recent_ids), ['a'])
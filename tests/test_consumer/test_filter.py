@@ -0,0 +1,130 @@
+import asyncio
+import tempfile
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock
+
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.consumer.authlog_consumer import AuthlogConsumer
+from duologsync.consumer.filter import RecordFilter, compile_paths
+from duologsync.metrics import RECORDS_FILTERED, Metrics, stream_labels
+from duologsync.program import Program
+
+AUTH_LOG = {
+    'txid': 'abc',
+    'eventtype': 'authentication',
+    'result': 'success',
+    'factor': 'duo_push',
+    'timestamp': 1700000000,
+    'access_device': {'ip': '10.0.0.1', 'location': {'city': 'Ann Arbor'}},
+    'user': {'name': 'jane'},
+}
+
+
+class TestRecordFilter(TestCase):
+    def tearDown(self):
+        Config._config = None
+        Config._config_is_set = False
+
+    def test_compile_paths_shorter_path_wins(self):
+        self.assertEqual(compile_paths(['a.b', 'a', 'c.d.e', 'c.f']),
+                         {'a': None, 'c': {'d': {'e': None}, 'f': None}})
+        self.assertEqual(compile_paths(['a', 'a.b']), {'a': None})
+
+    def test_is_dropped_by_any_condition(self):
+        record_filter = RecordFilter(drop=[
+            {'field': 'result', 'values': ['fraud']},
+            {'field': 'access_device.location.city', 'values': ['Ann Arbor']},
+        ])
+
+        self.assertTrue(record_filter.is_dropped(AUTH_LOG))
+        self.assertFalse(record_filter.is_dropped(dict(AUTH_LOG, access_device=None)))
+        self.assertFalse(record_filter.is_dropped({'result': {'nested': 'fraud'}}))
+        self.assertTrue(record_filter.is_dropped({'result': 'fraud'}))
+
+    def test_exclude_fields_copies_only_what_changes(self):
+        record_filter = RecordFilter(exclude_fields=['access_device.location', 'factor', 'missing.field'])
+
+        projected = record_filter.project(AUTH_LOG)
+
+        self.assertNotIn('factor', projected)
+        self.assertEqual(projected['access_device'], {'ip': '10.0.0.1'})
+        self.assertIs(projected['user'], AUTH_LOG['user'])
+        self.assertIn('location', AUTH_LOG['access_device'])
+        self.assertIn('factor', AUTH_LOG)
+
+    def test_project_without_changes_returns_record(self):
+        record_filter = RecordFilter(exclude_fields=['target.details'])
+
+        self.assertIs(record_filter.project(AUTH_LOG), AUTH_LOG)
+
+    def test_include_then_exclude_fields(self):
+        record_filter = RecordFilter(
+            include_fields=['txid', 'access_device', 'user.name'],
+            exclude_fields=['access_device.location'])
+
+        projected = record_filter.project(dict(AUTH_LOG, child_account_id='DA123'))
+
+        self.assertEqual(projected, {
+            'txid': 'abc',
+            'access_device': {'ip': '10.0.0.1'},
+            'user': {'name': 'jane'},
+            'child_account_id': 'DA123',
+        })
+
+    def test_create_from_config(self):
+        Config.set_config({'dls_settings': {'filters': {
+            'auth': {'drop': [{'field': 'eventtype', 'values': ['enrollment']}]}}}})
+
+        self.assertIsNotNone(RecordFilter.create(Config.AUTH))
+        self.assertIsNone(RecordFilter.create(Config.TELEPHONY))
+
+
+class TestConsumerFilters(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        CheckpointStore.open(self.temp_dir.name)
+        Config.set_config({'dls_settings': {
+            'dedup': {'enabled': False},
+            'filters': {'auth': {
+                'drop': [{'field': 'result', 'values': ['denied']}],
+                'exclude_fields': ['access_device.location'],
+            }},
+        }})
+
+    def tearDown(self):
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.temp_dir.cleanup()
+
+    def test_consumer_drops_and_projects_records(self):
+        writer = MagicMock()
+        writer.write = AsyncMock()
+        loop = asyncio.new_event_loop()
+        log_queue = asyncio.Queue()
+        consumer = AuthlogConsumer(Config.JSON, log_queue, writer)
+        denied = dict(AUTH_LOG, txid='def', result='denied', timestamp=1700000001)
+
+        async def consume_one_page():
+            await log_queue.put([AUTH_LOG, denied])
+            consume_task = asyncio.ensure_future(consumer.consume())
+            while log_queue.qsize():
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            Program._running = False
+            await log_queue.put([])
+            await consume_task
+
+        loop.run_until_complete(consume_one_page())
+        loop.close()
+
+        self.assertEqual(writer.write.call_count, 1)
+        written = writer.write.call_args[0][0]
+        self.assertIn(b'"txid": "abc"', written)
+        self.assertNotIn(b'location', written)
+        self.assertEqual(Metrics.get(RECORDS_FILTERED, stream_labels(Config.AUTH)), 1)
+        # The dropped record is still covered by the saved offset
+        self.assertEqual(CheckpointStore.get_offset(Config.AUTH), 1700000002)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from duologsync.backfill import BackfillProgress
+from duologsync.checkpoint import CheckpointStore
+from duologsync.config import Config
+from duologsync.control import Control, send_control_request
+from duologsync.metrics import RECORDS_FETCHED, Metrics, stream_labels
+from duologsync.producer.telephony_producer import TelephonyProducer
+from duologsync.program import Program
+from duologsync.streams import Stream, Streams
+from duologsync.writer import Writer
+
+
+class TestControl(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'duologsync.sock')
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        Config.set_config({'dls_settings': {
+            'api': {'offset': 0, 'timeout': 120, 'max_timeout': 0},
+            'checkpointing': {'enabled': False, 'directory': self.temp_dir.name},
+        }, 'account': {'is_msp': False}})
+        CheckpointStore.open(self.temp_dir.name)
+
+        self.producer = TelephonyProducer(None, asyncio.Queue(), url_path='/telephony')
+        consumer = MagicMock()
+        consumer.writer.server_id = 'siem'
+        consumer.log_format = Config.JSON
+        consumer.log_offset = '1700000000000,a'
+        consumer.acknowledged_log = None
+        Streams.add(Stream(Config.TELEPHONY, None, self.producer, consumer, []))
+
+        self.writer = Writer(
+            {'id': 'siem', 'protocol': 'TCP', 'hostname': 'localhost', 'port': 8888},
+            connect=False)
+        self.server = self.loop.run_until_complete(
+            Control.start_server(self.path, {'siem': self.writer}))
+
+    def tearDown(self):
+        if self.server:
+            self.loop.run_until_complete(Control.stop_server(self.server, self.path))
+        Streams.clear()
+        BackfillProgress.clear()
+        CheckpointStore.reset()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.temp_dir.cleanup()
+
+    def request(self, command, **arguments):
+        request = dict(arguments, command=command)
+        return self.loop.run_until_complete(
+            self.loop.run_in_executor(None, send_control_request, self.path, request))
+
+    def test_streams_are_listed_with_live_stats(self):
+        Metrics.inc(RECORDS_FETCHED, stream_labels(Config.TELEPHONY), 5)
+        Streams._quarantined['auth:DA123'] = stream_labels(Config.AUTH, 'DA123')
+
+        response = self.request('streams')
+
+        self.assertTrue(response['ok'])
+        stats = response['result']['streams'][0]
+        self.assertEqual(stats['stream'], Config.TELEPHONY)
+        self.assertEqual(stats['state'], 'running')
+        self.assertEqual(stats['server'], 'siem')
+        self.assertEqual((stats['poll_interval'], stats['page_size']), (120, 1000))
+        self.assertEqual((stats['records_fetched'], stats['records_written']), (5, 0))
+        self.assertEqual(response['result']['quarantined'], ['auth:DA123'])
+
+    def test_streams_are_paused_and_resumed(self):
+        self.assertEqual(self.request('pause', stream='telephony')['result']['state'], 'paused')
+        self.assertTrue(self.producer.paused)
+
+        self.assertEqual(self.request('resume', stream='telephony')['result']['state'], 'running')
+        self.assertFalse(self.producer.paused)
+
+    def test_settings_are_changed_at_runtime(self):
+        self.producer.wakeup = self.loop.create_future()
+
+        response = self.request('set', stream='telephony',
+                                settings={'timeout': 300, 'page_size': 100})
+
+        self.assertEqual((response['result']['poll_interval'], response['result']['page_size']),
+                         (300, 100))
+        # Waiting for its next poll, the producer sets it again
+        self.assertTrue(self.producer.wakeup.done())
+
+        response = self.request('reset', stream='telephony')
+
+        self.assertEqual(response['result']['poll_interval'], 120)
+        self.assertEqual(self.producer.overrides, {})
+
+    def test_invalid_requests(self):
+        for request, error in [
+                ({'command': 'pause', 'stream': 'auth'}, 'no auth stream is running'),
+                ({'command': 'stop'}, 'unknown command stop'),
+                ({'command': 'set', 'stream': 'telephony', 'settings': {'page_size': 0}},
+                 '0 is not a valid page_size'),
+                ({'command': 'set', 'stream': 'telephony', 'settings': {'page_size': 1001}},
+                 '1001 is not a valid page_size'),
+                ({'command': 'set', 'stream': 'telephony', 'settings': {'timeout': 0}},
+                 'expected at least 120 seconds'),
+                ({'command': 'set', 'stream': 'telephony',
+                  'settings': {'timeout': 600, 'max_timeout': 300}},
+                 '300 is not a valid max_timeout'),
+                ({'command': 'set', 'stream': 'telephony', 'settings': {'offset': 0}},
+                 'offset cannot be set')]:
+            with self.subTest(request=request):
+                response = self.request(**request)
+
+                self.assertFalse(response['ok'])
+                self.assertIn(error, response['error'])
+
+        # Rejected settings are not applied
+        self.assertEqual(self.producer.overrides, {})
+
+        response = self.loop.run_until_complete(Control.handle_request(b'{"command": '))
+        self.assertIn('not valid JSON', response['error'])
+
+    def test_checkpoints_are_flushed(self):
+        CheckpointStore.set_offset(Config.TELEPHONY, '1700000000000,a')
+
+        response = self.request('flush')
+
+        self.assertEqual(response['result']['changed'], False)
+        with open(CheckpointStore.get_path()) as store_file:
+            self.assertEqual(json.load(store_file)['offsets'], {'telephony': '1700000000000,a'})
+
+    def test_state_is_dumped(self):
+        self.producer.log_queue.put_nowait([{'txid': 'a'}])
+
+        result = self.request('dump')['result']
+
+        self.assertEqual(result['streams'][0]['queued_pages'], 1)
+        self.assertEqual(result['streams'][0]['consumer']['log_offset'], '1700000000000,a')
+        self.assertEqual(result['connections'], [{
+            'server': 'siem', 'protocol': 'TCP', 'hostname': 'localhost', 'port': 8888,
+            'connected': False}])
+
+    def test_socket_in_use_is_left_alone(self):
+        self.assertIsNone(self.loop.run_until_complete(
+            Control.start_server(self.path, {})))
+        self.assertTrue(self.request('streams')['ok'])
+
+    def test_socket_is_bound_without_permissions_for_others(self):
+        path = os.path.join(self.temp_dir.name, 'private.sock')
+        start_unix_server = asyncio.start_unix_server
+        umasks = []
+
+        async def start_server(*args, **kwargs):
+            umask = os.umask(0)
+            os.umask(umask)
+            umasks.append(umask)
+            return await start_unix_server(*args, **kwargs)
+
+        previous_umask = os.umask(0o022)
+        try:
+            with patch('duologsync.control.asyncio.start_unix_server', start_server):
+                server = self.loop.run_until_complete(Control.start_server(path, {}))
+            self.assertEqual(os.umask(previous_umask), 0o022)
+        finally:
+            os.umask(previous_umask)
+
+        self.assertEqual(umasks, [0o177])
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        self.loop.run_until_complete(Control.stop_server(server, path))
+
+    def test_stale_socket_is_replaced(self):
+        path = os.path.join(self.temp_dir.name, 'stale.sock')
+        stale_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale_socket.bind(path)
+        stale_socket.close()
+
+        server = self.loop.run_until_complete(Control.start_server(path, {}))
+
+        self.assertIsNotNone(server)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        self.loop.run_until_complete(Control.stop_server(server, path))
+        self.assertFalse(os.path.exists(path))
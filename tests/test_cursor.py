@@ -0,0 +1,117 @@
+from unittest import TestCase
+
+from duologsync.config import Config
+from duologsync.producer.cursor import (
+    ActivityCursor, AuthlogCursor, Cursor, TelephonyCursor, TrustMonitorCursor,
+    get_cursor_class
+)
+from tests.benchmarks.records import LOG_FACTORIES, make_logs, make_response
+
+START_MS = 1657411200000
+
+
+class TestCursor(TestCase):
+    def test_cursor_classes(self):
+        self.assertIs(get_cursor_class(Config.AUTH), AuthlogCursor)
+        self.assertIs(get_cursor_class(Config.TELEPHONY), TelephonyCursor)
+        self.assertIs(get_cursor_class(Config.ACTIVITY), ActivityCursor)
+        self.assertIs(get_cursor_class(Config.TRUST_MONITOR), TrustMonitorCursor)
+        self.assertIs(get_cursor_class('default'), Cursor)
+
+    def test_default_offset_is_mintime(self):
+        for log_type in LOG_FACTORIES:
+            with self.subTest(log_type=log_type):
+                cursor = get_cursor_class(log_type).from_checkpoint(START_MS)
+
+                self.assertEqual(cursor.mintime, START_MS)
+                self.assertIsNone(cursor.next_offset)
+
+    def test_checkpoint_round_trip(self):
+        for log_type in LOG_FACTORIES:
+            with self.subTest(log_type=log_type):
+                cursor_class = get_cursor_class(log_type)
+                last_log = make_logs(log_type, 3, START_MS)[-1]
+                checkpoint = cursor_class.get_checkpoint(last_log)
+
+                cursor = cursor_class.from_checkpoint(checkpoint)
+
+                if log_type == Config.AUTH:
+                    self.assertEqual(checkpoint, [str(START_MS + 2000), last_log['txid']])
+                    self.assertEqual(cursor.mintime, START_MS + 2000)
+                    self.assertEqual(cursor.next_offset, checkpoint)
+                else:
+                    self.assertEqual(cursor.mintime, cursor_class.get_record_time(last_log) + 1)
+                    self.assertIsNone(cursor.next_offset)
+
+    def test_start_cycle_sets_maxtime(self):
+        cursor = TelephonyCursor(mintime=START_MS)
+
+        cursor.start_cycle(now=1657411300.5)
+
+        self.assertEqual(cursor.maxtime, 1657411300500 - TelephonyCursor.MAXTIME_LAG)
+        self.assertTrue(cursor.has_more)
+
+    def test_advance_follows_next_offset_until_a_short_page(self):
+        for log_type in LOG_FACTORIES:
+            with self.subTest(log_type=log_type):
+                cursor = get_cursor_class(log_type)(mintime=START_MS)
+                logs = make_logs(log_type, 3, START_MS)
+                cursor.start_cycle()
+
+                records = cursor.advance(make_response(log_type, logs, has_more=True), 3)
+
+                self.assertEqual(records, logs)
+                self.assertIsNotNone(cursor.next_offset)
+                self.assertTrue(cursor.has_more)
+
+                cursor.advance(make_response(log_type, logs[:1], has_more=True), 3)
+
+                self.assertFalse(cursor.has_more)
+
+    def test_advance_without_next_offset_moves_mintime(self):
+        for log_type in LOG_FACTORIES:
+            with self.subTest(log_type=log_type):
+                cursor_class = get_cursor_class(log_type)
+                logs = make_logs(log_type, 3, START_MS)
+                cursor = cursor_class(mintime=START_MS)
+                cursor.start_cycle()
+                cursor.next_offset = cursor_class.get_page_offset(
+                    make_response(log_type, logs[:1], has_more=True))
+
+                cursor.advance(make_response(log_type, logs, has_more=False))
+
+                self.assertEqual(cursor.mintime, cursor_class.get_record_time(logs[-1]) + 1)
+                self.assertIsNone(cursor.next_offset)
+                self.assertFalse(cursor.has_more)
+
+    def test_record_time(self):
+        logs = {log_type: make_logs(log_type, 1, START_MS)[0] for log_type in LOG_FACTORIES}
+
+        self.assertEqual(AuthlogCursor.get_record_time(logs[Config.AUTH]), START_MS)
+        self.assertEqual(
+            TrustMonitorCursor.get_record_time(logs[Config.TRUST_MONITOR]), START_MS)
+        self.assertIsNone(TelephonyCursor.get_record_time({}))
+
+    def test_advance_keeps_position_without_logs(self):
+        cursor = AuthlogCursor(mintime=START_MS, next_offset=['1', 'txid'])
+        cursor.start_cycle()
+
+        self.assertEqual(cursor.advance(None), [])
+        self.assertEqual(cursor.advance(make_response(Config.AUTH, [], has_more=False)), [])
+
+        self.assertEqual(cursor.mintime, START_MS)
+        self.assertEqual(cursor.next_offset, ['1', 'txid'])
+        self.assertFalse(cursor.has_more)
+
+    def test_trust_monitor_offset_past_mintime_starts_next_cycle(self):
+        cursor = TrustMonitorCursor(mintime=START_MS, next_offset=START_MS + 5)
+
+        cursor.start_cycle()
+
+        self.assertEqual(cursor.mintime, START_MS + 5)
+        self.assertIsNone(cursor.next_offset)
+
+        cursor.next_offset = 2
+        cursor.start_cycle()
+
+        self.assertEqual(cursor.next_offset, 2)
@@ -0,0 +1,73 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from duologsync.metrics import (
+    API_CALL_DURATION, INGESTION_LAG, RECORDS_WRITTEN, Metrics, stream_labels
+)
+
+
+class TestMetrics(TestCase):
+    def tearDown(self):
+        Metrics.reset()
+
+    def test_inc_counter(self):
+        labels = stream_labels('auth', 'DA123')
+
+        Metrics.inc(RECORDS_WRITTEN, labels, 5)
+        Metrics.inc(RECORDS_WRITTEN, labels, 2)
+
+        self.assertEqual(Metrics.get(RECORDS_WRITTEN, labels), 7)
+        self.assertIsNone(Metrics.get(RECORDS_WRITTEN, stream_labels('auth')))
+
+    def test_render_counter(self):
+        Metrics.inc(RECORDS_WRITTEN, stream_labels('auth'), 3)
+
+        rendered = Metrics.render()
+
+        self.assertIn('# TYPE dls_records_written_total counter', rendered)
+        self.assertIn('dls_records_written_total{account="",endpoint="auth"} 3', rendered)
+
+    def test_render_histogram(self):
+        labels = stream_labels('telephony')
+
+        Metrics.observe(API_CALL_DURATION, labels, 0.2)
+        Metrics.observe(API_CALL_DURATION, labels, 120)
+
+        rendered = Metrics.render()
+
+        self.assertIn('dls_api_call_duration_seconds_bucket{account="",endpoint="telephony",le="0.1"} 0', rendered)
+        self.assertIn('dls_api_call_duration_seconds_bucket{account="",endpoint="telephony",le="0.25"} 1', rendered)
+        self.assertIn('dls_api_call_duration_seconds_bucket{account="",endpoint="telephony",le="+Inf"} 2', rendered)
+        self.assertIn('dls_api_call_duration_seconds_count{account="",endpoint="telephony"} 2', rendered)
+
+    @patch('duologsync.metrics.time.time', return_value=1000)
+    def test_render_age_metric(self, _):
+        Metrics.set(INGESTION_LAG, stream_labels('activity'), 940)
+
+        self.assertIn('dls_ingestion_lag_seconds{account="",endpoint="activity"} 60', Metrics.render())
+
+    def test_serve_metrics_over_http(self):
+        Metrics.inc(RECORDS_WRITTEN, stream_labels('auth'), 1)
+        loop = asyncio.new_event_loop()
+
+        async def scrape(path):
+            server = await Metrics.start_server('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response.decode()
+
+        try:
+            metrics_response = loop.run_until_complete(scrape('/metrics'))
+            missing_response = loop.run_until_complete(scrape('/nothing'))
+        finally:
+            loop.close()
+
+        self.assertTrue(metrics_response.startswith('HTTP/1.0 200 OK'))
+        self.assertIn('dls_records_written_total{account="",endpoint="auth"} 1', metrics_response)
+        self.assertTrue(missing_response.startswith('HTTP/1.0 404 Not Found'))
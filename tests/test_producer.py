@@ -0,0 +1,186 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from duologsync.backfill import BackfillProgress, CycleEnd
+from duologsync.config import Config
+from duologsync.metrics import Metrics
+from duologsync.producer.telephony_producer import TelephonyProducer
+from duologsync.program import Program, ProgramShutdownError
+from duologsync.scheduler import Scheduler
+from tests.benchmarks.records import make_logs, make_response
+
+START_MS = 1657411200000
+
+
+class TestProducerPollInterval(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        Config.set_config({'dls_settings': {
+            'api': {'offset': 0, 'timeout': 120, 'max_timeout': 900},
+            'checkpointing': {'enabled': False, 'directory': '/tmp'},
+        }, 'account': {'is_msp': False}})
+
+    def tearDown(self):
+        BackfillProgress.clear()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_poll_interval_doubles_while_idle(self):
+        producer = TelephonyProducer(None, asyncio.Queue())
+
+        intervals = []
+        for idle_cycles in range(5):
+            producer.idle_cycles = idle_cycles
+            intervals.append(producer.get_poll_interval())
+
+        self.assertEqual(intervals, [120, 240, 480, 900, 900])
+
+    def test_poll_interval_without_max_timeout(self):
+        Config.get_value(['dls_settings', 'api'])['max_timeout'] = 0
+        producer = TelephonyProducer(None, asyncio.Queue())
+        producer.idle_cycles = 3
+
+        self.assertEqual(producer.get_poll_interval(), 120)
+
+    def test_idle_cycles_reset_once_logs_appear(self):
+        logs = make_logs(Config.TELEPHONY, 2, START_MS)
+        responses = [
+            make_response(Config.TELEPHONY, [], has_more=False),
+            make_response(Config.TELEPHONY, [], has_more=False),
+            make_response(Config.TELEPHONY, logs, has_more=False),
+            make_response(Config.TELEPHONY, [], has_more=False),
+        ]
+        producer = TelephonyProducer(
+            lambda **kwargs: responses.pop(0), asyncio.Queue(), url_path='/telephony')
+        intervals = []
+
+        async def sleep_until(deadline, wake=None):
+            intervals.append(producer.get_poll_interval())
+            if not responses:
+                raise ProgramShutdownError
+            return True
+
+        with patch.object(Scheduler, 'sleep_until', sleep_until):
+            self.loop.run_until_complete(producer.produce())
+
+        self.assertEqual(intervals, [120, 240, 480, 120, 240])
+
+    def test_polls_without_poll_interval(self):
+        Config.get_value(['dls_settings', 'api']).update({'timeout': 0, 'max_timeout': 0})
+        logs = make_logs(Config.TELEPHONY, 2, START_MS)
+        responses = [
+            make_response(Config.TELEPHONY, logs, has_more=False),
+            make_response(Config.TELEPHONY, [], has_more=False),
+            make_response(Config.TELEPHONY, [], has_more=False),
+        ]
+        producer = TelephonyProducer(
+            lambda **kwargs: responses.pop(0), asyncio.Queue(), url_path='/telephony')
+        deadlines = []
+
+        async def sleep_until(deadline, wake=None):
+            deadlines.append(deadline)
+            if not responses:
+                raise ProgramShutdownError
+            return True
+
+        with patch.object(Scheduler, 'sleep_until', sleep_until):
+            self.loop.run_until_complete(producer.produce())
+
+        # Every cycle polled right after the one before
+        self.assertEqual(len(deadlines), 4)
+        self.assertEqual(producer.log_queue.get_nowait(), logs)
+        # Followed by the end of the cycle, left for the consumer to report
+        self.assertIsInstance(producer.log_queue.get_nowait(), CycleEnd)
+        self.assertFalse(producer.backfill.caught_up)
+
+    def test_cursor_is_logged_as_it_was_when_fetching(self):
+        responses = [make_response(Config.TELEPHONY, make_logs(Config.TELEPHONY, 2, START_MS))]
+        producer = TelephonyProducer(
+            lambda **kwargs: responses.pop(0), asyncio.Queue(), url_path='/telephony')
+
+        async def sleep_until(deadline, wake=None):
+            if not responses:
+                raise ProgramShutdownError
+            return True
+
+        with patch.object(Scheduler, 'sleep_until', sleep_until), \
+                patch.object(Program, 'log') as log:
+            self.loop.run_until_complete(producer.produce())
+
+        [fetching] = [call.args for call in log.call_args_list
+                      if call.args[0] == '%s producer: fetching logs from %s']
+        self.assertIsInstance(fetching[3], str)
+        self.assertNotEqual(fetching[3], str(producer.cursor))
+
+    def test_polls_are_spread_by_the_jitter(self):
+        Config.get_value(['dls_settings', 'api'])['jitter'] = 0.1
+
+        first_polls = [TelephonyProducer.get_next_poll(None, 120, now=0) for _ in range(200)]
+        next_polls = [TelephonyProducer.get_next_poll(120, 120, now=125) for _ in range(200)]
+
+        self.assertTrue(all(0 <= poll <= 120 for poll in first_polls))
+        self.assertGreater(max(first_polls) - min(first_polls), 60)
+        self.assertTrue(all(228 <= poll <= 252 for poll in next_polls))
+        self.assertGreater(len(set(next_polls)), 1)
+
+    def test_polls_without_jitter(self):
+        Config.get_value(['dls_settings', 'api'])['jitter'] = 0
+
+        self.assertEqual(TelephonyProducer.get_next_poll(None, 120, now=5), 125)
+        self.assertEqual(TelephonyProducer.get_next_poll(125, 120, now=130), 245)
+
+    def test_overrides_take_precedence_over_config(self):
+        producer = TelephonyProducer(None, asyncio.Queue())
+        producer.overrides = {'timeout': 30, 'max_timeout': 60, 'page_size': 50000}
+        producer.idle_cycles = 3
+
+        self.assertEqual(producer.get_poll_interval(), 60)
+        self.assertEqual(producer.get_page_size(), Config.API_PAGE_SIZE_MAX[Config.TELEPHONY])
+
+    def test_changed_poll_interval_applies_to_the_next_poll(self):
+        producer = TelephonyProducer(None, asyncio.Queue())
+        intervals = []
+
+        async def sleep_until(deadline, wake=None):
+            intervals.append(producer.get_poll_interval())
+            if len(intervals) > 1:
+                raise ProgramShutdownError
+
+            # Woken up by a new timeout before the deadline
+            producer.overrides['timeout'] = 30
+            producer.wake_up()
+            return not wake.done()
+
+        with patch.object(Scheduler, 'sleep_until', sleep_until):
+            self.loop.run_until_complete(producer.produce())
+
+        self.assertEqual(intervals, [120, 30])
+
+    def test_paused_producer_waits_until_resumed(self):
+        producer = TelephonyProducer(None, asyncio.Queue())
+        producer.paused = True
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(asyncio.wait_for(producer.wait_while_paused(), 0.2))
+
+        producer.paused = False
+        self.loop.run_until_complete(asyncio.wait_for(producer.wait_while_paused(), 0.2))
+
+    def test_paused_producer_wakes_up_once_resumed(self):
+        producer = TelephonyProducer(None, asyncio.Queue())
+        producer.paused = True
+
+        # Rather than at its next check of the pause
+        self.loop.call_later(0.05, setattr, producer, 'paused', False)
+        self.loop.run_until_complete(asyncio.wait_for(producer.wait_while_paused(), 0.5))
+
+        producer.paused = True
+        self.loop.call_later(0.05, Program.initiate_shutdown, 'test')
+        with self.assertRaises(ProgramShutdownError):
+            self.loop.run_until_complete(asyncio.wait_for(producer.wait_while_paused(), 0.5))
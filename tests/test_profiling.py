@@ -0,0 +1,86 @@
+import asyncio
+import io
+import os
+import pstats
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+
+from duologsync.metrics import Metrics, stream_labels
+from duologsync.profiling import (
+    FORMAT_LOG, WRITE, Profiler, StageTimer, StartupTimer, summarize_stages
+)
+
+
+class TestProfiling(TestCase):
+    def tearDown(self):
+        Metrics.reset()
+        Profiler._profile = None
+        StartupTimer._started_at = None
+
+    def test_stage_timer_records_per_stream_and_stage(self):
+        stage_timer = StageTimer(stream_labels('auth', 'DA123'))
+
+        stage_timer.record(FORMAT_LOG, 0.5)
+        stage_timer.record(FORMAT_LOG, 0.25)
+        with stage_timer.time(WRITE):
+            pass
+
+        histograms = {
+            labels['stage']: (total, count)
+            for labels, total, count in Metrics.get_histograms('dls_stage_duration_seconds')
+        }
+
+        self.assertEqual(histograms[FORMAT_LOG], (0.75, 2))
+        self.assertEqual(histograms[WRITE][1], 1)
+
+    def test_summarize_stages_slowest_first(self):
+        stage_timer = StageTimer(stream_labels('telephony'))
+
+        stage_timer.record(WRITE, 0.1)
+        stage_timer.record(FORMAT_LOG, 2)
+
+        summary = summarize_stages()
+
+        self.assertEqual(len(summary), 2)
+        self.assertTrue(summary[0].startswith('telephony format_log: 1 calls, 2.000s total'))
+
+    def test_toggle_saves_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            Profiler.toggle(directory)
+            self.assertTrue(Profiler.is_active())
+            sum(range(1000))
+
+            profile_path = Profiler.stop(directory)
+
+            self.assertFalse(Profiler.is_active())
+            self.assertEqual(os.path.dirname(profile_path), directory)
+            pstats.Stats(profile_path)
+
+    def test_stop_without_session(self):
+        self.assertIsNone(Profiler.stop('/tmp'))
+
+    def test_startup_timer_reports_every_step(self):
+        StartupTimer.start()
+        StartupTimer.record('import duologsync', 0.25)
+        with StartupTimer.time('read config'):
+            pass
+        result = asyncio.new_event_loop().run_until_complete(
+            StartupTimer.time_async('connect to servers', asyncio.sleep(0, 'writers')))
+
+        with redirect_stdout(io.StringIO()) as output:
+            lines = StartupTimer.report()
+
+        self.assertEqual(result, 'writers')
+        self.assertEqual(lines[0], 'import duologsync: 250.0ms')
+        self.assertEqual([line.split(':')[0] for line in lines[1:]],
+                         ['read config', 'connect to servers', 'total'])
+        self.assertIn('startup timing total', output.getvalue())
+        self.assertFalse(StartupTimer.is_active())
+
+    def test_startup_timer_inactive_by_default(self):
+        StartupTimer.record('read config', 1)
+        with StartupTimer.time('set up logging'):
+            pass
+
+        self.assertEqual(StartupTimer.report(), [])
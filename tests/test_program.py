@@ -1,10 +1,15 @@
+import asyncio
+import logging
+import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
-from duologsync.program import Program
+from duologsync.program import Program, RateLimitFilter
 
 class TestConfig(TestCase):
     
     def tearDown(self):
+        Program.shutdown_logging()
         Program._running = True
         Program._logging_set = False
 
@@ -28,13 +33,90 @@ class TestConfig(TestCase):
         Program.initiate_shutdown('test')
 
         self.assertEqual(Program._running, False)
+
+    def test_shutdown_future_is_done_once_shutdown_is_initiated(self):
+        loop = asyncio.new_event_loop()
+
+        async def shut_down():
+            future = Program.get_shutdown_future()
+            self.assertFalse(future.done())
+            Program.initiate_shutdown('test')
+            await asyncio.wait_for(future, 1)
+            self.assertIs(Program.get_shutdown_future(), future)
+
+        loop.run_until_complete(shut_down())
+        loop.close()
  
     def test_setup_logging_normal(self):
-        filepath = 'logs.txt'
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'logs.txt')
+
+            Program.setup_logging(filepath)
+
+            self.assertEqual(Program._logging_set, True)
+
+    def test_setup_logging_bad_filepath(self):
+        Program.setup_logging('absolute/nonsense/logs.txt')
+
+        self.assertEqual(Program._logging_set, False)
+        self.assertEqual(Program._running, False)
+
+    def test_setup_logging_writes_in_background(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'logs.txt')
+
+            Program.setup_logging(filepath)
+            Program.log('%s producer: adding %s logs to the queue', logging.INFO, 'auth', 5)
+            Program.shutdown_logging()
+
+            with open(filepath) as log_file:
+                self.assertIn('auth producer: adding 5 logs to the queue', log_file.read())
+
+    @patch('builtins.print')
+    def test_log_lazy_formatting_without_logging_set(self, mock_print):
+        Program.log('%s consumer: received %s logs', logging.INFO, 'auth', 3)
+
+        mock_print.assert_called_once_with('auth consumer: received 3 logs')
+
+    def test_rate_limit_filter(self):
+        rate_limit_filter = RateLimitFilter(2, interval=60)
+
+        def make_record(level=logging.INFO):
+            return logging.LogRecord('root', level, __file__, 1, '%s consumer: waiting', ('auth',), None)
+
+        results = [rate_limit_filter.filter(make_record()) for _ in range(4)]
+
+        self.assertEqual(results, [True, True, False, False])
+        self.assertTrue(rate_limit_filter.filter(make_record(logging.WARNING)))
+
+    @patch('duologsync.program.time.monotonic')
+    def test_rate_limit_filter_reports_suppressed(self, mock_monotonic):
+        rate_limit_filter = RateLimitFilter(1, interval=60)
+        mock_monotonic.return_value = 0
+
+        for _ in range(3):
+            rate_limit_filter.filter(logging.LogRecord('root', logging.INFO, __file__, 1, 'polling', (), None))
+
+        mock_monotonic.return_value = 61
+        record = logging.LogRecord('root', logging.INFO, __file__, 1, 'polling', (), None)
+
+        self.assertTrue(rate_limit_filter.filter(record))
+        self.assertIn('suppressed 2 similar messages', record.getMessage())
+
+    @patch.object(RateLimitFilter, 'MAX_TEMPLATES', 3)
+    def test_rate_limit_filter_forgets_least_recent_templates(self):
+        rate_limit_filter = RateLimitFilter(1, interval=60)
+
+        def log(template):
+            return rate_limit_filter.filter(
+                logging.LogRecord('root', logging.INFO, __file__, 1, template, (), None))
 
-        Program.setup_logging(filepath)
+        for template in ['a', 'b', 'c', 'a', 'd']:
+            log(template)
 
-        self.assertEqual(Program._logging_set, True)
+        self.assertEqual(list(rate_limit_filter._windows), ['c', 'a', 'd'])
+        # Still within its interval, a is still limited
+        self.assertFalse(log('a'))
 
     @patch('builtins.print')
     def test_log_without_logging_set(self, mock_print):
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from duologsync.backfill import BackfillProgress, CycleEnd
+from duologsync.config import Config
+from duologsync.metrics import QUEUE_DEPTH, Metrics, stream_labels
+from duologsync.producer.telephony_producer import TelephonyProducer
+from duologsync.program import Program
+from duologsync.recording import Recorder, Replayer, list_segments
+from tests.benchmarks.records import make_logs, make_response
+
+
+class TestRecording(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        Recorder.open(self.directory)
+
+    def tearDown(self):
+        Recorder.close()
+        Replayer.close()
+        Metrics.reset()
+        Program._running = True
+        self.temp_dir.cleanup()
+
+    def record(self, responses, log_type=Config.AUTH, child_account_id=None):
+        remaining_responses = iter(responses)
+
+        def api_call(**kwargs):
+            response = next(remaining_responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        recorded_api_call = Recorder.wrap(api_call, log_type, child_account_id)
+        results = []
+
+        for _ in responses:
+            try:
+                results.append(recorded_api_call(mintime=1))
+            except RuntimeError as runtime_error:
+                results.append(runtime_error)
+
+        return results
+
+    def test_responses_are_returned_and_recorded(self):
+        responses = [{'authlogs': [{'txid': str(index)}]} for index in range(3)]
+
+        results = self.record(responses)
+        Recorder.close()
+
+        self.assertEqual(results, responses)
+        self.assertEqual(list(list_segments(self.directory)), ['auth'])
+
+    def test_segments_are_rotated(self):
+        with patch('duologsync.recording.SEGMENT_MAX_RESPONSES', 2):
+            self.record([{'items': []}] * 5, Config.TELEPHONY, 'DA123')
+        Recorder.close()
+
+        self.assertEqual(sorted(os.listdir(self.directory)), [
+            'telephony_DA123-000000.jsonl.gz',
+            'telephony_DA123-000001.jsonl.gz',
+            'telephony_DA123-000002.jsonl.gz',
+        ])
+
+    def test_replay_returns_recorded_responses_and_errors(self):
+        rate_limited = RuntimeError('Received 429 Too Many Requests')
+        rate_limited.status = 429
+        rate_limited.data = {'code': 42901}
+        responses = [{'events': [{'sv_id': '1'}]}, rate_limited, {'events': []}]
+
+        self.record(responses, Config.TRUST_MONITOR)
+        Recorder.close()
+
+        streams = Replayer.open(self.directory, realtime=False)
+        self.assertEqual(streams, [(Config.TRUST_MONITOR, None)])
+
+        api_call = Replayer.get_api_call(Config.TRUST_MONITOR)
+        self.assertEqual(api_call(mintime=5), {'events': [{'sv_id': '1'}]})
+
+        with self.assertRaises(RuntimeError) as context:
+            api_call()
+        self.assertEqual(context.exception.status, 429)
+        self.assertEqual(context.exception.data, {'code': 42901})
+
+        self.assertEqual(api_call(), {'events': []})
+        self.assertFalse(Replayer.is_finished())
+        self.assertIsNone(api_call())
+
+    def test_replay_is_finished_once_queues_are_empty(self):
+        self.record([{'authlogs': []}], Config.AUTH, 'DA123')
+        Recorder.close()
+        Replayer.open(self.directory, realtime=False)
+        labels = stream_labels(Config.AUTH, 'DA123')
+
+        Replayer.get_api_call(Config.AUTH, 'DA123')()
+        Replayer.get_api_call(Config.AUTH, 'DA123')()
+        Metrics.set(QUEUE_DEPTH, labels, 1)
+        self.assertFalse(Replayer.is_finished())
+
+        Metrics.set(QUEUE_DEPTH, labels, 0)
+        asyncio.new_event_loop().run_until_complete(Replayer.run())
+        self.assertFalse(Program.is_running())
+
+    def test_recording_continues_after_earlier_segments(self):
+        self.record([{'authlogs': []}])
+        Recorder.close()
+
+        Recorder.open(self.directory)
+        self.record([{'authlogs': []}])
+        Recorder.close()
+
+        self.assertEqual(len(list_segments(self.directory)['auth']), 2)
+
+    def test_replay_through_the_producer(self):
+        logs = make_logs(Config.TELEPHONY, 6, 1657411200000)
+        # Three polling cycles, the first of which fetches two pages
+        self.record([
+            make_response(Config.TELEPHONY, logs[:2], has_more=True),
+            make_response(Config.TELEPHONY, logs[2:4], has_more=False),
+            make_response(Config.TELEPHONY, [], has_more=False),
+            make_response(Config.TELEPHONY, logs[4:], has_more=False),
+        ], Config.TELEPHONY)
+        Recorder.close()
+
+        Config.set_config({'dls_settings': {
+            'api': {'offset': 0, 'timeout': 120, 'max_timeout': 900},
+            'checkpointing': {'enabled': False, 'directory': self.directory},
+        }, 'account': {'is_msp': False}})
+        self.addCleanup(BackfillProgress.clear)
+        self.addCleanup(setattr, Config, '_config_is_set', False)
+        self.addCleanup(setattr, Config, '_config', None)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(loop.close)
+
+        Replayer.open(self.directory, realtime=False)
+        producer = TelephonyProducer(
+            Replayer.get_api_call(Config.TELEPHONY), asyncio.Queue(), url_path='/telephony')
+        pages = []
+
+        async def consume():
+            while True:
+                page = await producer.log_queue.get()
+                Metrics.set(QUEUE_DEPTH, producer.metric_labels, producer.log_queue.qsize())
+                if not page:
+                    break
+                if not isinstance(page, CycleEnd):
+                    pages.append(page)
+
+        loop.run_until_complete(asyncio.wait_for(
+            asyncio.gather(producer.produce(), consume(), Replayer.run()), 10))
+
+        self.assertEqual([log for page in pages for log in page], logs)
+        self.assertFalse(Program.is_running())
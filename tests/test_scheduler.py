@@ -0,0 +1,88 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from duologsync.program import Program, ProgramShutdownError
+from duologsync.scheduler import Scheduler
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        Program._running = True
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_next_deadline_is_fixed_rate(self):
+        self.assertEqual(Scheduler.next_deadline(100, 120, now=150), 220)
+        # Work took longer than a period, the missed deadline is skipped
+        self.assertEqual(Scheduler.next_deadline(100, 120, now=230), 340)
+        self.assertEqual(Scheduler.next_deadline(100, 120, now=580), 580)
+
+    def test_next_deadline_without_period(self):
+        self.assertEqual(Scheduler.next_deadline(100, 0, now=150), 150)
+        self.assertEqual(Scheduler.next_deadline(100, 0, now=50), 100)
+
+    def test_sleep_until_deadline(self):
+        async def sleep():
+            deadline = Scheduler.time() + 0.05
+            await Scheduler.sleep_until(deadline)
+            return Scheduler.time() - deadline
+
+        overshoot = self.loop.run_until_complete(sleep())
+
+        self.assertGreaterEqual(overshoot, 0)
+        self.assertLess(overshoot, Scheduler.RESOLUTION + 0.05)
+
+    def test_tasks_due_at_the_same_tick_share_a_timer(self):
+        wake_ups = []
+        wake_up = Scheduler._wake_up.__func__
+
+        def count_wake_up(cls):
+            wake_ups.append(cls.time())
+            wake_up(cls)
+
+        async def sleep_together():
+            deadline = Scheduler.time() + 0.05
+            await asyncio.gather(*[
+                Scheduler.sleep_until(deadline + i * 0.001) for i in range(20)])
+
+        with patch.object(Scheduler, '_wake_up', classmethod(count_wake_up)):
+            self.loop.run_until_complete(sleep_together())
+
+        self.assertLessEqual(len(wake_ups), 2)
+
+    def test_shutdown_wakes_sleeping_tasks_immediately(self):
+        async def sleep_then_shut_down():
+            sleeping = asyncio.ensure_future(Scheduler.sleep(60))
+            await asyncio.sleep(0.01)
+            started = Scheduler.time()
+            Program.initiate_shutdown('test')
+
+            with self.assertRaises(ProgramShutdownError):
+                await sleeping
+
+            return Scheduler.time() - started
+
+        self.assertLess(self.loop.run_until_complete(sleep_then_shut_down()), 1)
+
+    def test_sleep_after_shutdown_raises(self):
+        Program._running = False
+
+        with self.assertRaises(ProgramShutdownError):
+            self.loop.run_until_complete(Scheduler.sleep(60))
+
+    def test_wake_ends_sleep_early(self):
+        async def sleep_then_wake():
+            wake = self.loop.create_future()
+            sleeping = asyncio.ensure_future(Scheduler.sleep_until(Scheduler.time() + 60, wake))
+            await asyncio.sleep(0.01)
+            wake.set_result(None)
+            deadline_reached = await sleeping
+
+            return deadline_reached, Scheduler.get_sleeping()
+
+        self.assertEqual(self.loop.run_until_complete(sleep_then_wake()), (False, 0))
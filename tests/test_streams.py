@@ -0,0 +1,245 @@
+import asyncio
+import copy
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from duologsync.app import reload_config
+from duologsync.config import Config
+from duologsync.metrics import STREAM_QUARANTINED, STREAM_RESTARTS, Metrics, stream_labels
+from duologsync.program import Program
+from duologsync.streams import Stream, Streams
+
+CONFIG = {
+    "config_file_path": "config.yml",
+    "dls_settings": {
+        "log_filepath": "duologsync.log",
+        "log_format": "JSON",
+        "logging": {},
+        "checkpointing": {},
+        "dedup": {},
+        "metrics": {},
+        "archive": {},
+        "control": {},
+        "proxy": {"proxy_server": "", "proxy_port": 0},
+        "api": {"offset": 0, "timeout": 120},
+    },
+    "servers": [
+        {"id": "Main", "hostname": "localhost", "port": 8888, "protocol": "TCP"},
+        {"id": "Backup", "hostname": "localhost", "port": 9999, "protocol": "TCP"},
+    ],
+    "account": {
+        "ikey": "a",
+        "skey": "a",
+        "hostname": "a",
+        "endpoint_server_mappings": [
+            {"endpoints": ["auth", "telephony"], "server": "Main"},
+            {"endpoints": ["activity"], "server": "Backup"},
+        ],
+        "is_msp": False,
+    },
+}
+
+
+class TestStreams(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        Config.set_config(copy.deepcopy(CONFIG))
+
+        self.server_to_writer = {"Main": MagicMock(), "Backup": MagicMock()}
+        for log_type, server_id in [("auth", "Main"), ("telephony", "Main"),
+                                    ("activity", "Backup")]:
+            self.add_stream(log_type, self.server_to_writer[server_id])
+
+    def tearDown(self):
+        Streams.clear()
+        Config._config = None
+        Config._config_is_set = False
+        Program._running = True
+        Metrics.reset()
+        self.loop.close()
+
+    def add_stream(self, log_type, writer, admin=None, child_account=None):
+        consumer = MagicMock(writer=writer, log_format="JSON")
+        task = self.loop.create_future()
+        Streams.add(Stream(log_type, child_account, MagicMock(), consumer, [task]))
+        return [task]
+
+    def reload(self, config):
+        with patch("duologsync.app.Config.create_config", return_value=config), \
+                patch("duologsync.app.create_admin", return_value="duo_admin"), \
+                patch("duologsync.app.create_consumer_producer_pair",
+                      side_effect=self.add_stream) as create_pair:
+            self.loop.run_until_complete(reload_config(self.server_to_writer))
+
+        return create_pair
+
+    def test_unchanged_config_leaves_streams_alone(self):
+        streams = Streams.get_all()
+
+        create_pair = self.reload(copy.deepcopy(CONFIG))
+
+        create_pair.assert_not_called()
+        self.assertEqual(Streams.get_all(), streams)
+        self.assertFalse(any(task.done() for stream in streams for task in stream.tasks))
+
+    def test_only_affected_streams_change(self):
+        auth = Streams.get("auth")
+        telephony = Streams.get("telephony")
+        activity = Streams.get("activity")
+        config = copy.deepcopy(CONFIG)
+        config["account"]["endpoint_server_mappings"] = [
+            {"endpoints": ["auth"], "server": "Main"},
+            {"endpoints": ["activity", "trustmonitor"], "server": "Main"},
+        ]
+
+        create_pair = self.reload(config)
+
+        create_pair.assert_called_once_with(
+            "trustmonitor", self.server_to_writer["Main"], "duo_admin", None)
+        self.assertIs(Streams.get("auth"), auth)
+        self.assertFalse(auth.tasks[0].done())
+        self.assertIsNone(Streams.get("telephony"))
+        self.assertTrue(telephony.tasks[0].cancelled())
+        self.assertIs(Streams.get("activity"), activity)
+        self.assertIs(activity.consumer.writer, self.server_to_writer["Main"])
+        self.assertFalse(activity.tasks[0].done())
+
+    def test_changed_server_gets_a_new_writer(self):
+        old_writer = self.server_to_writer["Backup"]
+        config = copy.deepcopy(CONFIG)
+        config["servers"][1]["port"] = 7777
+        config["dls_settings"]["log_format"] = "CEF"
+
+        with patch("duologsync.app.Writer") as writer_class:
+            writer_class.return_value.connect = AsyncMock(return_value=True)
+            self.reload(config)
+
+        new_writer = writer_class.return_value
+        writer_class.assert_called_once_with(config["servers"][1], connect=False)
+        old_writer.close.assert_called_once_with()
+        self.server_to_writer["Main"].close.assert_not_called()
+        self.assertIs(self.server_to_writer["Backup"], new_writer)
+        self.assertIs(Streams.get("activity").consumer.writer, new_writer)
+        self.assertEqual(Streams.get("auth").consumer.log_format, "CEF")
+
+    def test_failed_connection_keeps_current_config(self):
+        config = copy.deepcopy(CONFIG)
+        config["servers"][1]["port"] = 7777
+        config["account"]["endpoint_server_mappings"][1]["endpoints"] = ["trustmonitor"]
+
+        with patch("duologsync.app.Writer") as writer_class:
+            writer_class.return_value.connect = AsyncMock(return_value=False)
+            create_pair = self.reload(config)
+
+        create_pair.assert_not_called()
+        self.assertEqual(Config.get_servers()[1]["port"], 9999)
+        self.assertIsNotNone(Streams.get("activity"))
+
+    def test_invalid_config_is_ignored(self):
+        config = copy.deepcopy(CONFIG)
+        config["account"]["endpoint_server_mappings"][0]["server"] = "Unknown"
+
+        create_pair = self.reload(config)
+        self.reload(None)
+
+        create_pair.assert_not_called()
+        self.assertEqual(len(Streams.get_all()), 3)
+        self.assertTrue(Program.is_running())
+
+    def test_restart_required_settings_keep_their_value(self):
+        config = copy.deepcopy(CONFIG)
+        config["dls_settings"]["log_filepath"] = "other.log"
+        config["dls_settings"]["api"]["timeout"] = 300
+
+        self.reload(config)
+
+        self.assertEqual(Config.get_log_filepath(), "duologsync.log")
+        self.assertEqual(Config.get_api_timeout(), 300)
+
+    def test_run_waits_for_streams_added_later(self):
+        first = Streams.get("auth").tasks[0]
+
+        async def replace_stream():
+            await Streams.remove(Streams.get("auth"))
+            Program._running = False
+            for stream in Streams.get_all():
+                stream.tasks[0].set_result(None)
+
+        self.loop.run_until_complete(asyncio.gather(Streams.run(), replace_stream()))
+        self.assertTrue(first.cancelled())
+
+    def test_failed_stream_is_restarted_while_others_keep_running(self):
+        Config.get_value(["dls_settings"])["supervisor"] = {
+            "max_restarts": 5, "backoff": 0.01, "max_backoff": 300}
+        failed = Streams.get("auth")
+        failed.restart = lambda writer: self.add_stream("auth", writer)
+        failed.tasks[0].set_exception(ValueError("bad log"))
+
+        async def wait_for_restart():
+            while Streams.get("auth") is failed:
+                await asyncio.sleep(0.01)
+            while Streams.get("auth") is None:
+                await asyncio.sleep(0.01)
+            Program.initiate_shutdown("test")
+            for stream in Streams.get_all():
+                stream.tasks[0].set_result(None)
+
+        self.loop.run_until_complete(asyncio.gather(Streams.run(), wait_for_restart()))
+
+        self.assertEqual(Streams.get("auth").restarts, 1)
+        self.assertFalse(Streams.get("telephony").tasks[0].cancelled())
+        self.assertEqual(Metrics.get(STREAM_RESTARTS, stream_labels("auth")), 1)
+
+    def test_stream_added_while_waiting_is_supervised(self):
+        Config.get_value(["dls_settings"])["supervisor"] = {
+            "max_restarts": 0, "backoff": 0.01, "max_backoff": 300}
+
+        async def add_failing_stream():
+            # Run is waiting on the streams added before
+            await asyncio.sleep(0.05)
+            self.add_stream("trustmonitor", self.server_to_writer["Main"])[0].set_exception(
+                RuntimeError("invalid ikey"))
+
+            while Streams.get("trustmonitor") is not None:
+                await asyncio.sleep(0.01)
+            Program.initiate_shutdown("test")
+            for stream in Streams.get_all():
+                stream.tasks[0].set_result(None)
+
+        self.loop.run_until_complete(asyncio.wait_for(
+            asyncio.gather(Streams.run(), add_failing_stream()), 5))
+
+        self.assertEqual(Streams.get_quarantined(), ["trustmonitor"])
+
+    def test_streams_failing_too_often_are_quarantined(self):
+        Config.get_value(["dls_settings"])["supervisor"] = {
+            "max_restarts": 0, "backoff": 0.01, "max_backoff": 300}
+
+        for stream in Streams.get_all():
+            stream.tasks[0].set_exception(RuntimeError("invalid ikey"))
+
+        self.loop.run_until_complete(Streams.run())
+
+        self.assertEqual(Streams.get_all(), [])
+        self.assertEqual(Metrics.get(STREAM_QUARANTINED, stream_labels("auth")), 1)
+        # Nothing is left running
+        self.assertFalse(Program.is_running())
+
+        Streams.forget_failures()
+        self.assertEqual(Metrics.get(STREAM_QUARANTINED, stream_labels("auth")), 0)
+
+    def test_shutdown_drains_streams_until_the_drain_timeout(self):
+        Config.get_value(["dls_settings"])["shutdown"] = {"drain_timeout": 0.2}
+        auth = Streams.get("auth").tasks[0]
+        telephony = Streams.get("telephony").tasks[0]
+
+        async def shut_down():
+            Program.initiate_shutdown("test")
+            # The auth stream finishes writing within the drain timeout
+            self.loop.call_later(0.05, auth.set_result, None)
+
+        self.loop.run_until_complete(asyncio.gather(Streams.run(), shut_down()))
+
+        self.assertFalse(auth.cancelled())
+        self.assertTrue(telephony.cancelled())
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+from duologsync.util import get_log_timestamp, get_offset_timestamp
+
+
+class TestUtil(TestCase):
+    def test_get_log_timestamp(self):
+        test_params = [
+            ({'timestamp': 1597671838}, 1597671838),
+            ({'timestamp': 1597671838335}, 1597671838.335),
+            ({'surfaced_timestamp': 1597671838335}, 1597671838.335),
+            ({'ts': '2020-08-17T13:43:58.335000+00:00'}, 1597671838.335),
+            ({'ts': '2020-08-17T13:43:58+00:00'}, 1597671838),
+            ({'isotimestamp': '2020-08-17T13:43:58.335000+00:00'}, 1597671838.335),
+            ({'eventtype': 'authentication'}, None),
+        ]
+
+        for log, expected_timestamp in test_params:
+            with self.subTest(log=log):
+                timestamp = get_log_timestamp(log)
+
+                if expected_timestamp is None:
+                    self.assertIsNone(timestamp)
+                else:
+                    self.assertAlmostEqual(timestamp, expected_timestamp, places=3)
+
+    def test_get_offset_timestamp(self):
+        test_params = [
+            (1597671838, 1597671838),
+            (1597671838336, 1597671838.336),
+            ('1597671838336,activity-id', 1597671838.336),
+            (['1597671838335', 'txid'], 1597671838.335),
+            ('not an offset', None),
+            ({'offset': 1597671838}, None),
+            (None, None),
+        ]
+
+        for log_offset, expected_timestamp in test_params:
+            with self.subTest(log_offset=log_offset):
+                timestamp = get_offset_timestamp(log_offset)
+
+                if expected_timestamp is None:
+                    self.assertIsNone(timestamp)
+                else:
+                    self.assertAlmostEqual(timestamp, expected_timestamp, places=3)